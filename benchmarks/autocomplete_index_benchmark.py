@@ -0,0 +1,101 @@
+# autocomplete_index_benchmark.py
+"""
+Benchmark of the autocomplete index on a synthetic dataset of 1M users
+(seeded, so every run is the same), with usernames, names and surnames
+made of syllables, so many of them share their first letters. It doesn't
+need a database: the users are given to the index in batches, like the
+scan of the table does.
+
+It reports the time to build the index and its memory per million users,
+the peak of memory of the process (it's while it's built), and in microseconds (p50 and p95)
+the latency of completing prefixes of 1 to 4 letters and of renaming a
+user.
+Run it from the root folder with:
+`python benchmarks/autocomplete_index_benchmark.py`
+"""
+import random
+import resource
+import statistics
+import time
+from service.autocomplete_index import AutocompleteIndex
+
+SEED = 45
+USERS = 1000000
+SYLLABLES = ["al", "an", "be", "ca", "da", "el", "fe", "ju", "ma", "ni", "ro", "sa"]
+PAGE = 10
+SAMPLES = 2000
+BATCH_SIZE = 2000
+
+
+def word(generator, syllables):
+    """
+    Returns a word of that many random syllables.
+    """
+    return "".join(generator.choice(SYLLABLES) for _ in range(syllables))
+
+
+def user_rows():
+    """
+    Generator of the (id, username, name, surname) rows in batches, sorted
+    by id.
+    """
+    generator = random.Random(SEED)
+    for start in range(1, USERS + 1, BATCH_SIZE):
+        yield [
+            (
+                user_id,
+                word(generator, 3) + str(user_id),
+                word(generator, 2).capitalize(),
+                word(generator, 3).capitalize(),
+            )
+            for user_id in range(start, min(start + BATCH_SIZE, USERS + 1))
+        ]
+
+
+def micros(samples):
+    """
+    Returns the p50 and p95 of the samples, in microseconds.
+    """
+    quantiles = statistics.quantiles(samples, n=20)
+    return quantiles[9] * 1e6, quantiles[18] * 1e6
+
+
+def main():
+    """
+    Runs the benchmark and prints the results.
+    """
+    index = AutocompleteIndex()
+    start = time.perf_counter()
+    index.load(user_rows())
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in KB (on linux), of the whole process.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    size = index.size()
+    print(
+        f"{USERS:,} users loaded in {elapsed:.1f} s: {size / 2**20:.1f} MB,"
+        f" {size / 2**20 * 1000000 / USERS:.1f} MB per million users,"
+        f" {peak / 2**20:.0f} MB peak of the process"
+    )
+
+    generator = random.Random(SEED)
+    for letters in (1, 2, 3, 4):
+        samples = []
+        for _ in range(SAMPLES):
+            prefix = word(generator, 2)[:letters]
+            start = time.perf_counter()
+            index.complete(prefix, PAGE)
+            samples.append(time.perf_counter() - start)
+        p50, p95 = micros(samples)
+        print(f"complete {letters} letters: {p50:.1f} us p50, {p95:.1f} us p95")
+
+    samples = []
+    for user_id in generator.sample(range(1, USERS + 1), SAMPLES):
+        start = time.perf_counter()
+        index.set_user(user_id, "renamed" + str(user_id), "Name", "Surname")
+        samples.append(time.perf_counter() - start)
+    p50, p95 = micros(samples)
+    print(f"rename: {p50:.1f} us p50, {p95:.1f} us p95")
+
+
+if __name__ == "__main__":
+    main()
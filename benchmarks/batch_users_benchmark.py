@@ -0,0 +1,107 @@
+# batch_users_benchmark.py
+"""
+Benchmark of getting many users one by one (one query per user, like the
+other services do today) against getting them with one batch.
+
+It needs a database, run it from the root folder with:
+`DB_URI=... python benchmarks/batch_users_benchmark.py`
+"""
+import datetime
+import time
+from sqlalchemy import insert
+from repository.tables.users import User
+from repository.user_repository import session
+from service.user_handler import UserHandler
+
+USERS = 500
+BATCH_SIZES = (10, 100, 500)
+PREFIX = "bench_batch_"
+FIELDS = ["id", "username", "name", "last_name", "avatar"]
+
+handler = UserHandler()
+
+
+def create_users(ammount=USERS):
+    """
+    Inserts the users of the benchmark and returns their usernames.
+    """
+    usernames = [PREFIX + str(i) for i in range(ammount)]
+    session.execute(
+        insert(User),
+        [
+            {
+                "email": username + "@bench.com",
+                "username": username,
+                "name": "Bench",
+                "surname": "User",
+                "password": "not_a_hash",
+                "date_of_birth": datetime.datetime(2000, 1, 1),
+                "bio": "",
+                "avatar": "",
+                "location": "",
+                "blocked": False,
+                "is_public": True,
+            }
+            for username in usernames
+        ],
+    )
+    session.commit()
+    return usernames
+
+
+def remove_users():
+    """
+    Removes the users of the benchmark.
+    """
+    session.query(User).filter(User.username.like(PREFIX + "%")).delete(
+        synchronize_session=False
+    )
+    session.commit()
+
+
+def one_by_one(usernames):
+    """
+    Gets every user with its own query.
+    """
+    return [handler.get_user_username(username) for username in usernames]
+
+
+def batch(usernames):
+    """
+    Gets every user with one batch.
+    """
+    return handler.get_users_batch({"usernames": usernames}, FIELDS)
+
+
+def measure(function, usernames, repeat=5):
+    """
+    Returns the best time (in milliseconds) of calling function.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        session.expunge_all()
+        start = time.perf_counter()
+        function(usernames)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    """
+    Runs the benchmark and prints the results.
+    """
+    remove_users()
+    usernames = create_users()
+    try:
+        print(f"{'users':>6} {'one by one (ms)':>16} {'batch (ms)':>11} {'speedup':>8}")
+        for size in BATCH_SIZES:
+            sample = usernames[:size]
+            slow = measure(one_by_one, sample)
+            fast = measure(batch, sample)
+            print(f"{size:>6} {slow:>16.2f} {fast:>11.2f} {slow / fast:>7.1f}x")
+    finally:
+        remove_users()
+
+
+if __name__ == "__main__":
+    main()
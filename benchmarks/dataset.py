@@ -0,0 +1,233 @@
+# dataset.py
+"""
+Seeded synthetic dataset for the benchmarks: users, follows and interests
+that look like the real ones, so the queries see realistic selectivity.
+
+- Names and surnames are drawn from lists of common ones with Zipf
+  weights (a few are very common, most are rare), and every username is
+  built from them, so searching a name matches many users.
+- Who follows who is a power law both ways: how many users someone
+  follows is a Pareto variable around FOLLOWING, and who it follows is
+  drawn with Zipf weights over a shuffled ranking of the users, so a few
+  users have a big part of the followers and most have a handful.
+- The interests are drawn from a catalog of CATALOG interests with Zipf
+  weights, 1 to 8 per user.
+
+The same seed gives the same dataset. Its users have emails @DOMAIN and
+its interests start with INTEREST_PREFIX, so it can be removed without
+touching anything else. It's loaded with batched inserts, see
+benchmarks/suite.py.
+"""
+import random
+from datetime import datetime, timedelta
+from itertools import accumulate
+from sqlalchemy import delete, func, insert, select, update
+from repository.user_repository import engine
+from repository.tables.users import User, Following, InterestCatalog, Interests
+
+SEED = 46
+USERS = 10000
+FOLLOWING = 50
+CATALOG = 2000
+DOMAIN = "bench.synthetic"
+INTEREST_PREFIX = "bench "
+# Every user of the dataset has this password (its hash is computed once).
+PASSWORD = "Bench_password123"
+BATCH_SIZE = 5000
+
+# The exponents of the Zipf weights and of the Pareto out-degrees.
+NAME_EXPONENT = 1.1
+POPULARITY_EXPONENT = 1.0
+INTEREST_EXPONENT = 1.0
+FOLLOWING_EXPONENT = 2.0
+
+FIRST_NAMES = """
+Sofia Mateo Valentina Santiago Martina Benjamin Isabella Thiago Catalina
+Joaquin Emilia Lautaro Camila Tomas Lucia Felipe Victoria Bautista Julieta
+Juan Agustina Lucas Mia Nicolas Florencia Martin Delfina Facundo Paula
+Ignacio Micaela Franco Carolina Gonzalo Rocio Federico Milagros Matias
+Antonella Diego Abril Alejandro Ana Pablo Maria Sebastian Laura Manuel
+""".split()
+SURNAMES = """
+Gonzalez Rodriguez Gomez Fernandez Lopez Diaz Martinez Perez Garcia Sanchez
+Romero Sosa Alvarez Torres Ruiz Ramirez Flores Acosta Benitez Medina Suarez
+Herrera Aguirre Pereyra Gutierrez Gimenez Molina Silva Castro Rojas Ortiz
+Nuñez Luna Juarez Cabrera Rios Ferreyra Godoy Morales Dominguez Moreno
+Peralta Vega Carrizo Quiroga Castillo Ledesma Muñoz Ojeda Ponce Vera
+""".split()
+
+
+def _zipf_weights(size, exponent):
+    """
+    Returns the cumulative Zipf weights of size ranks, for random.choices.
+    """
+    return list(accumulate(1 / (rank + 1) ** exponent for rank in range(size)))
+
+
+class Dataset:
+    """
+    A synthetic dataset, see the module docstring. Its rows are generated
+    in batches when they're asked for, they're never all in memory.
+    """
+
+    def __init__(self, users=USERS, following=FOLLOWING, seed=SEED):
+        self.users = users
+        self.following = following
+        self.seed = seed
+
+    def user_rows(self, password_hash):
+        """
+        Generator of batches of the columns of the users, in order.
+        """
+        generator = random.Random(self.seed)
+        first_names = _zipf_weights(len(FIRST_NAMES), NAME_EXPONENT)
+        surnames = _zipf_weights(len(SURNAMES), NAME_EXPONENT)
+        created = datetime(2023, 1, 1)
+        batch = []
+        for index in range(self.users):
+            name = generator.choices(FIRST_NAMES, cum_weights=first_names)[0]
+            surname = generator.choices(SURNAMES, cum_weights=surnames)[0]
+            username = f"{name}.{surname}{index}".lower()
+            batch.append(
+                {
+                    "email": f"{username}@{DOMAIN}",
+                    "username": username,
+                    "name": name,
+                    "surname": surname,
+                    "password": password_hash,
+                    "date_of_birth": datetime(1970, 1, 1)
+                    + timedelta(days=generator.randrange(365 * 40)),
+                    "bio": "",
+                    "avatar": "",
+                    "location": "",
+                    "blocked": index % 500 == 499,
+                    "is_public": index % 7 != 6,
+                    "created_at": created + timedelta(minutes=index),
+                }
+            )
+            if len(batch) == BATCH_SIZE:
+                yield batch
+                batch = []
+        yield batch
+
+    def following_rows(self, ids):
+        """
+        Generator of batches of (user_id, following_id) of the users with
+        these ids (in the order of user_rows), without repeated relations.
+        """
+        generator = random.Random(self.seed + 1)
+        ranking = list(ids)
+        generator.shuffle(ranking)
+        popularity = _zipf_weights(len(ranking), POPULARITY_EXPONENT)
+        # The mean of paretovariate(a) is a / (a - 1).
+        scale = self.following * (FOLLOWING_EXPONENT - 1) / FOLLOWING_EXPONENT
+        batch = []
+        for user_id in ids:
+            degree = int(scale * generator.paretovariate(FOLLOWING_EXPONENT))
+            degree = min(degree, len(ids) - 1)
+            followees = set(
+                generator.choices(ranking, cum_weights=popularity, k=degree)
+            )
+            followees.discard(user_id)
+            batch.extend((user_id, followee) for followee in sorted(followees))
+            if len(batch) >= BATCH_SIZE:
+                yield batch
+                batch = []
+        yield batch
+
+    def interest_rows(self, ids, catalog_ids):
+        """
+        Generator of batches of (user_id, interest_id) of the users with
+        these ids, with interests of catalog_ids (the most popular first).
+        """
+        generator = random.Random(self.seed + 2)
+        popularity = _zipf_weights(len(catalog_ids), INTEREST_EXPONENT)
+        batch = []
+        for user_id in ids:
+            interests = generator.choices(
+                catalog_ids, cum_weights=popularity, k=generator.randint(1, 8)
+            )
+            batch.extend((user_id, interest) for interest in sorted(set(interests)))
+            if len(batch) >= BATCH_SIZE:
+                yield batch
+                batch = []
+        yield batch
+
+
+def _insert(connection, table, rows):
+    """
+    Inserts the batches of rows (dicts of the columns) into the table and
+    returns how many there were.
+    """
+    count = 0
+    for batch in rows:
+        if batch:
+            connection.execute(insert(table), batch)
+            count += len(batch)
+    return count
+
+
+def load(dataset, password_hash):
+    """
+    Loads the dataset into the database (removing the previous one) and
+    returns how many users, relations and interests it has, and the ids
+    of the users in the order they were generated.
+    """
+    remove()
+    with engine.begin() as connection:
+        users = _insert(connection, User.__table__, dataset.user_rows(password_hash))
+        ids = list(
+            connection.scalars(
+                select(User.id).where(User.email.like("%@" + DOMAIN)).order_by(User.id)
+            )
+        )
+        catalog_ids = list(
+            connection.scalars(
+                insert(InterestCatalog.__table__).returning(InterestCatalog.id),
+                [
+                    {"name": f"{INTEREST_PREFIX}{rank}", "users": 0}
+                    for rank in range(CATALOG)
+                ],
+                execution_options={"sort_by_parameter_order": True},
+            )
+        )
+        relations = _insert(
+            connection,
+            Following.__table__,
+            (
+                [{"user_id": row[0], "following_id": row[1]} for row in batch]
+                for batch in dataset.following_rows(ids)
+            ),
+        )
+        interests = _insert(
+            connection,
+            Interests.__table__,
+            (
+                [{"user_id": row[0], "interest_id": row[1]} for row in batch]
+                for batch in dataset.interest_rows(ids, catalog_ids)
+            ),
+        )
+        connection.execute(
+            update(InterestCatalog)
+            .where(InterestCatalog.id.in_(catalog_ids))
+            .values(
+                users=select(func.count())
+                .where(Interests.interest_id == InterestCatalog.id)
+                .scalar_subquery()
+            )
+        )
+    return {"users": users, "relations": relations, "interests": interests, "ids": ids}
+
+
+def remove():
+    """
+    Removes the users of the datasets (their relations and interests go
+    with them) and their interests from the catalog.
+    """
+    with engine.begin() as connection:
+        connection.execute(delete(User).where(User.email.like("%@" + DOMAIN)))
+        connection.execute(
+            delete(InterestCatalog).where(
+                InterestCatalog.name.like(INTEREST_PREFIX + "%")
+            )
+        )
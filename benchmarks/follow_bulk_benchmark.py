@@ -0,0 +1,116 @@
+# follow_bulk_benchmark.py
+"""
+Benchmark of following (and then unfollowing) many accounts, like the
+suggestions of the onboarding: one /follow/{email} per target against a
+single /follow/bulk.
+
+It reports the milliseconds and the queries for all the targets.
+It needs a database, run it from the root folder with:
+`DB_URI=... python benchmarks/follow_bulk_benchmark.py`
+"""
+import datetime
+import time
+from sqlalchemy import event, insert
+from repository.tables.users import User
+from repository.user_repository import engine, session
+from service.follow_handler import FollowHandler
+
+TARGETS = (20, 200)
+PREFIX = "bench_bulk_"
+FOLLOWER = PREFIX + "follower@bench.com"
+
+handler = FollowHandler()
+queries = [0]
+
+
+def _count_query(*_):
+    queries[0] += 1
+
+
+def create_users(targets):
+    """
+    Inserts the follower and the targets, and returns the follower's id
+    and the targets' emails.
+    """
+    emails = [FOLLOWER] + [PREFIX + str(i) + "@bench.com" for i in range(targets)]
+    session.execute(
+        insert(User),
+        [
+            {
+                "email": email,
+                "username": email.split("@")[0],
+                "name": "Bulk",
+                "surname": "Target",
+                "password": "password",
+                "date_of_birth": datetime.datetime(1999, 9, 9),
+                "bio": "",
+                "avatar": "",
+                "location": "",
+            }
+            for email in emails
+        ],
+    )
+    session.commit()
+    follower_id = session.query(User.id).filter(User.email == FOLLOWER).scalar()
+    return follower_id, emails[1:]
+
+
+def remove_users():
+    """
+    Removes the users of the benchmark (and their relations).
+    """
+    session.query(User).filter(User.email.like(PREFIX + "%")).delete(
+        synchronize_session=False
+    )
+    session.commit()
+
+
+def one_by_one(_, emails):
+    """
+    A request per target, like the app does today.
+    """
+    for email in emails:
+        handler.create_follow(FOLLOWER, email)
+    for email in emails:
+        handler.remove_follow(FOLLOWER, email)
+
+
+def bulk(follower_id, emails):
+    """
+    One request to follow every target and one to unfollow them.
+    """
+    handler.follow_many(follower_id, {"emails": emails})
+    handler.unfollow_many(follower_id, {"emails": emails})
+
+
+def measure(function, follower_id, emails):
+    """
+    Returns the milliseconds and the queries of the function.
+    """
+    queries[0] = 0
+    event.listen(engine, "before_cursor_execute", _count_query)
+    start = time.perf_counter()
+    function(follower_id, emails)
+    elapsed = time.perf_counter() - start
+    event.remove(engine, "before_cursor_execute", _count_query)
+    return elapsed * 1000, queries[0]
+
+
+def main():
+    """
+    Runs the benchmark and prints the results.
+    """
+    print(f"{'':>10} {'targets':>8} {'ms':>9} {'queries':>8}")
+    try:
+        for targets in TARGETS:
+            remove_users()
+            follower_id, emails = create_users(targets)
+            for name, function in (("one by one", one_by_one), ("bulk", bulk)):
+                millis, count = measure(function, follower_id, emails)
+                print(f"{name:>10} {targets:>8} {millis:>9.1f} {count:>8}")
+    finally:
+        remove_users()
+
+
+if __name__ == "__main__":
+    main()
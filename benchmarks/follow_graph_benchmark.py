@@ -0,0 +1,131 @@
+# follow_graph_benchmark.py
+"""
+Benchmark of the in-process follow graph index on a synthetic power-law
+graph of 10M relations between 1M users (seeded, so every run is the
+same). It doesn't need a database: the relations are given to the index
+in batches, like the streaming scan of the table does.
+
+It reports the time to build it, the memory it takes and the latency
+of its queries and updates in microseconds (p50 and p95).
+Run it from the root folder with:
+`python benchmarks/follow_graph_benchmark.py`
+"""
+import random
+import statistics
+import time
+from array import array
+from itertools import accumulate
+from service.follow_graph import FollowGraph
+
+SEED = 39
+USERS = 1000000
+EDGES = 10000000
+# Exponents of the out-degree (how many each one follows) and of the
+# popularity of the users (how likely each one is to be followed).
+OUT_DEGREE_ALPHA = 1.5
+OUT_DEGREE_SCALE = 4
+MAX_OUT_DEGREE = 5000
+POPULARITY_EXPONENT = 0.8
+BATCH_SIZE = 2000
+SAMPLES = 2000
+
+
+def relations():
+    """
+    Returns the (user_id, following_id) relations, sorted like the scan of
+    the table, as two int arrays so they take less memory than the index.
+    """
+    generator = random.Random(SEED)
+    popularity = list(
+        accumulate(1 / (rank + 1) ** POPULARITY_EXPONENT for rank in range(USERS))
+    )
+    popular_first = list(range(1, USERS + 1))
+    generator.shuffle(popular_first)
+    users, followees = array("i"), array("i")
+    for user_id in range(1, USERS + 1):
+        degree = int(generator.paretovariate(OUT_DEGREE_ALPHA) * OUT_DEGREE_SCALE)
+        chosen = set(
+            generator.choices(
+                popular_first, cum_weights=popularity, k=min(degree, MAX_OUT_DEGREE)
+            )
+        )
+        chosen.discard(user_id)
+        chosen = sorted(chosen)[: EDGES - len(followees)]
+        users.extend([user_id] * len(chosen))
+        followees.extend(chosen)
+        if len(followees) == EDGES:
+            break
+    return users, followees
+
+
+def batches(users, followees):
+    """
+    Generator of the relations in batches of rows, like the streaming scan.
+    """
+    for start in range(0, len(users), BATCH_SIZE):
+        end = start + BATCH_SIZE
+        yield zip(users[start:end], followees[start:end])
+
+
+def microseconds(function, arguments):
+    """
+    Returns the p50 and p95 of calling the function with every argument
+    tuple, in microseconds.
+    """
+    samples = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(*argument)
+        samples.append(time.perf_counter() - start)
+    quantiles = statistics.quantiles(samples, n=20)
+    return quantiles[9] * 1e6, quantiles[18] * 1e6
+
+
+def main():
+    """
+    Runs the benchmark and prints the results.
+    """
+    start = time.perf_counter()
+    users, followees = relations()
+    print(f"{len(users):,} relations generated in {time.perf_counter() - start:.1f} s")
+
+    graph = FollowGraph(max_delta=EDGES)
+    start = time.perf_counter()
+    graph.load(batches(users, followees))
+    print(f"index built in {time.perf_counter() - start:.1f} s")
+    del users, followees
+    size = graph.size()
+    print(
+        f"arrays: {size / 2**20:.1f} MB, {size / graph.edges():.1f} bytes per"
+        " relation (with the offsets)"
+    )
+
+    generator = random.Random(SEED)
+    pairs = [
+        (generator.randint(1, USERS), generator.randint(1, USERS))
+        for _ in range(SAMPLES)
+    ]
+    users = [(user_id,) for user_id, _ in pairs]
+    print(f"{'':>22} {'p50 us':>9} {'p95 us':>9}")
+    for name, function, arguments in (
+        ("is_following", graph.is_following, pairs),
+        ("followers_count", graph.followers_count, users),
+        ("common_following", graph.common_following, pairs),
+        ("following_that_follow", graph.following_that_follow, pairs),
+        ("two_hop", graph.two_hop, users[:200]),
+        ("follow", graph.follow, pairs),
+        ("unfollow", graph.unfollow, pairs),
+    ):
+        p50, p95 = microseconds(function, arguments)
+        print(f"{name:>22} {p50:>9.1f} {p95:>9.1f}")
+
+    graph.max_delta = 0
+    start = time.perf_counter()
+    graph.follow(1, 2)
+    print(f"follow that starts the merge: {time.perf_counter() - start:.3f} s")
+    graph.wait_for_merge()
+    print(f"merging the changes into the arrays: {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# following_export_benchmark.py
+"""
+Benchmark of the export of the following relations on /following:
+loading every relation as an ORM entity and encoding the list (how it
+was done before) against streaming them from a server-side cursor.
+
+It reports the peak memory and the rows per second for two sizes of the
+graph: the peak of the stream must stay the same when the graph grows.
+It needs a database, run it from the root folder with:
+`DB_URI=... python benchmarks/following_export_benchmark.py`
+"""
+import datetime
+import time
+import tracemalloc
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import insert
+from repository.tables.users import User, Following
+from repository.user_repository import session, get_following_relations
+from service.follow_handler import FollowHandler
+from control.utils.serialization import FOLLOWING_EXPORT_FIELDS
+from control.utils.streaming import encode_batches
+
+USERS = 2000
+# Every user follows this many users, for each run:
+FOLLOWS_PER_USER = (10, 50)
+PREFIX = "bench_export_"
+
+handler = FollowHandler()
+
+
+def create_users():
+    """
+    Inserts the users of the benchmark and returns their ids.
+    """
+    users = []
+    for i in range(USERS):
+        username = PREFIX + str(i)
+        users.append(
+            {
+                "username": username,
+                "email": username + "@bench.com",
+                "password": "password",
+                "name": "Bench",
+                "surname": "Export",
+                "date_of_birth": datetime.datetime(2000, 1, 1),
+                "bio": "",
+                "avatar": "",
+                "location": "",
+            }
+        )
+    session.execute(insert(User), users)
+    session.commit()
+    ids = session.query(User.id).filter(User.username.like(PREFIX + "%"))
+    return sorted(user_id for (user_id,) in ids)
+
+
+def create_follows(ids, follows_per_user):
+    """
+    Replaces the relations of the users of the benchmark.
+    """
+    session.query(Following).filter(Following.user_id.in_(ids)).delete(
+        synchronize_session=False
+    )
+    session.execute(
+        insert(Following),
+        [
+            {"user_id": user_id, "following_id": ids[(index + step) % len(ids)]}
+            for index, user_id in enumerate(ids)
+            for step in range(1, follows_per_user + 1)
+        ],
+    )
+    session.commit()
+
+
+def remove_users():
+    """
+    Removes the users of the benchmark (and their relations).
+    """
+    session.query(User).filter(User.username.like(PREFIX + "%")).delete(
+        synchronize_session=False
+    )
+    session.commit()
+
+
+def export_list(ids):
+    """
+    How the export was done before: every entity in memory.
+    """
+    relations = [
+        relation
+        for relation in get_following_relations()
+        if ids[0] <= relation.user_id <= ids[-1]
+    ]
+    body = jsonable_encoder(relations)
+    session.expunge_all()
+    return len(body)
+
+
+def export_stream(ids):
+    """
+    How the export is done now.
+    """
+    filters = {"min_user_id": ids[0], "max_user_id": ids[-1]}
+    batches = handler.stream_following_relations(filters)
+    rows = 0
+    for chunk in encode_batches(batches, FOLLOWING_EXPORT_FIELDS, "ndjson"):
+        rows += chunk.count(b"\n")
+    return rows
+
+
+def measure(function, ids):
+    """
+    Returns the peak of memory in MB and the seconds it took.
+    """
+    start = time.perf_counter()
+    function(ids)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function(ids)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1_000_000, elapsed
+
+
+def main():
+    """
+    Runs the benchmark and prints the results.
+    """
+    remove_users()
+    ids = create_users()
+    try:
+        print(f"{'':>8} {'relations':>10} {'peak MB':>8} {'rows/s':>10}")
+        for follows_per_user in FOLLOWS_PER_USER:
+            create_follows(ids, follows_per_user)
+            relations = len(ids) * follows_per_user
+            for name, function in (("list", export_list), ("stream", export_stream)):
+                peak, elapsed = measure(function, ids)
+                print(
+                    f"{name:>8} {relations:>10,} {peak:>8.1f} "
+                    f"{relations / elapsed:>10,.0f}"
+                )
+    finally:
+        remove_users()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# graph_snapshot_benchmark.py
+"""
+Benchmark of the binary graph snapshots on the same synthetic graph of
+10M relations between 1M users as follow_graph_benchmark. It doesn't
+need a database: the rows are given to the writer in batches, like the
+scan of the tables does.
+
+It reports the time to write the snapshot and its size, the time to open
+it (it's mapped, not read), the latency of decoding the list of a user
+in microseconds (p50 and p95) and the time to load follow_graph from it.
+Run it from the root folder with:
+`python benchmarks/graph_snapshot_benchmark.py`
+"""
+import os
+import random
+import statistics
+import tempfile
+import time
+from benchmarks.follow_graph_benchmark import (
+    SEED,
+    USERS,
+    BATCH_SIZE,
+    SAMPLES,
+    relations,
+    batches,
+)
+from service.follow_graph import FollowGraph
+from service.graph_snapshot import GraphSnapshot, write
+
+
+def user_rows():
+    """
+    Generator of the users in batches of (id, username, blocked, is_public).
+    """
+    for start in range(1, USERS + 1, BATCH_SIZE):
+        yield [
+            (user_id, "user_" + str(user_id), user_id % 50 == 0, user_id % 7 != 0)
+            for user_id in range(start, min(start + BATCH_SIZE, USERS + 1))
+        ]
+
+
+def main():
+    """
+    Runs the benchmark and prints the results.
+    """
+    users, followees = relations()
+    path = os.path.join(tempfile.mkdtemp(), "graph.snap")
+
+    start = time.perf_counter()
+    stats = write(path, user_rows(), batches(users, followees))
+    print(
+        f"{stats['edges']:,} relations of {stats['users']:,} users written in"
+        f" {time.perf_counter() - start:.1f} s: {stats['bytes'] / 2**20:.1f} MB,"
+        f" {stats['bytes'] / stats['edges']:.2f} bytes per relation (with the users)"
+    )
+    del users, followees
+
+    start = time.perf_counter()
+    snapshot = GraphSnapshot(path)
+    print(f"opened in {(time.perf_counter() - start) * 1e6:.0f} us")
+
+    generator = random.Random(SEED)
+    samples = []
+    for user_id in generator.sample(range(1, USERS + 1), SAMPLES):
+        start = time.perf_counter()
+        snapshot.following(user_id)
+        samples.append(time.perf_counter() - start)
+    quantiles = statistics.quantiles(samples, n=20)
+    print(
+        f"following of a user: {quantiles[9] * 1e6:.1f} us p50,"
+        f" {quantiles[18] * 1e6:.1f} us p95"
+    )
+
+    graph = FollowGraph(max_delta=stats["edges"])
+    start = time.perf_counter()
+    graph.load(snapshot.rows(BATCH_SIZE))
+    print(f"follow_graph loaded from it in {time.perf_counter() - start:.1f} s")
+    snapshot.close()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
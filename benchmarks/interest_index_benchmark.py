@@ -0,0 +1,112 @@
+# interest_index_benchmark.py
+"""
+Benchmark of the suggestions by interests on a synthetic dataset of 1M
+users (seeded, so every run is the same). Each user has a few interests
+of a vocabulary where some interests are much more popular than others
+(Zipf), so the popular ones are in a big part of the users. It doesn't
+need a database: the interests are given to the index in batches, like
+the scan of the table does.
+
+It reports the time to build the index, its memory and, in
+milliseconds (p50 and p95), the latency of finding the candidates of a
+page of suggestions (twice as many as the page, like the handler) and
+of changing the interests of a user.
+Run it from the root folder with:
+`python benchmarks/interest_index_benchmark.py`
+"""
+import random
+import statistics
+import time
+from itertools import accumulate, islice
+from service.interest_index import InterestIndex
+
+SEED = 40
+USERS = 1000000
+VOCABULARY = 2000
+ZIPF_EXPONENT = 1.0
+MIN_INTERESTS = 1
+MAX_INTERESTS = 8
+PAGE = 25
+SAMPLES = 500
+BATCH_SIZE = 2000
+
+
+def interests_of_every_user():
+    """
+    Returns a dict from every user's id to its interests.
+    """
+    generator = random.Random(SEED)
+    # The interests are ids of the catalog, the most popular first.
+    vocabulary = list(range(1, VOCABULARY + 1))
+    popularity = list(
+        accumulate(1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(VOCABULARY))
+    )
+    return {
+        user_id: set(
+            generator.choices(
+                vocabulary,
+                cum_weights=popularity,
+                k=generator.randint(MIN_INTERESTS, MAX_INTERESTS),
+            )
+        )
+        for user_id in range(1, USERS + 1)
+    }
+
+
+def rows(interests):
+    """
+    Generator of the (user_id, interest_id) rows in batches, sorted by user_id.
+    """
+    batch = []
+    for user_id, interest_ids in interests.items():
+        batch.extend((user_id, interest_id) for interest_id in sorted(interest_ids))
+        if len(batch) >= BATCH_SIZE:
+            yield batch
+            batch = []
+    yield batch
+
+
+def millis(samples):
+    """
+    Returns the p50 and p95 of the samples (in seconds) in milliseconds.
+    """
+    quantiles = statistics.quantiles(samples, n=20)
+    return quantiles[9] * 1000, quantiles[18] * 1000
+
+
+def main():
+    """
+    Runs the benchmark and prints the results.
+    """
+    interests = interests_of_every_user()
+    memberships = sum(len(names) for names in interests.values())
+    index = InterestIndex()
+    start = time.perf_counter()
+    index.load(rows(interests))
+    print(
+        f"{USERS:,} users with {memberships:,} interests, index built in"
+        f" {time.perf_counter() - start:.1f} s, {index.size() / 2**20:.1f} MB"
+    )
+    print(f"users of the most popular interest: {index.users(1):,}")
+
+    generator = random.Random(SEED)
+    users = generator.sample(range(1, USERS + 1), SAMPLES)
+    pages, changes = [], []
+    for user_id in users:
+        start = time.perf_counter()
+        list(islice(index.ranked(interests[user_id], user_id), PAGE * 2))
+        pages.append(time.perf_counter() - start)
+        new_interests = {generator.randint(1, VOCABULARY)}
+        start = time.perf_counter()
+        index.set_interests(user_id, interests[user_id], new_interests)
+        changes.append(time.perf_counter() - start)
+        interests[user_id] = new_interests
+
+    print(f"{'':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, samples in (("page", pages), ("change", changes)):
+        p50, p95 = millis(samples)
+        print(f"{name:>8} {p50:>8.2f} {p95:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# logging_benchmark.py
+"""
+Benchmark of the time a route spends logging, that is, the time
+logger.info takes on the thread that calls it.
+
+Run it from the root folder with:
+`python benchmarks/logging_benchmark.py`
+"""
+import logging
+import os
+import time
+from control.utils.logger import configure_logger
+
+CALLS = 50_000
+# The routes log around two records per request.
+LOGS_PER_REQUEST = 2
+# stdout of a pod is a pipe, when the collector is slow writes block.
+SLOW_WRITE_SECONDS = 0.00005
+
+
+class SlowStream:
+    """
+    Stream that takes a while on every write, like a busy pipe.
+    """
+
+    def write(self, _text):
+        """
+        Waits instead of writing.
+        """
+        time.sleep(SLOW_WRITE_SECONDS)
+
+    def flush(self):
+        """
+        Nothing to flush.
+        """
+
+
+def measure(bench_logger, calls=CALLS):
+    """
+    Returns the microseconds per request spent in logger.info.
+    """
+    start = time.perf_counter()
+    for index in range(calls):
+        bench_logger.info("User %s got the number of followers of %s", index, "email")
+    return (time.perf_counter() - start) / calls * 1e6 * LOGS_PER_REQUEST
+
+
+def create_settings(name, log_format="json", level_rates=None):
+    """
+    Returns the settings for configure_logger.
+    """
+    return {
+        "name": name,
+        "level": "INFO",
+        "format": log_format,
+        "level_rates": level_rates or {},
+        "route_rates": {},
+    }
+
+
+def main():
+    """
+    Prints the cost per request of each logging setup.
+    """
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        for stream_name, stream in (("devnull", devnull), ("slow pipe", SlowStream())):
+            # What the routes did before: format and write on the request thread.
+            direct = logging.getLogger("bench-direct-" + stream_name)
+            direct.propagate = False
+            direct.setLevel(logging.INFO)
+            handler = logging.StreamHandler(stream)
+            handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+            direct.addHandler(handler)
+            name = f"direct StreamHandler ({stream_name})"
+            print(f"{name:<48} {measure(direct):8.2f} us/request")
+
+            for name, settings in {
+                "queue + json": create_settings("bench-json"),
+                "queue + text": create_settings("bench-text", "text"),
+                "queue + json, INFO sampled 10%": create_settings(
+                    "bench-sampled", level_rates={"INFO": 0.1}
+                ),
+            }.items():
+                bench_logger, listener = configure_logger(settings, stream)
+                name = f"{name} ({stream_name})"
+                print(f"{name:<48} {measure(bench_logger):8.2f} us/request")
+                listener.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# metrics_benchmark.py
+"""
+Benchmark of the cost of recording metrics on the hot path.
+
+Run it from the root folder with:
+`python benchmarks/metrics_benchmark.py`
+"""
+import threading
+import time
+from control.utils.prometheus import Registry
+
+ITERATIONS = 1_000_000
+THREADS = 8
+
+
+def _noop(_value):
+    return None
+
+
+def measure(function, iterations=ITERATIONS):
+    """
+    Returns the nanoseconds per call of function.
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function(0.003)
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def measure_threads(function, threads=THREADS, iterations=ITERATIONS // THREADS):
+    """
+    Returns the nanoseconds per call of function when called from many threads.
+    """
+    workers = [
+        threading.Thread(target=measure, args=(function, iterations))
+        for _ in range(threads)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / (threads * iterations) * 1e9
+
+
+def main():
+    """
+    Prints the cost of each operation next to the cost of an empty call.
+    """
+    registry = Registry()
+    counter = registry.counter("bench_total", "Benchmark counter.")
+    histogram = registry.histogram("bench_seconds", "Benchmark histogram.")
+    labeled = registry.histogram(
+        "bench_route_seconds", "Benchmark histogram.", ("method", "route", "status")
+    )
+
+    results = {
+        "empty call (baseline)": measure(_noop),
+        "counter.inc": measure(lambda _: counter.inc()),
+        "histogram.observe": measure(histogram.observe),
+        "labels(...).observe": measure(
+            lambda value: labeled.labels("GET", "/user", "200").observe(value)
+        ),
+        f"histogram.observe x{THREADS} threads": measure_threads(histogram.observe),
+    }
+    for name, nanoseconds in results.items():
+        print(f"{name:<40} {nanoseconds:8.1f} ns/op")
+
+    start = time.perf_counter()
+    registry.render()
+    print(f"{'render (scrape)':<40} {(time.perf_counter() - start) * 1e6:8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# profile_benchmark.py
+"""
+Benchmark of opening a profile with the five requests the app does today
+(user, followers count, following count, is following and is follower)
+against the single /profiles/{username} request.
+
+Every request authenticates the viewer, so that lookup is counted too.
+It needs a database, run it from the root folder with:
+`DB_URI=... python benchmarks/profile_benchmark.py`
+"""
+import time
+from sqlalchemy import event
+from repository.user_repository import engine, session
+from service.user_handler import UserHandler
+from service.follow_handler import FollowHandler
+from service.user import User
+
+ITERATIONS = 200
+FOLLOWERS = 50
+PREFIX = "bench_profile_"
+VIEWER = PREFIX + "viewer"
+OWNER = PREFIX + "owner"
+
+handler = UserHandler()
+follow_handler = FollowHandler()
+queries = [0]
+
+
+def _count_query(*_):
+    queries[0] += 1
+
+
+def create_user(username):
+    """
+    Saves a user for the benchmark.
+    """
+    User(
+        email=username + "@bench.com",
+        password="not_a_hash",
+        name="Bench",
+        surname="User",
+        username=username,
+        date_of_birth="2000 1 1",
+        bio="",
+        avatar="",
+        location="",
+        blocked=False,
+    ).save()
+
+
+def create_users():
+    """
+    Creates the owner of the profile, the viewer and some followers.
+    """
+    for username in [OWNER, VIEWER] + [PREFIX + str(i) for i in range(FOLLOWERS)]:
+        create_user(username)
+        if username != OWNER:
+            follow_handler.create_follow(username + "@bench.com", OWNER + "@bench.com")
+    handler.set_user_interests(OWNER + "@bench.com", "Cars,Cooking,Planes")
+
+
+def remove_users():
+    """
+    Removes the users of the benchmark.
+    """
+    for username in [OWNER, VIEWER] + [PREFIX + str(i) for i in range(FOLLOWERS)]:
+        try:
+            handler.remove_user_email(username + "@bench.com")
+        except Exception:  # pylint: disable=broad-except
+            continue
+
+
+def fan_out(viewer_email, username):
+    """
+    What the app does today: five requests, each one authenticating.
+    """
+    handler.get_user_email(viewer_email)
+    owner = handler.get_user_username(username)
+    handler.get_user_email(viewer_email)
+    follow_handler.get_followers_count(owner.email)
+    handler.get_user_email(viewer_email)
+    follow_handler.get_following_count(owner.email)
+    handler.get_user_email(viewer_email)
+    follow_handler.is_following(viewer_email, owner.email)
+    handler.get_user_email(viewer_email)
+    follow_handler.is_follower(viewer_email, owner.email)
+    handler.get_user_interests(owner.email)
+
+
+def composite(viewer_email, username):
+    """
+    One request to /profiles/{username}.
+    """
+    viewer = handler.get_user_email(viewer_email)
+    handler.get_profile(username, viewer.id)
+
+
+def measure(function):
+    """
+    Returns the milliseconds and the queries per profile.
+    """
+    queries[0] = 0
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        session.expunge_all()
+        function(VIEWER + "@bench.com", OWNER)
+    elapsed = time.perf_counter() - start
+    return elapsed / ITERATIONS * 1000, queries[0] / ITERATIONS
+
+
+def main():
+    """
+    Runs the benchmark and prints the results.
+    """
+    remove_users()
+    create_users()
+    event.listen(engine, "before_cursor_execute", _count_query)
+    try:
+        print(f"{'':>10} {'ms/profile':>11} {'queries':>8}")
+        for name, function in (("fan-out", fan_out), ("composite", composite)):
+            millis, count = measure(function)
+            print(f"{name:>10} {millis:>11.2f} {count:>8.1f}")
+    finally:
+        event.remove(engine, "before_cursor_execute", _count_query)
+        remove_users()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# read_models_benchmark.py
+"""
+Benchmark of reading users as ORM entities (all the columns, plus the
+bookkeeping of the identity map) against the projected read models.
+
+It reports the memory per listed user, the bytes of the values that come
+from the database per row (without the protocol overhead) and the time.
+It needs a database, run it from the root folder with:
+`DB_URI=... python benchmarks/read_models_benchmark.py`
+"""
+import datetime
+import time
+import tracemalloc
+from sqlalchemy import insert
+from repository.queries.user_queries import select_users, as_read_models
+from repository.read_models import AuthUser, UserSummary
+from repository.tables.users import User
+from repository.user_repository import session
+
+USERS = 5000
+PREFIX = "bench_read_"
+# A bcrypt hash and the url of a firebase avatar have these lengths:
+PASSWORD = "$2b$12$" + "x" * 53
+AVATAR = "https://firebasestorage.googleapis.com/v0/b/bucket/o/" + "a" * 120
+
+
+def create_users():
+    """
+    Inserts the users of the benchmark.
+    """
+    session.execute(
+        insert(User),
+        [
+            {
+                "email": PREFIX + str(i) + "@bench.com",
+                "username": PREFIX + str(i),
+                "name": "Bench",
+                "surname": "User",
+                "password": PASSWORD,
+                "date_of_birth": datetime.datetime(2000, 1, 1),
+                "bio": "A short bio",
+                "avatar": AVATAR,
+                "location": "Buenos Aires",
+                "blocked": False,
+                "is_public": True,
+            }
+            for i in range(USERS)
+        ],
+    )
+    session.commit()
+
+
+def remove_users():
+    """
+    Removes the users of the benchmark.
+    """
+    session.query(User).filter(User.username.like(PREFIX + "%")).delete(
+        synchronize_session=False
+    )
+    session.commit()
+
+
+def load_entities():
+    """
+    How the lists were read before.
+    """
+    return session.query(User).filter(User.username.like(PREFIX + "%")).all()
+
+
+def load_summaries():
+    """
+    How the lists and searches are read now.
+    """
+    query = select_users(session, UserSummary, User.username.like(PREFIX + "%"))
+    return as_read_models(UserSummary, query)
+
+
+def load_auth_users():
+    """
+    How the authorization reads the users now.
+    """
+    query = select_users(session, AuthUser, User.username.like(PREFIX + "%"))
+    return as_read_models(AuthUser, query)
+
+
+def payload(users, fields):
+    """
+    Returns the average bytes of the values of the given fields.
+    """
+    total = 0
+    for user in users:
+        for field in fields:
+            total += len(str(getattr(user, field)).encode())
+    return total / len(users)
+
+
+def measure(function):
+    """
+    Returns the users, the bytes allocated per user and the milliseconds.
+    """
+    session.expunge_all()
+    tracemalloc.start()
+    start = time.perf_counter()
+    users = function()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return users, peak / len(users), elapsed * 1000
+
+
+def main():
+    """
+    Runs the benchmark and prints the results.
+    """
+    remove_users()
+    create_users()
+    try:
+        all_columns = [column.name for column in User.__table__.columns]
+        cases = (
+            ("orm entity", load_entities, all_columns),
+            ("UserSummary", load_summaries, UserSummary._fields),
+            ("AuthUser", load_auth_users, AuthUser._fields),
+        )
+        print(f"{'':>12} {'bytes/user':>11} {'payload/row':>12} {'ms':>8}")
+        for name, function, fields in cases:
+            users, memory, millis = measure(function)
+            size = payload(users, fields)
+            print(f"{name:>12} {memory:>11,.0f} {size:>12,.0f} {millis:>8.1f}")
+            del users
+    finally:
+        remove_users()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# serialization_benchmark.py
+"""
+Benchmark of the serialization of lists of users: the old path (a
+UserResponse per row, validated and encoded again by FastAPI) against
+the fast path of control/utils/serialization.py.
+
+Run it from the root folder with:
+`python benchmarks/serialization_benchmark.py`
+"""
+import datetime
+import time
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from control.models.models import UserResponse
+from control.utils.serialization import FastJSONResponse, user_serializer
+from repository.tables.users import User
+
+LIST_SIZES = (25, 1000, 10000)
+MIN_SECONDS = 1.0
+
+
+def create_users(ammount):
+    """
+    Returns users like the ones that come from the database.
+    """
+    users = []
+    for i in range(ammount):
+        user = User(
+            username="username" + str(i),
+            surname="Surname",
+            name="Name",
+            password="not_a_hash",
+            email="user" + str(i) + "@bench.com",
+            date_of_birth=datetime.datetime(2000, 1, 1),
+            bio="A bio that is a bit longer than the others " * 3,
+            avatar="https://storage.example.com/avatars/" + str(i) + ".png",
+            location="Buenos Aires",
+        )
+        user.id = i
+        users.append(user)
+    return users
+
+
+def pydantic_path(users):
+    """
+    What the routes did: a model per row, then FastAPI encodes the list.
+    """
+    response = [
+        UserResponse(
+            email=user.email,
+            name=user.name,
+            last_name=user.surname,
+            username=user.username,
+            date_of_birth=str(user.date_of_birth),
+            bio=user.bio,
+            avatar=user.avatar,
+            location=user.location,
+            blocked=user.blocked,
+            is_public=user.is_public,
+        )
+        for user in users
+    ]
+    return JSONResponse(jsonable_encoder(response)).body
+
+
+def fast_path(users):
+    """
+    What the routes do now.
+    """
+    return FastJSONResponse(user_serializer.to_dicts(users)).body
+
+
+def rows_per_second(function, users):
+    """
+    Calls function until MIN_SECONDS pass and returns the rows per second.
+    """
+    rows = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < MIN_SECONDS:
+        function(users)
+        rows += len(users)
+    return rows / (time.perf_counter() - start)
+
+
+def main():
+    """
+    Runs the benchmark and prints the results.
+    """
+    print(
+        f"{'users':>6} {'pydantic (rows/s)':>18} {'fast (rows/s)':>14} {'speedup':>8}"
+    )
+    for size in LIST_SIZES:
+        users = create_users(size)
+        assert pydantic_path(users) == fast_path(users)
+        slow = rows_per_second(pydantic_path, users)
+        fast = rows_per_second(fast_path, users)
+        print(f"{size:>6} {slow:>18,.0f} {fast:>14,.0f} {fast / slow:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
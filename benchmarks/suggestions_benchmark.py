@@ -0,0 +1,166 @@
+# suggestions_benchmark.py
+"""
+Benchmark of GET /suggestions on a synthetic power-law graph: a few
+users follow thousands, most follow a handful, and the popular users are
+followed by many (preferential attachment). The graph is seeded, so
+every run is the same.
+
+For the users that follow the most it reports the latency of computing
+the suggestions (cache miss), of reading them from the cache (hit) and
+of applying a follow to the cache, in milliseconds (p50 and p95).
+It needs a database, run it from the root folder with:
+`DB_URI=... python benchmarks/suggestions_benchmark.py`
+"""
+import datetime
+import random
+import statistics
+import time
+from itertools import accumulate
+from sqlalchemy import insert
+from repository.tables.users import User, Following
+from repository.user_repository import session
+from service.suggestion_cache import suggestion_cache
+from service.suggestion_handler import SuggestionHandler
+
+SEED = 38
+USERS = 20000
+# Users that follow thousands, the ones the latency targets are for
+# (they draw this many followees, repeated ones are dropped):
+HEAVY_USERS = 20
+HEAVY_FOLLOWEES = 5000
+# Exponents of the out-degree (how many each one follows) and of the
+# popularity of the users (how likely each one is to be followed).
+OUT_DEGREE_ALPHA = 1.5
+POPULARITY_EXPONENT = 0.9
+MAX_OUT_DEGREE = 1000
+INSERT_BATCH = 20000
+PREFIX = "bench_suggest_"
+
+handler = SuggestionHandler()
+
+
+def create_users():
+    """
+    Inserts the users of the benchmark and returns their ids.
+    """
+    rows = []
+    for number in range(USERS):
+        username = PREFIX + str(number)
+        rows.append(
+            {
+                "username": username,
+                "email": username + "@bench.com",
+                "password": "password",
+                "name": "Graph",
+                "surname": "Node",
+                "date_of_birth": datetime.datetime(2001, 2, 3),
+                "bio": "",
+                "avatar": "",
+                "location": "",
+            }
+        )
+    session.execute(insert(User), rows)
+    session.commit()
+    ids = session.query(User.id).filter(User.username.like(PREFIX + "%"))
+    return sorted(user_id for (user_id,) in ids)
+
+
+def power_law_edges(ids):
+    """
+    Returns the (user_id, following_id) pairs of the graph.
+    """
+    generator = random.Random(SEED)
+    popularity = list(
+        accumulate(1 / (rank + 1) ** POPULARITY_EXPONENT for rank in range(len(ids)))
+    )
+    popular_first = ids[:]
+    generator.shuffle(popular_first)
+    edges = []
+    for index, user_id in enumerate(ids):
+        if index < HEAVY_USERS:
+            degree = HEAVY_FOLLOWEES
+        else:
+            degree = min(
+                int(generator.paretovariate(OUT_DEGREE_ALPHA) * 3), MAX_OUT_DEGREE
+            )
+        followees = set(
+            generator.choices(popular_first, cum_weights=popularity, k=degree)
+        )
+        followees.discard(user_id)
+        edges.extend((user_id, followee_id) for followee_id in followees)
+    return edges
+
+
+def insert_edges(edges):
+    """
+    Inserts the relations in batches.
+    """
+    for start in range(0, len(edges), INSERT_BATCH):
+        batch = edges[start : start + INSERT_BATCH]
+        session.execute(
+            insert(Following),
+            [{"user_id": user, "following_id": followed} for user, followed in batch],
+        )
+        session.commit()
+
+
+def remove_users():
+    """
+    Removes the users of the benchmark (and their relations).
+    """
+    session.query(User).filter(User.username.like(PREFIX + "%")).delete(
+        synchronize_session=False
+    )
+    session.commit()
+
+
+def percentiles(samples):
+    """
+    Returns the p50 and p95 of the samples, in milliseconds.
+    """
+    quantiles = statistics.quantiles(samples, n=20)
+    return quantiles[9] * 1000, quantiles[18] * 1000
+
+
+def timed(function, *args):
+    """
+    Returns the seconds the call took.
+    """
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    """
+    Runs the benchmark and prints the results.
+    """
+    remove_users()
+    try:
+        ids = create_users()
+        edges = power_law_edges(ids)
+        insert_edges(edges)
+        heavy = ids[:HEAVY_USERS]
+        heavy_edges = sum(1 for user, _ in edges if user < ids[HEAVY_USERS])
+        print(f"{len(ids):,} users, {len(edges):,} relations")
+        print(
+            f"{len(heavy)} users that follow {heavy_edges // len(heavy):,} on average"
+        )
+
+        suggestion_cache.clear()
+        misses = [timed(handler.get_suggestions, user, 1, 10) for user in heavy]
+        hits = [timed(handler.get_suggestions, user, 1, 10) for user in heavy]
+        # A follow of a popular user, applied to the cached candidates:
+        updates = [timed(handler.followed, user, ids[-1]) for user in heavy]
+
+        print(f"{'':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        for name, samples in (("miss", misses), ("hit", hits), ("follow", updates)):
+            p50, p95 = percentiles(samples)
+            print(f"{name:>8} {p50:>8.2f} {p95:>8.2f}")
+    finally:
+        suggestion_cache.clear()
+        remove_users()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# tracing_benchmark.py
+"""
+Benchmark of the cost of tracing a request with each tracing setting.
+
+Each request is a server span with two child spans, like a route with
+its @tracer.start_as_current_span decorator and a call to the gateway.
+
+Run it from the root folder with:
+`python benchmarks/tracing_benchmark.py`
+"""
+import os
+import time
+from opentelemetry.sdk.trace.export import (
+    ConsoleSpanExporter,
+    SpanExporter,
+    SpanExportResult,
+)
+from control.utils.tracer import build_tracer_provider
+
+REQUESTS = 20_000
+ROUTE = "GET /users/{email}"
+
+
+class NullExporter(SpanExporter):
+    """
+    Exporter that drops everything, to measure only the cost of tracing.
+    """
+
+    def export(self, spans):
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        return None
+
+
+def create_settings(exporter="otlp", sample_ratio=1.0, keep_slow_ms=None):
+    """
+    Returns the settings for build_tracer_provider.
+    """
+    return {
+        "exporter": exporter,
+        "sample_ratio": sample_ratio,
+        "route_ratios": {},
+        "keep_slow_ms": keep_slow_ms,
+    }
+
+
+def measure(provider, requests=REQUESTS):
+    """
+    Returns the microseconds per request spent tracing it.
+    """
+    tracer = provider.get_tracer("benchmark")
+    start = time.perf_counter()
+    for _ in range(requests):
+        with tracer.start_as_current_span(ROUTE) as span:
+            span.set_attribute("http.method", "GET")
+            span.set_attribute("http.status_code", 200)
+            with tracer.start_as_current_span("Get followers - Followers"):
+                with tracer.start_as_current_span("HTTP GET"):
+                    pass
+    elapsed = time.perf_counter() - start
+    if hasattr(provider, "force_flush"):
+        provider.force_flush()
+    return elapsed / requests * 1e6
+
+
+def main():
+    """
+    Prints the cost per request of each setting.
+    """
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        cases = {
+            "none (no-op provider)": build_tracer_provider(create_settings("none")),
+            "ratio 0": build_tracer_provider(
+                create_settings(sample_ratio=0), NullExporter()
+            ),
+            "ratio 0.1": build_tracer_provider(
+                create_settings(sample_ratio=0.1), NullExporter()
+            ),
+            "ratio 1": build_tracer_provider(create_settings(), NullExporter()),
+            "ratio 0.1 + keep slow/errors": build_tracer_provider(
+                create_settings(sample_ratio=0.1, keep_slow_ms=500), NullExporter()
+            ),
+            "ratio 1 + console exporter": build_tracer_provider(
+                create_settings(), ConsoleSpanExporter(out=devnull)
+            ),
+        }
+        for name, provider in cases.items():
+            print(f"{name:<32} {measure(provider):8.2f} us/request")
+            if hasattr(provider, "shutdown"):
+                provider.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# user_export_benchmark.py
+"""
+Benchmark of a report of every user: paging through them MAX_AMMOUNT at
+a time, like the back-office did with /users, against the streamed
+export of /users/admin/export.
+
+It reports the rows per second and the peak memory of both. The pages
+use less memory, but every one of them is an OFFSET query (slower the
+further it goes) and, in production, a request with its own admin check
+on the gateway, which isn't counted here.
+It needs a database, run it from the root folder with:
+`DB_URI=... python benchmarks/user_export_benchmark.py`
+"""
+import datetime
+import time
+import tracemalloc
+from sqlalchemy import insert
+from repository.tables.users import User
+from repository.user_repository import session
+from service.admin_handler import AdminHandler
+from service.user_handler import MAX_AMMOUNT
+from control.utils.serialization import user_serializer, USER_EXPORT_FIELDS
+from control.utils.streaming import encode_batches
+
+USERS = 20000
+PREFIX = "bench_user_export_"
+
+handler = AdminHandler()
+
+
+def bench_user(number):
+    """
+    Returns the values of the user number of the benchmark.
+    """
+    username = PREFIX + str(number)
+    return {
+        "username": username,
+        "email": username + "@bench.com",
+        "password": "password",
+        "name": "Report",
+        "surname": "User",
+        "date_of_birth": datetime.datetime(1990, 5, 17),
+        "bio": "A bio of the report",
+        "avatar": "avatar.png",
+        "location": "Cordoba",
+        "is_public": number % 2 == 0,
+    }
+
+
+def create_users():
+    """
+    Inserts the users of the benchmark.
+    """
+    session.execute(insert(User), [bench_user(i) for i in range(USERS)])
+    session.commit()
+
+
+def remove_users():
+    """
+    Removes the users of the benchmark.
+    """
+    session.query(User).filter(User.username.like(PREFIX + "%")).delete(
+        synchronize_session=False
+    )
+    session.commit()
+
+
+def report_by_pages():
+    """
+    Every page is a request: the users are read and serialized.
+    """
+    rows = 0
+    start = 0
+    page = handler.get_all_users(start, MAX_AMMOUNT)
+    while page:
+        rows += len(user_serializer.to_dicts(page))
+        start += MAX_AMMOUNT
+        page = handler.get_all_users(start, MAX_AMMOUNT)
+    return rows
+
+
+def report_by_export():
+    """
+    A single streamed export.
+    """
+    rows = 0
+    for chunk in encode_batches(handler.stream_users({}), USER_EXPORT_FIELDS, "ndjson"):
+        rows += chunk.count(b"\n")
+    return rows
+
+
+def measure(function):
+    """
+    Returns the rows, the rows per second and the peak of memory in MB.
+    """
+    start = time.perf_counter()
+    rows = function()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rows, rows / elapsed, peak / 1_000_000
+
+
+def main():
+    """
+    Runs the benchmark and prints the results.
+    """
+    remove_users()
+    create_users()
+    try:
+        print(f"{'':>8} {'rows':>8} {'rows/s':>10} {'peak MB':>8}")
+        for name, function in (
+            ("pages", report_by_pages),
+            ("export", report_by_export),
+        ):
+            rows, throughput, peak = measure(function)
+            print(f"{name:>8} {rows:>8,} {throughput:>10,.0f} {peak:>8.1f}")
+    finally:
+        remove_users()
+
+
+if __name__ == "__main__":
+    main()
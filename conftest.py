@@ -1 +1,31 @@
 # para correr pytest
+"""
+Fixtures shared by the tests.
+"""
+from contextlib import contextmanager
+import pytest
+from control.utils.instrumentation import instrument_statements
+from control.utils.query_stats import watch_queries
+from repository.user_repository import engine
+
+
+@pytest.fixture
+def max_queries():
+    """
+    Fixture to check how many statements a block runs at most (a handler,
+    or a route called with a TestClient). It gives the QueryStats, so the
+    test can also check there's no N+1:
+
+        with max_queries(2) as queries:
+            handler.get_all_followers(EMAIL)
+        assert not queries.repeated()
+    """
+    instrument_statements(engine)
+
+    @contextmanager
+    def check(limit):
+        with watch_queries() as queries:
+            yield queries
+        assert queries.count <= limit, queries.describe()
+
+    return check
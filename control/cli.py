@@ -0,0 +1,111 @@
+# cli.py
+"""
+This module is the command line of the admin jobs. They're run from the
+root folder, with the PYTHONPATH and the DB_URI exported:
+
+`python -m control.cli snapshot graph.snap` writes a graph snapshot (see
+service/graph_snapshot.py) of every user and relation.
+
+`python -m control.cli changes changes.snap --since-snapshot graph.snap`
+writes the changes since that snapshot was taken, or since a date in UTC
+with `--since 2026-10-19T18:00:00`.
+
+`python -m control.cli load --users users.csv --following following.ndjson
+--interests interests.csv` loads users, follows and interests in bulk
+(see service/bulk_loader.py for the fields of the files). Any of them can
+be left out. `--workers` is how many processes hash the passwords (one
+per CPU by default) and `--rebuild-indexes` drops the secondary indexes
+while loading, for empty databases.
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+from control.utils.auth import AuthHandler
+from service.bulk_loader import BulkLoader
+from service.follow_handler import FollowHandler
+from service.graph_snapshot import GraphSnapshot
+
+follow_handler = FollowHandler()
+auth_handler = AuthHandler()
+
+
+def snapshot(arguments):
+    """
+    Writes a graph snapshot, of everything or of the changes since a date.
+    """
+    since = arguments.since
+    if arguments.since_snapshot is not None:
+        with GraphSnapshot(arguments.since_snapshot) as previous:
+            since = previous.taken_at
+    start = time.perf_counter()
+    stats = follow_handler.write_graph_snapshot(arguments.path, since)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Wrote {arguments.path} in {elapsed:.1f} s: {stats['users']} users,"
+        f" {stats['edges']} relations, {stats['removed']} removed users,"
+        f" {stats['bytes']} bytes, taken at {stats['taken_at'].isoformat()}"
+    )
+
+
+def load(arguments):
+    """
+    Loads the files of users, follows and interests in bulk.
+    """
+    loader = BulkLoader(
+        auth_handler.get_password_hash,
+        auth_handler.pwd_context.identify,
+        arguments.workers,
+    )
+    try:
+        stats = loader.load(
+            arguments.users,
+            arguments.following,
+            arguments.interests,
+            arguments.rebuild_indexes,
+        )
+    except (OSError, ValueError) as error:
+        sys.exit(f"Nothing was loaded: {error}")
+    for kind in ("users", "following", "interests"):
+        if kind in stats:
+            print(
+                f"Loaded {getattr(arguments, kind)} in {stats[kind]['seconds']:.1f} s:"
+                f" {stats[kind]['rows']} rows, {stats[kind]['added']} added,"
+                f" {stats[kind]['rows_per_second']:.0f} rows/s"
+            )
+    print(
+        f"Done in {stats['seconds']:.1f} s ({stats['rows_per_second']:.0f} rows/s),"
+        f" {stats['hashed']} passwords hashed"
+    )
+
+
+def main(argv=None):
+    """
+    Runs the job of the arguments (the ones of the command line if None).
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m control.cli", description="Admin jobs of the users."
+    )
+    jobs = parser.add_subparsers(required=True, dest="job")
+    full = jobs.add_parser("snapshot", help="write a graph snapshot")
+    full.add_argument("path")
+    full.set_defaults(run=snapshot, since=None, since_snapshot=None)
+    changes = jobs.add_parser("changes", help="write the changes of the graph")
+    changes.add_argument("path")
+    since = changes.add_mutually_exclusive_group(required=True)
+    since.add_argument("--since-snapshot", help="a previous snapshot")
+    since.add_argument("--since", type=datetime.fromisoformat, help="a UTC date")
+    changes.set_defaults(run=snapshot)
+    bulk = jobs.add_parser("load", help="load users, follows and interests")
+    bulk.add_argument("--users", help="a CSV or NDJSON file of users")
+    bulk.add_argument("--following", help="a CSV or NDJSON file of follows")
+    bulk.add_argument("--interests", help="a CSV or NDJSON file of interests")
+    bulk.add_argument("--workers", type=int, help="processes that hash passwords")
+    bulk.add_argument("--rebuild-indexes", action="store_true")
+    bulk.set_defaults(run=load)
+    arguments = parser.parse_args(argv)
+    arguments.run(arguments)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,3 +11,4 @@ USER_NOT_ADMIN = status.HTTP_400_BAD_REQUEST
 INCORRECT_CREDENTIALS = status.HTTP_401_UNAUTHORIZED
 BLOCKED_USER = status.HTTP_403_FORBIDDEN
 BAD_REQUEST = status.HTTP_400_BAD_REQUEST
+NOT_MODIFIED = status.HTTP_304_NOT_MODIFIED
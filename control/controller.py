@@ -4,24 +4,86 @@
 This is the controller layer of the REST API for the user's backend.
 """
 
+import threading
+from contextlib import asynccontextmanager
+
 # Para permitir pegarle a la API desde localhost:
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from control.routers import followers, admins, users, users_put
+from control.routers import followers, admins, users, users_put, monitoring
+from control.utils.instrumentation import (
+    add_metrics_middleware,
+    instrument_engine,
+    instrument_slow_queries,
+    instrument_follow_graph,
+    instrument_interest_index,
+    instrument_autocomplete_index,
+    instrument_rabbitmq,
+    instrument_suggestion_cache,
+)
+from control.utils.logger import add_request_context_middleware
+from control.utils.profiler import add_profiler_middleware, sampling_profiler
+from control.utils.query_stats import add_query_stats_middleware
+from control.utils.utils import rabbitmq_manager, token_is_admin
+from repository.user_repository import engine
+from service.follow_graph import FOLLOW_GRAPH_INDEX, follow_graph
+from service.follow_handler import FollowHandler
+from service.interest_index import INTEREST_INDEX, interest_index
+from service.autocomplete_index import AUTOCOMPLETE_INDEX, autocomplete_index
+from service.suggestion_cache import suggestion_cache
+from service.suggestion_handler import SuggestionHandler
+from service.user_handler import UserHandler
+
+
+@asynccontextmanager
+async def lifespan(_):
+    """
+    Builds the in-process indexes that are enabled in the background, the
+    app answers from the database until they're ready.
+    """
+    for enabled, load, name in (
+        (FOLLOW_GRAPH_INDEX, FollowHandler().load_follow_graph, "follow-graph"),
+        (INTEREST_INDEX, SuggestionHandler().load_interest_index, "interest-index"),
+        (AUTOCOMPLETE_INDEX, UserHandler().load_autocomplete_index, "autocomplete"),
+    ):
+        if enabled:
+            threading.Thread(target=load, name=name, daemon=True).start()
+    yield
 
 
 app = FastAPI(
-    title="User's API", description="This is the API for the user's microservice."
+    title="User's API",
+    description="This is the API for the user's microservice.",
+    lifespan=lifespan,
 )
 FastAPIInstrumentor.instrument_app(app)
 
 origins = ["*"]
-# All the routers are here:
+# All the routers are here. users goes before admins, so its /users/...
+# routes are matched before the /users/{query} of the admins:
+app.include_router(users.router)
 app.include_router(admins.router)
 app.include_router(followers.router)
-app.include_router(users.router)
 app.include_router(users_put.router)
+app.include_router(monitoring.router)
+
+# Metrics for /metrics:
+add_metrics_middleware(app)
+instrument_engine(engine)
+instrument_slow_queries(engine)
+instrument_rabbitmq(rabbitmq_manager)
+instrument_suggestion_cache(suggestion_cache)
+instrument_follow_graph(follow_graph)
+instrument_interest_index(interest_index)
+instrument_autocomplete_index(autocomplete_index)
+# Profiles of the requests of admins that ask for them, and of everything:
+add_profiler_middleware(app, token_is_admin)
+sampling_profiler.start()
+# Statements of every request, inside the request ids so its N+1 logs have it:
+add_query_stats_middleware(app)
+# Request ids for the logs, added last so it wraps everything else:
+add_request_context_middleware(app)
 
 app.add_middleware(
     CORSMiddleware,
@@ -2,6 +2,7 @@
 """
 This module is dedicated for all the pydantic models the API will use.
 """
+from typing import List, Optional
 from pydantic import BaseModel
 
 
@@ -56,6 +57,29 @@ class UserResponse(BaseModel):
         from_attributes = True
 
 
+class ProfileResponse(BaseModel):
+    """
+    This class is a Pydantic model for the response body of a profile.
+    """
+
+    id: int
+    email: str
+    name: str
+    last_name: str
+    username: str
+    date_of_birth: str
+    bio: str
+    avatar: str
+    location: str
+    blocked: bool
+    is_public: bool
+    followers_count: int
+    following_count: int
+    interests: List[str]
+    following: bool
+    followed_by: bool
+
+
 class UserPostResponse(BaseModel):
     """
     This class is a Pydantic model for the response body.
@@ -83,3 +107,35 @@ class UserPostResponse(BaseModel):
 
         orm_mode = True
         from_attributes = True
+
+
+class UserBatchRequest(BaseModel):
+    """
+    This class is a Pydantic model for the request body of a batch of users.
+    Any combination of ids, emails and usernames can be asked for.
+    """
+
+    ids: List[int] = []
+    emails: List[str] = []
+    usernames: List[str] = []
+    fields: Optional[List[str]] = None
+
+
+class FollowStatusRequest(BaseModel):
+    """
+    This class is a Pydantic model for the request body of the follow status
+    of many users. Any combination of ids and emails can be asked for.
+    """
+
+    ids: List[int] = []
+    emails: List[str] = []
+
+
+class FollowBulkRequest(BaseModel):
+    """
+    This class is a Pydantic model for the request body of a bulk follow
+    or unfollow. Any combination of ids and emails can be sent.
+    """
+
+    ids: List[int] = []
+    emails: List[str] = []
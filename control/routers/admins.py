@@ -3,18 +3,20 @@
 This module is dedicated for all the admin routes.
 """
 from datetime import datetime, timedelta
+from typing import Optional
 from fastapi import (
     APIRouter,
     Header,
     HTTPException,
     Query,
 )
+from fastapi.responses import PlainTextResponse
 from firebase_admin import storage
 
 from service.follow_handler import FollowHandler
 from service.admin_handler import AdminHandler
 from service.user_handler import UserHandler
-from service.errors import UserNotFound, MaxAmmountExceeded
+from service.errors import UserNotFound, MaxAmmountExceeded, InvalidExportFilter
 
 from control.models.models import (
     UserResponse,
@@ -28,6 +30,23 @@ from control.utils.utils import (
     push_metric,
 )
 from control.utils.metrics import BlockMetric
+from control.utils.slow_queries import slow_query_log
+from control.utils.profiler import (
+    FORMAT_FOLDED,
+    PROFILE_FORMATS,
+    profile_store,
+    sampling_profiler,
+)
+from control.utils.serialization import (
+    FOLLOWING_EXPORT_FIELDS,
+    USER_EXPORT_FIELDS,
+)
+from control.utils.streaming import (
+    FORMAT_JSON,
+    FORMAT_NDJSON,
+    MEDIA_TYPES,
+    stream_response,
+)
 
 from control.codes import (
     USER_NOT_FOUND,
@@ -127,6 +146,58 @@ def get_all_users(
     return generate_response_list(user_list)
 
 
+@router.get("/users/admin/export")
+@tracer.start_as_current_span("Export Users - Admin")
+# pylint: disable=too-many-arguments, too-many-positional-arguments
+def export_users(
+    token: str = Header(...),
+    export_format: str = Query(FORMAT_NDJSON, alias="format"),
+    blocked: Optional[bool] = None,
+    is_public: Optional[bool] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+):
+    """
+    This function streams every user that matches the filters, so a report
+    of all the users takes one request (and one admin check) instead of
+    paging through /users.
+
+    :param token: Token used to verify the user who is calling this is an admin.
+    :param export_format: "ndjson" (default), "csv" or "json".
+    :param blocked: Only the users with this blocked status.
+    :param is_public: Only the users with this privacy.
+    :param created_from: Only the users created since this date.
+    :param created_to: Only the users created until this date.
+
+    :return: The users, ordered by id.
+    """
+    admin = [None]
+    if not token_is_admin(token, admin):
+        raise HTTPException(
+            status_code=USER_NOT_ADMIN,
+            detail="Only administrators can export the users",
+        )
+    if export_format not in MEDIA_TYPES:
+        raise HTTPException(
+            status_code=BAD_REQUEST,
+            detail="format must be one of: " + ", ".join(MEDIA_TYPES),
+        )
+    filters = {
+        "blocked": blocked,
+        "is_public": is_public,
+        "created_from": created_from,
+        "created_to": created_to,
+    }
+    try:
+        batches = admin_handler.stream_users(filters)
+    except InvalidExportFilter as error:
+        raise HTTPException(status_code=BAD_REQUEST, detail=str(error)) from error
+    logger.info("Admin %s exported the users with %s", admin[0], filters)
+    return stream_response(
+        batches, USER_EXPORT_FIELDS, export_format, "users", filename="users"
+    )
+
+
 @router.get("/users/{query}")
 @tracer.start_as_current_span("Find User - Query - Admin")
 def get_users_by_query(
@@ -247,20 +318,181 @@ def translate_path_to_image_link(firebase_path: str, token: str = Header(...)):
 
 @router.get("/following")
 @tracer.start_as_current_span("Following")
-def get_all_following_relations(token: str = Header(...)):
+def get_all_following_relations(
+    token: str = Header(...),
+    export_format: str = Query(FORMAT_JSON, alias="format"),
+    since: Optional[datetime] = None,
+    min_user_id: Optional[int] = None,
+    max_user_id: Optional[int] = None,
+):
     """
     This function is a function that returns all of the following relations in the database.
+    They are streamed from the database, so the whole graph is never in memory.
 
     :param token: Token used to verify the user who is calling this is an admin.
+    :param export_format: "json" (default), "ndjson" or "csv".
+    :param since: Only the relations created since this date.
+    :param min_user_id: Only the relations of followers with at least this id.
+    :param max_user_id: Only the relations of followers with at most this id.
 
-    :return: JSON of all users.
+    :return: Every relation, with its user_id, following_id and created_at.
     """
     if not token_is_admin(token):
         raise HTTPException(
             status_code=USER_NOT_ADMIN,
             detail="Only administrators can get all following relations",
         )
-    return follower_handler.get_all_following_relations()
+    if export_format not in MEDIA_TYPES:
+        raise HTTPException(
+            status_code=BAD_REQUEST,
+            detail="format must be one of: " + ", ".join(MEDIA_TYPES),
+        )
+    filters = {
+        "since": since,
+        "min_user_id": min_user_id,
+        "max_user_id": max_user_id,
+    }
+    try:
+        batches = follower_handler.stream_following_relations(filters)
+    except InvalidExportFilter as error:
+        raise HTTPException(status_code=BAD_REQUEST, detail=str(error)) from error
+    return stream_response(batches, FOLLOWING_EXPORT_FIELDS, export_format, "following")
+
+
+@router.get("/admin/slow_queries")
+@tracer.start_as_current_span("Slow Queries")
+def get_slow_queries(token: str = Header(...), clear: bool = False):
+    """
+    This function returns the statements that took more than SLOW_QUERY_MS
+    (see control/utils/slow_queries.py), the most recent first.
+
+    :param token: Token used to verify the user who is calling this is an admin.
+    :param clear: Whether to remove them after returning them.
+
+    :return: JSON with whether the log is "enabled", its "threshold_ms" and
+    the "queries", each with its statement, the shapes of its parameters,
+    its ms, function, route, request_id and plan.
+    """
+    if not token_is_admin(token):
+        raise HTTPException(
+            status_code=USER_NOT_ADMIN,
+            detail="Only administrators can get the slow queries",
+        )
+    queries = slow_query_log.entries()
+    if clear:
+        slow_query_log.clear()
+    return {
+        "enabled": slow_query_log.enabled,
+        "threshold_ms": slow_query_log.threshold and slow_query_log.threshold * 1000,
+        "queries": queries,
+    }
+
+
+def _profile_response(profile, output_format, limit, **fields):
+    """
+    Returns the profile as its folded stacks or as JSON with its hottest
+    functions and stacks, and the fields.
+    """
+    if output_format not in PROFILE_FORMATS:
+        raise HTTPException(
+            status_code=BAD_REQUEST,
+            detail="format must be one of: " + ", ".join(PROFILE_FORMATS),
+        )
+    if output_format == FORMAT_FOLDED:
+        return PlainTextResponse(profile.folded())
+    return {**fields, **profile.as_dict(limit)}
+
+
+@router.get("/admin/profiles")
+@tracer.start_as_current_span("Profiles")
+def get_profiles(token: str = Header(...)):
+    """
+    This function returns the requests that were profiled (with the header
+    X-Profile, see control/utils/profiler.py), the most recent first.
+
+    :param token: Token used to verify the user who is calling this is an admin.
+
+    :return: JSON with the "profiles", each with its id, route, ms and samples.
+    """
+    if not token_is_admin(token):
+        raise HTTPException(
+            status_code=USER_NOT_ADMIN,
+            detail="Only administrators can get the profiles",
+        )
+    return {"profiles": profile_store.summaries()}
+
+
+@router.get("/admin/profiles/{profile_id}")
+@tracer.start_as_current_span("Profile")
+def get_profile(
+    profile_id: str,
+    token: str = Header(...),
+    output_format: str = Query(FORMAT_JSON, alias="format"),
+    limit: int = Query(30, title="limit", description="max functions and stacks"),
+):
+    """
+    This function returns the profile of a request, by the id in its
+    X-Profile-Id header.
+
+    :param profile_id: The id of the profile.
+    :param token: Token used to verify the user who is calling this is an admin.
+    :param output_format: "json" (default) or "folded", the stacks for a flamegraph.
+    :param limit: How many functions and stacks are in the JSON.
+
+    :return: The route, ms and samples of the request, its hottest
+    functions and its hottest stacks.
+    """
+    if not token_is_admin(token):
+        raise HTTPException(
+            status_code=USER_NOT_ADMIN,
+            detail="Only administrators can get the profiles",
+        )
+    entry = profile_store.get(profile_id)
+    if entry is None:
+        raise HTTPException(status_code=USER_NOT_FOUND, detail="Profile not found")
+    return _profile_response(
+        entry["profile"],
+        output_format,
+        limit,
+        id=entry["id"],
+        at=entry["at"],
+        route=entry["route"],
+        ms=entry["ms"],
+    )
+
+
+@router.get("/admin/profiler/hot")
+@tracer.start_as_current_span("Hot Stacks")
+def get_hot_stacks(
+    token: str = Header(...),
+    seconds: float = Query(300, title="seconds", description="how far back to look"),
+    output_format: str = Query(FORMAT_JSON, alias="format"),
+    limit: int = Query(30, title="limit", description="max functions and stacks"),
+):
+    """
+    This function returns the stacks the always-on profiler saw the most
+    in the last seconds (see control/utils/profiler.py).
+
+    :param token: Token used to verify the user who is calling this is an admin.
+    :param seconds: How far back to look, rounded to the windows of the profiler.
+    :param output_format: "json" (default) or "folded", the stacks for a flamegraph.
+    :param limit: How many functions and stacks are in the JSON.
+
+    :return: Whether the profiler is "enabled", the seconds it spent
+    sampling, and the hottest functions and stacks.
+    """
+    if not token_is_admin(token):
+        raise HTTPException(
+            status_code=USER_NOT_ADMIN,
+            detail="Only administrators can get the hot stacks",
+        )
+    return _profile_response(
+        sampling_profiler.hot(seconds),
+        output_format,
+        limit,
+        enabled=sampling_profiler.enabled,
+        sampling_seconds=round(sampling_profiler.sampling_seconds, 3),
+    )
 
 
 @router.get("/health")
@@ -2,34 +2,124 @@
 """
 All of the user's followers and following are managed here.
 """
+from typing import Optional
 from fastapi import (
     APIRouter,
     Header,
     HTTPException,
+    Query,
+    Response,
 )
 
 from service.follow_handler import FollowHandler
+from service.suggestion_handler import SuggestionHandler
 
 from service.errors import (
     UserNotFound,
     UserCantFollowItself,
     FollowingRelationAlreadyExists,
+    MaxAmmountExceeded,
 )
+from control.models.models import FollowStatusRequest, FollowBulkRequest
 from control.utils.tracer import tracer
 from control.utils.logger import logger
+from control.utils.caching import (
+    make_etag,
+    etag_matches,
+    cache_headers,
+    set_cache_headers,
+    not_modified,
+)
 from control.utils.utils import (
     check_and_get_user_from_token,
     generate_response_list,
+    generate_mutuals_response,
 )
 
 from control.codes import (
     USER_NOT_FOUND,
+    BAD_REQUEST,
 )
 
 router = APIRouter(tags=["Followers"])
 origins = ["*"]
 
 handler = FollowHandler()
+suggestion_handler = SuggestionHandler()
+
+
+# It has to be declared before /follow/{email_following} so it's not
+# taken as an email.
+@router.post("/follow/status")
+@tracer.start_as_current_span("Get follow status - Followers")
+def get_follow_status(targets: FollowStatusRequest, token: str = Header(...)):
+    """
+    This function returns the relation between the user and many others,
+    so a list of users can show its follow buttons with a single request.
+
+    :param targets: The ids and emails of the users to check.
+    :param token: Token used to verify you are requesting from a valid user.
+    :return: A map from each id and email to {following, followed_by},
+    or null if there is no such user.
+    """
+    user = check_and_get_user_from_token(token)
+    try:
+        status = handler.get_follow_status(
+            user.id, {"ids": targets.ids, "emails": targets.emails}
+        )
+    except MaxAmmountExceeded as error:
+        raise HTTPException(status_code=BAD_REQUEST, detail=str(error)) from error
+    logger.info("User %s got the follow status of %d users", user.email, len(status))
+    return status
+
+
+# It has to be declared before /follow/{email_following} so it's not
+# taken as an email.
+@router.post("/follow/bulk")
+@tracer.start_as_current_span("Create follows - Followers")
+def create_follows(targets: FollowBulkRequest, token: str = Header(...)):
+    """
+    This function makes the user follow many users at once, like the
+    accounts suggested on the onboarding or the imported contacts.
+
+    :param targets: The ids and emails of the users to follow.
+    :param token: Identifier of the user who wants to follow them.
+    :return: A map from each id and email to "followed",
+    "already_following", "not_found" or "self".
+    """
+    user = check_and_get_user_from_token(token)
+    try:
+        outcomes = handler.follow_many(
+            user.id, {"ids": targets.ids, "emails": targets.emails}
+        )
+    except MaxAmmountExceeded as error:
+        raise HTTPException(status_code=BAD_REQUEST, detail=str(error)) from error
+    except UserNotFound as error:
+        raise HTTPException(status_code=USER_NOT_FOUND, detail=str(error)) from error
+    logger.info("User %s followed %d users at once", user.email, len(outcomes))
+    return outcomes
+
+
+@router.delete("/follow/bulk")
+@tracer.start_as_current_span("Delete follows - Followers")
+def delete_follows(targets: FollowBulkRequest, token: str = Header(...)):
+    """
+    This function makes the user unfollow many users at once.
+
+    :param targets: The ids and emails of the users to unfollow.
+    :param token: Identifier of the user who wants to unfollow them.
+    :return: A map from each id and email to "unfollowed",
+    "not_following", "not_found" or "self".
+    """
+    user = check_and_get_user_from_token(token)
+    try:
+        outcomes = handler.unfollow_many(
+            user.id, {"ids": targets.ids, "emails": targets.emails}
+        )
+    except MaxAmmountExceeded as error:
+        raise HTTPException(status_code=BAD_REQUEST, detail=str(error)) from error
+    logger.info("User %s unfollowed %d users at once", user.email, len(outcomes))
+    return outcomes
 
 
 @router.post("/follow/{email_following}")
@@ -57,35 +147,95 @@ def create_follow(email_following: str, token: str = Header(...)):
 
 @router.get("/followers/{email}")
 @tracer.start_as_current_span("Get followers - Followers")
-def get_followers(email: str, token: str = Header(...)):
+def get_followers(
+    email: str,
+    with_relation: bool = Query(
+        False, title="with_relation", description="embed the follow status"
+    ),
+    token: str = Header(...),
+    if_none_match: Optional[str] = Header(None),
+):
     """
     This function returns the users a username is followed by.
 
     :param email: Email of the user to get the followers of.
+    :param with_relation: If true, every user has its relation to the requester.
     :param token: Token used to verify you are requesting from a valid user.
-    :return: Status code with a JSON message.
+    :param if_none_match: ETag of the copy the client has, if any.
+    :return: Status code with a JSON message, or 304 if it didn't change.
     """
     requester = check_and_get_user_from_token(token)
     try:
+        etag_parts = ["followers", *handler.get_followers_version(email)]
+        if with_relation:
+            etag_parts += [requester.id, requester.follow_version]
+        etag = make_etag(*etag_parts)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
         user_list = handler.get_all_followers(email)
         logger.info("User %s got all the users following %s", requester.email, email)
-        return generate_response_list(user_list)
+        relations = None
+        if with_relation:
+            relations = handler.get_users_follow_status(requester.id, user_list)
+        return generate_response_list(user_list, relations, cache_headers(etag))
     except UserNotFound as error:
         raise HTTPException(status_code=USER_NOT_FOUND, detail=str(error)) from error
 
 
+@router.get("/followers/{email}/mutual")
+@tracer.start_as_current_span("Get mutual followers - Followers")
+def get_mutual_followers(
+    email: str,
+    ammount: int = Query(
+        3, title="ammount", description="max ammount of users to return"
+    ),
+    token: str = Header(...),
+):
+    """
+    This function returns the users the user follows that follow email,
+    for the "followed by X, Y and 12 others you follow" of a profile.
+
+    :param email: Email of the user whose profile is shown.
+    :param ammount: The max ammount of users to return.
+    :param token: Token used to verify you are requesting from a valid user.
+    :return: How many of them there are ("count"), if only part of the
+    users the user follows were looked at ("capped") and the first ones
+    ("users").
+    """
+    user = check_and_get_user_from_token(token)
+    try:
+        users, count, capped = handler.get_mutual_followers(user.id, email, ammount)
+    except UserNotFound as error:
+        raise HTTPException(status_code=USER_NOT_FOUND, detail=str(error)) from error
+    except (ValueError, MaxAmmountExceeded) as error:
+        raise HTTPException(status_code=BAD_REQUEST, detail=str(error)) from error
+    logger.info("User %s got %d mutual followers of %s", user.email, count, email)
+    return generate_mutuals_response(users, count, capped)
+
+
 @router.get("/is_following/{email}")
 @tracer.start_as_current_span("Get is following - Followers")
-def get_is_following(email_following: str, token: str = Header(...)):
+def get_is_following(
+    email_following: str,
+    response: Response,
+    token: str = Header(...),
+    if_none_match: Optional[str] = Header(None),
+):
     """
     This function returns if the user is following the given user.
 
     :param email: Email of the user to check if is following.
     :param token: Token used to verify you are requesting from a valid user.
-    :return: Status code with a JSON message.
+    :param if_none_match: ETag of the copy the client has, if any.
+    :return: Status code with a JSON message, or 304 if it didn't change.
     """
 
     user = check_and_get_user_from_token(token)
+    # Following or unfollowing anyone changes the user's follow_version.
+    etag = make_etag("is_following", user.id, user.follow_version, email_following)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_cache_headers(response, etag)
     try:
         logger.info("User %s asked if is following %s", user.email, email_following)
         return handler.is_following(user.email, email_following)
@@ -95,15 +245,26 @@ def get_is_following(email_following: str, token: str = Header(...)):
 
 @router.get("/is_follower/{email}")
 @tracer.start_as_current_span("Get is follower - Followers")
-def get_is_follower(email_follower: str, token: str = Header(...)):
+def get_is_follower(
+    email_follower: str,
+    response: Response,
+    token: str = Header(...),
+    if_none_match: Optional[str] = Header(None),
+):
     """
     This function returns if the user is a follower the given user.
 
     :param email: Email of the user to check if is a follower.
     :param token: Token used to verify you are requesting from a valid user.
-    :return: Status code with a JSON message.
+    :param if_none_match: ETag of the copy the client has, if any.
+    :return: Status code with a JSON message, or 304 if it didn't change.
     """
     user = check_and_get_user_from_token(token)
+    # Being followed or unfollowed by anyone changes the user's follow_version.
+    etag = make_etag("is_follower", user.id, user.follow_version, email_follower)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_cache_headers(response, etag)
     try:
         logger.info("User %s asked if is a follower of %s", user.email, email_follower)
         return handler.is_follower(user.email, email_follower)
@@ -113,38 +274,66 @@ def get_is_follower(email_follower: str, token: str = Header(...)):
 
 @router.get("/following/{email}")
 @tracer.start_as_current_span("Get following from email - Followers")
-def get_following(email: str, token: str = Header(...)):
+def get_following(
+    email: str,
+    with_relation: bool = Query(
+        False, title="with_relation", description="embed the follow status"
+    ),
+    token: str = Header(...),
+    if_none_match: Optional[str] = Header(None),
+):
     """
     This function returns the users a username is following.
 
     :param email: Email of the user to get the following of.
+    :param with_relation: If true, every user has its relation to the requester.
     :param token: Token used to verify you are requesting from a valid user.
-    :return: Status code with a JSON message.
+    :param if_none_match: ETag of the copy the client has, if any.
+    :return: Status code with a JSON message, or 304 if it didn't change.
     """
     # Checks the person requesting is a logged user:
     requester = check_and_get_user_from_token(token)
     # Does the actual request:
     try:
+        etag_parts = ["following", *handler.get_following_version(email)]
+        if with_relation:
+            etag_parts += [requester.id, requester.follow_version]
+        etag = make_etag(*etag_parts)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
         user_list = handler.get_all_following(email)
         logger.info("User %s got all the users %s is following", requester.email, email)
-        return generate_response_list(user_list)
+        relations = None
+        if with_relation:
+            relations = handler.get_users_follow_status(requester.id, user_list)
+        return generate_response_list(user_list, relations, cache_headers(etag))
     except UserNotFound as error:
         raise HTTPException(status_code=USER_NOT_FOUND, detail=str(error)) from error
 
 
 @router.get("/follow/{email}/count")
 @tracer.start_as_current_span("Get follow count - Followers")
-def get_followers_count(email: str, token: str = Header(...)):
+def get_followers_count(
+    email: str,
+    response: Response,
+    token: str = Header(...),
+    if_none_match: Optional[str] = Header(None),
+):
     """
     This function returns the number of followers of a username.
 
     :param email: Email of the user to get the followers count of.
-    :return: Status code with a JSON message.
+    :param if_none_match: ETag of the copy the client has, if any.
+    :return: Status code with a JSON message, or 304 if it didn't change.
     """
     # Checks the person requesting is a logged user:
     user = check_and_get_user_from_token(token)
     # Does the actual request:
     try:
+        etag = make_etag("followers_count", *handler.get_follow_version(email))
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
         logger.info("User %s got the number of followers of %s", user.email, email)
         return handler.get_followers_count(email)
     except UserNotFound as error:
@@ -153,18 +342,28 @@ def get_followers_count(email: str, token: str = Header(...)):
 
 @router.get("/following/{email}/count")
 @tracer.start_as_current_span("Get following count - Followers")
-def get_following_count(email: str, token: str = Header(...)):
+def get_following_count(
+    email: str,
+    response: Response,
+    token: str = Header(...),
+    if_none_match: Optional[str] = Header(None),
+):
     """
     This function returns the number of users a email is following.
 
     :param email: Email of the user to get the following count of.
     :param token: Token used to verify you are requesting from a valid user.
-    :return: Status code with a JSON message.
+    :param if_none_match: ETag of the copy the client has, if any.
+    :return: Status code with a JSON message, or 304 if it didn't change.
     """
     # Checks the person requesting is a logged user:
     user = check_and_get_user_from_token(token)
     # Does the actual request:
     try:
+        etag = make_etag("following_count", *handler.get_follow_version(email))
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
         logger.info(
             "User %s got the number of users %s is following", user.email, email
         )
@@ -191,3 +390,75 @@ def unfollow(email_unfollowing: str, token: str = Header(...)):
         return handler.remove_follow(user.email, email_unfollowing)
     except UserNotFound as error:
         raise HTTPException(status_code=USER_NOT_FOUND, detail=str(error)) from error
+
+
+@router.get("/suggestions")
+@tracer.start_as_current_span("Get suggestions - Followers")
+def get_suggestions(
+    ammount: int = Query(
+        10, title="ammount", description="max ammount of users to return"
+    ),
+    token: str = Header(...),
+):
+    """
+    This function returns users to follow: the ones followed by the most
+    people the user follows, leaving out the ones it already follows and
+    the blocked ones.
+
+    :param ammount: The max ammount of users to return.
+    :param token: Token used to verify you are requesting from a valid user.
+    :return: The users, best first, each with the number of people the
+    user follows that follow them ("mutuals").
+    """
+    user = check_and_get_user_from_token(token)
+    try:
+        users, mutuals = suggestion_handler.get_suggestions(
+            user.id, user.follow_version, ammount
+        )
+    except (ValueError, MaxAmmountExceeded) as error:
+        raise HTTPException(status_code=BAD_REQUEST, detail=str(error)) from error
+    logger.info("User %s got %d suggestions", user.email, len(users))
+    relations = {user_id: {"mutuals": count} for user_id, count in mutuals.items()}
+    return generate_response_list(users, relations)
+
+
+@router.get("/suggestions/by-interests")
+@tracer.start_as_current_span("Get suggestions by interests - Followers")
+def get_suggestions_by_interests(
+    ammount: int = Query(
+        10, title="ammount", description="max ammount of users to return"
+    ),
+    public_only: bool = Query(
+        False, title="public_only", description="leave out the private users"
+    ),
+    not_followed: bool = Query(
+        True, title="not_followed", description="leave out the users you follow"
+    ),
+    token: str = Header(...),
+):
+    """
+    This function returns the users that share the most interests with the
+    user, leaving out the blocked ones.
+
+    :param ammount: The max ammount of users to return.
+    :param public_only: If the private users are left out.
+    :param not_followed: If the users the user follows are left out.
+    :param token: Token used to verify you are requesting from a valid user.
+    :return: The users, best first, each with the number of interests they
+    share with the user ("shared_interests").
+    """
+    user = check_and_get_user_from_token(token)
+    options = {
+        "ammount": ammount,
+        "public_only": public_only,
+        "not_followed": not_followed,
+    }
+    try:
+        users, shared = suggestion_handler.get_interest_suggestions(user.id, options)
+    except (ValueError, MaxAmmountExceeded) as error:
+        raise HTTPException(status_code=BAD_REQUEST, detail=str(error)) from error
+    logger.info("User %s got %d suggestions by interests", user.email, len(users))
+    relations = {
+        user_id: {"shared_interests": count} for user_id, count in shared.items()
+    }
+    return generate_response_list(users, relations)
@@ -0,0 +1,22 @@
+# monitoring.py
+"""
+This module is dedicated for the routes used to monitor the service.
+"""
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from control.utils.prometheus import registry, CONTENT_TYPE
+
+router = APIRouter(tags=["Monitoring"])
+origins = ["*"]
+
+
+@router.get("/metrics")
+def get_metrics():
+    """
+    This function returns all the metrics of the service in the
+    Prometheus text format, so they can be scraped.
+
+    :return: The metrics as plain text.
+    """
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
@@ -3,6 +3,7 @@
 This module is dedicated for all the users routes.
 """
 from datetime import datetime
+from typing import Optional
 import firebase_admin
 from firebase_admin import credentials, auth
 from firebase_admin.auth import InvalidIdTokenError
@@ -12,8 +13,10 @@ from fastapi import (
     Header,
     HTTPException,
     Query,
+    Response,
 )
 from service.user_handler import UserHandler
+from service.follow_handler import FollowHandler
 from service.errors import UserNotFound, MaxAmmountExceeded
 
 from control.models.models import (
@@ -21,15 +24,28 @@ from control.models.models import (
     UserRegistration,
     UserResponse,
     UserPostResponse,
+    UserBatchRequest,
 )
 from control.utils.auth import auth_handler
 from control.utils.tracer import tracer
+from control.utils.caching import (
+    PUBLIC_CACHE,
+    PRIVATE_CACHE,
+    make_etag,
+    etag_matches,
+    cache_headers,
+    set_cache_headers,
+    not_modified,
+)
 from control.utils.logger import logger
 from control.utils.utils import (
     token_is_admin,
     generate_response,
     generate_response_list,
+    generate_search_page_response,
     generate_response_with_id,
+    generate_batch_response,
+    generate_profile_response,
     create_user_from_user_data,
     handle_user_registration,
     handle_user_login,
@@ -62,6 +78,7 @@ firebase_admin.initialize_app(cred, {"storageBucket": "snapmsg-a9735.appspot.com
 # We create a global handler for the service layer.
 # Since the handler is stateless, we don't care if it's global.
 user_handler = UserHandler()
+follow_handler = FollowHandler()
 
 
 # Create a POST route
@@ -143,21 +160,84 @@ def login_with_google(firebase_id_token: str = Header(...)):
 
 @router.get("/users/interests")
 @tracer.start_as_current_span("Get User Interests - Users")
-def get_interests(token: str = Header(...)):
+def get_interests(
+    response: Response,
+    token: str = Header(...),
+    if_none_match: Optional[str] = Header(None),
+):
     """
     This function is for getting the user's interests
 
     :param token: Token used to verify the user.
-    :return: Status code with a JSON message.
+    :param if_none_match: ETag of the copy the client has, if any.
+    :return: Status code with a JSON message, or 304 if it didn't change.
     """
     try:
         user = check_and_get_user_from_token(token)
+        etag = make_etag("interests", user.id, user.version)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
         logger.info("User %s requested their interests", user.email)
         return user_handler.get_user_interests(user.email)
     except UserNotFound as error:
         raise HTTPException(status_code=USER_NOT_FOUND, detail=str(error)) from error
 
 
+@router.get("/interests")
+@tracer.start_as_current_span("Get Popular Interests - Users")
+def get_popular_interests(
+    prefix: Optional[str] = Query(
+        None, title="prefix", description="only the interests that start with it"
+    ),
+    ammount: int = Query(
+        10, title="ammount", description="max ammount of interests to return"
+    ),
+    token: str = Header(...),
+):
+    """
+    This function returns the interests most users have, for the
+    autocomplete of the interests.
+
+    :param prefix: If it's given, only the interests that start with it
+    (ignoring case).
+    :param ammount: The max ammount of interests to return.
+    :param token: Token used to verify the user.
+    :return: A list of {"name", "users"}, the most popular first.
+    """
+    check_and_get_user_from_token(token)
+    try:
+        return user_handler.get_popular_interests(prefix, ammount)
+    except (ValueError, MaxAmmountExceeded) as error:
+        raise HTTPException(status_code=BAD_REQUEST, detail=str(error)) from error
+
+
+@router.get("/users/autocomplete")
+@tracer.start_as_current_span("Autocomplete Users - Users")
+def autocomplete_users(
+    prefix: str = Query(
+        ..., title="prefix", description="start of the username, name or surname"
+    ),
+    ammount: int = Query(
+        10, title="ammount", description="max ammount of users to return"
+    ),
+    token: str = Header(...),
+):
+    """
+    This function is for the autocomplete of the mentions (`@ali...`).
+
+    :param prefix: The start of the username, name or surname (ignoring case).
+    :param ammount: The max ammount of users to return.
+    :param token: Token used to verify the user.
+    :return: A list of {"id", "username", "name", "surname"}.
+    """
+    check_and_get_user_from_token(token)
+    try:
+        return user_handler.autocomplete_users(prefix, ammount)
+    except (ValueError, MaxAmmountExceeded) as error:
+        raise HTTPException(status_code=BAD_REQUEST, detail=str(error)) from error
+
+
 @router.delete("/users/{email}")
 @tracer.start_as_current_span("Delete User - Users")
 def delete_user(email: str, token: str = Header(...)):
@@ -188,18 +268,26 @@ def delete_user(email: str, token: str = Header(...)):
 
 @router.get("/get_user_by_token", response_model=UserResponse)
 @tracer.start_as_current_span("Get User by Token - Users")
-def get_user_by_token(token: str = Header(...)):
+def get_user_by_token(
+    token: str = Header(...),
+    if_none_match: Optional[str] = Header(None),
+):
     """
     This function retrieves an user by token.
 
     :param token: The authentication token.
-    :return: User details or a 401 response.
+    :param if_none_match: ETag of the copy the client has, if any.
+    :return: User details, a 304 if they didn't change or a 401 response.
     """
     try:
         user = check_and_get_user_from_token(token)
-        user = generate_response(user)
+        etag = make_etag("user", user.id, user.version)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
         logger.info("User %s requested their details by token", user.email)
-        return user
+        return generate_response(
+            user_handler.get_user_summary(user.email), cache_headers(etag)
+        )
     except UserNotFound as error:
         raise HTTPException(
             status_code=INCORRECT_CREDENTIALS, detail=str(error)
@@ -210,18 +298,26 @@ def get_user_by_token(token: str = Header(...)):
 
 @router.get("/user", response_model=UserPostResponse)
 @tracer.start_as_current_span("Get User by Token with ID - Users")
-def get_user_by_token_with_id(token: str = Header(...)):
+def get_user_by_token_with_id(
+    token: str = Header(...),
+    if_none_match: Optional[str] = Header(None),
+):
     """
     This function retrieves an user by token.
 
     :param token: The authentication token.
-    :return: User details or a 401 response.
+    :param if_none_match: ETag of the copy the client has, if any.
+    :return: User details, a 304 if they didn't change or a 401 response.
     """
     try:
         user = check_and_get_user_from_token(token)
-        user = generate_response_with_id(user)
+        etag = make_etag("user_with_id", user.id, user.version)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
         logger.info("User %s requested their details by token", user.email)
-        return user
+        return generate_response_with_id(
+            user_handler.get_user_summary(user.email), cache_headers(etag)
+        )
     except UserNotFound as error:
         raise HTTPException(
             status_code=INCORRECT_CREDENTIALS, detail=str(error)
@@ -232,6 +328,7 @@ def get_user_by_token_with_id(token: str = Header(...)):
 
 @router.get("/user/search/{query}")
 @tracer.start_as_current_span("Search User - Users")
+# pylint: disable=too-many-arguments, too-many-positional-arguments
 def search_users(
     query: str,
     offset=Query(0, title="offset", description="offset for pagination"),
@@ -239,12 +336,16 @@ def search_users(
     in_followers: bool = Query(
         False, title="in_followers", description="search in followers"
     ),
+    with_relation: bool = Query(
+        False, title="with_relation", description="embed the follow status"
+    ),
     token: str = Header(...),
 ):
     """
     This function retrieves an user by token.
 
     :param token: The authentication token.
+    :param with_relation: If true, every user has its relation to the requester.
     :return: User details or a 401 response.
     """
     try:
@@ -258,25 +359,149 @@ def search_users(
         users = user_handler.search_for_users(query, user_search_options)
     except MaxAmmountExceeded as error:
         logger.error(
-            "User %s tried to search for too many users, ammount: %d",
+            "User %s tried to search for too many users, ammount: %s",
             user.email,
             ammount,
         )
         raise HTTPException(status_code=BAD_REQUEST, detail=str(error)) from error
     logger.info("User %s searched for %s", user.email, query)
-    return generate_response_list(users)
+    relations = None
+    if with_relation:
+        relations = follow_handler.get_users_follow_status(user.id, users)
+    return generate_response_list(users, relations)
+
+
+@router.get("/user/search/{query}/ranked")
+@tracer.start_as_current_span("Search User Ranked - Users")
+def search_users_ranked(
+    query: str,
+    cursor: Optional[str] = Query(
+        None, title="cursor", description="next_cursor of the previous page"
+    ),
+    ammount: int = Query(
+        10, title="ammount", description="max ammount of users to return"
+    ),
+    with_relation: bool = Query(
+        False, title="with_relation", description="embed the follow status"
+    ),
+    token: str = Header(...),
+):
+    """
+    This function searches for users ranked by their social distance to
+    the user: the ones it follows, then its followers, then the users
+    followed by the ones it follows and then everyone else, the best text
+    matches first on each group.
+
+    :param cursor: The next_cursor of the previous page, none for the first.
+    :param with_relation: If true, every user has its relation to the requester.
+    :return: {"users", "next_cursor"}, next_cursor is null on the last page.
+    """
+    user = check_and_get_user_from_token(token)
+    options = {"user_id": user.id, "cursor": cursor, "ammount": ammount}
+    try:
+        users, next_cursor = user_handler.search_users_by_distance(query, options)
+    except (ValueError, MaxAmmountExceeded) as error:
+        raise HTTPException(status_code=BAD_REQUEST, detail=str(error)) from error
+    logger.info("User %s searched for %s ranked", user.email, query)
+    relations = None
+    if with_relation:
+        relations = follow_handler.get_users_follow_status(user.id, users)
+    return generate_search_page_response(users, next_cursor, relations)
 
 
 @router.get("/users/username/{username}")
-def get_user_by_username(username: str, token: str = Header(...)):
+def get_user_by_username(
+    username: str,
+    token: str = Header(...),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    This function retrieves an user by username, without its password.
+    It needs a token, so only the client can cache it.
     """
-    This function retrieves an user by username.
+    _ = check_and_get_user_from_token(token)
+    try:
+        versions = user_handler.get_profile_versions(username)
+        etag = make_etag("username", versions.id, versions.version)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        user = user_handler.get_user_summary_username(username)
+    except UserNotFound as error:
+        raise HTTPException(status_code=USER_NOT_FOUND, detail=str(error)) from error
+    return generate_response(user, cache_headers(etag))
+
+
+@router.get("/profiles/{username}")
+@tracer.start_as_current_span("Get Profile - Users")
+def get_profile(
+    username: str,
+    response: Response,
+    token: str = Header(...),
+    if_none_match: Optional[str] = Header(None),
+):
     """
+    This function retrieves everything the app shows in a profile: the user,
+    its followers and following counts, its interests and whether the
+    requester follows it and is followed by it.
+
+    The ETag only needs the versions of the user: following or unfollowing
+    it changes its follow_version, so the counts and the relation are
+    covered too. They're read with the profile, so it's a single query
+    (besides the token's). Public profiles can be cached by an edge cache.
+
+    :param username: The username of the user of the profile.
+    :param token: Token used to verify you are requesting from a valid user.
+    :param if_none_match: ETag of the copy the client has, if any.
+    :return: The profile, a 304 if it didn't change or a 404 response.
+    """
+    viewer = check_and_get_user_from_token(token)
     try:
-        _ = check_and_get_user_from_token(token)
-        return user_handler.get_user_username(username)
+        profile = user_handler.get_profile(username, viewer.id)
     except UserNotFound as error:
         raise HTTPException(status_code=USER_NOT_FOUND, detail=str(error)) from error
+    etag = make_etag(
+        "profile",
+        profile["id"],
+        profile.pop("version"),
+        profile.pop("follow_version"),
+        viewer.id,
+    )
+    cache_control = PUBLIC_CACHE if profile["is_public"] else PRIVATE_CACHE
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, cache_control)
+    set_cache_headers(response, etag, cache_control)
+    logger.info("User %s got the profile of %s", viewer.email, username)
+    return generate_profile_response(profile)
+
+
+@router.post("/users/batch")
+@tracer.start_as_current_span("Get Users Batch - Users")
+def get_users_batch(batch: UserBatchRequest, token: str = Header(...)):
+    """
+    This function retrieves many users at once, by id, email or username.
+    It's meant for other services that need to show the profile of every
+    user in a list (like the authors of a timeline).
+
+    :param batch: The ids, emails and usernames to look for, and optionally
+    the fields to return for each user (all of them by default).
+    :param token: Token used to verify you are requesting from a valid user.
+    :return: A map for each kind of identifier from the identifier to the
+    user's fields, or null if there is no such user.
+    """
+    requester = check_and_get_user_from_token(token)
+    identifiers = {
+        "ids": batch.ids,
+        "emails": batch.emails,
+        "usernames": batch.usernames,
+    }
+    try:
+        users = user_handler.get_users_batch(identifiers, batch.fields)
+    except MaxAmmountExceeded as error:
+        raise HTTPException(status_code=BAD_REQUEST, detail=str(error)) from error
+    except ValueError as error:
+        raise HTTPException(status_code=BAD_REQUEST, detail=str(error)) from error
+    logger.info("User %s got a batch of users", requester.email)
+    return generate_batch_response(users)
 
 
 @router.post("/user/biometric_token")
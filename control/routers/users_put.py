@@ -66,7 +66,7 @@ def change_bio(new_bio: str, token: str = Header(...)):
     try:
         user = check_and_get_user_from_token(token)
         user_handler.change_bio(user.email, new_bio)
-        logger.info("User %s changed bio to %s from %s", user.email, new_bio, user.bio)
+        logger.info("User %s changed bio", user.email)
     except UserNotFound as error:
         raise HTTPException(status_code=USER_NOT_FOUND, detail=str(error)) from error
     return {"message": "User information updated"}
@@ -104,9 +104,7 @@ def change_name(new_name: str, token: str = Header(...)):
     try:
         user = check_and_get_user_from_token(token)
         user_handler.change_name(user.email, new_name)
-        logger.info(
-            "User %s changed name to %s from %s", user.email, new_name, user.name
-        )
+        logger.info("User %s changed name", user.email)
     except UserNotFound as error:
         raise HTTPException(status_code=USER_NOT_FOUND, detail=str(error)) from error
     return {"message": "User information updated"}
@@ -125,12 +123,7 @@ def change_date_of_birth(new_date_of_birth: str, token: str = Header(...)):
     try:
         user = check_and_get_user_from_token(token)
         user_handler.change_date_of_birth(user.email, new_date_of_birth)
-        logger.info(
-            "User %s changed date of birth to %s from %s",
-            user.email,
-            new_date_of_birth,
-            user.date_of_birth,
-        )
+        logger.info("User %s changed date of birth", user.email)
     except UserNotFound as error:
         raise HTTPException(status_code=USER_NOT_FOUND, detail=str(error)) from error
     return {"message": "User information updated"}
@@ -149,12 +142,7 @@ def change_last_name(new_last_name: str, token: str = Header(...)):
     try:
         user = check_and_get_user_from_token(token)
         user_handler.change_last_name(user.email, new_last_name)
-        logger.info(
-            "User %s changed last name to %s from %s",
-            user.email,
-            new_last_name,
-            user.surname,
-        )
+        logger.info("User %s changed last name", user.email)
     except UserNotFound as error:
         raise HTTPException(status_code=USER_NOT_FOUND, detail=str(error)) from error
     return {"message": "User information updated"}
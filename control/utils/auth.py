@@ -10,6 +10,7 @@ from fastapi import HTTPException, Security
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from passlib.context import CryptContext
 from control.utils.logger import logger
+from control.utils.prometheus import AUTH_LATENCY, timed
 
 LIFE_TIME_DAYS = 30
 LIFE_TIME_MINS = 0
@@ -29,6 +30,7 @@ class AuthHandler:
     pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
     secret = "SO_SECRET"
 
+    @timed(AUTH_LATENCY.labels("bcrypt_hash"))
     def get_password_hash(self, password):
         """
         get a new hash from the password
@@ -36,12 +38,14 @@ class AuthHandler:
 
         return self.pwd_context.hash(password)
 
+    @timed(AUTH_LATENCY.labels("bcrypt_verify"))
     def verify_password(self, plain_password, hashed_password):
         """
         check if the password and the hashed password given match
         """
         return self.pwd_context.verify(plain_password, hashed_password)
 
+    @timed(AUTH_LATENCY.labels("jwt_encode"))
     def encode_token(self, user_email):
         """
         encode the token with the user email and the expiration date
@@ -57,6 +61,7 @@ class AuthHandler:
 
         return jwt.encode(payload, self.secret, algorithm=ENCODING_ALGORITHM)
 
+    @timed(AUTH_LATENCY.labels("jwt_decode"))
     def decode_token(self, token):
         """
         decode the token and return the user email
@@ -0,0 +1,68 @@
+# caching.py
+"""
+This module has the helpers for the conditional GETs.
+
+The routes compute a strong ETag from the versions of the rows they show
+(users.version and users.follow_version), without building the body.
+If the client sends it back in If-None-Match, they answer 304.
+
+Public profiles can also be cached by an edge cache for
+PUBLIC_PROFILE_MAX_AGE seconds (defaults to 30).
+"""
+import os
+from fastapi import Response
+from control.codes import NOT_MODIFIED
+
+# The client can keep the response, but has to revalidate it every time.
+PRIVATE_CACHE = "private, no-cache"
+PUBLIC_PROFILE_MAX_AGE = int(os.getenv("PUBLIC_PROFILE_MAX_AGE", "30"))
+PUBLIC_CACHE = "public, max-age=" + str(PUBLIC_PROFILE_MAX_AGE)
+# Every route depends on who is asking.
+VARY = "token"
+
+
+def make_etag(*parts):
+    """
+    Returns a strong ETag made of the given parts,
+    like make_etag("user", 7, 3) -> '"user-7-3"'.
+    """
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def etag_matches(if_none_match, etag: str):
+    """
+    Returns True if the If-None-Match header has the given ETag.
+    If-None-Match uses the weak comparison, so W/ is ignored.
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in ("*", etag):
+            return True
+    return False
+
+
+def cache_headers(etag: str, cache_control=PRIVATE_CACHE):
+    """
+    Returns the caching headers of a response with the given ETag.
+    """
+    return {"ETag": etag, "Cache-Control": cache_control, "Vary": VARY}
+
+
+def set_cache_headers(response: Response, etag: str, cache_control=PRIVATE_CACHE):
+    """
+    Adds the caching headers to the response of a route.
+    """
+    response.headers.update(cache_headers(etag, cache_control))
+
+
+def not_modified(etag: str, cache_control=PRIVATE_CACHE):
+    """
+    Returns the 304 response for a client that already has the ETag.
+    """
+    return Response(
+        status_code=NOT_MODIFIED, headers=cache_headers(etag, cache_control)
+    )
@@ -0,0 +1,244 @@
+# instrumentation.py
+"""
+This module hooks the metrics registry (control/utils/prometheus.py)
+into the app, the database engine and the rabbitmq queue.
+"""
+import sys
+import time
+from anyio import to_thread
+from sqlalchemy import event
+from control.utils.prometheus import (
+    registry,
+    REQUEST_LATENCY,
+    REQUESTS_IN_PROGRESS,
+    DB_QUERY_LATENCY,
+    DB_QUERIES,
+    DB_POOL_CHECKOUT,
+    record_cache_lookup,
+)
+from control.utils.query_stats import record_query
+from control.utils.slow_queries import (
+    slow_query_log,
+    route_comment,
+    SLOW_QUERY_EXPLAIN,
+    SQL_COMMENTS,
+)
+
+REPOSITORY_MODULE = "repository.user_repository"
+UNKNOWN_FUNCTION = "unknown"
+UNMATCHED_ROUTE = "unmatched"
+# How many frames we walk up looking for the repository function.
+MAX_STACK_DEPTH = 50
+QUERY_START_KEY = "query_start_time"
+
+THREADPOOL_IN_USE = registry.gauge(
+    "threadpool_threads_in_use", "Worker threads running sync routes right now."
+)
+THREADPOOL_SIZE = registry.gauge(
+    "threadpool_threads_total", "Max worker threads available for sync routes."
+)
+
+
+def repository_caller():
+    """
+    Returns the name of the function of the repository layer that
+    is executing the current statement, or "unknown" if there is none.
+    """
+    # pylint: disable=protected-access
+    frame = sys._getframe(1)
+    depth = 0
+    while frame is not None and depth < MAX_STACK_DEPTH:
+        if frame.f_globals.get("__name__") == REPOSITORY_MODULE:
+            return frame.f_code.co_name
+        frame = frame.f_back
+        depth += 1
+    return UNKNOWN_FUNCTION
+
+
+def _before_cursor_execute(conn, *_):
+    conn.info.setdefault(QUERY_START_KEY, []).append(time.perf_counter())
+
+
+# pylint: disable=too-many-arguments
+def _after_cursor_execute(conn, _, statement, parameters, __, executemany):
+    elapsed = time.perf_counter() - conn.info[QUERY_START_KEY].pop()
+    function = repository_caller()
+    DB_QUERY_LATENCY.labels(function).observe(elapsed)
+    DB_QUERIES.labels(function).inc()
+    record_query(statement, parameters, elapsed, executemany)
+    slow_query_log.record(statement, parameters, elapsed, function, executemany)
+
+
+# pylint: disable=too-many-arguments
+def _add_route_comment(_, __, statement, parameters, ___, ____):
+    return statement + route_comment(), parameters
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute isn't called when the statement fails.
+    connection = exception_context.connection
+    if connection is not None and connection.info.get(QUERY_START_KEY):
+        connection.info[QUERY_START_KEY].pop()
+
+
+def _pool_status(pool):
+    status = []
+    for name in ("size", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if method is not None:
+            status.append(((name,), method()))
+    return status
+
+
+def instrument_statements(engine):
+    """
+    Records the latency and count of every statement by repository function
+    and by request (see query_stats). It can be called more than once.
+    """
+    if event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def instrument_engine(engine):
+    """
+    Records every statement (see instrument_statements), the time spent
+    waiting for a connection and the state of the pool.
+    """
+    instrument_statements(engine)
+
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            DB_POOL_CHECKOUT.observe(time.perf_counter() - start)
+
+    pool.connect = timed_connect
+    registry.gauge(
+        "db_pool_connections",
+        "Connections of the pool by state.",
+        ("state",),
+        callback=lambda: _pool_status(pool),
+    )
+
+
+def instrument_slow_queries(engine):
+    """
+    Starts taking the plans of the slow statements if the slow query log
+    is enabled, and adds the routes to the statements if SQL_COMMENTS is
+    (see slow_queries).
+    """
+    if slow_query_log.enabled and SLOW_QUERY_EXPLAIN:
+        slow_query_log.start_explaining(engine)
+    if SQL_COMMENTS:
+        event.listen(engine, "before_cursor_execute", _add_route_comment, retval=True)
+
+
+def instrument_rabbitmq(manager):
+    """
+    Exposes the depth of the rabbitmq metrics queue. It's read on every scrape.
+    """
+
+    def queue_depth():
+        depth = manager.queue_depth()
+        return [] if depth is None else [((), depth)]
+
+    registry.gauge(
+        "metrics_queue_depth",
+        "Messages waiting in the rabbitmq metrics queue.",
+        callback=queue_depth,
+    )
+
+
+def instrument_suggestion_cache(cache):
+    """
+    Counts the hits and misses of the suggestions cache and exposes how
+    many users have an entry.
+    """
+    cache.on_lookup = lambda hit: record_cache_lookup("suggestions", hit)
+    registry.gauge(
+        "suggestion_cache_users",
+        "Users with their follow suggestions cached.",
+        callback=lambda: [((), len(cache))],
+    )
+
+
+def instrument_follow_graph(graph):
+    """
+    Exposes the relations and the bytes of the follow graph index (both
+    are 0 until it's loaded).
+    """
+    registry.gauge(
+        "follow_graph_edges",
+        "Relations in the in-process follow graph index.",
+        callback=lambda: [((), graph.edges())],
+    )
+    registry.gauge(
+        "follow_graph_bytes",
+        "Bytes of the arrays of the in-process follow graph index.",
+        callback=lambda: [((), graph.size())],
+    )
+
+
+def instrument_interest_index(index):
+    """
+    Exposes the bytes of the interest index (0 until it's loaded).
+    """
+    registry.gauge(
+        "interest_index_bytes",
+        "Bytes of the postings of the in-process interest index.",
+        callback=lambda: [((), index.size())],
+    )
+
+
+def instrument_autocomplete_index(index):
+    """
+    Exposes the bytes of the autocomplete index (0 until it's loaded).
+    """
+    registry.gauge(
+        "autocomplete_index_bytes",
+        "Bytes of the arrays of the in-process autocomplete index.",
+        callback=lambda: [((), index.size())],
+    )
+
+
+def add_metrics_middleware(app):
+    """
+    Adds the middleware that records the latency of every route and the
+    saturation of the threadpool that runs the sync routes.
+    """
+    in_progress = [0]
+
+    @app.middleware("http")
+    async def record_request_metrics(request, call_next):
+        # This runs on the event loop, so nothing here needs a lock.
+        limiter = to_thread.current_default_thread_limiter()
+        THREADPOOL_IN_USE.set(limiter.borrowed_tokens)
+        THREADPOOL_SIZE.set(limiter.total_tokens)
+        in_progress[0] += 1
+        REQUESTS_IN_PROGRESS.set(in_progress[0])
+        status = 500
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            in_progress[0] -= 1
+            REQUESTS_IN_PROGRESS.set(in_progress[0])
+            route = request.scope.get("route")
+            # The template (/users/{email}) and not the path, to keep
+            # the number of series bounded.
+            route_path = route.path if route is not None else UNMATCHED_ROUTE
+            REQUEST_LATENCY.labels(request.method, route_path, str(status)).observe(
+                elapsed
+            )
+
+    return record_request_metrics
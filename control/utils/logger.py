@@ -1,7 +1,191 @@
 # logger.py
 """
 This is the global logger that will be used throughout the project.
+
+Routes only put the record in a queue: a QueueListener thread formats
+it (as JSON by default) and writes it, so that work is off the request.
+
+It's configured with environment variables:
+- LOG_LEVEL: minimum level that is logged. Defaults to INFO.
+- LOG_FORMAT: "json" (default) or "text".
+- LOG_SAMPLE_RATES: ratio of the records kept by level, like "DEBUG=0,INFO=0.5".
+  WARNING and above are always kept unless configured here.
+- LOG_ROUTE_SAMPLE_RATES: ratio of the INFO and DEBUG records kept for
+  specific routes, like "GET /is_following/{email}=0.1".
 """
+import atexit
+import json
 import logging
+import os
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+LOGGER_NAME = "back-users"
+REQUEST_ID_HEADER = "X-Request-ID"
+NO_REQUEST = "-"
+
+# The request id and the scope of the request being handled by this context.
+request_id_var = ContextVar("request_id", default=NO_REQUEST)
+request_scope_var = ContextVar("request_scope", default=None)
+
+
+def _parse_rates(text: str):
+    """
+    Parses "INFO=0.5,DEBUG=0" into a dict.
+    """
+    rates = {}
+    for item in text.split(","):
+        if "=" not in item:
+            continue
+        key, rate = item.rsplit("=", 1)
+        rates[key.strip()] = float(rate)
+    return rates
+
+
+def current_route():
+    """
+    Returns the route being handled (like "GET /users/{email}"),
+    or None outside of a request.
+    """
+    scope = request_scope_var.get()
+    if scope is None:
+        return None
+    route = scope.get("route")
+    if route is None:
+        return None
+    return scope["method"] + " " + route.path
+
+
+# pylint: disable=too-few-public-methods
+class SamplingFilter(logging.Filter):
+    """
+    Drops a ratio of the records by level, and of the INFO and DEBUG
+    records of the routes that have a ratio configured.
+    """
+
+    def __init__(self, level_rates=None, route_rates=None):
+        super().__init__()
+        self._level_rates = level_rates or {}
+        self._route_rates = route_rates or {}
+
+    def filter(self, record):
+        rate = self._level_rates.get(record.levelname, 1.0)
+        if record.levelno <= logging.INFO and self._route_rates:
+            rate = min(rate, self._route_rates.get(current_route(), 1.0))
+        return rate >= 1.0 or random.random() < rate
+
+
+class RequestQueueHandler(QueueHandler):
+    """
+    Queue handler that only adds the request id and the route to the record.
+    Unlike QueueHandler, it doesn't format the message on the calling
+    thread: the listener does it.
+    """
+
+    def prepare(self, record):
+        record.request_id = request_id_var.get()
+        record.route = current_route()
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats the records as one JSON object per line.
+    """
+
+    def format(self, record):
+        entry = {
+            "timestamp": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", NO_REQUEST),
+        }
+        route = getattr(record, "route", None)
+        if route is not None:
+            entry["route"] = route
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def create_output_handler(log_format: str, stream=None):
+    """
+    Returns the handler that actually writes the records.
+    """
+    handler = logging.StreamHandler(stream or sys.stdout)
+    if log_format == "text":
+        handler.setFormatter(
+            logging.Formatter(
+                "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+            )
+        )
+    else:
+        handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def configure_logger(settings, stream=None):
+    """
+    Configures a logger that writes through a queue.
+    Returns the logger and the listener (already started).
+    """
+    log_queue = queue.SimpleQueue()
+    queue_handler = RequestQueueHandler(log_queue)
+    queue_handler.addFilter(
+        SamplingFilter(settings["level_rates"], settings["route_rates"])
+    )
+    listener = QueueListener(
+        log_queue, create_output_handler(settings["format"], stream)
+    )
+    listener.start()
+
+    configured_logger = logging.getLogger(settings["name"])
+    configured_logger.setLevel(settings["level"])
+    configured_logger.handlers = [queue_handler]
+    configured_logger.propagate = False
+    return configured_logger, listener
+
+
+def settings_from_env():
+    """
+    Reads the logging settings from the environment variables.
+    """
+    return {
+        "name": LOGGER_NAME,
+        "level": os.getenv("LOG_LEVEL", "INFO").upper(),
+        "format": os.getenv("LOG_FORMAT", "json").lower(),
+        "level_rates": _parse_rates(os.getenv("LOG_SAMPLE_RATES", "")),
+        "route_rates": _parse_rates(os.getenv("LOG_ROUTE_SAMPLE_RATES", "")),
+    }
+
+
+def add_request_context_middleware(app):
+    """
+    Adds the middleware that gives every request an id (the X-Request-ID
+    header if the client sent one) so all its logs can be grouped.
+    """
+
+    @app.middleware("http")
+    async def set_request_context(request, call_next):
+        request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        id_token = request_id_var.set(request_id)
+        scope_token = request_scope_var.set(request.scope)
+        try:
+            response = await call_next(request)
+        finally:
+            request_id_var.reset(id_token)
+            request_scope_var.reset(scope_token)
+        response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+
+    return set_request_context
+
 
-logger = logging.getLogger("uvicorn")
+logger, _listener = configure_logger(settings_from_env())
+# Writes whatever is left in the queue before the process ends.
+atexit.register(_listener.stop)
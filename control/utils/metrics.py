@@ -7,6 +7,7 @@ import json
 import os
 import ssl
 import pika
+from control.utils.prometheus import METRICS_PUBLISH_LATENCY
 
 LOGIN_EVENT = "login"
 REGISTER_EVENT = "registration"
@@ -65,10 +66,22 @@ class RabbitMQManager:
         """
         Gets a valid channel and publishes the metric
         """
-        rabbitmq_channel = self.get_channel()
-        rabbitmq_channel.basic_publish(
-            exchange="", routing_key=QUEUE_NAME, body=json_body
-        )
+        with METRICS_PUBLISH_LATENCY.time():
+            rabbitmq_channel = self.get_channel()
+            rabbitmq_channel.basic_publish(
+                exchange="", routing_key=QUEUE_NAME, body=json_body
+            )
+
+    def queue_depth(self):
+        """
+        Returns how many messages are waiting in the metrics queue,
+        or None if the broker can't be asked right now.
+        """
+        try:
+            declared = self.get_channel().queue_declare(queue=QUEUE_NAME, passive=True)
+        except pika.exceptions.AMQPError:
+            return None
+        return declared.method.message_count
 
 
 class RegistrationMetric:
@@ -0,0 +1,392 @@
+# profiler.py
+"""
+This module is for finding where the time goes inside the process, with
+sampling profilers: a thread takes the stacks of the other threads every
+few milliseconds (sys._current_frames), and counts them as "folded"
+stacks, the outermost function first and separated by ";", which is what
+flamegraph.pl and speedscope read. The threads that are waiting for work
+(in selectors, threading or queue) are not counted. The time in C code
+(bcrypt, the driver waiting for postgres) is counted in the Python
+function that called it.
+
+There are two of them:
+- The profile of a single request: an admin sends the header X-Profile: 1
+  (or ?profile=1) and the request runs with a thread sampling every
+  millisecond the event loop and the threads running its endpoint.
+  Nothing changes in the response but the header X-Profile-Id, the id of
+  the profile in GET /admin/profiles/{profile_id} (the last
+  PROFILES_KEPT are kept). The sync routes run in a threadpool, so a
+  deterministic profiler (cProfile) in the middleware wouldn't see them.
+  Other requests of the same route that run at the same time are
+  counted too, and so is the event loop while it handles them. The body
+  of a streamed response is sent after the headers, so it's not counted.
+- The always-on one, if PROFILER_SAMPLE_MS is set: a thread samples every
+  thread every PROFILER_SAMPLE_MS and keeps the counts of the last
+  PROFILER_WINDOWS windows of PROFILER_WINDOW seconds, for
+  GET /admin/profiler/hot. A sample takes a few microseconds per thread,
+  so at 10 ms it's well under 1% of a CPU.
+
+It's configured with environment variables:
+- PROFILER_SAMPLE_MS: milliseconds between the samples of the always-on
+  profiler. Defaults to nothing, it's disabled.
+- PROFILER_WINDOW: seconds of every window. Defaults to 60.
+- PROFILER_WINDOWS: how many windows are kept. Defaults to 15.
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from datetime import datetime
+from inspect import unwrap
+from starlette.concurrency import run_in_threadpool
+from control.utils.logger import NO_REQUEST, current_route, request_id_var
+
+PROFILER_SAMPLE_MS = os.getenv("PROFILER_SAMPLE_MS")
+PROFILER_WINDOW = float(os.getenv("PROFILER_WINDOW", "60"))
+PROFILER_WINDOWS = int(os.getenv("PROFILER_WINDOWS", "15"))
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY = "profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+# Milliseconds between the samples of a profiled request.
+REQUEST_SAMPLE_MS = 1
+# Profiles of requests that are kept.
+PROFILES_KEPT = 20
+# Frames of a stack that are kept, the innermost ones.
+MAX_DEPTH = 64
+# Different stacks of a profile, the rest are counted as OTHER.
+MAX_STACKS = 5000
+OTHER = "(other)"
+FORMAT_JSON = "json"
+FORMAT_FOLDED = "folded"
+PROFILE_FORMATS = (FORMAT_JSON, FORMAT_FOLDED)
+# The threads with a function of these files at the top of the stack are
+# waiting for work, and so are the ones in these functions (the thread of
+# the logs waits in the C code of a SimpleQueue).
+IDLE_FILES = ("selectors.py", "threading.py", "queue.py")
+IDLE_FUNCTIONS = (("handlers.py", "dequeue"),)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+def _thread_frames():
+    """
+    Returns (id, frame at the top of its stack) of every thread.
+    """
+    # It's the only way to see the stacks of other threads.
+    return sys._current_frames().items()  # pylint: disable=protected-access
+
+
+def is_idle(frame):
+    """
+    Returns whether the thread with the frame at the top of its stack is
+    waiting for work.
+    """
+    filename = os.path.basename(frame.f_code.co_filename)
+    return filename in IDLE_FILES or (filename, frame.f_code.co_name) in IDLE_FUNCTIONS
+
+
+def folded_stack(frame, depth=MAX_DEPTH):
+    """
+    Returns the stack of the frame, the outermost function first.
+    """
+    names = []
+    while frame is not None and len(names) < depth:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def stack_has_code(frame, code):
+    """
+    Returns whether the code object runs in the stack of the frame.
+    """
+    while frame is not None:
+        if frame.f_code is code:
+            return True
+        frame = frame.f_back
+    return False
+
+
+class StackProfile:
+    """
+    The counts of the folded stacks of a profile.
+    """
+
+    def __init__(self):
+        self.samples = 0
+        self.stacks = Counter()
+
+    def add(self, stack, count=1):
+        """
+        Counts a folded stack.
+        """
+        self.samples += count
+        if stack not in self.stacks and len(self.stacks) >= MAX_STACKS:
+            stack = OTHER
+        self.stacks[stack] += count
+
+    def merge(self, other):
+        """
+        Adds the counts of another profile.
+        """
+        for stack, count in other.stacks.items():
+            self.add(stack, count)
+
+    def functions(self, limit):
+        """
+        Returns the limit functions in the most samples, with the samples
+        they were running in ("self") and the ones they were in the stack.
+        """
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            names = stack.split(";")
+            own[names[-1]] += count
+            for name in set(names):
+                total[name] += count
+        return [
+            {"function": name, "samples": samples, "self": own[name]}
+            for name, samples in total.most_common(limit)
+        ]
+
+    def folded(self):
+        """
+        Returns the profile in the folded format, a stack per line.
+        """
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+    def as_dict(self, limit):
+        """
+        Returns the samples, the hottest functions and the limit hottest
+        stacks.
+        """
+        return {
+            "samples": self.samples,
+            "functions": self.functions(limit),
+            "stacks": [
+                {"stack": stack.split(";"), "samples": count}
+                for stack, count in self.stacks.most_common(limit)
+            ],
+        }
+
+
+class RequestSampler:
+    """
+    The thread that samples the event loop and the threads running the
+    endpoint of a request while it's handled, see the module docstring.
+    """
+
+    def __init__(self, scope, interval=REQUEST_SAMPLE_MS / 1000):
+        self.profile = StackProfile()
+        self._scope = scope
+        self._interval = interval
+        self._loop_thread = threading.get_ident()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._sample, name="request-profiler", daemon=True
+        )
+
+    def start(self):
+        """
+        Starts sampling.
+        """
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops sampling and returns the profile.
+        """
+        self._stopped.set()
+        self._thread.join()
+        return self.profile
+
+    def _endpoint_code(self):
+        endpoint = self._scope.get("endpoint")
+        return None if endpoint is None else getattr(unwrap(endpoint), "__code__", None)
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self._interval):
+            code = self._endpoint_code()
+            for ident, frame in _thread_frames():
+                if ident == own or is_idle(frame):
+                    continue
+                if ident == self._loop_thread or (
+                    code is not None and stack_has_code(frame, code)
+                ):
+                    self.profile.add(folded_stack(frame))
+
+
+class ProfileStore:
+    """
+    The profiles of the last requests that were profiled.
+    """
+
+    def __init__(self, size=PROFILES_KEPT):
+        self._size = size
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile_id, profile, route, seconds):
+        """
+        Keeps the profile of a request, dropping the oldest one if there
+        are already size of them.
+        """
+        with self._lock:
+            self._profiles[profile_id] = {
+                "id": profile_id,
+                "at": datetime.utcnow().isoformat(),
+                "route": route,
+                "ms": round(seconds * 1000, 3),
+                "profile": profile,
+            }
+            while len(self._profiles) > self._size:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id):
+        """
+        Returns the profile with the id (and what the request was), or None.
+        """
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def summaries(self):
+        """
+        Returns what the requests of the profiles were, the most recent
+        first.
+        """
+        with self._lock:
+            return [
+                {key: value for key, value in entry.items() if key != "profile"}
+                | {"samples": entry["profile"].samples}
+                for entry in reversed(self._profiles.values())
+            ]
+
+
+class SamplingProfiler:
+    """
+    The always-on profiler, see the module docstring. It's disabled if
+    interval_ms is None.
+    """
+
+    def __init__(
+        self, interval_ms=None, window=PROFILER_WINDOW, windows=PROFILER_WINDOWS
+    ):
+        self.interval = None if interval_ms is None else interval_ms / 1000
+        self.window = window
+        # (start, StackProfile) of every window, the current one last.
+        self._windows = deque(maxlen=windows)
+        self._lock = threading.Lock()
+        # Seconds spent taking the samples, its overhead.
+        self.sampling_seconds = 0.0
+
+    @property
+    def enabled(self):
+        """
+        Whether the profiler samples the threads.
+        """
+        return self.interval is not None
+
+    def start(self):
+        """
+        Starts the thread that samples the others, if it's enabled.
+        """
+        if self.enabled:
+            threading.Thread(
+                target=self._sample_forever, name="sampling-profiler", daemon=True
+            ).start()
+
+    def _sample_forever(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            self.sample(skip=own)
+
+    def sample(self, skip=None):
+        """
+        Counts the stacks of the threads that are not idle (nor skip) in
+        the current window.
+        """
+        started = time.perf_counter()
+        stacks = [
+            folded_stack(frame)
+            for ident, frame in _thread_frames()
+            if ident != skip and not is_idle(frame)
+        ]
+        now = time.time()
+        with self._lock:
+            if not self._windows or now - self._windows[-1][0] >= self.window:
+                self._windows.append((now, StackProfile()))
+            profile = self._windows[-1][1]
+            for stack in stacks:
+                profile.add(stack)
+            self.sampling_seconds += time.perf_counter() - started
+
+    def hot(self, seconds):
+        """
+        Returns the profile of the windows that started in the last
+        seconds (the current one always counts).
+        """
+        since = time.time() - seconds
+        profile = StackProfile()
+        with self._lock:
+            for index, (start, window) in enumerate(self._windows):
+                if start >= since or index == len(self._windows) - 1:
+                    profile.merge(window)
+        return profile
+
+
+def wants_profile(request):
+    """
+    Returns whether the request asks to be profiled.
+    """
+    flag = request.headers.get(PROFILE_HEADER) or request.query_params.get(
+        PROFILE_QUERY
+    )
+    return flag is not None and flag.lower() in ("1", "true")
+
+
+def add_profiler_middleware(app, is_admin, store=None):
+    """
+    Adds the middleware that profiles the requests of admins that ask for
+    it, see the module docstring. is_admin(token) checks the token header.
+    """
+    store = profile_store if store is None else store
+
+    @app.middleware("http")
+    async def profile_request(request, call_next):
+        if not wants_profile(request):
+            return await call_next(request)
+        token = request.headers.get("token")
+        if token is None or not await run_in_threadpool(is_admin, token):
+            return await call_next(request)
+        sampler = RequestSampler(request.scope)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            response = await call_next(request)
+        finally:
+            profile = sampler.stop()
+        profile_id = request_id_var.get()
+        if profile_id == NO_REQUEST:
+            profile_id = uuid.uuid4().hex
+        store.add(profile_id, profile, current_route(), time.perf_counter() - started)
+        response.headers[PROFILE_ID_HEADER] = profile_id
+        return response
+
+    return profile_request
+
+
+profile_store = ProfileStore()
+sampling_profiler = SamplingProfiler(
+    None if PROFILER_SAMPLE_MS is None else float(PROFILER_SAMPLE_MS)
+)
@@ -0,0 +1,511 @@
+# prometheus.py
+"""
+This module is an in-process metrics registry that is exposed in the
+Prometheus text format on /metrics.
+
+Recording a value is lock-free on the hot path: every metric keeps one
+shard per thread and only the thread that owns a shard writes to it.
+The shards are added together when /metrics is scraped.
+"""
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Default buckets (in seconds), good enough for routes and db queries:
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# bcrypt is slow on purpose, so it needs bigger buckets:
+AUTH_BUCKETS = (0.0001, 0.001, 0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0)
+# Statements run by a request:
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+# An export of the whole table takes seconds or minutes:
+EXPORT_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+class _Shards:
+    """
+    One shard per thread, created lazily. Only the creation of a shard
+    takes the lock, after that the thread writes to its own shard.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = []
+
+    def get(self):
+        """
+        Returns the shard of the current thread.
+        """
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._factory()
+            with self._lock:
+                self._all.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def all(self):
+        """
+        Returns a copy of the list of shards of every thread.
+        """
+        with self._lock:
+            return list(self._all)
+
+
+class _CounterChild:
+    """
+    A counter for one combination of label values.
+    """
+
+    def __init__(self):
+        self._shards = _Shards(lambda: [0.0])
+
+    def inc(self, ammount=1.0):
+        """
+        Increments the counter by ammount (default 1).
+        """
+        self._shards.get()[0] += ammount
+
+    def value(self):
+        """
+        Returns the value of the counter summing all the shards.
+        """
+        return sum(shard[0] for shard in self._shards.all())
+
+
+class _GaugeChild:
+    """
+    A gauge for one combination of label values.
+    Gauges are set from a single place, so they don't need shards.
+    """
+
+    def __init__(self):
+        self._value = 0.0
+
+    def set(self, value):
+        """
+        Sets the gauge to value.
+        """
+        self._value = value
+
+    def value(self):
+        """
+        Returns the current value of the gauge.
+        """
+        return self._value
+
+
+class _HistogramChild:
+    """
+    A histogram for one combination of label values.
+    Each shard is a list with a counter per bucket (the last one is +Inf)
+    followed by the sum of the observed values.
+    """
+
+    def __init__(self, buckets):
+        self._buckets = buckets
+        size = len(buckets) + 2
+        self._shards = _Shards(lambda: [0.0] * size)
+
+    def observe(self, value):
+        """
+        Records a new observation.
+        """
+        shard = self._shards.get()
+        shard[bisect_left(self._buckets, value)] += 1
+        shard[-1] += value
+
+    def time(self):
+        """
+        Returns a context manager that observes the time spent inside it.
+        """
+        return _Timer(self)
+
+    def snapshot(self):
+        """
+        Returns the cumulative bucket counts, the total count and the sum.
+        """
+        totals = [0.0] * (len(self._buckets) + 2)
+        for shard in self._shards.all():
+            for index, value in enumerate(shard):
+                totals[index] += value
+        cumulative = []
+        running = 0.0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, running, totals[-1]
+
+
+class _Timer:
+    """
+    Context manager used by histogram.time()
+    """
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._start)
+
+
+class _Metric:
+    """
+    Base class for a metric family: a name, a help text and the children
+    for every combination of label values that was used.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *labelvalues):
+        """
+        Returns the child for the given label values (in the same order as
+        labelnames), creating it the first time.
+        """
+        child = self._children.get(labelvalues)
+        if child is None:
+            if len(labelvalues) != len(self.labelnames):
+                raise ValueError("Wrong number of labels for " + self.name)
+            with self._lock:
+                child = self._children.setdefault(labelvalues, self._new_child())
+        return child
+
+    def children(self):
+        """
+        Returns a copy of the (labelvalues, child) pairs.
+        """
+        with self._lock:
+            return list(self._children.items())
+
+    def _label_text(self, labelvalues, extra=None):
+        pairs = list(zip(self.labelnames, labelvalues))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        inner = ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs)
+        return "{" + inner + "}"
+
+    def samples(self):
+        """
+        Returns the lines of this metric in the Prometheus text format.
+        """
+        raise NotImplementedError
+
+    def render(self):
+        """
+        Returns the HELP, TYPE and sample lines of the metric.
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(_Metric):
+    """
+    A value that only goes up.
+    """
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, ammount=1.0):
+        """
+        Increments the counter without labels.
+        """
+        self._children[()].inc(ammount)
+
+    def samples(self):
+        return [
+            f"{self.name}{self._label_text(labels)} {_format(child.value())}"
+            for labels, child in self.children()
+        ]
+
+
+class Gauge(_Metric):
+    """
+    A value that can go up and down. If a callback is given, it's called
+    on every scrape and must return a list of (labelvalues, value).
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        """
+        Sets the gauge without labels.
+        """
+        self._children[()].set(value)
+
+    def samples(self):
+        if self.callback is not None:
+            for labelvalues, value in self.callback():
+                self.labels(*labelvalues).set(value)
+        return [
+            f"{self.name}{self._label_text(labels)} {_format(child.value())}"
+            for labels, child in self.children()
+        ]
+
+
+class Histogram(_Metric):
+    """
+    Observations counted in buckets, plus their count and sum.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        """
+        Observes a value in the histogram without labels.
+        """
+        self._children[()].observe(value)
+
+    def time(self):
+        """
+        Times the block inside it in the histogram without labels.
+        """
+        return self._children[()].time()
+
+    def samples(self):
+        lines = []
+        bounds = [_format(bucket) for bucket in self.buckets] + ["+Inf"]
+        for labels, child in self.children():
+            cumulative, count, total = child.snapshot()
+            for bound, value in zip(bounds, cumulative):
+                label_text = self._label_text(labels, ("le", bound))
+                lines.append(f"{self.name}_bucket{label_text} {_format(value)}")
+            label_text = self._label_text(labels)
+            lines.append(f"{self.name}_count{label_text} {_format(count)}")
+            lines.append(f"{self.name}_sum{label_text} {_format(total)}")
+        return lines
+
+
+class Registry:
+    """
+    Holds all the metrics of the process and renders them.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Adds a metric to the registry and returns it.
+        """
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError("Metric " + metric.name + " already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """
+        Creates and registers a counter.
+        """
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        """
+        Creates and registers a gauge.
+        """
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        Creates and registers a histogram.
+        """
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name):
+        """
+        Returns the metric registered with the given name.
+        """
+        return self._metrics[name]
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception:  # pylint: disable=broad-except
+                # A broken callback can't take the whole scrape down.
+                continue
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value):
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def timed(histogram_child):
+    """
+    Decorator that observes the duration of every call to the function
+    in the given histogram child.
+    """
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram_child.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+# Global registry and the metrics used throughout the project:
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    "http_request_duration_seconds",
+    "Latency of the HTTP requests by route.",
+    ("method", "route", "status"),
+)
+REQUESTS_IN_PROGRESS = registry.gauge(
+    "http_requests_in_progress", "HTTP requests currently being handled."
+)
+DB_QUERY_LATENCY = registry.histogram(
+    "db_query_duration_seconds",
+    "Latency of the database statements by repository function.",
+    ("function",),
+)
+DB_QUERIES = registry.counter(
+    "db_queries_total",
+    "Number of database statements by repository function.",
+    ("function",),
+)
+REQUEST_DB_QUERIES = registry.histogram(
+    "http_request_db_queries",
+    "Database statements run by each HTTP request, by route.",
+    ("method", "route"),
+    QUERY_COUNT_BUCKETS,
+)
+REQUEST_DB_DURATION = registry.histogram(
+    "http_request_db_duration_seconds",
+    "Time spent in the database by each HTTP request, by route.",
+    ("method", "route"),
+)
+N_PLUS_ONE_REQUESTS = registry.counter(
+    "db_n_plus_one_total",
+    "Requests that ran a statement with many different parameters"
+    " (a probable N+1), by route.",
+    ("method", "route"),
+)
+DB_POOL_CHECKOUT = registry.histogram(
+    "db_pool_checkout_seconds",
+    "Time spent waiting for a connection from the pool.",
+)
+AUTH_LATENCY = registry.histogram(
+    "auth_operation_duration_seconds",
+    "Time spent hashing and verifying passwords and tokens.",
+    ("operation",),
+    AUTH_BUCKETS,
+)
+CACHE_REQUESTS = registry.counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result (hit or miss).",
+    ("cache", "result"),
+)
+METRICS_PUBLISH_LATENCY = registry.histogram(
+    "metrics_queue_publish_duration_seconds",
+    "Time spent pushing a business metric to the rabbitmq queue.",
+)
+EXPORT_ROWS = registry.counter(
+    "export_rows_total",
+    "Rows sent by the streamed exports of the admins.",
+    ("export",),
+)
+EXPORT_DURATION = registry.histogram(
+    "export_duration_seconds",
+    "Duration of the streamed exports of the admins.",
+    ("export",),
+    EXPORT_BUCKETS,
+)
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    """
+    Counts a lookup in one of the caches of the service.
+    The hit ratio is hits / (hits + misses).
+    """
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_export(export: str, rows: int, seconds: float):
+    """
+    Records the rows and the duration of a streamed export.
+    The throughput is export_rows_total / export_duration_seconds_sum.
+    """
+    EXPORT_ROWS.labels(export).inc(rows)
+    EXPORT_DURATION.labels(export).observe(seconds)
@@ -0,0 +1,153 @@
+# query_stats.py
+"""
+This module counts the database statements of every request and the time
+they take (the engine hooks of control/utils/instrumentation.py record
+them here), to catch the routes that run more queries than they should.
+
+Every request has its QueryStats in a context variable, the sync routes
+see it from the threadpool too. When the request ends its count and time
+go to the metrics by route, and in debug mode to the response headers
+X-DB-Queries and X-DB-Time-Ms.
+
+A statement that runs with many different parameters in the same request
+is probably a query per row of another one (an N+1): it's logged as a
+warning, counted in db_n_plus_one_total and, in debug mode, the header
+X-DB-N-Plus-One has how many statements were like that.
+
+The statements of a streamed body run after the headers are sent, so
+they're not counted.
+
+It's configured with environment variables:
+- DEBUG: 1 to add the headers to the responses. Defaults to 0.
+- N_PLUS_ONE_THRESHOLD: different parameters of a statement in a request
+  from which it's a probable N+1. Defaults to 5.
+"""
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from control.utils.logger import logger
+from control.utils.prometheus import (
+    REQUEST_DB_QUERIES,
+    REQUEST_DB_DURATION,
+    N_PLUS_ONE_REQUESTS,
+)
+
+DEBUG = os.getenv("DEBUG", "0") == "1"
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+QUERIES_HEADER = "X-DB-Queries"
+TIME_HEADER = "X-DB-Time-Ms"
+N_PLUS_ONE_HEADER = "X-DB-N-Plus-One"
+# The statements are cut to this many characters in the logs.
+MAX_LOGGED_STATEMENT = 300
+
+request_queries_var = ContextVar("request_queries", default=None)
+# The QueryStats of the watch_queries blocks that are running.
+_watching = []
+
+
+class QueryStats:
+    """
+    The statements of a request, or of a watch_queries block.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        # Every statement, with the hashes of the parameters it ran with.
+        self.parameters = {}
+
+    def record(self, statement, parameters, seconds, executemany=False):
+        """
+        Records a statement that took seconds. The ones that ran with many
+        parameters at once (executemany) are counted once.
+        """
+        self.count += 1
+        self.seconds += seconds
+        hashes = self.parameters.setdefault(statement, set())
+        if not executemany:
+            hashes.add(hash(repr(parameters)))
+
+    def repeated(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """
+        Returns the (statement, times) of the statements that ran with at
+        least threshold different parameters, the probable N+1.
+        """
+        return [
+            (statement, len(hashes))
+            for statement, hashes in self.parameters.items()
+            if len(hashes) >= threshold
+        ]
+
+    def describe(self):
+        """
+        Returns a summary of the statements, for the messages of the tests.
+        """
+        lines = [f"{self.count} statements in {self.seconds * 1000:.1f} ms:"]
+        for statement, hashes in self.parameters.items():
+            lines.append(f"  {len(hashes) or 1}x {statement}")
+        return "\n".join(lines)
+
+
+def record_query(statement, parameters, seconds, executemany=False):
+    """
+    Records a statement in the QueryStats of the request being handled (if
+    any) and in the ones of the watch_queries blocks.
+    """
+    stats = request_queries_var.get()
+    if stats is not None:
+        stats.record(statement, parameters, seconds, executemany)
+    for watched in _watching:
+        watched.record(statement, parameters, seconds, executemany)
+
+
+@contextmanager
+def watch_queries():
+    """
+    Context manager of a QueryStats of every statement that runs while the
+    block runs, in any thread. It's for tests and benchmarks.
+    """
+    stats = QueryStats()
+    _watching.append(stats)
+    try:
+        yield stats
+    finally:
+        _watching.remove(stats)
+
+
+def add_query_stats_middleware(app, headers=DEBUG):
+    """
+    Adds the middleware that counts the statements of every request, see
+    the module docstring. With headers, they're added to the responses.
+    """
+
+    @app.middleware("http")
+    async def count_queries(request, call_next):
+        stats = QueryStats()
+        token = request_queries_var.set(stats)
+        try:
+            response = await call_next(request)
+        finally:
+            request_queries_var.reset(token)
+        route = request.scope.get("route")
+        if route is None:
+            return response
+        REQUEST_DB_QUERIES.labels(request.method, route.path).observe(stats.count)
+        REQUEST_DB_DURATION.labels(request.method, route.path).observe(stats.seconds)
+        repeated = stats.repeated()
+        if repeated:
+            N_PLUS_ONE_REQUESTS.labels(request.method, route.path).inc()
+            for statement, times in repeated:
+                logger.warning(
+                    "Probable N+1 in %s %s, ran %d times: %s",
+                    request.method,
+                    route.path,
+                    times,
+                    statement[:MAX_LOGGED_STATEMENT],
+                )
+        if headers:
+            response.headers[QUERIES_HEADER] = str(stats.count)
+            response.headers[TIME_HEADER] = f"{stats.seconds * 1000:.2f}"
+            response.headers[N_PLUS_ONE_HEADER] = str(len(repeated))
+        return response
+
+    return count_queries
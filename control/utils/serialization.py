@@ -0,0 +1,108 @@
+# serialization.py
+"""
+This module is the fast path for the responses with users.
+
+The rows are projected straight into dicts and encoded with orjson,
+without building a pydantic model per row: the data comes from our own
+database, so it isn't validated again. The routes return the response
+directly, so FastAPI doesn't validate nor encode it either.
+The pydantic models in control/models are still used for the docs.
+"""
+from operator import attrgetter
+import orjson
+from fastapi import Response
+
+# The fields of the responses and the attribute of the row they come from:
+USER_FIELDS = (
+    ("email", "email"),
+    ("name", "name"),
+    ("last_name", "surname"),
+    ("username", "username"),
+    ("date_of_birth", "date_of_birth"),
+    ("bio", "bio"),
+    ("avatar", "avatar"),
+    ("location", "location"),
+    ("blocked", "blocked"),
+    ("is_public", "is_public"),
+)
+USER_FIELDS_WITH_ID = (("id", "id"),) + USER_FIELDS
+# The fields of the rows of the streamed exports, in the order of their queries
+# (UserExport for the users).
+USER_EXPORT_FIELDS = (
+    "id",
+    "email",
+    "username",
+    "name",
+    "last_name",
+    "date_of_birth",
+    "location",
+    "bio",
+    "avatar",
+    "is_public",
+    "blocked",
+    "created_at",
+)
+FOLLOWING_EXPORT_FIELDS = ("user_id", "following_id", "created_at")
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response encoded with orjson.
+    Dicts can have int keys (like the ids of a batch).
+    """
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        # pylint: disable=no-member
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class UserSerializer:
+    """
+    Projects rows (orm objects or rows of a query with the same attributes)
+    into the dicts of the responses.
+    """
+
+    def __init__(self, fields=USER_FIELDS):
+        self._names = tuple(field for field, _ in fields)
+        self._getter = attrgetter(*(attribute for _, attribute in fields))
+        self._date_index = self._names.index("date_of_birth")
+
+    def to_tuple(self, user):
+        """
+        Returns the values of the fields of the user, in order.
+        The date of birth is sent as str(date_of_birth), like it always was.
+        """
+        values = list(self._getter(user))
+        values[self._date_index] = str(values[self._date_index])
+        return values
+
+    def to_dict(self, user):
+        """
+        Returns the dict of the response of the user.
+        """
+        return dict(zip(self._names, self.to_tuple(user)))
+
+    def to_dicts(self, users, relations=None):
+        """
+        Returns the dicts of the response of every user. If relations (a dict
+        from each user's id to its follow status) is given, it's embedded
+        in every user, and the users without one (removed after they were
+        listed) are left out.
+        """
+        if relations is None:
+            return [self.to_dict(user) for user in users]
+        response = []
+        for user in users:
+            relation = relations.get(user.id)
+            if relation is None:
+                continue
+            data = self.to_dict(user)
+            data.update(relation)
+            response.append(data)
+        return response
+
+
+user_serializer = UserSerializer()
+user_with_id_serializer = UserSerializer(USER_FIELDS_WITH_ID)
@@ -0,0 +1,245 @@
+# slow_queries.py
+"""
+This module is the opt-in slow query log: the statements that take more
+than SLOW_QUERY_MS are kept in a ring buffer of the last
+SLOW_QUERY_BUFFER ones, for GET /admin/slow_queries. Each one has:
+- the statement, the shapes of its parameters (their types and how many
+  there are, never their values) and how long it took;
+- the repository function and the route (and request id) that ran it;
+- a plan, taken out of band: a thread runs EXPLAIN (ANALYZE, BUFFERS) of
+  the statement with the same parameters on its own connection, in a
+  read only transaction that is rolled back (the statements that are not
+  SELECT are only EXPLAINed), with the strings of the plan masked as '?'.
+  It runs the statement again, so it's done at most once every
+  SLOW_QUERY_EXPLAIN_INTERVAL seconds per statement, and the ones that
+  don't fit in its queue are dropped.
+
+With SQL_COMMENTS=1 every statement of a request ends with a comment with
+its route, like /*route='GET /users/{email}'*/ (as sqlcommenter does), so it
+shows up in pg_stat_activity, the logs of the slow statements of postgres,
+auto_explain and pg_stat_monitor. pg_stat_statements groups the
+statements ignoring the comments, but the text it keeps has the route of
+the first one.
+
+It's configured with environment variables:
+- SLOW_QUERY_MS: the threshold, in milliseconds. Defaults to nothing, it's
+  disabled.
+- SLOW_QUERY_BUFFER: how many slow statements are kept. Defaults to 200.
+- SLOW_QUERY_EXPLAIN: 0 to not take plans. Defaults to 1.
+- SLOW_QUERY_EXPLAIN_INTERVAL: seconds between plans of a statement.
+  Defaults to 60.
+- SQL_COMMENTS: 1 to add the route to the statements. Defaults to 0.
+"""
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from control.utils.logger import current_route, logger, request_id_var
+
+SLOW_QUERY_MS = os.getenv("SLOW_QUERY_MS")
+SLOW_QUERY_BUFFER = int(os.getenv("SLOW_QUERY_BUFFER", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1") == "1"
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "60"))
+SQL_COMMENTS = os.getenv("SQL_COMMENTS", "0") == "1"
+
+# Statements waiting for their plan, the rest are dropped.
+EXPLAIN_QUEUE_SIZE = 16
+# A plan that takes longer than this is cancelled.
+EXPLAIN_TIMEOUT_MS = 10000
+# Statements are cut to this many characters.
+MAX_STATEMENT = 4000
+# With more parameters than this, only how many of each type are kept.
+MAX_SHAPES = 20
+# The statements that are run again by EXPLAIN ANALYZE.
+ANALYZED = ("SELECT", "WITH")
+# The strings of the plans, the values of the parameters among them.
+LITERAL = re.compile(r"'(?:[^']|'')*'")
+# What can't be in the comments: the end of the comment or of the string,
+# and % that the driver would take as a parameter.
+NOT_IN_COMMENTS = re.compile(r"[^\w/{}. -]")
+
+
+def _shape(value):
+    """
+    Returns the type of a parameter, and its length if it's a collection.
+    """
+    if value is None:
+        return "null"
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def parameter_shapes(parameters, executemany=False):
+    """
+    Returns the shapes of the parameters of a statement (see _shape), by
+    name if they're a dict. With executemany, the ones of the first row
+    and how many rows there were.
+    """
+    if executemany:
+        rows = list(parameters)
+        return {
+            "rows": len(rows),
+            "row": parameter_shapes(rows[0]) if rows else None,
+        }
+    if not parameters:
+        return {}
+    if not isinstance(parameters, dict):
+        parameters = dict(enumerate(parameters))
+    if len(parameters) > MAX_SHAPES:
+        counts = {}
+        for value in parameters.values():
+            counts[_shape(value)] = counts.get(_shape(value), 0) + 1
+        return {"count": len(parameters), "types": counts}
+    return {str(name): _shape(value) for name, value in parameters.items()}
+
+
+def route_comment():
+    """
+    Returns the comment with the route of the request being handled, or ""
+    outside of a request. The characters that could end it are replaced.
+    """
+    route = current_route()
+    if route is None:
+        return ""
+    return f" /*route='{NOT_IN_COMMENTS.sub('_', route)}'*/"
+
+
+class SlowQueryLog:
+    """
+    The ring buffer of slow statements and the thread that takes their
+    plans, see the module docstring. It's disabled if threshold_ms is None.
+    """
+
+    def __init__(
+        self,
+        threshold_ms=None,
+        size=SLOW_QUERY_BUFFER,
+        explain_interval=SLOW_QUERY_EXPLAIN_INTERVAL,
+    ):
+        self.threshold = None if threshold_ms is None else threshold_ms / 1000
+        self.explain_interval = explain_interval
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._engine = None
+        self._explains = queue.Queue(EXPLAIN_QUEUE_SIZE)
+        # When the last plan of every statement was taken.
+        self._explained = {}
+
+    @property
+    def enabled(self):
+        """
+        Whether the slow statements are recorded.
+        """
+        return self.threshold is not None
+
+    def start_explaining(self, engine):
+        """
+        Starts the thread that takes the plans with connections of engine.
+        """
+        self._engine = engine
+        threading.Thread(
+            target=self._explain_forever, name="slow-query-explain", daemon=True
+        ).start()
+
+    # pylint: disable=too-many-arguments
+    def record(self, statement, parameters, seconds, function, executemany=False):
+        """
+        Records the statement if it took more than the threshold.
+        """
+        if self.threshold is None or seconds < self.threshold:
+            return
+        entry = {
+            "at": datetime.utcnow().isoformat(),
+            "ms": round(seconds * 1000, 3),
+            "statement": statement[:MAX_STATEMENT],
+            "parameters": parameter_shapes(parameters, executemany),
+            "function": function,
+            "route": current_route(),
+            "request_id": request_id_var.get(),
+            "plan": None,
+        }
+        with self._lock:
+            self._entries.append(entry)
+        if self._engine is not None and self._should_explain(statement):
+            if executemany:
+                parameters = next(iter(parameters), None)
+            try:
+                self._explains.put_nowait((entry, statement, parameters))
+            except queue.Full:
+                pass
+
+    def _should_explain(self, statement):
+        """
+        Returns whether a plan of the statement can be taken now, and if so
+        records that it was.
+        """
+        now = time.monotonic()
+        with self._lock:
+            last = self._explained.get(statement)
+            if last is not None and now - last < self.explain_interval:
+                return False
+            if len(self._explained) > self._entries.maxlen:
+                self._explained.clear()
+            self._explained[statement] = now
+            return True
+
+    def _explain_forever(self):
+        while True:
+            entry, statement, parameters = self._explains.get()
+            try:
+                plan = self.explain(statement, parameters)
+            # Whatever fails, the thread has to keep going.
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                logger.warning("Couldn't explain a slow statement: %s", error)
+                plan = ["Couldn't explain it: " + str(error).strip()]
+            with self._lock:
+                entry["plan"] = plan
+            self._explains.task_done()
+
+    def explain(self, statement, parameters):
+        """
+        Returns the lines of the plan of the statement with the parameters,
+        see the module docstring.
+        """
+        analyze = statement.lstrip().upper().startswith(ANALYZED)
+        prefix = "EXPLAIN (ANALYZE, BUFFERS) " if analyze else "EXPLAIN "
+        # The cursor of the driver, so it's the statement and parameters it
+        # got, and the hooks of the engine don't see it.
+        with self._engine.connect() as connection:
+            transaction = connection.begin()
+            try:
+                cursor = connection.connection.cursor()
+                cursor.execute("SET TRANSACTION READ ONLY")
+                cursor.execute(f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}")
+                cursor.execute(prefix + statement, parameters)
+                return [LITERAL.sub("'?'", row[0]) for row in cursor.fetchall()]
+            finally:
+                transaction.rollback()
+
+    def wait_for_plans(self):
+        """
+        Waits until the plans of the statements recorded are taken.
+        """
+        self._explains.join()
+
+    def entries(self):
+        """
+        Returns a copy of the slow statements, the most recent first.
+        """
+        with self._lock:
+            return [dict(entry) for entry in reversed(self._entries)]
+
+    def clear(self):
+        """
+        Removes every slow statement.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._explained.clear()
+
+
+slow_query_log = SlowQueryLog(None if SLOW_QUERY_MS is None else float(SLOW_QUERY_MS))
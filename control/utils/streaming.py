@@ -0,0 +1,140 @@
+# streaming.py
+"""
+This module sends big exports (like every following relation) as a
+stream in JSON, NDJSON or CSV.
+
+The rows come in batches from a server-side cursor and every batch is
+encoded and sent before the next one is read, so the memory used doesn't
+depend on how many rows there are.
+"""
+import csv
+import io
+import time
+from datetime import date
+import orjson
+from fastapi.responses import StreamingResponse
+from control.utils.logger import logger
+from control.utils.prometheus import record_export
+
+FORMAT_JSON = "json"
+FORMAT_NDJSON = "ndjson"
+FORMAT_CSV = "csv"
+
+MEDIA_TYPES = {
+    FORMAT_JSON: "application/json",
+    FORMAT_NDJSON: "application/x-ndjson",
+    FORMAT_CSV: "text/csv; charset=utf-8",
+}
+
+
+def _json_chunks(batches, fields):
+    """
+    A JSON array, written one batch at a time.
+    """
+    yield b"["
+    separator = b""
+    for batch in batches:
+        if not batch:
+            continue
+        # pylint: disable=no-member
+        yield separator + b",".join(
+            orjson.dumps(dict(zip(fields, row))) for row in batch
+        )
+        separator = b","
+    yield b"]"
+
+
+def _ndjson_chunks(batches, fields):
+    """
+    One JSON object per line.
+    """
+    # pylint: disable=no-member
+    option = orjson.OPT_APPEND_NEWLINE
+    for batch in batches:
+        yield b"".join(
+            orjson.dumps(dict(zip(fields, row)), option=option) for row in batch
+        )
+
+
+def _csv_value(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _csv_chunks(batches, fields):
+    """
+    A header with the fields and then one line per row.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for batch in batches:
+        writer.writerows([_csv_value(value) for value in row] for row in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+ENCODERS = {
+    FORMAT_JSON: _json_chunks,
+    FORMAT_NDJSON: _ndjson_chunks,
+    FORMAT_CSV: _csv_chunks,
+}
+
+
+def measure_export(batches, export: str):
+    """
+    Passes the batches through, counting their rows. When the export ends
+    (or the client goes away) the rows and the rows per second are logged
+    and recorded in the export metrics.
+    """
+    rows = 0
+    start = time.perf_counter()
+    try:
+        for batch in batches:
+            rows += len(batch)
+            yield batch
+    finally:
+        elapsed = time.perf_counter() - start
+        record_export(export, rows, elapsed)
+        logger.info(
+            "Export %s sent %d rows in %.2fs (%.0f rows/s)",
+            export,
+            rows,
+            elapsed,
+            rows / elapsed if elapsed else 0.0,
+        )
+
+
+def encode_batches(batches, fields, export_format: str):
+    """
+    Returns a generator of the bytes of the rows in the given format.
+    Every row is a tuple with the values of fields, in the same order.
+    Raises ValueError if the format is not supported.
+    """
+    encoder = ENCODERS.get(export_format)
+    if encoder is None:
+        raise ValueError("Unsupported format: " + export_format)
+    return encoder(batches, fields)
+
+
+def stream_response(batches, fields, export_format: str, export: str, filename=None):
+    """
+    Returns a StreamingResponse that sends the rows in the given format,
+    measuring the export with the given name.
+    If filename is given, it's sent as an attachment with that name
+    (the extension is the format).
+    Raises ValueError if the format is not supported, before anything is sent.
+    """
+    chunks = encode_batches(measure_export(batches, export), fields, export_format)
+    headers = {}
+    if filename is not None:
+        headers[
+            "Content-Disposition"
+        ] = f'attachment; filename="{filename}.{export_format}"'
+    return StreamingResponse(
+        chunks, media_type=MEDIA_TYPES[export_format], headers=headers
+    )
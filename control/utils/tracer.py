@@ -1,28 +1,283 @@
 # tracer.py
 """
-This module is for using the uptrace tracer.
+This module is for configuring the tracer used throughout the project.
+
+Everything is configured with environment variables:
+- TRACE_EXPORTER: where the spans go. "otlp" (uptrace, needs UPTRACE_DSN),
+  "console" (stdout, only for local development) or "none".
+  Defaults to "otlp" if UPTRACE_DSN is set and to "none" if it isn't.
+- TRACE_SAMPLE_RATIO: ratio of the traces that are kept (head sampling),
+  from 0 to 1. Defaults to 1.
+- TRACE_ROUTE_SAMPLE_RATIOS: ratio for specific routes, separated by
+  commas, like "GET /health=0,POST /login=1". The route is the name of
+  the server span: the method and the template of the path.
+- TRACE_KEEP_SLOW_MS: if set, traces that were not sampled are still
+  recorded, and they are exported anyway if the request took more than
+  this many milliseconds or ended in an error.
 """
 import os
-import uptrace
+import threading
+from collections import OrderedDict
 from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor, TracerProvider
 from opentelemetry.sdk.trace.export import (
     BatchSpanProcessor,
     ConsoleSpanExporter,
 )
-
-uptrace.configure_opentelemetry(
-    dsn=os.getenv("UPTRACE_DSN"),
-    service_name="back-users",
-    service_version="1.0.0",
+from opentelemetry.sdk.trace.sampling import (
+    Decision,
+    ParentBased,
+    Sampler,
+    SamplingResult,
+    TraceIdRatioBased,
 )
+from opentelemetry.trace import SpanContext, StatusCode, TraceFlags
+
+SERVICE_NAME = "back-users"
+SERVICE_VERSION = "1.0.0"
+
+EXPORTER_OTLP = "otlp"
+EXPORTER_CONSOLE = "console"
+EXPORTER_NONE = "none"
+
+DEFAULT_ROUTE_SAMPLE_RATIOS = "GET /health=0,GET /metrics=0"
+# Traces waiting for their root span to end, when keeping slow traces.
+MAX_PENDING_TRACES = 2000
+RETAINED_ATTRIBUTE = "sampling.retained"
+
+
+def _parse_route_ratios(text: str):
+    """
+    Parses "GET /health=0,POST /login=0.5" into a dict.
+    """
+    ratios = {}
+    for item in text.split(","):
+        if "=" not in item:
+            continue
+        route, ratio = item.rsplit("=", 1)
+        ratios[route.strip()] = float(ratio)
+    return ratios
+
+
+def settings_from_env():
+    """
+    Reads the tracing settings from the environment variables.
+    """
+    default_exporter = EXPORTER_OTLP if os.getenv("UPTRACE_DSN") else EXPORTER_NONE
+    keep_slow_ms = os.getenv("TRACE_KEEP_SLOW_MS")
+    return {
+        "exporter": os.getenv("TRACE_EXPORTER", default_exporter).lower(),
+        "sample_ratio": float(os.getenv("TRACE_SAMPLE_RATIO", "1")),
+        "route_ratios": _parse_route_ratios(
+            os.getenv("TRACE_ROUTE_SAMPLE_RATIOS", DEFAULT_ROUTE_SAMPLE_RATIOS)
+        ),
+        "keep_slow_ms": float(keep_slow_ms) if keep_slow_ms else None,
+    }
+
+
+class RouteRatioSampler(Sampler):
+    """
+    Head sampler that keeps a ratio of the traces, with a different ratio
+    for the routes that have one configured.
+
+    If record_unsampled is True, the traces that are not sampled are still
+    recorded (but not exported), so the TailRetentionProcessor can keep
+    them if they turn out to be slow or fail.
+    """
+
+    def __init__(self, default_ratio, route_ratios=None, record_unsampled=False):
+        self._default = TraceIdRatioBased(default_ratio)
+        self._routes = {
+            route: TraceIdRatioBased(ratio)
+            for route, ratio in (route_ratios or {}).items()
+        }
+        self._not_sampled = Decision.RECORD_ONLY if record_unsampled else Decision.DROP
+
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+    def should_sample(
+        self,
+        parent_context,
+        trace_id,
+        name,
+        kind=None,
+        attributes=None,
+        links=None,
+        trace_state=None,
+    ):
+        sampler = self._routes.get(name, self._default)
+        result = sampler.should_sample(parent_context, trace_id, name, kind)
+        if result.decision is Decision.RECORD_AND_SAMPLE:
+            return SamplingResult(result.decision, attributes, result.trace_state)
+        return SamplingResult(self._not_sampled, None, result.trace_state)
+
+    def get_description(self):
+        return f"RouteRatioSampler{{{self._default.rate}, {len(self._routes)} routes}}"
+
+
+class _RecordOnlySampler(Sampler):
+    """
+    Records the children of the traces that were not sampled, so they can
+    be exported later if the trace is retained.
+    """
+
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+    def should_sample(
+        self,
+        parent_context,
+        trace_id,
+        name,
+        kind=None,
+        attributes=None,
+        links=None,
+        trace_state=None,
+    ):
+        parent = trace.get_current_span(parent_context).get_span_context()
+        return SamplingResult(Decision.RECORD_ONLY, None, parent.trace_state)
+
+    def get_description(self):
+        return "RecordOnlySampler"
+
+
+def _as_sampled(span: ReadableSpan, reason: str):
+    """
+    Returns a copy of a span that was not sampled, marked as sampled so the
+    exporter accepts it.
+    """
+    context = SpanContext(
+        span.context.trace_id,
+        span.context.span_id,
+        span.context.is_remote,
+        TraceFlags(TraceFlags.SAMPLED),
+        span.context.trace_state,
+    )
+    attributes = dict(span.attributes or {})
+    attributes[RETAINED_ATTRIBUTE] = reason
+    return ReadableSpan(
+        name=span.name,
+        context=context,
+        parent=span.parent,
+        resource=span.resource,
+        attributes=attributes,
+        events=span.events,
+        links=span.links,
+        kind=span.kind,
+        status=span.status,
+        start_time=span.start_time,
+        end_time=span.end_time,
+        instrumentation_scope=span.instrumentation_scope,
+    )
+
+
+class TailRetentionProcessor(SpanProcessor):
+    """
+    Sends the sampled spans to the delegate processor. The spans that were
+    not sampled are held until the local root span of their trace ends:
+    if it was slow or any span failed, the whole trace is exported anyway.
+    Otherwise it's dropped.
+    """
+
+    def __init__(self, delegate, keep_slow_ms, max_pending=MAX_PENDING_TRACES):
+        self._delegate = delegate
+        self._threshold_ns = int(keep_slow_ms * 1_000_000)
+        self._max_pending = max_pending
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+
+    def on_start(self, span, parent_context=None):
+        self._delegate.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span):
+        if span.context.trace_flags.sampled:
+            self._delegate.on_end(span)
+            return
+        is_local_root = span.parent is None or span.parent.is_remote
+        with self._lock:
+            spans = self._pending.pop(span.context.trace_id, [])
+            spans.append(span)
+            if not is_local_root:
+                self._pending[span.context.trace_id] = spans
+                if len(self._pending) > self._max_pending:
+                    self._pending.popitem(last=False)
+                return
+        reason = self._retention_reason(span, spans)
+        if reason is not None:
+            for pending in spans:
+                self._delegate.on_end(_as_sampled(pending, reason))
+
+    def _retention_reason(self, root, spans):
+        if any(pending.status.status_code is StatusCode.ERROR for pending in spans):
+            return "error"
+        if root.end_time - root.start_time >= self._threshold_ns:
+            return "slow"
+        return None
+
+    def shutdown(self):
+        self._delegate.shutdown()
+
+    def force_flush(self, timeout_millis=30000):
+        return self._delegate.force_flush(timeout_millis)
+
+
+def _build_otlp_exporter():
+    # Imported here so the other exporters don't need grpc.
+    # pylint: disable=import-outside-toplevel
+    import grpc
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import (
+        OTLPSpanExporter,
+    )
+    from uptrace.dsn import parse_dsn
+
+    dsn = parse_dsn(os.getenv("UPTRACE_DSN", ""))
+    return OTLPSpanExporter(
+        endpoint=dsn.otlp_grpc_endpoint,
+        headers=(("uptrace-dsn", dsn.str),),
+        timeout=5,
+        compression=grpc.Compression.Gzip,
+    )
+
+
+def build_tracer_provider(settings, exporter=None):
+    """
+    Builds the tracer provider for the given settings.
+    If exporter is given, it's used instead of the one in the settings.
+    """
+    if exporter is None:
+        if settings["exporter"] == EXPORTER_NONE:
+            return trace.NoOpTracerProvider()
+        if settings["exporter"] == EXPORTER_CONSOLE:
+            exporter = ConsoleSpanExporter()
+        else:
+            exporter = _build_otlp_exporter()
+
+    keep_slow = settings["keep_slow_ms"] is not None
+    root = RouteRatioSampler(
+        settings["sample_ratio"], settings["route_ratios"], record_unsampled=keep_slow
+    )
+    if keep_slow:
+        sampler = ParentBased(
+            root,
+            remote_parent_not_sampled=_RecordOnlySampler(),
+            local_parent_not_sampled=_RecordOnlySampler(),
+        )
+    else:
+        sampler = ParentBased(root)
+
+    provider = TracerProvider(
+        sampler=sampler,
+        resource=Resource.create(
+            {"service.name": SERVICE_NAME, "service.version": SERVICE_VERSION}
+        ),
+    )
+    processor = BatchSpanProcessor(exporter)
+    if keep_slow:
+        processor = TailRetentionProcessor(processor, settings["keep_slow_ms"])
+    provider.add_span_processor(processor)
+    return provider
 
-provider = TracerProvider()
-processor = BatchSpanProcessor(ConsoleSpanExporter())
-provider.add_span_processor(processor)
 
 # Sets the global default tracer provider
-trace.set_tracer_provider(provider)
+trace.set_tracer_provider(build_tracer_provider(settings_from_env()))
 
 # Creates a tracer from the global tracer provider
-tracer = trace.get_tracer("back-users")
+tracer = trace.get_tracer(SERVICE_NAME)
@@ -15,11 +15,15 @@ from control.codes import (
     OK,
 )
 from control.models.models import (
-    UserResponse,
-    UserPostResponse,
     UserRegistration,
+    ProfileResponse,
 )
 from control.utils.logger import logger
+from control.utils.serialization import (
+    FastJSONResponse,
+    user_serializer,
+    user_with_id_serializer,
+)
 from control.utils.metrics import (
     RegistrationMetric,
     LoginMetric,
@@ -53,7 +57,7 @@ def check_and_get_user_from_token(token: str):
     """
     try:
         email = auth_handler.decode_token(token)
-        user = user_handler.get_user_email(email)
+        user = user_handler.get_auth_user(email)
         if user.blocked:
             raise HTTPException(status_code=BLOCKED_USER, detail="User is blocked.")
         return user
@@ -63,53 +67,72 @@ def check_and_get_user_from_token(token: str):
         ) from error
 
 
-def generate_response(user):
+def generate_response(user, headers=None):
     """
-    This function casts the orm_object into a pydantic model.
+    This function casts the orm_object into a json response.
     (from data base object to json)
     """
-    return UserResponse(
-        email=user.email,
-        name=user.name,
-        last_name=user.surname,
-        username=user.username,
-        date_of_birth=str(user.date_of_birth),
-        bio=user.bio,
-        avatar=user.avatar,
-        location=user.location,
-        blocked=user.blocked,
-        is_public=user.is_public,
-    )
+    return FastJSONResponse(user_serializer.to_dict(user), headers=headers)
 
 
-def generate_response_with_id(user):
+def generate_response_with_id(user, headers=None):
     """
-    This function casts the orm_object into a pydantic model.
+    This function casts the orm_object into a json response, with its id.
     (from data base object to json)
     """
-    return UserPostResponse(
-        id=user.id,
-        email=user.email,
-        name=user.name,
-        last_name=user.surname,
-        username=user.username,
-        date_of_birth=str(user.date_of_birth),
-        bio=user.bio,
-        avatar=user.avatar,
-        location=user.location,
-        blocked=user.blocked,
-        is_public=user.is_public,
+    return FastJSONResponse(user_with_id_serializer.to_dict(user), headers=headers)
+
+
+def generate_response_list(users, relations=None, headers=None):
+    """
+    This function casts the list of users into a json response.
+    If relations (a dict from each user's id to its follow status) is
+    given, it's embedded in every user.
+    """
+    return FastJSONResponse(user_serializer.to_dicts(users, relations), headers=headers)
+
+
+def generate_mutuals_response(users, count, capped):
+    """
+    This function casts the users someone follows that follow another user
+    into a json response, with how many of them there are.
+    """
+    return FastJSONResponse(
+        {"count": count, "capped": capped, "users": user_serializer.to_dicts(users)}
     )
 
 
-def generate_response_list(users):
+def generate_search_page_response(users, next_cursor, relations=None):
+    """
+    This function casts a page of the ranked search into a json response,
+    with the cursor of the next page (None if it's the last one).
+    """
+    return FastJSONResponse(
+        {
+            "users": user_serializer.to_dicts(users, relations),
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+def generate_profile_response(profile):
+    """
+    This function casts the profile into a pydantic model.
+    """
+    profile["date_of_birth"] = str(profile["date_of_birth"])
+    return ProfileResponse(**profile)
+
+
+def generate_batch_response(batch):
     """
-    This function casts the list of users into a list of pydantic models.
+    This function casts the dates of a batch of users into strings,
+    like generate_response does, and encodes it.
     """
-    response = []
-    for user in users:
-        response.append(generate_response(user))
-    return response
+    for users in batch.values():
+        for user in users.values():
+            if user is not None and "date_of_birth" in user:
+                user["date_of_birth"] = str(user["date_of_birth"])
+    return FastJSONResponse(batch)
 
 
 def token_is_admin(token: str, admin_email_list=None):
@@ -184,7 +207,7 @@ def handle_user_registration(user: User, registration_metric: RegistrationMetric
         raise HTTPException(
             status_code=USER_ALREADY_REGISTERED, detail=str(error)
         ) from error
-    logger.info(user.email, " registered successfully")
+    logger.info("%s registered successfully", user.email)
     return {"message": "Registration successful", "token": token}
 
 
@@ -228,7 +251,7 @@ def handle_get_user_email(email: str, login_metric: LoginMetric):
     This function handles getting a user from the data base.
     """
     try:
-        return user_handler.get_user_email(email)
+        return user_handler.get_user_credentials(email)
     except UserNotFound as error:
         login_json = (
             login_metric.set_timestamp_finish(datetime.datetime.now())
@@ -0,0 +1,41 @@
+# pylint: skip-file
+"""se agregan las versiones de los usuarios para los etags
+
+Revision ID: 3f1c2a9d7b45
+Revises: eaa861baac9d
+Create Date: 2026-10-19 10:12:31.482913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "3f1c2a9d7b45"
+down_revision: Union[str, None] = "eaa861baac9d"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "users",
+        sa.Column("version", sa.Integer(), server_default="1", nullable=False),
+    )
+    op.add_column(
+        "users",
+        sa.Column(
+            "updated_at", sa.DateTime(), server_default=sa.func.now(), nullable=True
+        ),
+    )
+    op.add_column(
+        "users",
+        sa.Column("follow_version", sa.Integer(), server_default="1", nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("users", "follow_version")
+    op.drop_column("users", "updated_at")
+    op.drop_column("users", "version")
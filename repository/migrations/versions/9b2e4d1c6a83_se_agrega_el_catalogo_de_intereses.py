@@ -0,0 +1,102 @@
+# pylint: skip-file
+"""se agrega el catalogo de intereses y los intereses de los usuarios pasan a ser ids
+
+Revision ID: 9b2e4d1c6a83
+Revises: 3f1c2a9d7b45
+Create Date: 2026-10-19 16:40:12.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "9b2e4d1c6a83"
+down_revision: Union[str, None] = "3f1c2a9d7b45"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The rows of interests are converted this many users at a time, so no
+# statement touches the whole table.
+BATCH_USERS = 5000
+
+
+def _in_batches(statement):
+    """
+    Runs the statement (with :start and :end) for every range of user ids.
+    """
+    connection = op.get_bind()
+    max_user_id = connection.execute(
+        sa.text("SELECT coalesce(max(user_id), 0) FROM interests")
+    ).scalar()
+    for start in range(0, max_user_id + 1, BATCH_USERS):
+        connection.execute(
+            sa.text(statement), {"start": start, "end": start + BATCH_USERS}
+        )
+
+
+def upgrade() -> None:
+    op.create_table(
+        "interest_catalog",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=75), nullable=False),
+        sa.Column("users", sa.Integer(), server_default="0", nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("name"),
+    )
+    op.create_index(
+        "ix_interest_catalog_users", "interest_catalog", ["users"], unique=False
+    )
+    op.create_index(
+        "ix_interest_catalog_name_prefix",
+        "interest_catalog",
+        [sa.text("lower(name) text_pattern_ops")],
+        unique=False,
+    )
+    # Every name once, with how many users have it (the only GROUP BY, the
+    # counts are kept up to date by the app from now on):
+    op.execute(
+        "INSERT INTO interest_catalog (name, users) "
+        "SELECT interest, count(*) FROM interests GROUP BY interest"
+    )
+    op.add_column("interests", sa.Column("interest_id", sa.Integer(), nullable=True))
+    _in_batches(
+        "UPDATE interests SET interest_id = interest_catalog.id "
+        "FROM interest_catalog WHERE interest_catalog.name = interests.interest "
+        "AND interests.user_id >= :start AND interests.user_id < :end"
+    )
+    op.alter_column("interests", "interest_id", nullable=False)
+    op.drop_constraint("interests_pkey", "interests", type_="primary")
+    op.drop_column("interests", "interest")
+    op.create_primary_key("interests_pkey", "interests", ["user_id", "interest_id"])
+    op.create_foreign_key(
+        "interests_interest_id_fkey",
+        "interests",
+        "interest_catalog",
+        ["interest_id"],
+        ["id"],
+    )
+    op.create_index(
+        "ix_interests_interest_id", "interests", ["interest_id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.add_column(
+        "interests", sa.Column("interest", sa.String(length=75), nullable=True)
+    )
+    _in_batches(
+        "UPDATE interests SET interest = interest_catalog.name "
+        "FROM interest_catalog WHERE interest_catalog.id = interests.interest_id "
+        "AND interests.user_id >= :start AND interests.user_id < :end"
+    )
+    op.alter_column("interests", "interest", nullable=False)
+    op.drop_index("ix_interests_interest_id", table_name="interests")
+    op.drop_constraint("interests_interest_id_fkey", "interests", type_="foreignkey")
+    op.drop_constraint("interests_pkey", "interests", type_="primary")
+    op.drop_column("interests", "interest_id")
+    op.create_primary_key("interests_pkey", "interests", ["user_id", "interest"])
+    op.drop_index("ix_interest_catalog_name_prefix", table_name="interest_catalog")
+    op.drop_index("ix_interest_catalog_users", table_name="interest_catalog")
+    op.drop_table("interest_catalog")
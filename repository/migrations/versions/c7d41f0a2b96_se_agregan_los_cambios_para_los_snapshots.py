@@ -0,0 +1,37 @@
+# pylint: skip-file
+"""se agregan la fecha de los cambios de follows y los usuarios borrados para los snapshots
+
+Revision ID: c7d41f0a2b96
+Revises: 9b2e4d1c6a83
+Create Date: 2026-10-19 18:05:47.203311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "c7d41f0a2b96"
+down_revision: Union[str, None] = "9b2e4d1c6a83"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("users", sa.Column("follow_updated_at", sa.DateTime(), nullable=True))
+    op.create_table(
+        "removed_users",
+        sa.Column("user_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("removed_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    op.create_index(
+        "ix_removed_users_removed_at", "removed_users", ["removed_at"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_removed_users_removed_at", table_name="removed_users")
+    op.drop_table("removed_users")
+    op.drop_column("users", "follow_updated_at")
@@ -0,0 +1,259 @@
+# bulk_queries.py
+"""
+This module has the queries of the bulk loads of users, follows and
+interests, for imports and for seeding an environment.
+
+Every kind of row is copied into a temporary staging table first, with
+Postgres COPY (or batched executemany with the other dialects), and then
+merged into its table with a single INSERT ... SELECT ... ON CONFLICT DO
+NOTHING, so the rows that are already there are skipped. The follows and
+the interests reference their users by email, so they're resolved with a
+join. (The selects have a WHERE, even if it's true, since SQLite can't
+parse an upsert after a SELECT without one.)
+
+What the app keeps up to date row by row is left for the end (finish):
+the follow versions of the users whose relations were added, the
+versions of the users whose interests were loaded and how many users
+have each loaded interest, with one statement each. With rebuild_indexes
+the secondary indexes of the tables are dropped at the start and built
+again at the end (the primary keys and unique constraints stay, the
+conflicts need them). It takes a lock of the tables, so it's for empty
+databases or maintenance windows.
+"""
+import datetime
+import io
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table
+from sqlalchemy import func, insert, literal, select, true, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import aliased
+from repository.tables.users import User, Following, InterestCatalog, Interests
+
+LOADED_TABLES = [User, Following, InterestCatalog, Interests]
+# The columns of the users table that are loaded (the rest have defaults).
+USER_COLUMNS = (
+    "email username name surname password date_of_birth bio avatar location"
+    " blocked is_public"
+).split()
+
+_staging = MetaData()
+# "line" is where the row was in its file, the users are inserted in that
+# order (so their ids are too).
+staged_users = Table(
+    "staged_users",
+    _staging,
+    Column("line", Integer),
+    *(Column(name, User.__table__.c[name].type) for name in USER_COLUMNS),
+    prefixes=["TEMPORARY"],
+)
+staged_following = Table(
+    "staged_following",
+    _staging,
+    Column("email", String(100)),
+    Column("email_to_follow", String(100)),
+    prefixes=["TEMPORARY"],
+)
+staged_interests = Table(
+    "staged_interests",
+    _staging,
+    Column("email", String(100)),
+    Column("interest", String(75)),
+    prefixes=["TEMPORARY"],
+)
+
+
+def _copy_value(value):
+    """
+    Returns the value in the text format of COPY.
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class BulkLoad:
+    """
+    A bulk load on a connection, see the module docstring. Its methods
+    take batches of tuples with the columns of their staging table, and
+    finish has to be called once at the end, in the same transaction.
+    """
+
+    def __init__(self, connection, rebuild_indexes=False, use_copy=None):
+        self.connection = connection
+        dialect = connection.dialect.name
+        self.use_copy = dialect == "postgresql" if use_copy is None else use_copy
+        if self.use_copy and dialect != "postgresql":
+            raise ValueError("COPY can only be used with postgresql")
+        # The insert with ON CONFLICT of the dialect.
+        self.insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        # Every row loaded now has the same dates, the start of the load.
+        self.now = datetime.datetime.utcnow()
+        self.staged = []
+        self.indexes = []
+        if rebuild_indexes:
+            for table in LOADED_TABLES:
+                self.indexes.extend(table.__table__.indexes)
+            for index in self.indexes:
+                index.drop(connection, checkfirst=True)
+
+    def _stage(self, table, batches):
+        """
+        Creates the staging table and copies the batches into it.
+        Returns how many rows there were.
+        """
+        table.create(self.connection)
+        self.staged.append(table)
+        names = [column.name for column in table.columns]
+        count = 0
+        for batch in batches:
+            if not batch:
+                continue
+            if self.use_copy:
+                data = io.StringIO()
+                for row in batch:
+                    data.write("\t".join(_copy_value(value) for value in row) + "\n")
+                data.seek(0)
+                with self.connection.connection.cursor() as cursor:
+                    cursor.copy_expert(
+                        f"COPY {table.name} ({', '.join(names)}) FROM STDIN", data
+                    )
+            else:
+                self.connection.execute(
+                    insert(table), [dict(zip(names, row)) for row in batch]
+                )
+            count += len(batch)
+        return count
+
+    def users(self, batches):
+        """
+        Loads batches of (line, *USER_COLUMNS) rows, the password already
+        hashed. The users with an email or username that is taken are
+        skipped.
+        Returns how many rows there were and how many users were added.
+        """
+        count = self._stage(staged_users, batches)
+        dates = [literal(self.now, DateTime)] * 3
+        statement = (
+            self.insert(User)
+            .from_select(
+                USER_COLUMNS + ["created_at", "updated_at", "follow_updated_at"],
+                select(*(staged_users.c[name] for name in USER_COLUMNS), *dates)
+                .where(true())
+                .order_by(staged_users.c.line),
+            )
+            .on_conflict_do_nothing()
+        )
+        return count, self.connection.execute(statement).rowcount
+
+    def following(self, batches):
+        """
+        Loads batches of (email, email_to_follow) rows. The relations of
+        users that don't exist, of users with themselves and the ones that
+        are already there are skipped.
+        Returns how many rows there were and how many relations were added.
+        """
+        count = self._stage(staged_following, batches)
+        follower, followee = aliased(User), aliased(User)
+        statement = (
+            self.insert(Following)
+            .from_select(
+                ["user_id", "following_id", "created_at"],
+                select(follower.id, followee.id, literal(self.now, DateTime))
+                .select_from(staged_following)
+                .join(follower, follower.email == staged_following.c.email)
+                .join(followee, followee.email == staged_following.c.email_to_follow)
+                .where(follower.id != followee.id),
+            )
+            .on_conflict_do_nothing()
+        )
+        return count, self.connection.execute(statement).rowcount
+
+    def interests(self, batches):
+        """
+        Loads batches of (email, interest) rows, adding the interests that
+        are not in the catalog. The interests of users that don't exist
+        and the ones the users already have are skipped.
+        Returns how many rows there were and how many interests were added.
+        """
+        count = self._stage(staged_interests, batches)
+        self.connection.execute(
+            self.insert(InterestCatalog)
+            .from_select(
+                ["name"], select(staged_interests.c.interest).distinct().where(true())
+            )
+            .on_conflict_do_nothing()
+        )
+        statement = (
+            self.insert(Interests)
+            .from_select(
+                ["user_id", "interest_id"],
+                select(User.id, InterestCatalog.id)
+                .select_from(staged_interests)
+                .join(User, User.email == staged_interests.c.email)
+                .join(
+                    InterestCatalog,
+                    InterestCatalog.name == staged_interests.c.interest,
+                ),
+            )
+            .on_conflict_do_nothing()
+        )
+        return count, self.connection.execute(statement).rowcount
+
+    def finish(self):
+        """
+        Builds the dropped indexes, updates the versions and the counts of
+        what was loaded and drops the staging tables.
+        """
+        for index in self.indexes:
+            index.create(self.connection, checkfirst=True)
+        if staged_following in self.staged:
+            # The relations added now are the ones created at the start of
+            # the load, the skipped ones change nobody's lists.
+            added = Following.created_at == self.now
+            ids = (
+                select(Following.user_id)
+                .where(added)
+                .union(select(Following.following_id).where(added))
+            )
+            self.connection.execute(
+                update(User)
+                .where(User.id.in_(ids))
+                .values(
+                    {
+                        User.follow_version: User.follow_version + 1,
+                        User.follow_updated_at: self.now,
+                        User.version: User.version,
+                        User.updated_at: User.updated_at,
+                    }
+                )
+            )
+        if staged_interests in self.staged:
+            self.connection.execute(
+                update(User)
+                .where(User.email.in_(select(staged_interests.c.email)))
+                .values({User.version: User.version + 1})
+            )
+            self.connection.execute(
+                update(InterestCatalog)
+                .where(InterestCatalog.name.in_(select(staged_interests.c.interest)))
+                .values(
+                    users=select(func.count())
+                    .where(Interests.interest_id == InterestCatalog.id)
+                    .scalar_subquery()
+                )
+            )
+        for table in self.staged:
+            table.drop(self.connection)
+        if self.connection.dialect.name == "postgresql":
+            # The statistics of the planner don't know about the new rows.
+            names = ", ".join(table.__tablename__ for table in LOADED_TABLES)
+            self.connection.exec_driver_sql(f"ANALYZE {names}")
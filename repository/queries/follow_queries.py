@@ -2,63 +2,131 @@
 """
 Module dedicated to the queries that the repository might need for the following feature.
 """
+from sqlalchemy import and_, delete, exists, func, or_, select
+from sqlalchemy.orm import aliased
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 from repository.tables.users import User
 from repository.tables.users import Following
-from repository.queries.user_queries import get_user_by_mail
+from repository.tables.users import Interests
+from repository.tables.users import RemovedUser
+from repository.queries.user_queries import (
+    bump_follow_versions,
+    get_user_by_mail,
+    select_users,
+    as_read_models,
+)
+from repository.read_models import UserSummary
 from repository.errors import RelationAlreadyExists
 
 
 def create_follow(session, email, email_to_follow):
     """
     Creates a follow relationship between two users.
+    Returns the ids of the follower and the followed user, or None if any
+    of them doesn't exist.
     """
     user = get_user_by_mail(session, email)
     user_to_follow = get_user_by_mail(session, email_to_follow)
     if user and user_to_follow:
+        # Read before the commit expires them.
+        ids = (user.id, user_to_follow.id)
         try:
-            following = Following(user.id, user_to_follow.id)
-            session.add(following)
+            session.add(Following(*ids))
+            session.flush()
+            bump_follow_versions(session, *ids)
             session.commit()
         except IntegrityError as error:
             session.rollback()
             raise RelationAlreadyExists() from error
-        return following
+        return ids
     return None
 
 
+def create_follows(session, user_id, ids_to_follow):
+    """
+    Makes the user follow every user in ids_to_follow, with a single
+    INSERT ... ON CONFLICT DO NOTHING, and bumps the follow versions of
+    the users whose relations changed once.
+    Returns the ids that were not followed before.
+    """
+    statement = (
+        insert(Following)
+        .values(
+            [
+                {"user_id": user_id, "following_id": following_id}
+                for following_id in ids_to_follow
+            ]
+        )
+        .on_conflict_do_nothing()
+        .returning(Following.following_id)
+    )
+    try:
+        followed = session.execute(statement).scalars().all()
+        if followed:
+            bump_follow_versions(session, user_id, *followed)
+        session.commit()
+    except IntegrityError as error:
+        # One of the users was deleted after it was looked up.
+        session.rollback()
+        raise KeyError("A user to follow doesn't exist") from error
+    return followed
+
+
+def remove_follows(session, user_id, ids_to_unfollow):
+    """
+    Makes the user unfollow every user in ids_to_unfollow, with a single
+    DELETE ... WHERE following_id IN (...), and bumps the follow versions
+    of the users whose relations changed once.
+    Returns the ids that were followed before.
+    """
+    statement = (
+        delete(Following)
+        .where(Following.user_id == user_id)
+        .where(Following.following_id.in_(ids_to_unfollow))
+        .returning(Following.following_id)
+    )
+    unfollowed = session.execute(statement).scalars().all()
+    if unfollowed:
+        bump_follow_versions(session, user_id, *unfollowed)
+    session.commit()
+    return unfollowed
+
+
 def get_followers(session, user_id):
     """
     Returns a list of the followers of the user with the given username.
     """
-    users = session.query(Following).filter(Following.following_id == user_id).all()
-    return [
-        session.query(User).filter(User.id == user.user_id).first() for user in users
-    ]
+    users = (
+        select_users(session, UserSummary, Following.following_id == user_id)
+        .join(Following, Following.user_id == User.id)
+        .order_by(Following.created_at)
+    )
+    return as_read_models(UserSummary, users)
 
 
 def get_following(session, user_id):
     """
     Returns a list of the users that the user with the given username is following.
     """
-    users = session.query(Following).filter(Following.user_id == user_id).all()
-    return [
-        session.query(User).filter(User.id == user.following_id).first()
-        for user in users
-    ]
+    users = (
+        select_users(session, UserSummary, Following.user_id == user_id)
+        .join(Following, Following.following_id == User.id)
+        .order_by(Following.created_at)
+    )
+    return as_read_models(UserSummary, users)
 
 
 def is_following(session, user_id, user_id_to_check_if_following):
     """
     Returns True if the user with the given id is following the user with the given id.
     """
-    following = (
-        session.query(Following)
-        .filter(Following.user_id == user_id)
-        .filter(Following.following_id == user_id_to_check_if_following)
-        .first()
-    )
-    return following is not None
+    return session.query(
+        exists().where(
+            Following.user_id == user_id,
+            Following.following_id == user_id_to_check_if_following,
+        )
+    ).scalar()
 
 
 def get_following_relations(session):
@@ -68,18 +136,101 @@ def get_following_relations(session):
     return session.query(Following).all()
 
 
+# The columns of the following relations export, in order.
+FOLLOWING_EXPORT_COLUMNS = (
+    Following.user_id,
+    Following.following_id,
+    Following.created_at,
+)
+
+
+def following_relations_statement(since=None, min_user_id=None, max_user_id=None):
+    """
+    Returns the select of the following relations created since the given
+    date, whose follower id is between min_user_id and max_user_id.
+    Any filter that is None is not applied.
+    It's ordered by the primary key, so it's read through its index.
+    """
+    statement = select(*FOLLOWING_EXPORT_COLUMNS)
+    if since is not None:
+        statement = statement.where(Following.created_at >= since)
+    if min_user_id is not None:
+        statement = statement.where(Following.user_id >= min_user_id)
+    if max_user_id is not None:
+        statement = statement.where(Following.user_id <= max_user_id)
+    return statement.order_by(Following.user_id, Following.following_id)
+
+
+def _changed_since(since):
+    """
+    Condition of the users created, changed or that followed, unfollowed,
+    were followed or unfollowed since the given date.
+    """
+    return or_(
+        User.created_at >= since,
+        User.updated_at >= since,
+        User.follow_updated_at >= since,
+    )
+
+
+def graph_users_statement(since=None):
+    """
+    Returns the select of the (id, username, blocked, is_public) of the
+    users of a graph snapshot, ordered by id: all of them, or the ones that
+    changed since the given date.
+    """
+    statement = select(User.id, User.username, User.blocked, User.is_public)
+    if since is not None:
+        statement = statement.where(_changed_since(since))
+    return statement.order_by(User.id)
+
+
+def graph_following_statement(since=None):
+    """
+    Returns the select of the (user_id, following_id) of a graph snapshot,
+    ordered by the primary key: every relation, or every relation of the
+    users that changed since the given date.
+    """
+    statement = select(Following.user_id, Following.following_id)
+    if since is not None:
+        changed = select(User.id).where(_changed_since(since))
+        statement = statement.where(Following.user_id.in_(changed))
+    return statement.order_by(Following.user_id, Following.following_id)
+
+
+def removed_users_statement(since):
+    """
+    Returns the select of the ids of the users removed since the given date.
+    """
+    return (
+        select(RemovedUser.user_id)
+        .where(RemovedUser.removed_at >= since)
+        .order_by(RemovedUser.user_id)
+    )
+
+
 def get_following_count(session, user_id):
     """
     Returns the number of users that the user with the given username is following.
     """
-    return session.query(Following).filter(Following.user_id == user_id).count()
+    return (
+        session.query(func.count())
+        .select_from(Following)
+        .filter(Following.user_id == user_id)
+        .scalar()
+    )
 
 
 def get_followers_count(session, user_id):
     """
     Returns the number of followers of the user with the given username.
     """
-    return session.query(Following).filter(Following.following_id == user_id).count()
+    return (
+        session.query(func.count())
+        .select_from(Following)
+        .filter(Following.following_id == user_id)
+        .scalar()
+    )
 
 
 def remove_follow(session, user_id, user_id_to_unfollow):
@@ -95,8 +246,208 @@ def remove_follow(session, user_id, user_id_to_unfollow):
     try:
         if following:
             session.delete(following)
+            bump_follow_versions(session, user_id, user_id_to_unfollow)
             session.commit()
             return
     except IntegrityError:
         session.rollback()
     raise KeyError("The relation doesn't exist")
+
+
+def get_follow_status(session, user_id, key, values):
+    """
+    Returns, for every user whose key column is in values, if the user with
+    the given id is following them and if they are following that user.
+    Both are subqueries, so it's a single query for all the users.
+    """
+    key_column = getattr(User, key)
+    following = exists().where(
+        Following.user_id == user_id, Following.following_id == User.id
+    )
+    followed_by = exists().where(
+        Following.user_id == User.id, Following.following_id == user_id
+    )
+    return (
+        session.query(
+            key_column.label("key"),
+            following.label("following"),
+            followed_by.label("followed_by"),
+        )
+        .filter(key_column.in_(values))
+        .all()
+    )
+
+
+def _not_followed_by(user_id, candidate_id):
+    """
+    Condition of the candidates the user with the given id doesn't follow.
+    """
+    mine = aliased(Following)
+    return ~exists().where(mine.user_id == user_id, mine.following_id == candidate_id)
+
+
+def get_suggestion_scores(session, user_id, max_followees, ammount):
+    """
+    Ranks the users followed by the people the user with the given id
+    follows, by how many of them follow each one. It's a two-hop
+    expansion bounded to the max_followees the user followed last.
+    The user, the users it already follows and the blocked users are left
+    out. Returns at most ammount rows of (id, mutuals), best first.
+    """
+    followees = (
+        select(Following.following_id)
+        .where(Following.user_id == user_id)
+        .order_by(Following.created_at.desc())
+        .limit(max_followees)
+        .subquery()
+    )
+    mutuals = func.count().label("mutuals")
+    return (
+        session.query(Following.following_id.label("id"), mutuals)
+        .join(followees, Following.user_id == followees.c.following_id)
+        .join(User, User.id == Following.following_id)
+        .filter(
+            Following.following_id != user_id,
+            User.blocked.is_(False),
+            _not_followed_by(user_id, Following.following_id),
+        )
+        .group_by(Following.following_id)
+        .order_by(mutuals.desc(), Following.following_id)
+        .limit(ammount)
+        .all()
+    )
+
+
+def get_interest_suggestion_scores(session, user_id, filters, ammount):
+    """
+    Ranks the users by how many interests they share with the user with the
+    given id. The user and the blocked users are left out, and if the
+    filters say so, the private ones ("public_only") and the ones the user
+    follows ("not_followed"). Returns at most ammount rows of (id, shared),
+    best first.
+    """
+    mine = aliased(Interests)
+    shared = func.count().label("shared")
+    query = (
+        session.query(Interests.user_id.label("id"), shared)
+        .join(
+            mine,
+            and_(mine.interest_id == Interests.interest_id, mine.user_id == user_id),
+        )
+        .join(User, User.id == Interests.user_id)
+        .filter(Interests.user_id != user_id, User.blocked.is_(False))
+    )
+    if filters.get("public_only"):
+        query = query.filter(User.is_public.is_(True))
+    if filters.get("not_followed"):
+        query = query.filter(_not_followed_by(user_id, Interests.user_id))
+    return (
+        query.group_by(Interests.user_id)
+        .order_by(shared.desc(), Interests.user_id)
+        .limit(ammount)
+        .all()
+    )
+
+
+def get_following_ids(session, user_id):
+    """
+    Returns the ids of the users the user with the given id follows.
+    """
+    rows = session.query(Following.following_id).filter(Following.user_id == user_id)
+    return [following_id for (following_id,) in rows]
+
+
+def get_following_that_follow(session, user_id, target_id, max_followees):
+    """
+    Returns the sorted ids of the users the user with the given id follows
+    that follow target_id, leaving out the blocked ones. Only the
+    max_followees with the lowest ids are looked at (like follow_graph
+    does, so both give the same users), and each one is a lookup of the
+    primary key of following, so it takes the same no matter how many
+    followers the target has.
+    """
+    followees = (
+        select(Following.following_id)
+        .where(Following.user_id == user_id)
+        .order_by(Following.following_id)
+        .limit(max_followees)
+        .subquery()
+    )
+    rows = (
+        session.query(Following.user_id)
+        .join(followees, Following.user_id == followees.c.following_id)
+        .join(User, User.id == Following.user_id)
+        .filter(Following.following_id == target_id, User.blocked.is_(False))
+        .order_by(Following.user_id)
+    )
+    return [follower_id for (follower_id,) in rows]
+
+
+def get_suggestion_score(session, user_id, candidate_id, max_followees):
+    """
+    Returns the score get_suggestion_scores gives candidate_id: how many
+    of the max_followees the user with the given id followed last follow
+    it. It's 0 if the candidate is blocked.
+    """
+    followees = (
+        select(Following.following_id)
+        .where(Following.user_id == user_id)
+        .order_by(Following.created_at.desc())
+        .limit(max_followees)
+        .subquery()
+    )
+    return (
+        session.query(func.count())
+        .select_from(Following)
+        .join(followees, Following.user_id == followees.c.following_id)
+        .join(User, User.id == Following.following_id)
+        .filter(Following.following_id == candidate_id, User.blocked.is_(False))
+        .scalar()
+    )
+
+
+def get_suggestion_candidates(session, user_id, followee_id):
+    """
+    Returns the ids of the users followed by followee_id that could be
+    suggested to the user with the given id: not the user itself, not
+    blocked and not followed by the user already.
+    """
+    rows = (
+        session.query(Following.following_id)
+        .join(User, User.id == Following.following_id)
+        .filter(
+            Following.user_id == followee_id,
+            Following.following_id != user_id,
+            User.blocked.is_(False),
+            _not_followed_by(user_id, Following.following_id),
+        )
+        .all()
+    )
+    return [candidate_id for (candidate_id,) in rows]
+
+
+def get_followers_version(session, user_id):
+    """
+    Returns how many followers the user with the given id has and the sum
+    of their versions. The sum alone could stay the same if a follower
+    leaves and another one changes.
+    """
+    return (
+        session.query(func.count(), func.coalesce(func.sum(User.version), 0))
+        .join(Following, Following.user_id == User.id)
+        .filter(Following.following_id == user_id)
+        .one()
+    )
+
+
+def get_following_version(session, user_id):
+    """
+    Returns how many users the user with the given id is following and the
+    sum of their versions, see get_followers_version.
+    """
+    return (
+        session.query(func.count(), func.coalesce(func.sum(User.version), 0))
+        .join(Following, Following.following_id == User.id)
+        .filter(Following.user_id == user_id)
+        .one()
+    )
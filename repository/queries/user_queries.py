@@ -2,16 +2,114 @@
 """
 Module dedicated to the queries that the repository might need.
 """
+import datetime
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import or_
-from repository.tables.users import User, Interests, Following
+from sqlalchemy import or_, case, delete, exists, func, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from repository.tables.users import (
+    User,
+    Interests,
+    InterestCatalog,
+    Following,
+    RemovedUser,
+)
+from repository.read_models import (
+    AuthUser,
+    UserCredentials,
+    UserSummary,
+    UserExport,
+)
 from repository.errors import (
     UsernameAlreadyExists,
     EmailAlreadyExists,
-    InterestAlreadyExists,
 )
 
 
+def columns_of(read_model):
+    """
+    Returns the columns of the users table that make a read model.
+    """
+    return [getattr(User, field) for field in read_model._fields]
+
+
+def select_users(session, read_model, *criteria):
+    """
+    Selects only the columns of the read model, for the users that match
+    all the criteria, and returns the query.
+    """
+    return session.query(*columns_of(read_model)).filter(*criteria)
+
+
+def as_read_models(read_model, rows):
+    """
+    Builds the read models from the rows of a projected query.
+    """
+    return [read_model._make(row) for row in rows]
+
+
+def first_as_read_model(read_model, query):
+    """
+    Returns the first row of the query as a read model, or None.
+    """
+    row = query.first()
+    return None if row is None else read_model._make(row)
+
+
+def get_auth_user_by_mail(session, mail):
+    """
+    Searches for the AuthUser with the given mail.
+    """
+    return first_as_read_model(
+        AuthUser, select_users(session, AuthUser, User.email == mail)
+    )
+
+
+def get_credentials_by_mail(session, mail):
+    """
+    Searches for the UserCredentials of the user with the given mail.
+    """
+    return first_as_read_model(
+        UserCredentials, select_users(session, UserCredentials, User.email == mail)
+    )
+
+
+def get_user_summary_by_mail(session, mail):
+    """
+    Searches for the UserSummary of the user with the given mail.
+    """
+    return first_as_read_model(
+        UserSummary, select_users(session, UserSummary, User.email == mail)
+    )
+
+
+def get_user_summary_by_username(session, username):
+    """
+    Searches for the UserSummary of the user with the given username.
+    """
+    return first_as_read_model(
+        UserSummary, select_users(session, UserSummary, User.username == username)
+    )
+
+
+def get_user_summaries_by_ids(session, ids):
+    """
+    Returns the UserSummary of the users with the given ids that are not
+    blocked, in no particular order.
+    """
+    query = select_users(
+        session, UserSummary, User.id.in_(ids), User.blocked.is_(False)
+    )
+    return as_read_models(UserSummary, query)
+
+
+def get_blocked_ids(session, ids):
+    """
+    Returns the ids of the users with the given ids that are blocked.
+    """
+    rows = session.query(User.id).filter(User.id.in_(ids), User.blocked.is_(True))
+    return {user_id for (user_id,) in rows}
+
+
 def get_user_by_id(session, user_id):
     """
     Searches for a user by its id.
@@ -89,6 +187,24 @@ def update_user_password(session, user_id, new_password):
     return None
 
 
+def bump_follow_versions(session, *user_ids):
+    """
+    Increments the follow_version (and sets the follow_updated_at) of the
+    given users, in the transaction of the follow or unfollow that changed
+    their relations.
+    The version of the row is left as is: the user's fields didn't change.
+    """
+    session.query(User).filter(User.id.in_(user_ids)).update(
+        {
+            User.follow_version: User.follow_version + 1,
+            User.follow_updated_at: datetime.datetime.utcnow(),
+            User.version: User.version,
+            User.updated_at: User.updated_at,
+        },
+        synchronize_session=False,
+    )
+
+
 def delete_user(session, user_id):
     """
     Deletes the user with the given id.
@@ -99,7 +215,25 @@ def delete_user(session, user_id):
     user = session.query(User).filter(User.id == user_id).first()
     if user:
         try:
+            # Its interests are deleted by the cascade, they stop counting.
+            interest_ids = session.scalars(
+                select(Interests.interest_id).where(Interests.user_id == user_id)
+            ).all()
+            _count_interest_users(session, interest_ids, -1)
+            # Its follows are deleted by the cascade too, so the relations
+            # of the users on the other side change.
+            related_ids = session.scalars(
+                select(Following.following_id)
+                .where(Following.user_id == user_id)
+                .union(
+                    select(Following.user_id).where(Following.following_id == user_id)
+                )
+            ).all()
+            if related_ids:
+                bump_follow_versions(session, *related_ids)
             session.delete(user)
+            # So the changes of the graph snapshots have it.
+            session.add(RemovedUser(user_id))
             session.commit()
             return True
         except IntegrityError:
@@ -235,51 +369,170 @@ def update_user_public_status(session, user_id, public):
     return None
 
 
+def bump_user_version(session, user_id):
+    """
+    Increments the version of the user with the given id, for the changes
+    that are not in its row (like its interests). It's not committed, it
+    goes in the transaction of the change.
+    """
+    session.query(User).filter(User.id == user_id).update(
+        {User.version: User.version + 1}, synchronize_session=False
+    )
+
+
 def get_all_users(session, start, ammount):
     """
     Query mostly for testing, it retrieves all the users of the database.
     """
-    return session.query(User).offset(start).limit(ammount).all()
+    query = select_users(session, UserSummary).order_by(User.id)
+    return as_read_models(UserSummary, query.offset(start).limit(ammount))
 
 
-def delete_user_interests(session, user_id):
+def users_export_statement(filters):
     """
-    Deletes all the interests of the user with the given id.
+    Returns the select of the UserExport columns of the users that match
+    the filters, ordered by id. filters may have "blocked", "is_public",
+    "created_from" and "created_to" (both inclusive); the ones that are
+    None are not applied.
+    """
+    statement = select(*columns_of(UserExport))
+    if filters.get("blocked") is not None:
+        statement = statement.where(User.blocked == filters["blocked"])
+    if filters.get("is_public") is not None:
+        statement = statement.where(User.is_public == filters["is_public"])
+    if filters.get("created_from") is not None:
+        statement = statement.where(User.created_at >= filters["created_from"])
+    if filters.get("created_to") is not None:
+        statement = statement.where(User.created_at <= filters["created_to"])
+    return statement.order_by(User.id)
 
-    :param: session: the session to use
-    :param: user_id: the id of the user to delete
-    :returns: True if it found and deleted the user's interests, false if it didn't.
-    (False means the user didn't have any interests)
+
+def get_interest_ids(session, names):
     """
-    interests = session.query(Interests).filter(Interests.user_id == user_id).all()
-    if interests:
-        try:
-            for interest in interests:
-                session.delete(interest)
-            session.commit()
-            return True
-        except IntegrityError:
-            session.rollback()
-    return False
+    Returns a dict from every name to its id in interest_catalog, adding
+    the names that are not there yet. It takes two statements.
+    """
+    session.execute(
+        insert(InterestCatalog)
+        .values([{"name": name} for name in names])
+        .on_conflict_do_nothing()
+    )
+    rows = session.execute(
+        select(InterestCatalog.name, InterestCatalog.id).where(
+            InterestCatalog.name.in_(names)
+        )
+    )
+    return dict(rows.all())
 
 
-def add_user_interest(session, user_id, interest):
+def _count_interest_users(session, interest_ids, delta):
+    """
+    Adds delta to how many users have each of the interests.
     """
-    Adds to the interests table a interest for given user_id
+    if interest_ids:
+        session.execute(
+            update(InterestCatalog)
+            .where(InterestCatalog.id.in_(interest_ids))
+            .values(users=InterestCatalog.users + delta)
+        )
+
+
+def set_user_interests(session, user_id, names):
+    """
+    Replaces the interests of the user with the given id by the ones with
+    these names, and updates how many users have each interest that was
+    added or removed and the version of the user, in a single transaction.
 
     :param: session: the session to use
-    :param: user_id: the id of the user to add the interest
-    :param: interest: the interest to add
+    :param: user_id: the id of the user
+    :param: names: the names of the interests, repeated ones are ignored
+    :returns: the ids of the interests the user had and of the ones it has
+    """
+    names = list(dict.fromkeys(names))
+    new_ids = set(get_interest_ids(session, names).values()) if names else set()
+    old_ids = set(
+        session.scalars(
+            select(Interests.interest_id).where(Interests.user_id == user_id)
+        )
+    )
+    removed, added = old_ids - new_ids, new_ids - old_ids
+    if removed:
+        session.execute(
+            delete(Interests).where(
+                Interests.user_id == user_id, Interests.interest_id.in_(removed)
+            )
+        )
+    if added:
+        session.execute(
+            insert(Interests).values(
+                [
+                    {"user_id": user_id, "interest_id": interest_id}
+                    for interest_id in added
+                ]
+            )
+        )
+    _count_interest_users(session, removed, -1)
+    _count_interest_users(session, added, 1)
+    bump_user_version(session, user_id)
+    session.commit()
+    return old_ids, new_ids
+
+
+def get_popular_interests(session, prefix, ammount):
     """
-    interest = Interests(user_id=user_id, interest=interest)
-    try:
-        session.add(interest)
-        session.commit()
-    except IntegrityError as error:
-        session.rollback()
-        raise InterestAlreadyExists(
-            f"Interest {interest} already exists for user"
-        ) from error
+    Returns the (name, users) of the ammount interests that most users
+    have, whose name starts with prefix (ignoring case) if it's not None.
+    """
+    query = session.query(InterestCatalog.name, InterestCatalog.users).filter(
+        InterestCatalog.users > 0
+    )
+    if prefix:
+        query = query.filter(
+            func.lower(InterestCatalog.name).startswith(prefix.lower(), autoescape=True)
+        )
+    return (
+        query.order_by(InterestCatalog.users.desc(), InterestCatalog.name)
+        .limit(ammount)
+        .all()
+    )
+
+
+def interests_statement():
+    """
+    Returns the select of every (user_id, interest_id), ordered by the
+    primary key, so the ids of the users of each interest come sorted.
+    """
+    return select(Interests.user_id, Interests.interest_id).order_by(
+        Interests.user_id, Interests.interest_id
+    )
+
+
+def autocomplete_statement():
+    """
+    Returns the select of the (id, username, name, surname) of every user,
+    ordered by id, that the autocomplete index is built from.
+    """
+    return select(User.id, User.username, User.name, User.surname).order_by(User.id)
+
+
+def autocomplete_users(session, prefix, amount):
+    """
+    Returns the (id, username, name, surname) of up to amount users with a
+    username, name or surname that starts with prefix (ignoring case),
+    sorted by username.
+    """
+    prefix = prefix.lower()
+    starts = [
+        func.lower(column).startswith(prefix, autoescape=True)
+        for column in (User.username, User.name, User.surname)
+    ]
+    statement = (
+        select(User.id, User.username, User.name, User.surname)
+        .where(or_(*starts))
+        .order_by(func.lower(User.username), User.id)
+        .limit(amount)
+    )
+    return [tuple(row) for row in session.execute(statement)]
 
 
 def get_user_interests(session, user_id):
@@ -288,9 +541,27 @@ def get_user_interests(session, user_id):
 
     :param: session: the session to use
     :param: user_id: the id of the user to get the interests
-    :returns: a list of the interests of the user
+    :returns: a list of the (interest_id, interest) of the user
     """
-    return session.query(Interests).filter(Interests.user_id == user_id).all()
+    return (
+        session.query(Interests.interest_id, InterestCatalog.name.label("interest"))
+        .join(InterestCatalog, InterestCatalog.id == Interests.interest_id)
+        .filter(Interests.user_id == user_id)
+        .all()
+    )
+
+
+def _text_matches(query):
+    """
+    Returns the criteria of the users whose email, username, name or
+    surname contain the query.
+    """
+    return or_(
+        User.email.ilike(f"%{query}%"),
+        User.username.ilike(f"%{query}%"),
+        User.name.ilike(f"%{query}%"),
+        User.surname.ilike(f"%{query}%"),
+    )
 
 
 def search_for_users(session, query: str, start, amount):
@@ -303,20 +574,14 @@ def search_for_users(session, query: str, start, amount):
     :param: amount: the amount of users to return
     :returns: a list of users with the given query
     """
-    return (
-        session.query(User)
-        .filter(
-            or_(
-                User.email.ilike(f"%{query}%"),
-                User.username.ilike(f"%{query}%"),
-                User.name.ilike(f"%{query}%"),
-                User.surname.ilike(f"%{query}%"),
-            )
-        )
+    # Ordered, so the pages are stable.
+    users = (
+        select_users(session, UserSummary, _text_matches(query))
+        .order_by(User.id)
         .offset(start)
         .limit(amount)
-        .all()
     )
+    return as_read_models(UserSummary, users)
 
 
 def search_users_in_followers(session, username: str, start, amount, email):
@@ -329,13 +594,207 @@ def search_users_in_followers(session, username: str, start, amount, email):
     :param: amount: the amount of users to return
     :returns: a list of users with the given username who are followed by others
     """
-    user = session.query(User).filter(User.email == email).first()
-    user_id = user.id
-    return (
-        session.query(User)
+    user_id = session.query(User.id).filter(User.email == email).scalar()
+    users = (
+        select_users(session, UserSummary, User.username.ilike(f"{username}%"))
         .join(Following, Following.user_id == User.id)
         .filter(Following.following_id == user_id)
-        .filter(User.username.ilike(f"{username}%"))
+        .order_by(User.id)
         .offset(start)
         .limit(amount)
     )
+    return as_read_models(UserSummary, users)
+
+
+# The social distance of the ranked search, closest first.
+FOLLOWEE, FOLLOWER, TWO_HOP, EVERYONE = range(4)
+
+
+def _text_relevance(query):
+    """
+    Returns how well the username matches the query, best first: the
+    same username, a prefix of it, part of it, or only the other columns.
+    """
+    return case(
+        (func.lower(User.username) == query.lower(), 0),
+        (User.username.ilike(f"{query}%"), 1),
+        (User.username.ilike(f"%{query}%"), 2),
+        else_=3,
+    )
+
+
+# pylint: disable=too-many-arguments
+def search_users_by_distance(session, query, user_id, *, after, amount, limits):
+    """
+    Searches for users like search_for_users, ranked by their social
+    distance to the user with the given id (see FOLLOWEE, FOLLOWER, TWO_HOP
+    and EVERYONE), then by text relevance and then by id.
+
+    It's one query: the followees (only the limits[0] followed last) and
+    the two-hop users (only limits[1] of them, the users those followees
+    followed last) are hashed once, and whether a match follows the user is
+    a lookup of the primary key of following, so every match costs the same
+    no matter how many relations there are. Every page still scans the
+    matches of the text and ranks all of them; the cursor only avoids
+    reading and skipping the previous pages like an offset would.
+
+    :param: after: the (distance, relevance, id) of the last user of the
+    previous page, or None for the first page
+    :param: limits: the max followees and two-hop users that are looked at
+    :returns: a list of (distance, relevance, UserSummary)
+    """
+    followees = (
+        select(Following.following_id.label("id"))
+        .where(Following.user_id == user_id)
+        .order_by(Following.created_at.desc())
+        .limit(limits[0])
+        .cte("followees")
+    )
+    followed_by_followees = (
+        select(Following.following_id.label("id"))
+        .join(followees, Following.user_id == followees.c.id)
+        # Ordered, so the same users are looked at in every page.
+        .order_by(Following.created_at.desc(), Following.following_id)
+        .limit(limits[1])
+        .subquery()
+    )
+    two_hop = select(followed_by_followees.c.id).distinct().cte("two_hop")
+    distance = case(
+        (followees.c.id.isnot(None), FOLLOWEE),
+        (
+            exists().where(
+                Following.user_id == User.id, Following.following_id == user_id
+            ),
+            FOLLOWER,
+        ),
+        (two_hop.c.id.isnot(None), TWO_HOP),
+        else_=EVERYONE,
+    )
+    ranked = (
+        select(
+            distance.label("distance"),
+            _text_relevance(query).label("relevance"),
+            *columns_of(UserSummary),
+        )
+        .outerjoin(followees, followees.c.id == User.id)
+        .outerjoin(two_hop, two_hop.c.id == User.id)
+        .where(_text_matches(query))
+        .subquery()
+    )
+    key = (ranked.c.distance, ranked.c.relevance, ranked.c.id)
+    page = select(ranked).order_by(*key).limit(amount)
+    if after is not None:
+        page = page.where(tuple_(*key) > tuple_(*after))
+    return [
+        (distance, relevance, UserSummary._make(user))
+        for distance, relevance, *user in session.execute(page)
+    ]
+
+
+def get_users_by_column(session, key: str, values, columns):
+    """
+    Gets the users whose column key is in values, with a single IN query.
+
+    :param: session: the session to use
+    :param: key: the column to search by ("id", "email" or "username")
+    :param: values: the values of that column to look for
+    :param: columns: dict with the label and the name of each column to return
+    :returns: a list of rows, the first element of each row is the key
+    """
+    key_column = getattr(User, key)
+    selected = [key_column.label("key")] + [
+        getattr(User, column).label(label) for label, column in columns.items()
+    ]
+    return session.query(*selected).filter(key_column.in_(values)).all()
+
+
+# The columns of the users table that are part of a profile.
+PROFILE_COLUMNS = (
+    "id",
+    "email",
+    "username",
+    "name",
+    "surname",
+    "date_of_birth",
+    "bio",
+    "avatar",
+    "location",
+    "blocked",
+    "is_public",
+    "version",
+    "follow_version",
+)
+
+
+def get_profile_versions(session, username):
+    """
+    Gets the id, the versions and the public status of the user with the
+    given username: enough to know if a cached profile is still valid.
+    """
+    return (
+        session.query(User.id, User.version, User.follow_version, User.is_public)
+        .filter(User.username == username)
+        .first()
+    )
+
+
+def get_ids_by_id_or_email(session, ids, emails):
+    """
+    Returns the id and the email of the users whose id is in ids or whose
+    email is in emails, with a single query.
+    """
+    return (
+        session.query(User.id, User.email)
+        .filter(or_(User.id.in_(ids), User.email.in_(emails)))
+        .all()
+    )
+
+
+def get_profile(session, username, viewer_id):
+    """
+    Gets the profile of the user with the given username in a single query:
+    its columns (with the versions), the count of followers and following,
+    its relation with the user with id viewer_id and the array of its
+    interests (as subqueries, the interests are NULL if it has none).
+
+    :param: session: the session to use
+    :param: username: the username of the user
+    :param: viewer_id: the id of the user looking at the profile
+    :returns: the row of the profile, or None if there is no such user
+    """
+    followers_count = (
+        select(func.count())
+        .select_from(Following)
+        .where(Following.following_id == User.id)
+        .scalar_subquery()
+    )
+    following_count = (
+        select(func.count())
+        .select_from(Following)
+        .where(Following.user_id == User.id)
+        .scalar_subquery()
+    )
+    following = exists().where(
+        Following.user_id == viewer_id, Following.following_id == User.id
+    )
+    followed_by = exists().where(
+        Following.user_id == User.id, Following.following_id == viewer_id
+    )
+    interests = (
+        select(func.array_agg(InterestCatalog.name))
+        .join(Interests, Interests.interest_id == InterestCatalog.id)
+        .where(Interests.user_id == User.id)
+        .scalar_subquery()
+    )
+    return (
+        session.query(
+            *[getattr(User, column) for column in PROFILE_COLUMNS],
+            followers_count.label("followers_count"),
+            following_count.label("following_count"),
+            following.label("following"),
+            followed_by.label("followed_by"),
+            interests.label("interests"),
+        )
+        .filter(User.username == username)
+        .first()
+    )
@@ -0,0 +1,75 @@
+# read_models.py
+"""
+This module has the read models of the users.
+
+They are named tuples: immutable, without a __dict__ per instance, and
+built straight from the rows of queries that only select their columns.
+The ORM entities of tables/ are only loaded for writes, so the reads
+never bring the password (or any column they don't show).
+"""
+import datetime
+from typing import NamedTuple
+
+
+class AuthUser(NamedTuple):
+    """
+    What the routes need to know about the user that makes the request,
+    and what the follow lookups need to know about the other user.
+    """
+
+    id: int
+    email: str
+    username: str
+    blocked: bool
+    is_public: bool
+    location: str
+    version: int
+    follow_version: int
+
+
+class UserCredentials(NamedTuple):
+    """
+    What the login needs to check the password of a user.
+    """
+
+    id: int
+    email: str
+    password: str
+    blocked: bool
+
+
+class UserSummary(NamedTuple):
+    """
+    The fields of a user that are shown in lists, searches and details.
+    """
+
+    id: int
+    email: str
+    username: str
+    name: str
+    surname: str
+    date_of_birth: datetime.datetime
+    location: str
+    bio: str
+    avatar: str
+    is_public: bool
+    blocked: bool
+
+
+class UserExport(NamedTuple):
+    """
+    The fields of a user in the exports of the back-office.
+    """
+
+    id: int
+    email: str
+    username: str
+    name: str
+    surname: str
+    date_of_birth: datetime.datetime
+    location: str
+    bio: str
+    avatar: str
+    is_public: bool
+    blocked: bool
+    created_at: datetime.datetime
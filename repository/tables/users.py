@@ -9,6 +9,8 @@ from sqlalchemy import Column, Integer
 from sqlalchemy import String, DateTime
 from sqlalchemy import Boolean, ForeignKey
 from sqlalchemy import UniqueConstraint
+from sqlalchemy import Index
+from sqlalchemy import literal_column, func
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -48,6 +50,23 @@ class User(Base):
     location = Column(String(100), nullable=False)
     blocked = Column(Boolean, nullable=False, default=False)
     is_public = Column(Boolean, default=True, nullable=False)
+    # Goes up every time the row (or the user's interests) changes,
+    # it's what the ETags of the user are computed from.
+    version = Column(
+        Integer,
+        nullable=False,
+        default=1,
+        server_default="1",
+        onupdate=literal_column("version + 1"),
+    )
+    updated_at = Column(
+        DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow
+    )
+    # Goes up every time the user follows or unfollows someone,
+    # or someone follows or unfollows the user.
+    follow_version = Column(Integer, nullable=False, default=1, server_default="1")
+    # When follow_version last went up, for the changes of the graph snapshots.
+    follow_updated_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     # pylint: disable=too-many-arguments
     def __init__(
@@ -102,22 +121,56 @@ class Following(Base):
         self.following_id = following_id
 
 
+class InterestCatalog(Base):
+    """
+    Class that represents the dictionary of interests: every interest
+    name once, with an id and how many users have it.
+    """
+
+    __tablename__ = "interest_catalog"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(75), unique=True, nullable=False)
+    # Goes up and down when the users change their interests (or are
+    # removed), so the popular interests don't need a GROUP BY.
+    users = Column(Integer, nullable=False, default=0, server_default="0", index=True)
+
+    # For the autocomplete: lower(name) LIKE 'prefix%' uses it.
+    __table_args__ = (
+        Index(
+            "ix_interest_catalog_name_prefix",
+            func.lower(name).label("lower_name"),
+            postgresql_ops={"lower_name": "text_pattern_ops"},
+        ),
+    )
+
+    def __init__(self, name):
+        self.name = name
+
+
 class Interests(Base):
     """
-    Class that represents the interests table of users
+    Class that represents the interests table of users, with the id of
+    each interest in interest_catalog.
     """
 
     __tablename__ = "interests"
 
     user_id = create_users_foreign_key(True)
 
-    interest = Column(String(75), nullable=False, primary_key=True)
+    interest_id = Column(
+        Integer,
+        ForeignKey("interest_catalog.id"),
+        nullable=False,
+        primary_key=True,
+        index=True,
+    )
 
-    _table_args__ = (UniqueConstraint("user_id", "interest"),)
+    _table_args__ = (UniqueConstraint("user_id", "interest_id"),)
 
-    def __init__(self, user_id, interest):
+    def __init__(self, user_id, interest_id):
         self.user_id = user_id
-        self.interest = interest
+        self.interest_id = interest_id
 
 
 class BiometricToken(Base):
@@ -136,3 +189,18 @@ class BiometricToken(Base):
     def __init__(self, user_id, biometric_token):
         self.user_id = user_id
         self.biometric_token = biometric_token
+
+
+class RemovedUser(Base):
+    """
+    Class that represents the ids of the removed users and when they were
+    removed, so the changes of the graph snapshots can tell who is gone.
+    """
+
+    __tablename__ = "removed_users"
+
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    removed_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+    def __init__(self, user_id):
+        self.user_id = user_id
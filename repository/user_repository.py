@@ -4,6 +4,7 @@
 This module is for the repository layer of the REST API for the login backend.
 """
 import os
+from contextlib import contextmanager
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from repository.tables.users import Base
@@ -12,6 +13,12 @@ from repository.queries.user_queries import (
     delete_user as delete_user_db,
     get_all_users as get_all_users_db,
     get_user_by_mail as get_user_by_mail_db,
+    get_auth_user_by_mail as get_auth_user_by_mail_db,
+    get_credentials_by_mail as get_credentials_by_mail_db,
+    get_user_summary_by_mail as get_user_summary_by_mail_db,
+    get_user_summary_by_username as get_user_summary_by_username_db,
+    get_user_summaries_by_ids as get_user_summaries_by_ids_db,
+    get_blocked_ids as get_blocked_ids_db,
     get_user_by_username as get_user_by_username_db,
     get_user_by_id as get_user_by_id_db,
     update_user_password as update_user_password_db,
@@ -22,12 +29,21 @@ from repository.queries.user_queries import (
     update_user_avatar as update_user_avatar_db,
     update_user_location as update_user_location_db,
     update_user_blocked_status as update_user_blocked_status_db,
-    delete_user_interests,
-    add_user_interest,
+    set_user_interests as set_user_interests_db,
+    get_popular_interests as get_popular_interests_db,
     get_user_interests as get_user_interests_db,
     search_for_users as search_for_users_db,
     search_users_in_followers as search_users_in_followers_db,
+    search_users_by_distance as search_users_by_distance_db,
+    autocomplete_users as autocomplete_users_db,
     update_user_public_status as update_user_public_status_db,
+    get_users_by_column as get_users_by_column_db,
+    get_profile as get_profile_db,
+    get_profile_versions as get_profile_versions_db,
+    users_export_statement,
+    interests_statement,
+    autocomplete_statement,
+    get_ids_by_id_or_email as get_ids_by_id_or_email_db,
 )
 
 from repository.queries.follow_queries import (
@@ -35,12 +51,29 @@ from repository.queries.follow_queries import (
     get_followers as get_followers_db,
     get_following as get_following_db,
     get_following_relations as get_following_relations_db,
+    following_relations_statement,
+    create_follows as create_follows_db,
+    get_suggestion_scores as get_suggestion_scores_db,
+    get_suggestion_candidates as get_suggestion_candidates_db,
+    get_suggestion_score as get_suggestion_score_db,
+    get_interest_suggestion_scores as get_interest_suggestion_scores_db,
+    get_following_ids as get_following_ids_db,
+    get_following_that_follow as get_following_that_follow_db,
+    graph_users_statement,
+    graph_following_statement,
+    removed_users_statement,
+    remove_follows as remove_follows_db,
     get_following_count as get_following_count_db,
     get_followers_count as get_followers_count_db,
     remove_follow as remove_follow_db,
     is_following as is_following_db,
+    get_follow_status as get_follow_status_db,
+    get_followers_version as get_followers_version_db,
+    get_following_version as get_following_version_db,
 )
 
+from repository.queries.bulk_queries import BulkLoad
+
 from repository.queries.biometric_queries import (
     add_user_biometric_token as add_user_biometric_token_db,
     get_biometric_token as get_biometric_token_db,
@@ -57,6 +90,10 @@ Base.metadata.create_all(engine)
 Session = sessionmaker(bind=engine)
 session = Session()
 TIMEOUT = 60
+# Max values sent in a single IN (...) query.
+IN_QUERY_CHUNK_SIZE = 500
+# Rows fetched at a time from the server-side cursor of the exports.
+STREAM_BATCH_SIZE = 2000
 
 
 def register_user(
@@ -69,12 +106,12 @@ def register_user(
     This function that adds a user to the database.
 
     :param user: The user to register.
-    :return: confirmation JSON message.
+    :return: confirmation JSON message, with the id of the user.
     """
 
-    create_user_db(session, email, password, username, data)
+    user = create_user_db(session, email, password, username, data)
 
-    return {"message": "Registration successful"}
+    return {"message": "Registration successful", "id": user.id}
 
 
 def get_user_email(email: str):
@@ -90,6 +127,82 @@ def get_user_email(email: str):
     return user
 
 
+def get_auth_user(email: str):
+    """
+    This function retrieves the AuthUser of a user: only what's needed
+    to authorize a request or to know who the user is.
+
+    :param email: The email of the user to retrieve.
+    :return: The AuthUser.
+    """
+    user = get_auth_user_by_mail_db(session, email)
+    if user is None:
+        raise KeyError()
+    return user
+
+
+def get_user_credentials(email: str):
+    """
+    This function retrieves what's needed to check the password of a user.
+
+    :param email: The email of the user to retrieve.
+    :return: The UserCredentials.
+    """
+    credentials = get_credentials_by_mail_db(session, email)
+    if credentials is None:
+        raise KeyError()
+    return credentials
+
+
+def get_user_summary(email: str):
+    """
+    This function retrieves the fields of a user that are shown,
+    without its password.
+
+    :param email: The email of the user to retrieve.
+    :return: The UserSummary.
+    """
+    user = get_user_summary_by_mail_db(session, email)
+    if user is None:
+        raise KeyError()
+    return user
+
+
+def get_user_summary_username(username: str):
+    """
+    This function retrieves the fields of a user that are shown, by its
+    username, without its password.
+
+    :param username: The username of the user to retrieve.
+    :return: The UserSummary.
+    """
+    user = get_user_summary_by_username_db(session, username)
+    if user is None:
+        raise KeyError()
+    return user
+
+
+def get_user_summaries_by_ids(ids):
+    """
+    This function retrieves the fields that are shown of many users at
+    once, leaving out the blocked ones.
+
+    :param ids: The ids of the users to retrieve.
+    :return: A list of UserSummary, in no particular order.
+    """
+    return get_user_summaries_by_ids_db(session, list(ids))
+
+
+def get_blocked_ids(ids):
+    """
+    This function retrieves which of the users are blocked.
+
+    :param ids: The ids of the users to check.
+    :return: A set with the ids of the blocked ones.
+    """
+    return get_blocked_ids_db(session, list(ids))
+
+
 def get_user_username(username: str):
     """
     This function retrieves an user by username.
@@ -122,11 +235,14 @@ def remove_user(email: str):
     This is used for deleting a user from the data base.
 
     :param email: The email used to identify the user.
+    :return: The id of the removed user.
     """
     user = get_user_by_mail_db(session, email)
     if user is None:
         raise KeyError()
-    delete_user_db(session, user.id)
+    user_id = user.id
+    delete_user_db(session, user_id)
+    return user_id
 
 
 def create_follow(email: str, email_to_follow: str):
@@ -135,10 +251,116 @@ def create_follow(email: str, email_to_follow: str):
 
     :param email: The email of the user that wants to follow.
     :param email_to_follow: The email of the user that is being followed.
+    :return: The ids of both users.
     """
-    follow = create_follow_db(session, email, email_to_follow)
-    if follow is None:
+    ids = create_follow_db(session, email, email_to_follow)
+    if ids is None:
         raise KeyError()
+    return ids
+
+
+def get_ids_by_id_or_email(ids: list, emails: list):
+    """
+    This is used for resolving many users at once, with a single query.
+
+    :param ids: The ids to look for.
+    :param emails: The emails to look for.
+    :return: A list of rows with the id and the email of the users found.
+    """
+    return get_ids_by_id_or_email_db(session, ids, emails)
+
+
+def create_follows(user_id: int, ids_to_follow):
+    """
+    This is used for following many users at once, in a single statement.
+
+    :param user_id: The id of the user that wants to follow.
+    :param ids_to_follow: The ids of the users to follow.
+    :return: The ids that were not followed before.
+    """
+    return create_follows_db(session, user_id, list(ids_to_follow))
+
+
+def remove_follows(user_id: int, ids_to_unfollow):
+    """
+    This is used for unfollowing many users at once, in a single statement.
+
+    :param user_id: The id of the user that wants to unfollow.
+    :param ids_to_unfollow: The ids of the users to unfollow.
+    :return: The ids that were followed before.
+    """
+    return remove_follows_db(session, user_id, list(ids_to_unfollow))
+
+
+def get_suggestion_scores(user_id: int, max_followees: int, ammount: int):
+    """
+    This is used for ranking the users followed by the people a user follows.
+
+    :param user_id: The user's id.
+    :param max_followees: How many of the user's followees are expanded.
+    :param ammount: The max ammount of candidates to return.
+    :return: A list of rows with the id and the mutuals of each candidate.
+    """
+    return get_suggestion_scores_db(session, user_id, max_followees, ammount)
+
+
+def get_suggestion_candidates(user_id: int, followee_id: int):
+    """
+    This is used for knowing which users a followee adds to the suggestions.
+
+    :param user_id: The user's id.
+    :param followee_id: The id of the user it follows (or unfollows).
+    :return: The ids of the users followee_id follows that can be suggested.
+    """
+    return get_suggestion_candidates_db(session, user_id, followee_id)
+
+
+def get_suggestion_score(user_id: int, candidate_id: int, max_followees: int):
+    """
+    This is used for knowing the score of a user that can be suggested
+    again, after it was unfollowed.
+
+    :param user_id: The user's id.
+    :param candidate_id: The id of the user it unfollowed.
+    :param max_followees: How many of the user's followees are looked at.
+    :return: How many of them follow candidate_id.
+    """
+    return get_suggestion_score_db(session, user_id, candidate_id, max_followees)
+
+
+def get_interest_suggestion_scores(user_id: int, filters: dict, ammount: int):
+    """
+    This is used for getting the users that share the most interests with
+    a user.
+
+    :param user_id: The user's id.
+    :param filters: Dict with "public_only" and "not_followed".
+    :param ammount: The max ammount of users.
+    :return: Rows of (id, shared), best first.
+    """
+    return get_interest_suggestion_scores_db(session, user_id, filters, ammount)
+
+
+def get_following_ids(user_id: int):
+    """
+    This is used for getting the ids of the users a user follows.
+
+    :param user_id: The user's id.
+    """
+    return get_following_ids_db(session, user_id)
+
+
+def get_following_that_follow(user_id: int, target_id: int, max_followees: int):
+    """
+    This is used for getting the ids of the users a user follows that
+    follow another one.
+
+    :param user_id: The user's id.
+    :param target_id: The id of the user they follow.
+    :param max_followees: How many of the users the user follows (the
+    lowest ids) are looked at.
+    """
+    return get_following_that_follow_db(session, user_id, target_id, max_followees)
 
 
 def get_followers(user_id: int):
@@ -177,6 +399,43 @@ def is_follower(user_id: int, user_id_to_check_if_follower: int):
     return is_following_db(session, user_id_to_check_if_follower, user_id)
 
 
+def get_follow_status(user_id: int, key: str, values: list):
+    """
+    This is used for getting the relation between an user and many others.
+    The values are looked up in chunks of IN_QUERY_CHUNK_SIZE.
+
+    :param user_id: The user's id.
+    :param key: The column to search the others by ("id" or "email").
+    :param values: The values of that column to look for.
+    :return: A list of rows with the key, following and followed_by.
+    """
+    rows = []
+    for start in range(0, len(values), IN_QUERY_CHUNK_SIZE):
+        chunk = values[start : start + IN_QUERY_CHUNK_SIZE]
+        rows.extend(get_follow_status_db(session, user_id, key, chunk))
+    return rows
+
+
+def get_followers_version(user_id: int):
+    """
+    This is used for knowing if the list of followers of an user changed.
+
+    :param user_id: The user's id.
+    :return: How many followers it has and the sum of their versions.
+    """
+    return get_followers_version_db(session, user_id)
+
+
+def get_following_version(user_id: int):
+    """
+    This is used for knowing if the list of users an user follows changed.
+
+    :param user_id: The user's id.
+    :return: How many users it follows and the sum of their versions.
+    """
+    return get_following_version_db(session, user_id)
+
+
 def get_following_relations():
     """
     This is used for getting the following relations between users.
@@ -184,6 +443,103 @@ def get_following_relations():
     return get_following_relations_db(session)
 
 
+def _stream_rows(statement, batch_size):
+    """
+    Generator of the rows of the statement, in batches of batch_size rows.
+    It reads from a server-side cursor on its own connection, so only one
+    batch is in memory at a time and the global session is left alone
+    while an export is being sent. The connection is given back when the
+    generator ends or is closed.
+    """
+    with engine.connect() as connection:
+        result = connection.execution_options(yield_per=batch_size).execute(statement)
+        yield from result.partitions()
+
+
+def stream_following_relations(
+    since=None, min_user_id=None, max_user_id=None, batch_size=STREAM_BATCH_SIZE
+):
+    """
+    Generator of the following relations, in batches of
+    (user_id, following_id, created_at) rows.
+    """
+    statement = following_relations_statement(since, min_user_id, max_user_id)
+    return _stream_rows(statement, batch_size)
+
+
+def stream_interests(batch_size=STREAM_BATCH_SIZE):
+    """
+    Generator of every interest, in batches of (user_id, interest) rows
+    sorted by user_id.
+    """
+    return _stream_rows(interests_statement(), batch_size)
+
+
+def stream_autocomplete_users(batch_size=STREAM_BATCH_SIZE):
+    """
+    Generator of every user, in batches of (id, username, name, surname)
+    rows sorted by id.
+    """
+    return _stream_rows(autocomplete_statement(), batch_size)
+
+
+def stream_users(filters: dict, batch_size=STREAM_BATCH_SIZE):
+    """
+    Generator of the users that match the filters, in batches of rows
+    with the fields of UserExport.
+    """
+    return _stream_rows(users_export_statement(filters), batch_size)
+
+
+@contextmanager
+def read_graph(since=None, batch_size=STREAM_BATCH_SIZE):
+    """
+    Context manager of the rows of a graph snapshot, read in a single
+    REPEATABLE READ transaction on its own connection, so they're
+    consistent with each other. It gives a dict with generators of
+    batches, read from server-side cursors, that have to be read in order:
+    "users" (id, username, blocked, is_public), "following" (user_id,
+    following_id) and "removed" (user_id). They're every user and
+    relation, or the ones that changed (and the removed users) since the
+    given date.
+    """
+    with engine.connect() as connection:
+        connection = connection.execution_options(
+            isolation_level="REPEATABLE READ", yield_per=batch_size
+        )
+        with connection.begin():
+
+            def stream(statement):
+                yield from connection.execute(statement).partitions()
+
+            yield {
+                "users": stream(graph_users_statement(since)),
+                "following": stream(graph_following_statement(since)),
+                "removed": ()
+                if since is None
+                else stream(removed_users_statement(since)),
+            }
+
+
+@contextmanager
+def bulk_load(rebuild_indexes=False, use_copy=None):
+    """
+    Context manager of a BulkLoad (see repository/queries/bulk_queries.py)
+    on its own connection, in a single transaction: if anything fails
+    nothing is loaded. It's finished when the block ends.
+
+    :param rebuild_indexes: Whether to drop the secondary indexes of the
+    tables while loading and build them again at the end.
+    :param use_copy: Whether to copy the rows with COPY or with batched
+    inserts, None to use COPY with postgres. It raises ValueError if it's
+    true with another database.
+    """
+    with engine.begin() as connection:
+        load = BulkLoad(connection, rebuild_indexes, use_copy)
+        yield load
+        load.finish()
+
+
 def get_following_count(user_id: int):
     """
     This is used for getting the number of users a user is following.
@@ -241,11 +597,12 @@ def update_user_last_name(email: str, last_name: str):
 
     :param email: The email used to identify the user.
     :param last_name: The last_name to update.
+    :return: The user updated.
     """
     user = get_user_by_mail_db(session, email)
     if user is None:
         raise KeyError()
-    update_user_last_name_db(session, user.id, last_name)
+    return update_user_last_name_db(session, user.id, last_name)
 
 
 def update_user_name(email: str, name: str):
@@ -254,11 +611,12 @@ def update_user_name(email: str, name: str):
 
     :param email: The email used to identify the user.
     :param name: The name to update.
+    :return: The user updated.
     """
     user = get_user_by_mail_db(session, email)
     if user is None:
         raise KeyError()
-    update_user_name_db(session, user.id, name)
+    return update_user_name_db(session, user.id, name)
 
 
 def update_user_date_of_birth(email: str, date_of_birth: str):
@@ -332,10 +690,9 @@ def set_user_interests(user_id: int, interests: list):
 
     :param user_id: The id of the user you want to set the interests.
     :param interests: The interests to set in a list.
+    :return: The ids of the interests the user had and of the ones it has.
     """
-    delete_user_interests(session, user_id)
-    for interest in interests:
-        add_user_interest(session, user_id, interest)
+    return set_user_interests_db(session, user_id, interests)
 
 
 def get_user_interests(user_id: int):
@@ -348,6 +705,58 @@ def get_user_interests(user_id: int):
     return get_user_interests_db(session, user_id)
 
 
+def get_popular_interests(prefix, ammount: int):
+    """
+    This function is used for getting the interests most users have.
+
+    :param prefix: If it's not None, only the interests that start with it.
+    :param ammount: The max ammount of interests.
+    :return: Rows of (name, users), the most popular first.
+    """
+    return get_popular_interests_db(session, prefix, ammount)
+
+
+def autocomplete_users(prefix: str, amount: int):
+    """
+    This function is used for the autocomplete of the users.
+
+    :param prefix: The start of the username, name or surname.
+    :param amount: The max amount of users.
+    :return: A list of (id, username, name, surname).
+    """
+    return autocomplete_users_db(session, prefix, amount)
+
+
+def get_profile(username: str, viewer_id: int):
+    """
+    This function is used for getting everything shown in a profile:
+    the user (with its versions), its followers and following counts, its
+    relation with the viewer and its interests, in a single query.
+
+    :param username: The username of the user of the profile.
+    :param viewer_id: The id of the user looking at the profile.
+    :return: The row of the profile.
+    """
+    profile = get_profile_db(session, username, viewer_id)
+    if profile is None:
+        raise KeyError()
+    return profile
+
+
+def get_profile_versions(username: str):
+    """
+    This function is used for getting the versions of a profile,
+    to check if a cached copy is still valid.
+
+    :param username: The username of the user of the profile.
+    :return: The row with the id, version, follow_version and is_public.
+    """
+    versions = get_profile_versions_db(session, username)
+    if versions is None:
+        raise KeyError()
+    return versions
+
+
 def search_for_users(
     username: str, start: int, amount: int, email=None, in_followers=False
 ):
@@ -364,6 +773,40 @@ def search_for_users(
     return search_for_users_db(session, username, start, amount)
 
 
+def search_users_by_distance(query: str, user_id: int, *, after, amount: int, limits):
+    """
+    This function is used for searching for users ranked by their social
+    distance to the user with the given id.
+
+    :param query: The text to search for.
+    :param after: The (distance, relevance, id) of the last user of the
+    previous page, or None.
+    :param amount: The amount of users to return.
+    :param limits: The max followees and two-hop users that are looked at.
+    :return: A list of (distance, relevance, UserSummary).
+    """
+    return search_users_by_distance_db(
+        session, query, user_id, after=after, amount=amount, limits=limits
+    )
+
+
+def get_users_batch(key: str, values: list, columns: dict):
+    """
+    This function is used for getting many users at once.
+    The values are looked up in chunks of IN_QUERY_CHUNK_SIZE.
+
+    :param key: The column to search by ("id", "email" or "username").
+    :param values: The values of that column to look for.
+    :param columns: Dict with the label and the name of each column to return.
+    :return: A list of rows, the first element of each row is the key.
+    """
+    rows = []
+    for start in range(0, len(values), IN_QUERY_CHUNK_SIZE):
+        chunk = values[start : start + IN_QUERY_CHUNK_SIZE]
+        rows.extend(get_users_by_column_db(session, key, chunk, columns))
+    return rows
+
+
 def add_user_biometric_token(
     email: str,
     biometric_token: str,
@@ -4,11 +4,13 @@ This module is for encapsulating all the admin related functions and logic.
 """
 from repository.user_repository import (
     get_user_collection,
+    stream_users as stream_users_repo,
     update_user_blocked_status as update_user_blocked_status_repo,
     manual_rollback,
 )
 from service.errors import UserNotFound
 from service.errors import MaxAmmountExceeded
+from service.errors import InvalidExportFilter
 from service.user_handler import MAX_AMMOUNT
 
 
@@ -27,6 +29,23 @@ class AdminHandler:
             raise MaxAmmountExceeded("ammount must be less than " + str(MAX_AMMOUNT))
         return get_user_collection(start, ammount)
 
+    def stream_users(self, filters: dict):
+        """
+        This function is used to export the users that match the filters
+        in batches, without loading them all. filters may have "blocked",
+        "is_public", "created_from" and "created_to".
+        The filters are checked here, before the export starts.
+        """
+        created_from = filters.get("created_from")
+        created_to = filters.get("created_to")
+        if (
+            created_from is not None
+            and created_to is not None
+            and created_from > created_to
+        ):
+            raise InvalidExportFilter("created_from can't be after created_to")
+        return stream_users_repo(filters)
+
     def change_blocked_status(self, email: str, blocked_status: bool):
         """
         This function is used to update the user in the database.
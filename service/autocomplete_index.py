@@ -0,0 +1,241 @@
+# autocomplete_index.py
+"""
+This module is the optional in-process index of the autocomplete of the
+mentions (`@ali...`): the users whose username, name or surname start
+with a prefix, without going to the database.
+
+It's a sorted array of the lowercased usernames, names and surnames
+(the terms), packed one after the other in a bytes object with an array
+of where each one starts and an array with the id of its user. A prefix
+is two binary searches and the matches are the terms in between, so the
+first ones come in a few microseconds no matter how many users there
+are. They come sorted by the term, so "ali" comes before "alicia".
+
+What is shown of every user (its username, name and surname as they
+are) is packed the same way, by id.
+
+It's built from a streaming scan of the users and kept current with the
+users registered, renamed and removed by this process. Like follow_graph,
+those changes are kept apart (the delta) and merged into the arrays when
+there are more than AUTOCOMPLETE_MAX_DELTA of them, and it's meant for a
+single process.
+
+Memory: a user takes its three terms and its record (~2 times the bytes
+of its username, name and surname) plus 12 bytes of the arrays of every
+term and 12 of the ones of its record. With usernames of ~12 letters and
+names and surnames of ~5 it's ~90 bytes per user, ~89 MB per million
+users (see benchmarks/autocomplete_index_benchmark.py). While it's built
+from the scan the terms are sorted as python objects, which takes ~5
+times that. A change in the delta takes ~200 bytes until it's merged.
+
+It's configured with environment variables:
+- AUTOCOMPLETE_INDEX: 1 to build it when the app starts. Defaults to 0.
+- AUTOCOMPLETE_MAX_DELTA: changes kept apart before merging them into
+  the arrays. Defaults to 10000.
+"""
+import os
+from array import array
+from bisect import bisect_left, insort
+from heapq import merge
+from itertools import islice, takewhile
+from service.in_process_index import InProcessIndex
+
+AUTOCOMPLETE_INDEX = os.getenv("AUTOCOMPLETE_INDEX", "0") == "1"
+AUTOCOMPLETE_MAX_DELTA = int(os.getenv("AUTOCOMPLETE_MAX_DELTA", "10000"))
+
+# Separates the username, name and surname in the record of a user.
+SEPARATOR = "\x00"
+# Goes between a term and the id of its user while they're sorted, it's
+# lower than every other byte so "al" still goes before "ala".
+ENTRY_SEPARATOR = b"\x00"
+
+
+def _terms(fields):
+    """
+    Returns the set of lowercased terms (as utf-8) of the (username, name,
+    surname) of a user, or an empty one if it's None.
+    """
+    return {field.lower().encode() for field in fields or () if field}
+
+
+class _Packed:
+    """
+    Sorted keys packed in a bytes object, each with an int value. It's
+    built from the (key, value) pairs, sorted by key.
+    """
+
+    def __init__(self, pairs):
+        data = bytearray()
+        self.offsets = array("Q", [0])
+        self.values = array("i")
+        for key, value in pairs:
+            data += key
+            self.offsets.append(len(data))
+            self.values.append(value)
+        self.data = bytes(data)
+
+    def key(self, index):
+        """
+        Returns the key at index.
+        """
+        return self.data[self.offsets[index] : self.offsets[index + 1]]
+
+    def search(self, prefix):
+        """
+        Returns the index of the first key that is not lower than prefix.
+        """
+        low, high = 0, len(self.values)
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def starting_with(self, prefix):
+        """
+        Generator of the (key, value) of the keys that start with prefix.
+        """
+        for index in range(self.search(prefix), len(self.values)):
+            key = self.key(index)
+            if not key.startswith(prefix):
+                return
+            yield key, self.values[index]
+
+    def size(self):
+        """
+        Returns the bytes of the data and the arrays.
+        """
+        return (
+            len(self.data)
+            + len(self.offsets) * self.offsets.itemsize
+            + len(self.values) * self.values.itemsize
+        )
+
+
+class AutocompleteIndex(InProcessIndex):
+    """
+    In-process index of the autocomplete, see the module docstring. It's
+    loaded from batches of (id, username, name, surname) rows sorted by
+    id, like the ones of stream_autocomplete_users.
+    """
+
+    def __init__(self, max_delta=AUTOCOMPLETE_MAX_DELTA):
+        super().__init__()
+        self.max_delta = max_delta
+        self._install(None)
+
+    def _build(self, *sources):
+        (batches,) = sources
+        records, entries = [], []
+        for batch in batches:
+            for user_id, *fields in batch:
+                fields = [field or "" for field in fields]
+                records.append((SEPARATOR.join(fields).encode(), user_id))
+                # The term and the id in one bytes object, so they take less
+                # memory than a tuple while they're sorted.
+                suffix = ENTRY_SEPARATOR + user_id.to_bytes(4, "big")
+                entries.extend(term + suffix for term in _terms(fields))
+        entries.sort()
+        terms = _Packed(
+            (entry[:-5], int.from_bytes(entry[-4:], "big")) for entry in entries
+        )
+        return terms, _Packed(records)
+
+    def _install(self, state):
+        self._terms, self._records = state or (_Packed(()), _Packed(()))
+        self._added = []
+        self._removed = set()
+        self._users = {}
+
+    def _changed(self):
+        if len(self._added) + len(self._removed) > self.max_delta:
+            terms = _Packed(self._entries(b""))
+            user_ids = sorted(set(self._records.values).union(self._users))
+            records = _Packed(
+                (SEPARATOR.join(self._user(user_id)).encode(), user_id)
+                for user_id in user_ids
+                if self._user(user_id)
+            )
+            self._install((terms, records))
+
+    def _user(self, user_id):
+        """
+        Returns the (username, name, surname) of the user, or None if it's
+        not in the index.
+        """
+        if user_id in self._users:
+            return self._users[user_id]
+        index = bisect_left(self._records.values, user_id)
+        if index == len(self._records.values) or self._records.values[index] != user_id:
+            return None
+        return tuple(str(self._records.key(index), "utf-8").split(SEPARATOR))
+
+    def _entries(self, prefix):
+        """
+        Generator of the (term, user id) that start with prefix, sorted.
+        """
+        added = takewhile(
+            lambda entry: entry[0].startswith(prefix),
+            islice(self._added, bisect_left(self._added, (prefix,)), None),
+        )
+        packed = (
+            entry
+            for entry in self._terms.starting_with(prefix)
+            if entry not in self._removed
+        )
+        return merge(packed, added)
+
+    def _set(self, user_id, fields):
+        old, new = _terms(self._user(user_id)), _terms(fields)
+        for term in old.difference(new):
+            index = bisect_left(self._added, (term, user_id))
+            if index < len(self._added) and self._added[index] == (term, user_id):
+                del self._added[index]
+            else:
+                self._removed.add((term, user_id))
+        for term in new.difference(old):
+            if (term, user_id) in self._removed:
+                self._removed.discard((term, user_id))
+            else:
+                insort(self._added, (term, user_id))
+        self._users[user_id] = None if fields is None else tuple(fields)
+
+    def set_user(self, user_id, username, name, surname):
+        """
+        Records that the user was registered or renamed.
+        """
+        fields = (username or "", name or "", surname or "")
+        self._record(lambda: self._set(user_id, fields))
+
+    def remove_user(self, user_id):
+        """
+        Records that the user was removed.
+        """
+        self._record(lambda: self._set(user_id, None))
+
+    def complete(self, prefix, ammount):
+        """
+        Returns the (id, username, name, surname) of up to ammount users
+        with a username, name or surname that starts with prefix (ignoring
+        case), sorted by the term that matched.
+        """
+        users = {}
+        with self._lock:
+            for _, user_id in self._entries(prefix.lower().encode()):
+                if len(users) == ammount:
+                    break
+                if user_id not in users:
+                    users[user_id] = self._user(user_id)
+        return [(user_id, *fields) for user_id, fields in users.items()]
+
+    def size(self):
+        """
+        Returns the bytes of its arrays (0 until it's loaded).
+        """
+        with self._lock:
+            return self._terms.size() + self._records.size()
+
+
+autocomplete_index = AutocompleteIndex()
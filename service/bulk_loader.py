@@ -0,0 +1,262 @@
+# bulk_loader.py
+"""
+This module is the bulk loader of users, follows and interests from files,
+for imports from other systems and for seeding environments (see
+`python -m control.cli load`).
+
+The files are CSVs with a header or NDJSON (.ndjson or .jsonl, a JSON
+object per line), with these fields:
+- users: email, username, name, surname, date_of_birth (ISO 8601) and a
+  password, hashed here, or a password_hash (a bcrypt hash, used as is).
+  bio, avatar, location, blocked and is_public are optional.
+- following: email (the follower) and email_to_follow.
+- interests: email and interest, one per row.
+
+They're read and loaded in batches of BULK_BATCH_SIZE rows, so they can
+be bigger than the memory, with the COPY of repository/queries/
+bulk_queries.py. The rows that are already there are skipped.
+
+bcrypt is slow on purpose (~0.25 s a password), so the passwords are
+hashed in a pool of processes, the ones of a batch while the previous
+one is being loaded. Loading password_hash instead is orders of magnitude
+faster.
+
+Everything is loaded in a single transaction: a row that is not valid
+raises ValueError with its file and line, and nothing is loaded. The
+in-process indexes of the running apps see the new rows when they're
+built again (when they start).
+"""
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import orjson
+from repository.user_repository import bulk_load as bulk_load_repo
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "5000"))
+# Passwords sent to a process of the pool at a time.
+HASH_CHUNK_SIZE = 8
+FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+TRUE = {"true", "t", "1", "yes"}
+FALSE = {"false", "f", "0", "no"}
+# Where the password is in the rows of the users.
+PASSWORD = 5
+
+
+def read_records(path: str):
+    """
+    Generator of the (line, record) of a CSV or NDJSON file, the records
+    are dicts of its fields.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"{path}: it should be a .csv, .ndjson or .jsonl file")
+    with open(path, newline="", encoding="utf-8") as file:
+        if FORMATS[extension] == "csv":
+            reader = csv.DictReader(file)
+            for record in reader:
+                yield reader.line_num, record
+            return
+        for line, text in enumerate(file, 1):
+            if not text.strip():
+                continue
+            # pylint: disable=no-member
+            try:
+                record = orjson.loads(text)
+            except orjson.JSONDecodeError as error:
+                raise ValueError(f"{path}:{line}: {error}") from error
+            if not isinstance(record, dict):
+                raise ValueError(f"{path}:{line}: it's not an object")
+            yield line, record
+
+
+def _text(record, name, required=True):
+    """
+    Returns the field of the record as a string, "" if it's missing and
+    not required.
+    """
+    value = record.get(name)
+    if value is None or value == "":
+        if required:
+            raise ValueError(f"{name} is missing")
+        return ""
+    return str(value)
+
+
+def _boolean(record, name, default):
+    """
+    Returns the field of the record as a bool, default if it's missing.
+    """
+    value = record.get(name)
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in TRUE:
+        return True
+    if str(value).lower() in FALSE:
+        return False
+    raise ValueError(f"{name} should be true or false, not {value!r}")
+
+
+def _following(_, record):
+    """
+    Returns the (email, email_to_follow) of a record of the follows.
+    """
+    return _text(record, "email"), _text(record, "email_to_follow")
+
+
+def _interest(_, record):
+    """
+    Returns the (email, interest) of a record of the interests.
+    """
+    return _text(record, "email"), _text(record, "interest")
+
+
+def _batches(path, convert):
+    """
+    Generator of the records of the file in batches of BULK_BATCH_SIZE,
+    converted to rows by convert(line, record).
+    """
+    batch = []
+    for line, record in read_records(path):
+        try:
+            batch.append(convert(line, record))
+        except ValueError as error:
+            raise ValueError(f"{path}:{line}: {error}") from error
+        if len(batch) == BULK_BATCH_SIZE:
+            yield batch
+            batch = []
+    yield batch
+
+
+def _timed(load, batches):
+    """
+    Loads the batches and returns how many "rows" there were, how many
+    were "added" and the "seconds" and "rows_per_second" it took.
+    """
+    start = time.perf_counter()
+    rows, added = load(batches)
+    seconds = time.perf_counter() - start
+    return {
+        "rows": rows,
+        "added": added,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds else 0.0,
+    }
+
+
+# pylint: disable=too-few-public-methods
+class BulkLoader:
+    """
+    The bulk loader, see the module docstring. The passwords are hashed
+    with hash_password (in other processes, so it has to be picklable) and
+    the ones that are already hashed are checked with is_hash.
+    """
+
+    def __init__(self, hash_password, is_hash, workers=None):
+        self.hash_password = hash_password
+        self.is_hash = is_hash
+        self.workers = workers
+        self.hashed = 0
+
+    def _user(self, line, record):
+        """
+        Returns the row of a record of the users, with its password as it
+        is, and whether it was already hashed.
+        """
+        row = [line]
+        row.extend(
+            _text(record, name) for name in ("email", "username", "name", "surname")
+        )
+        if record.get("password_hash"):
+            row.append(_text(record, "password_hash"))
+            if not self.is_hash(row[PASSWORD]):
+                raise ValueError("password_hash is not a bcrypt hash")
+        else:
+            row.append(_text(record, "password"))
+        row.append(datetime.fromisoformat(_text(record, "date_of_birth")))
+        row.extend(_text(record, name, False) for name in ("bio", "avatar", "location"))
+        row.append(_boolean(record, "blocked", False))
+        row.append(_boolean(record, "is_public", True))
+        return row, bool(record.get("password_hash"))
+
+    def _with_hashes(self, batch, hashes):
+        """
+        Returns the rows of the batch, with the hashes of the passwords that
+        were not hashed.
+        """
+        rows = []
+        for row, hashed in batch:
+            if not hashed:
+                row[PASSWORD] = next(hashes)
+                self.hashed += 1
+            rows.append(tuple(row))
+        return rows
+
+    def _hashed(self, batches, executor):
+        """
+        Generator of the batches of users with their passwords hashed. The
+        ones of a batch are hashed in the pool while the previous one is
+        being loaded.
+        """
+        pending = None
+        for batch in batches:
+            passwords = [row[PASSWORD] for row, hashed in batch if not hashed]
+            hashes = executor.map(
+                self.hash_password, passwords, chunksize=HASH_CHUNK_SIZE
+            )
+            if pending is not None:
+                yield self._with_hashes(*pending)
+            pending = batch, hashes
+        if pending is not None:
+            yield self._with_hashes(*pending)
+
+    # pylint: disable=too-many-arguments
+    def load(
+        self,
+        users=None,
+        following=None,
+        interests=None,
+        rebuild_indexes=False,
+        use_copy=None,
+    ):
+        """
+        Loads the files of users, follows and interests that are not None,
+        in that order.
+
+        :param rebuild_indexes: Whether to drop the secondary indexes while
+        loading and build them again at the end (see bulk_queries).
+        :param use_copy: Whether to use COPY (only with postgres), None to
+        use it with postgres.
+        :return: For each file loaded ("users", "following" and
+        "interests"), how many "rows" it had, how many were "added" and the
+        "seconds" and "rows_per_second" it took. And the passwords
+        "hashed", and the "seconds" and "rows_per_second" of everything.
+        """
+        stats = {}
+        self.hashed = 0
+        start = time.perf_counter()
+        executor = ProcessPoolExecutor(self.workers)
+        try:
+            with bulk_load_repo(rebuild_indexes, use_copy) as load:
+                if users is not None:
+                    batches = self._hashed(_batches(users, self._user), executor)
+                    stats["users"] = _timed(load.users, batches)
+                if following is not None:
+                    batches = _batches(following, _following)
+                    stats["following"] = _timed(load.following, batches)
+                if interests is not None:
+                    batches = _batches(interests, _interest)
+                    stats["interests"] = _timed(load.interests, batches)
+        finally:
+            executor.shutdown(cancel_futures=True)
+        seconds = time.perf_counter() - start
+        rows = sum(kind["rows"] for kind in stats.values())
+        stats.update(
+            hashed=self.hashed,
+            seconds=seconds,
+            rows_per_second=rows / seconds if seconds else 0.0,
+        )
+        return stats
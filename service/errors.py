@@ -66,3 +66,12 @@ class MaxAmmountExceeded(Exception):
 
     def __init__(self, message):
         super().__init__(message)
+
+
+class InvalidExportFilter(Exception):
+    """
+    Exception raised when the filters of an export don't make sense.
+    """
+
+    def __init__(self, message):
+        super().__init__(message)
@@ -0,0 +1,475 @@
+# follow_graph.py
+"""
+This module is the optional in-process index of the follow graph.
+
+It holds the following table as two CSR adjacency structures, one with
+who every user follows and one with who follows every user. Each is an
+array of offsets indexed by user id and an array with the neighbors of
+every user one after the other, sorted. So is_following is a binary
+search, the counts are a subtraction and the intersections and two-hop
+expansions walk plain int arrays, without going to the database.
+
+It's built from a streaming scan of the table, ordered by user_id and
+following_id, and kept current with the follows, unfollows and removed
+users of this process. Those changes are kept apart (the delta) and
+merged into the arrays when there are more than FOLLOW_GRAPH_MAX_DELTA
+of them. Since it only sees the changes made through this process, it's
+meant for a single process (like the uvicorn of the Dockerfile).
+
+Memory: the neighbors are 4 byte ints and every edge is in both
+directions, so an edge takes 8 bytes. The offsets are 8 byte ints, so
+every user id up to the biggest one takes 16 bytes. 10M edges between
+1M users are ~91 MB. A change in the delta takes ~70 bytes until it's
+merged. The arrays are merged in another thread, from a copy of the
+delta, while the queries keep using the old ones: the changes made
+meanwhile are applied again to the new arrays before they replace the
+old ones, so nothing waits for the merge (there are two copies of the
+arrays while it runs).
+
+It's configured with environment variables:
+- FOLLOW_GRAPH_INDEX: 1 to build it when the app starts. Defaults to 0.
+- FOLLOW_GRAPH_MAX_DELTA: changes kept apart before merging them into
+  the arrays. Defaults to 100000.
+- FOLLOW_GRAPH_SNAPSHOT: a graph snapshot (see graph_snapshot) to build
+  it from instead of the table, plus the changes since it was taken.
+"""
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from service.in_process_index import InProcessIndex
+
+FOLLOW_GRAPH_INDEX = os.getenv("FOLLOW_GRAPH_INDEX", "0") == "1"
+FOLLOW_GRAPH_SNAPSHOT = os.getenv("FOLLOW_GRAPH_SNAPSHOT")
+
+# The ids are a postgres integer, so they fit in 4 bytes.
+NEIGHBOR_TYPE = "i"
+OFFSET_TYPE = "q"
+
+# A list is intersected with a much longer one (this many times longer)
+# by searching its elements in the longer one instead of walking both.
+SEARCH_RATIO = 16
+
+
+def _contains(neighbors, value, start, end):
+    """
+    Returns if value is in the sorted neighbors[start:end].
+    """
+    index = bisect_left(neighbors, value, start, end)
+    return index < end and neighbors[index] == value
+
+
+def intersect(first, second):
+    """
+    Returns the sorted list of the values in both sorted sequences.
+    """
+    if len(first) > len(second):
+        first, second = second, first
+    if len(first) * SEARCH_RATIO < len(second):
+        return [value for value in first if _contains(second, value, 0, len(second))]
+    return sorted(set(first).intersection(second))
+
+
+def _caught_up(batches, lists, removed_ids):
+    """
+    Generator of the batches of rows sorted by user_id, with the sorted
+    lists of the users in lists instead of theirs, and without the rows
+    of the removed users (nor the ones to them).
+    """
+    removed = set(removed_ids)
+    replaced = sorted(set(lists).difference(removed))
+    position = 0
+
+    def replacements(until):
+        nonlocal position
+        rows = []
+        while position < len(replaced) and replaced[position] < until:
+            user_id = replaced[position]
+            rows.extend(
+                (user_id, following_id)
+                for following_id in lists[user_id]
+                if following_id not in removed
+            )
+            position += 1
+        return rows
+
+    for batch in batches:
+        rows = []
+        for row in batch:
+            rows.extend(replacements(row[0]))
+            if row[0] not in lists and row[0] not in removed and row[1] not in removed:
+                rows.append(row)
+        yield rows
+    yield replacements(float("inf"))
+
+
+class _Adjacency:
+    """
+    One direction of the graph: the sorted neighbors of every user id, and
+    the neighbors added and removed since they were built.
+    """
+
+    def __init__(self, offsets, neighbors):
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.added = {}
+        self.removed = {}
+        self.changes = 0
+        self.edges = len(neighbors)
+
+    @classmethod
+    def from_rows(cls, batches):
+        """
+        Builds it from batches of (user_id, neighbor_id, ...) rows, sorted
+        by user_id and neighbor_id, without keeping the rows.
+        """
+        offsets = array(OFFSET_TYPE)
+        neighbors = array(NEIGHBOR_TYPE)
+        for batch in batches:
+            for row in batch:
+                while len(offsets) <= row[0]:
+                    offsets.append(len(neighbors))
+                neighbors.append(row[1])
+        offsets.append(len(neighbors))
+        return cls(offsets, neighbors)
+
+    def reversed(self):
+        """
+        Returns the other direction of the graph, with a counting sort:
+        walking the users in order leaves the neighbors of each one sorted.
+        """
+        users = len(self.offsets) - 1
+        size = max(users, max(self.neighbors, default=-1) + 1)
+        degrees = Counter(self.neighbors)
+        offsets = array(OFFSET_TYPE, [0])
+        for user_id in range(size):
+            offsets.append(offsets[-1] + degrees.get(user_id, 0))
+        positions = array(OFFSET_TYPE, offsets)
+        neighbors = array(NEIGHBOR_TYPE, [0]) * len(self.neighbors)
+        for user_id in range(users):
+            for neighbor_id in self.neighbors[
+                self.offsets[user_id] : self.offsets[user_id + 1]
+            ]:
+                neighbors[positions[neighbor_id]] = user_id
+                positions[neighbor_id] += 1
+        return _Adjacency(offsets, neighbors)
+
+    def bounds(self, user_id):
+        """
+        Returns where the neighbors the user had when it was built start
+        and end in the neighbors array.
+        """
+        if 0 <= user_id < len(self.offsets) - 1:
+            return self.offsets[user_id], self.offsets[user_id + 1]
+        return 0, 0
+
+    def contains(self, user_id, neighbor_id):
+        """
+        Returns if neighbor_id is a neighbor of the user.
+        """
+        if neighbor_id in self.added.get(user_id, ()):
+            return True
+        if neighbor_id in self.removed.get(user_id, ()):
+            return False
+        return _contains(self.neighbors, neighbor_id, *self.bounds(user_id))
+
+    def degree(self, user_id):
+        """
+        Returns how many neighbors the user has.
+        """
+        start, end = self.bounds(user_id)
+        added = len(self.added.get(user_id, ()))
+        return end - start + added - len(self.removed.get(user_id, ()))
+
+    def of(self, user_id):
+        """
+        Returns the sorted neighbors of the user.
+        """
+        start, end = self.bounds(user_id)
+        neighbors = self.neighbors[start:end]
+        if user_id not in self.added and user_id not in self.removed:
+            return neighbors
+        merged = set(neighbors).difference(self.removed.get(user_id, ()))
+        return sorted(merged.union(self.added.get(user_id, ())))
+
+    def _move(self, source, target, user_id, neighbor_id):
+        """
+        Takes the change out of source if it's there (it's undone), or
+        records it in target.
+        """
+        pending = source.get(user_id)
+        if pending is not None and neighbor_id in pending:
+            pending.discard(neighbor_id)
+            if not pending:
+                del source[user_id]
+            self.changes -= 1
+        else:
+            target.setdefault(user_id, set()).add(neighbor_id)
+            self.changes += 1
+
+    def add(self, user_id, neighbor_id):
+        """
+        Adds the neighbor to the user, if it isn't one already.
+        """
+        if not self.contains(user_id, neighbor_id):
+            self._move(self.removed, self.added, user_id, neighbor_id)
+            self.edges += 1
+
+    def remove(self, user_id, neighbor_id):
+        """
+        Removes the neighbor from the user, if it's one.
+        """
+        if self.contains(user_id, neighbor_id):
+            self._move(self.added, self.removed, user_id, neighbor_id)
+            self.edges -= 1
+
+    def frozen(self):
+        """
+        Returns a copy that doesn't see the changes made after it (the
+        arrays are shared, they're never changed).
+        """
+        copy = _Adjacency(self.offsets, self.neighbors)
+        copy.added = {user_id: set(ids) for user_id, ids in self.added.items()}
+        copy.removed = {user_id: set(ids) for user_id, ids in self.removed.items()}
+        copy.changes = self.changes
+        copy.edges = self.edges
+        return copy
+
+    def compacted(self):
+        """
+        Returns it with the changes merged into the arrays.
+        """
+        size = max(len(self.offsets) - 1, max(self.added, default=-1) + 1)
+        offsets = array(OFFSET_TYPE, [0])
+        neighbors = array(NEIGHBOR_TYPE)
+        for user_id in range(size):
+            if user_id in self.added or user_id in self.removed:
+                neighbors.extend(self.of(user_id))
+            else:
+                start, end = self.bounds(user_id)
+                neighbors.extend(self.neighbors[start:end])
+            offsets.append(len(neighbors))
+        return _Adjacency(offsets, neighbors)
+
+    def size(self):
+        """
+        Returns the bytes of the arrays.
+        """
+        return (
+            len(self.offsets) * self.offsets.itemsize
+            + len(self.neighbors) * self.neighbors.itemsize
+        )
+
+
+class FollowGraph(InProcessIndex):
+    """
+    In-process index of the following relations, see the module docstring.
+    It's loaded from batches of (user_id, following_id, ...) rows sorted
+    by user_id and following_id, like the ones of stream_following_relations
+    or of a graph snapshot. For a snapshot, the second source is a function
+    that returns the changes since it was taken: a dict from the users that
+    changed to everyone they follow now, and the ids of the removed users.
+    """
+
+    def __init__(self, max_delta=100000):
+        super().__init__()
+        self.max_delta = max_delta
+        self._following = None
+        self._followers = None
+        # The (user_id, following_id, follows) changes made while the
+        # arrays are merged, or None if they're not, and the thread merging.
+        self._merging = None
+        self._merger = None
+
+    def _build(self, *sources):
+        batches, *catch_up = sources
+        if catch_up:
+            (changes,) = catch_up
+            batches = _caught_up(batches, *changes())
+        following = _Adjacency.from_rows(batches)
+        return following, following.reversed()
+
+    def _install(self, state):
+        self._following, self._followers = state or (None, None)
+        # A merge of the arrays that were replaced is thrown away.
+        self._merging = None
+
+    def _changed(self):
+        if (
+            self._merging is None
+            and self._following.changes + self._followers.changes > self.max_delta
+        ):
+            self._merging = []
+            self._merger = threading.Thread(
+                target=self._merge,
+                args=(
+                    self._merging,
+                    self._following.frozen(),
+                    self._followers.frozen(),
+                ),
+                name="follow-graph-merge",
+                daemon=True,
+            )
+            self._merger.start()
+
+    def _merge(self, changes, following, followers):
+        """
+        Merges the copies of the delta into new arrays, without the lock,
+        and installs them with the changes made meanwhile.
+        """
+        try:
+            following, followers = following.compacted(), followers.compacted()
+        except Exception:
+            with self._lock:
+                if self._merging is changes:
+                    self._merging = None
+            raise
+        with self._lock:
+            if self._merging is not changes:
+                return
+            for user_id, following_id, follows in changes:
+                if follows:
+                    following.add(user_id, following_id)
+                    followers.add(following_id, user_id)
+                else:
+                    following.remove(user_id, following_id)
+                    followers.remove(following_id, user_id)
+            self._following, self._followers = following, followers
+            self._merging = None
+            self._changed()
+
+    def wait_for_merge(self):
+        """
+        Waits until the arrays that are being merged (if any) replace the
+        old ones.
+        """
+        with self._lock:
+            merger = self._merger if self._merging is not None else None
+        while merger is not None:
+            merger.join()
+            with self._lock:
+                merger = self._merger if self._merging is not None else None
+
+    def _follow(self, user_id, following_id):
+        self._following.add(user_id, following_id)
+        self._followers.add(following_id, user_id)
+        if self._merging is not None:
+            self._merging.append((user_id, following_id, True))
+
+    def _unfollow(self, user_id, following_id):
+        self._following.remove(user_id, following_id)
+        self._followers.remove(following_id, user_id)
+        if self._merging is not None:
+            self._merging.append((user_id, following_id, False))
+
+    def _remove_user(self, user_id):
+        for following_id in self._following.of(user_id):
+            self._unfollow(user_id, following_id)
+        for follower_id in self._followers.of(user_id):
+            self._unfollow(follower_id, user_id)
+
+    def follow(self, user_id, following_id):
+        """
+        Records that the user follows following_id.
+        """
+        self._record(lambda: self._follow(user_id, following_id))
+
+    def unfollow(self, user_id, following_id):
+        """
+        Records that the user doesn't follow following_id anymore.
+        """
+        self._record(lambda: self._unfollow(user_id, following_id))
+
+    def remove_user(self, user_id):
+        """
+        Records that the user was removed, with all its relations.
+        """
+        self._record(lambda: self._remove_user(user_id))
+
+    def is_following(self, user_id, following_id):
+        """
+        Returns if the user follows following_id.
+        """
+        with self._lock:
+            return self._following.contains(user_id, following_id)
+
+    def following_count(self, user_id):
+        """
+        Returns how many users the user follows.
+        """
+        with self._lock:
+            return self._following.degree(user_id)
+
+    def followers_count(self, user_id):
+        """
+        Returns how many users follow the user.
+        """
+        with self._lock:
+            return self._followers.degree(user_id)
+
+    def following(self, user_id):
+        """
+        Returns the sorted ids of the users the user follows.
+        """
+        with self._lock:
+            return self._following.of(user_id)
+
+    def followers(self, user_id):
+        """
+        Returns the sorted ids of the users that follow the user.
+        """
+        with self._lock:
+            return self._followers.of(user_id)
+
+    def common_following(self, user_id, other_id):
+        """
+        Returns the sorted ids of the users both users follow.
+        """
+        with self._lock:
+            return intersect(self._following.of(user_id), self._following.of(other_id))
+
+    def following_that_follow(self, user_id, target_id, max_following=None):
+        """
+        Returns the sorted ids of the users the user follows that follow
+        target_id. If max_following is given, only that many of the users
+        the user follows (the lowest ids) are looked at.
+        """
+        with self._lock:
+            following = self._following.of(user_id)[:max_following]
+            return intersect(following, self._followers.of(target_id))
+
+    def two_hop(self, user_id):
+        """
+        Returns a Counter from the ids of the users followed by the users
+        the user follows to how many of them follow each one, without the
+        user and the users it already follows.
+        """
+        with self._lock:
+            followees = self._following.of(user_id)
+            counts = Counter()
+            for followee_id in followees:
+                counts.update(self._following.of(followee_id))
+        for excluded_id in followees:
+            counts.pop(excluded_id, None)
+        counts.pop(user_id, None)
+        return counts
+
+    def edges(self):
+        """
+        Returns how many relations it has.
+        """
+        with self._lock:
+            return self._following.edges if self.loaded else 0
+
+    def size(self):
+        """
+        Returns the bytes of its arrays (the delta is not counted).
+        """
+        with self._lock:
+            if not self.loaded:
+                return 0
+            return self._following.size() + self._followers.size()
+
+
+follow_graph = FollowGraph(int(os.getenv("FOLLOW_GRAPH_MAX_DELTA", "100000")))
@@ -2,24 +2,66 @@
 """
 This module is used to encapsulate all the following and followers related functions.
 """
+import os
+from datetime import datetime, timedelta
 from repository.errors import RelationAlreadyExists
 from repository.user_repository import (
-    get_user_email,
+    get_auth_user,
     is_following as is_following_repo,
     is_follower as is_follower_repo,
     get_followers_count as get_followers_count_repo,
     get_following_count as get_following_count_repo,
     get_following_relations as get_following_relations_repo,
+    stream_following_relations as stream_following_relations_repo,
+    read_graph as read_graph_repo,
     get_followers as get_followers_repo,
+    get_following_that_follow as get_following_that_follow_repo,
+    get_user_summaries_by_ids as get_user_summaries_by_ids_repo,
+    get_blocked_ids as get_blocked_ids_repo,
     get_following as get_following_repo,
     create_follow as create_follow_repo,
     remove_follow as remove_follow_repo,
+    get_follow_status as get_follow_status_repo,
+    get_followers_version as get_followers_version_repo,
+    get_following_version as get_following_version_repo,
+    get_ids_by_id_or_email as get_ids_by_id_or_email_repo,
+    create_follows as create_follows_repo,
+    remove_follows as remove_follows_repo,
 )
 from service.errors import (
     UserNotFound,
     FollowingRelationAlreadyExists,
     UserCantFollowItself,
+    MaxAmmountExceeded,
+    InvalidExportFilter,
 )
+from service.user_handler import MAX_AMMOUNT, MAX_BATCH_AMMOUNT
+from service.suggestion_handler import SuggestionHandler
+from service.follow_graph import follow_graph, FOLLOW_GRAPH_SNAPSHOT
+from service import graph_snapshot
+
+# The kind of target and the column used to look it up.
+STATUS_KEYS = {"ids": "id", "emails": "email"}
+
+# The outcomes of every target of a bulk follow or unfollow.
+FOLLOWED = "followed"
+ALREADY_FOLLOWING = "already_following"
+UNFOLLOWED = "unfollowed"
+NOT_FOLLOWING = "not_following"
+NOT_FOUND = "not_found"
+SELF = "self"
+
+# How many of the users someone follows are looked at to find the ones
+# that follow another user, so it takes about the same for everyone.
+MAX_MUTUAL_FOLLOWEES = int(os.getenv("MUTUALS_MAX_FOLLOWEES", "5000"))
+
+# The changes since a snapshot are read from a bit before it was taken, so
+# the ones of the transactions that were still open then are not missed.
+# Applying a change twice gives the same graph.
+SNAPSHOT_OVERLAP = timedelta(minutes=5)
+
+# The cached suggestions are updated on every follow and unfollow.
+suggestion_handler = SuggestionHandler()
 
 
 class FollowHandler:
@@ -34,18 +76,20 @@ class FollowHandler:
         if email == email_to_follow:
             raise UserCantFollowItself()
         try:
-            create_follow_repo(email, email_to_follow)
+            user_id, followee_id = create_follow_repo(email, email_to_follow)
         except KeyError as error:
             raise UserNotFound() from error
         except RelationAlreadyExists as error:
             raise FollowingRelationAlreadyExists() from error
+        follow_graph.follow(user_id, followee_id)
+        suggestion_handler.followed(user_id, followee_id)
 
     def get_all_followers(self, email: str):
         """
         This function is used to retrieve all username's followers from the database.
         """
         try:
-            user = get_user_email(email)
+            user = get_auth_user(email)
             return get_followers_repo(user.id)
         except KeyError as error:
             raise UserNotFound() from error
@@ -55,7 +99,7 @@ class FollowHandler:
         This function is used to retrieve all users following  username from the database.
         """
         try:
-            user = get_user_email(email)
+            user = get_auth_user(email)
             return get_following_repo(user.id)
         except KeyError as error:
             raise UserNotFound() from error
@@ -66,12 +110,89 @@ class FollowHandler:
         """
         return get_following_relations_repo()
 
+    def stream_following_relations(self, filters: dict):
+        """
+        This function is used to export the follow relations in batches of
+        (user_id, following_id, created_at), without loading them all.
+        filters may have "since", "min_user_id" and "max_user_id".
+        The filters are checked here, before the export starts.
+        """
+        min_user_id = filters.get("min_user_id")
+        max_user_id = filters.get("max_user_id")
+        if (
+            min_user_id is not None
+            and max_user_id is not None
+            and min_user_id > max_user_id
+        ):
+            raise InvalidExportFilter("min_user_id can't be bigger than max_user_id")
+        return stream_following_relations_repo(
+            filters.get("since"), min_user_id, max_user_id
+        )
+
+    def load_follow_graph(self, snapshot_path=FOLLOW_GRAPH_SNAPSHOT):
+        """
+        This function is used to build the in-process index of the follow
+        graph (follow_graph) from a streaming scan of the relations, or
+        from a graph snapshot and the changes since it was taken. Until
+        it's built, the queries that can use it go to the database.
+
+        :param snapshot_path: The path of the snapshot, if any.
+        """
+        if snapshot_path is None:
+            follow_graph.load(stream_following_relations_repo())
+            return
+        with graph_snapshot.GraphSnapshot(snapshot_path) as snapshot:
+            since = snapshot.taken_at - SNAPSHOT_OVERLAP
+            follow_graph.load(snapshot.rows(), lambda: self._read_graph_changes(since))
+
+    def _read_graph_changes(self, since: datetime):
+        """
+        Reads how the follow graph changed since the given date.
+        Returns a dict from the ids of the users that changed to the sorted
+        ids of everyone they follow now, and the ids of the removed users.
+        """
+        with read_graph_repo(since) as rows:
+            lists = {row.id: [] for batch in rows["users"] for row in batch}
+            for batch in rows["following"]:
+                for user_id, following_id in batch:
+                    lists[user_id].append(following_id)
+            removed_ids = [user_id for batch in rows["removed"] for (user_id,) in batch]
+        return lists, removed_ids
+
+    def write_graph_snapshot(self, path: str, since=None):
+        """
+        This function is used to write a graph snapshot (see graph_snapshot)
+        of every user and relation, or of the changes since the given date
+        (usually the taken_at of the last snapshot).
+
+        :param path: Where to write it.
+        :param since: The date of the changes, or None for a full one.
+        :return: How many "users", "edges" and "removed" users it has, its
+        "bytes" and when it was "taken_at".
+        """
+        taken_at = datetime.utcnow()
+        if since is not None:
+            since -= SNAPSHOT_OVERLAP
+        with read_graph_repo(since) as rows:
+            stats = graph_snapshot.write(
+                path,
+                rows["users"],
+                rows["following"],
+                removed=rows["removed"],
+                taken_at=taken_at,
+                since=since,
+            )
+        stats["taken_at"] = taken_at
+        return stats
+
     def get_following_count(self, email: str):
         """
         This function is used to get email's following count from database.
         """
         try:
-            user = get_user_email(email)
+            user = get_auth_user(email)
+            if follow_graph.loaded:
+                return follow_graph.following_count(user.id)
             return get_following_count_repo(user.id)
         except KeyError as error:
             raise UserNotFound() from error
@@ -81,7 +202,9 @@ class FollowHandler:
         This function is used to get email's followers count from database.
         """
         try:
-            user = get_user_email(email)
+            user = get_auth_user(email)
+            if follow_graph.loaded:
+                return follow_graph.followers_count(user.id)
             return get_followers_count_repo(user.id)
         except KeyError as error:
             raise UserNotFound() from error
@@ -91,20 +214,24 @@ class FollowHandler:
         This function is used to remove a follow relationship.
         """
         try:
-            user = get_user_email(email)
-            user_to_unfollow = get_user_email(email_to_unfollow)
+            user = get_auth_user(email)
+            user_to_unfollow = get_auth_user(email_to_unfollow)
             remove_follow_repo(user.id, user_to_unfollow.id)
-            return {"message": "Unfollow successful"}
         except KeyError as error:
             raise UserNotFound() from error
+        follow_graph.unfollow(user.id, user_to_unfollow.id)
+        suggestion_handler.unfollowed(user.id, user_to_unfollow.id)
+        return {"message": "Unfollow successful"}
 
     def is_following(self, email: str, email_to_check_if_following: str):
         """
         This function is used to check if a user is following another user.
         """
         try:
-            user = get_user_email(email)
-            user_to_check = get_user_email(email_to_check_if_following)
+            user = get_auth_user(email)
+            user_to_check = get_auth_user(email_to_check_if_following)
+            if follow_graph.loaded:
+                return follow_graph.is_following(user.id, user_to_check.id)
             return is_following_repo(user.id, user_to_check.id)
         except KeyError as error:
             raise UserNotFound() from error
@@ -114,8 +241,222 @@ class FollowHandler:
         This function is used to check if a user is a follower of another user.
         """
         try:
-            user = get_user_email(email)
-            user_to_check = get_user_email(email_to_check_if_follower)
+            user = get_auth_user(email)
+            user_to_check = get_auth_user(email_to_check_if_follower)
+            if follow_graph.loaded:
+                return follow_graph.is_following(user_to_check.id, user.id)
             return is_follower_repo(user.id, user_to_check.id)
         except KeyError as error:
             raise UserNotFound() from error
+
+    def get_mutual_followers(self, user_id: int, email: str, ammount: int):
+        """
+        This function is used to get the users a user follows that follow
+        someone else ("followed by X, Y and 12 others you follow"). They are
+        the intersection of the sorted arrays of follow_graph if it's
+        loaded, or a join by primary key if it isn't. Only the
+        MAX_MUTUAL_FOLLOWEES users with the lowest ids the user follows
+        are looked at, both ways.
+
+        :param user_id: The id of the user asking.
+        :param email: The email of the user whose followers are checked.
+        :param ammount: The max ammount of users to return.
+        :return: The UserSummary of up to ammount of them (lowest id first),
+        how many there are and if the user follows more than
+        MAX_MUTUAL_FOLLOWEES (so there may be more). The blocked users are
+        neither returned nor counted.
+        """
+        if ammount < 0:
+            raise ValueError("ammount must be positive")
+        if ammount > MAX_AMMOUNT:
+            raise MaxAmmountExceeded("ammount must be less than " + str(MAX_AMMOUNT))
+        try:
+            target = get_auth_user(email)
+        except KeyError as error:
+            raise UserNotFound() from error
+        if follow_graph.loaded:
+            mutual_ids = follow_graph.following_that_follow(
+                user_id, target.id, MAX_MUTUAL_FOLLOWEES
+            )
+            following = follow_graph.following_count(user_id)
+            # The graph doesn't know who is blocked.
+            if mutual_ids:
+                blocked = get_blocked_ids_repo(mutual_ids)
+                mutual_ids = [
+                    mutual_id for mutual_id in mutual_ids if mutual_id not in blocked
+                ]
+        else:
+            mutual_ids = get_following_that_follow_repo(
+                user_id, target.id, MAX_MUTUAL_FOLLOWEES
+            )
+            following = get_following_count_repo(user_id)
+        candidate_ids = mutual_ids[:ammount]
+        users = {}
+        if candidate_ids:
+            users = {
+                user.id: user for user in get_user_summaries_by_ids_repo(candidate_ids)
+            }
+        named = [users[mutual_id] for mutual_id in candidate_ids if mutual_id in users]
+        return named, len(mutual_ids), following > MAX_MUTUAL_FOLLOWEES
+
+    def get_follow_status(self, user_id: int, targets: dict):
+        """
+        This function is used to get the relation between a user and many
+        others, with one query for each kind of target.
+
+        :param user_id: The id of the user asking.
+        :param targets: Dict with the lists "ids" and "emails".
+        :return: A dict from each target to {"following", "followed_by"},
+        or to None if there is no such user.
+        """
+        total = sum(len(targets.get(kind) or []) for kind in STATUS_KEYS)
+        if total > MAX_BATCH_AMMOUNT:
+            raise MaxAmmountExceeded(
+                "Can't ask for more than " + str(MAX_BATCH_AMMOUNT) + " users"
+            )
+        return self._follow_status(user_id, targets)
+
+    def _follow_status(self, user_id: int, targets: dict):
+        """
+        Does what get_follow_status does for any number of targets, with a
+        query for every MAX_BATCH_AMMOUNT of them.
+        """
+        status = {}
+        for kind, key in STATUS_KEYS.items():
+            values = list(dict.fromkeys(targets.get(kind) or []))
+            status.update(dict.fromkeys(values))
+            for start in range(0, len(values), MAX_BATCH_AMMOUNT):
+                chunk = values[start : start + MAX_BATCH_AMMOUNT]
+                for row in get_follow_status_repo(user_id, key, chunk):
+                    status[row.key] = {
+                        "following": row.following,
+                        "followed_by": row.followed_by,
+                    }
+        return status
+
+    def _resolve_targets(self, user_id: int, targets: dict):
+        """
+        Looks up the ids and emails of the targets of a bulk operation in a
+        single query. Returns the outcomes of the targets that can't be
+        followed (not found or the user itself) and a dict from the other
+        targets to their ids.
+        """
+        ids = list(dict.fromkeys(targets.get("ids") or []))
+        emails = list(dict.fromkeys(targets.get("emails") or []))
+        if len(ids) + len(emails) > MAX_BATCH_AMMOUNT:
+            raise MaxAmmountExceeded(
+                "Can't ask for more than " + str(MAX_BATCH_AMMOUNT) + " users"
+            )
+        outcomes = dict.fromkeys(ids + emails, NOT_FOUND)
+        resolved = {}
+        if not outcomes:
+            return outcomes, resolved
+        for row in get_ids_by_id_or_email_repo(ids, emails):
+            for target in (row.id, row.email):
+                if target not in outcomes:
+                    continue
+                if row.id == user_id:
+                    outcomes[target] = SELF
+                else:
+                    resolved[target] = row.id
+        return outcomes, resolved
+
+    def follow_many(self, user_id: int, targets: dict):
+        """
+        This function is used to follow many users at once: they are looked
+        up in one query and followed in one statement.
+
+        :param user_id: The id of the user that wants to follow.
+        :param targets: Dict with the lists "ids" and "emails".
+        :return: A dict from each target to "followed", "already_following",
+        "not_found" or "self".
+        """
+        outcomes, resolved = self._resolve_targets(user_id, targets)
+        if not resolved:
+            return outcomes
+        try:
+            followed = set(create_follows_repo(user_id, set(resolved.values())))
+        except KeyError as error:
+            raise UserNotFound() from error
+        for following_id in followed:
+            follow_graph.follow(user_id, following_id)
+        if followed:
+            suggestion_handler.forget(user_id)
+        for target, target_id in resolved.items():
+            outcomes[target] = FOLLOWED if target_id in followed else ALREADY_FOLLOWING
+        return outcomes
+
+    def unfollow_many(self, user_id: int, targets: dict):
+        """
+        This function is used to unfollow many users at once: they are
+        looked up in one query and unfollowed in one statement.
+
+        :param user_id: The id of the user that wants to unfollow.
+        :param targets: Dict with the lists "ids" and "emails".
+        :return: A dict from each target to "unfollowed", "not_following",
+        "not_found" or "self".
+        """
+        outcomes, resolved = self._resolve_targets(user_id, targets)
+        if not resolved:
+            return outcomes
+        unfollowed = set(remove_follows_repo(user_id, set(resolved.values())))
+        for following_id in unfollowed:
+            follow_graph.unfollow(user_id, following_id)
+        if unfollowed:
+            suggestion_handler.forget(user_id)
+        for target, target_id in resolved.items():
+            outcomes[target] = UNFOLLOWED if target_id in unfollowed else NOT_FOLLOWING
+        return outcomes
+
+    def get_users_follow_status(self, user_id: int, users: list):
+        """
+        This function is used to get the relation between a user and every
+        user of a list (like the result of a search), in a single query.
+
+        :param user_id: The id of the user asking.
+        :param users: The users to get the relation with.
+        :return: A dict from each user's id to {"following", "followed_by"}.
+        """
+        ids = [user.id for user in users]
+        if not ids:
+            return {}
+        # The lists of followers have no limit, so neither does this.
+        return self._follow_status(user_id, {"ids": ids})
+
+    def get_follow_version(self, email: str):
+        """
+        This function is used to get the version of the follow relations
+        of a user: it changes every time they follow, unfollow, or
+        someone follows or unfollows them.
+
+        :return: The id and the follow_version of the user.
+        """
+        try:
+            user = get_auth_user(email)
+            return user.id, user.follow_version
+        except KeyError as error:
+            raise UserNotFound() from error
+
+    def get_followers_version(self, email: str):
+        """
+        This function is used to get the version of the list of followers
+        of a user: it changes if someone follows or unfollows them, or if
+        one of the followers changes.
+
+        :return: The id and follow_version of the user, how many followers
+        it has and the sum of their versions.
+        """
+        user_id, follow_version = self.get_follow_version(email)
+        return (user_id, follow_version, *get_followers_version_repo(user_id))
+
+    def get_following_version(self, email: str):
+        """
+        This function is used to get the version of the list of users a user
+        follows: it changes if they follow or unfollow someone, or if one of
+        the users they follow changes.
+
+        :return: The id and follow_version of the user, how many users it
+        follows and the sum of their versions.
+        """
+        user_id, follow_version = self.get_follow_version(email)
+        return (user_id, follow_version, *get_following_version_repo(user_id))
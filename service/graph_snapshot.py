@@ -0,0 +1,321 @@
+# graph_snapshot.py
+"""
+This module is the binary snapshot of the users and the follow graph, for
+the analytics jobs and the warm starts of follow_graph.
+
+A snapshot is a file that is memory-mapped and used without copying nor
+parsing it: after a fixed header every section is a plain array of
+little-endian ints, aligned to 8 bytes, so it's a memoryview.cast of the
+mapped file. Only the lists of followees are decoded, when they're used.
+
+Layout, for n users and r removed users:
+- HEADER: magic, FORMAT_VERSION, kind, taken_at, since, n, r and the
+  bytes of the usernames and of the edges.
+- ids: uint32[n], sorted.
+- flags: uint8[n], with the BLOCKED and PUBLIC bits.
+- username_offsets: uint32[n + 1], where every username starts.
+- usernames: utf-8, one after the other.
+- edges: for every user, the gaps between the sorted ids it follows, as
+  uint8, uint16 or uint32 (the smallest that fits all of them, aligned to
+  its size). Close ids take 1 or 2 bytes instead of 4.
+- edge_offsets: uint64[n], where the gaps of every user start in edges.
+- degrees: uint32[n], how many users every user follows.
+- bases: uint32[n], the first id every user follows (the gaps start there).
+- widths: uint8[n], the bytes of every gap of every user.
+- removed: uint32[r], the ids of the removed users.
+
+A FULL snapshot has every user and relation. A CHANGES one has the users
+created or changed (their fields or who they follow) since `since`, each
+with everyone it follows now, and the users removed since then: applying
+it to an older snapshot (replacing the lists of its users and dropping
+the removed ones and the relations to them) gives the newer one.
+taken_at and since are microseconds since the epoch, in UTC.
+
+FORMAT_VERSION goes up with every change of the layout, and the readers
+reject the versions they don't know.
+"""
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from contextlib import suppress
+from datetime import datetime, timedelta
+from itertools import accumulate, groupby
+from operator import itemgetter
+
+MAGIC = b"FGRAPHSN"
+FORMAT_VERSION = 1
+
+FULL = 0
+CHANGES = 1
+
+# magic, version, kind, taken_at, since, users, removed, usernames and edges bytes.
+HEADER = struct.Struct("<8sIIqqQQQQ")
+
+BLOCKED = 1
+PUBLIC = 2
+
+ALIGNMENT = 8
+# The typecode of the gaps of every width.
+WIDTHS = {1: "B", 2: "H", 4: "I"}
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _micros(moment):
+    """
+    Returns the microseconds since the epoch of the (UTC) datetime, 0 if None.
+    """
+    if moment is None:
+        return 0
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def _moment(micros):
+    """
+    Returns the (UTC) datetime of the microseconds since the epoch.
+    """
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def _padding(position, alignment=ALIGNMENT):
+    """
+    Returns how many bytes go after position to align it.
+    """
+    return -position % alignment
+
+
+def _write_aligned(out, data):
+    """
+    Writes the data (anything with the buffer protocol) aligned to ALIGNMENT.
+    """
+    out.write(bytes(_padding(out.tell())))
+    out.write(data)
+
+
+def _gaps(following_ids):
+    """
+    Returns the width and the bytes of the gaps between the sorted ids.
+    """
+    gaps = [second - first for first, second in zip(following_ids, following_ids[1:])]
+    largest = max(gaps, default=0)
+    width = 1 if largest < 1 << 8 else 2 if largest < 1 << 16 else 4
+    return width, array(WIDTHS[width], gaps).tobytes()
+
+
+# pylint: disable=too-many-locals,too-many-arguments
+def write(path, users, following, *, removed=(), taken_at=None, since=None):
+    """
+    Writes a snapshot to path: a FULL one if since is None, or the CHANGES
+    since then. It's written to a temporary file that replaces path at the
+    end, so a reader never sees half of it.
+
+    :param users: Batches of (id, username, blocked, is_public), sorted by id.
+    :param following: Batches of (user_id, following_id), sorted, of the users.
+    :param removed: Batches of (user_id,) of the removed users.
+    :param taken_at: When the rows were read (UTC).
+    :param since: Since when the changes were read (UTC), or None.
+    :return: A dict with how many "users", "edges" and "removed" it has, and
+    its "bytes".
+    """
+    ids, flags = array("I"), bytearray()
+    username_offsets, usernames = array("I", [0]), bytearray()
+    for batch in users:
+        for user_id, username, blocked, is_public in batch:
+            ids.append(user_id)
+            flags.append(BLOCKED * bool(blocked) | PUBLIC * bool(is_public))
+            usernames += username.encode()
+            username_offsets.append(len(usernames))
+    count = len(ids)
+    edge_offsets = array("Q", [0]) * count
+    degrees, bases = array("I", [0]) * count, array("I", [0]) * count
+    widths = bytearray(b"\x01" * count)
+
+    partial = path + ".tmp"
+    try:
+        with open(partial, "wb") as out:
+            out.write(bytes(HEADER.size))
+            for section in (ids, flags, username_offsets, usernames, b""):
+                _write_aligned(out, section)
+            edges_start = out.tell()
+            last_index = -1
+            rows = (row for batch in following for row in batch)
+            for user_id, group in groupby(rows, key=itemgetter(0)):
+                index = bisect_left(ids, user_id)
+                if index == count or ids[index] != user_id or index <= last_index:
+                    raise ValueError(
+                        f"The relations of {user_id} are unsorted or unknown"
+                    )
+                last_index = index
+                following_ids = array("I", map(itemgetter(1), group))
+                widths[index], data = _gaps(following_ids)
+                out.write(bytes(_padding(out.tell(), widths[index])))
+                edge_offsets[index] = out.tell() - edges_start
+                degrees[index], bases[index] = len(following_ids), following_ids[0]
+                out.write(data)
+            edges_bytes = out.tell() - edges_start
+            removed_ids = array("I", (row[0] for batch in removed for row in batch))
+            for section in (edge_offsets, degrees, bases, widths, removed_ids):
+                _write_aligned(out, section)
+            size = out.tell()
+            out.seek(0)
+            out.write(
+                HEADER.pack(
+                    MAGIC,
+                    FORMAT_VERSION,
+                    FULL if since is None else CHANGES,
+                    _micros(taken_at),
+                    _micros(since),
+                    count,
+                    len(removed_ids),
+                    len(usernames),
+                    edges_bytes,
+                )
+            )
+    except Exception:
+        with suppress(FileNotFoundError):
+            os.remove(partial)
+        raise
+    os.replace(partial, path)
+    return {
+        "users": count,
+        "edges": sum(degrees),
+        "removed": len(removed_ids),
+        "bytes": size,
+    }
+
+
+class GraphSnapshot:
+    """
+    A snapshot mapped in memory, see the module docstring. ids, flags,
+    degrees and removed are views of the file. It's used as a context
+    manager, or closed when it's not needed anymore (the views stop
+    working then).
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._map)
+        self._views = []
+        if len(self._buffer) < HEADER.size or self._buffer[:8] != MAGIC:
+            self.close()
+            raise ValueError(path + " is not a graph snapshot")
+        (_, version, kind, taken_at, since, *counts) = HEADER.unpack_from(self._buffer)
+        if version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported snapshot version {version}")
+        users, removed, usernames_bytes, edges_bytes = counts
+        self.kind = kind
+        self.taken_at = _moment(taken_at)
+        self.since = _moment(since) if kind == CHANGES else None
+        self._position = HEADER.size
+        self.ids = self._next("I", users)
+        self.flags = self._next("B", users)
+        self._username_offsets = self._next("I", users + 1)
+        self._usernames = self._next("B", usernames_bytes)
+        self._edges = self._next("B", edges_bytes)
+        self._edge_offsets = self._next("Q", users)
+        self.degrees = self._next("I", users)
+        self._bases = self._next("I", users)
+        self._widths = self._next("B", users)
+        self.removed = self._next("I", removed)
+
+    def _next(self, typecode, count):
+        """
+        Returns a view of the next section, of count items of the typecode.
+        """
+        start = self._position + _padding(self._position)
+        self._position = start + count * struct.calcsize(typecode)
+        view = self._buffer[start : self._position].cast(typecode)
+        self._views.append(view)
+        return view
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Releases the views and unmaps the file.
+        """
+        for view in self._views:
+            view.release()
+        self._buffer.release()
+        self._map.close()
+
+    def index(self, user_id):
+        """
+        Returns the position of the user in the sections.
+        Raises KeyError if it's not in the snapshot.
+        """
+        index = bisect_left(self.ids, user_id)
+        if index == len(self.ids) or self.ids[index] != user_id:
+            raise KeyError(user_id)
+        return index
+
+    def user(self, index):
+        """
+        Returns the (id, username, blocked, is_public) of the user at index.
+        """
+        start, end = self._username_offsets[index], self._username_offsets[index + 1]
+        flags = self.flags[index]
+        return (
+            self.ids[index],
+            str(self._usernames[start:end], "utf-8"),
+            bool(flags & BLOCKED),
+            bool(flags & PUBLIC),
+        )
+
+    def users(self):
+        """
+        Generator of the (id, username, blocked, is_public) of every user.
+        """
+        return (self.user(index) for index in range(len(self.ids)))
+
+    def _following_at(self, index):
+        degree = self.degrees[index]
+        if not degree:
+            return array("I")
+        width = self._widths[index]
+        start = self._edge_offsets[index]
+        with self._edges[start : start + (degree - 1) * width] as data:
+            with data.cast(WIDTHS[width]) as gaps:
+                return array("I", accumulate(gaps, initial=self._bases[index]))
+
+    def following(self, user_id):
+        """
+        Returns the sorted ids of the users the user follows.
+        Raises KeyError if it's not in the snapshot.
+        """
+        return self._following_at(self.index(user_id))
+
+    def rows(self, batch_size=100000):
+        """
+        Generator of batches of (user_id, following_id) of every relation,
+        sorted, like the ones follow_graph is loaded from.
+        """
+        batch = []
+        for index, user_id in enumerate(self.ids):
+            if self.degrees[index]:
+                batch.extend(
+                    (user_id, following_id)
+                    for following_id in self._following_at(index)
+                )
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        yield batch
+
+    def edges(self):
+        """
+        Returns how many relations it has.
+        """
+        return sum(self.degrees)
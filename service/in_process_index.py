@@ -0,0 +1,88 @@
+# in_process_index.py
+"""
+This module has the base of the in-process indexes (like follow_graph):
+they are built from a scan of the database and then kept current with
+the changes made through this process.
+"""
+import threading
+
+
+class InProcessIndex:
+    """
+    Base of an in-process index. Until it's loaded it answers nothing, the
+    callers have to check loaded and go to the database instead.
+
+    It can be built while the app is running: the changes recorded while
+    it's being built are kept and applied after. They have to be
+    idempotent, since the scan may or may not have seen them.
+
+    The subclasses implement _build (returns the state built from the
+    sources, without the lock) and _install (sets the state, or drops it
+    if it's None), and may implement _changed (called after every change).
+    Their queries have to hold self._lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = None
+        self._loaded = False
+
+    @property
+    def loaded(self):
+        """
+        Returns if it can answer queries.
+        """
+        return self._loaded
+
+    def load(self, *sources):
+        """
+        Builds the index from the sources, and applies the changes that
+        were recorded meanwhile.
+        """
+        with self._lock:
+            self._pending = []
+        try:
+            state = self._build(*sources)
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            self._install(state)
+            self._loaded = True
+            pending, self._pending = self._pending, None
+            for change in pending:
+                change()
+            self._changed()
+
+    def clear(self):
+        """
+        Drops the index, it has to be loaded again to answer queries.
+        """
+        with self._lock:
+            self._install(None)
+            self._loaded = False
+            self._pending = None
+
+    def _record(self, change):
+        """
+        Applies the change (a function without arguments) if it's loaded,
+        or keeps it for when it's loaded if it's being built.
+        """
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(change)
+            elif self._loaded:
+                change()
+                self._changed()
+
+    def _build(self, *sources):
+        raise NotImplementedError()
+
+    def _install(self, state):
+        raise NotImplementedError()
+
+    def _changed(self):
+        """
+        Called with the lock held after the changes are applied.
+        """
@@ -0,0 +1,200 @@
+# interest_index.py
+"""
+This module is the optional in-process inverted index of the interests.
+
+For every interest it has the sorted ids of the users that have it. An
+interest few users have is an int array (4 bytes per user). One that more
+than 1 in DENSE_RATIO of the users have is a bitmap: a python int whose
+bit n is set if the user n has it. It takes at most 8 times its array,
+and the overlaps can be counted a machine word at a time instead of a
+user at a time.
+
+The users that share the most interests with someone are found by
+adding the bitmaps of its interests as a bit-sliced binary counter (one
+int per bit of the count), and then taking the users with the highest
+count, then the next one, and so on, lowest id first. Only the counts
+that are needed are looked at.
+
+It's built from a scan of the interests table ordered by user_id, and
+kept current with set_user_interests and the removed users of this
+process, so it's meant for a single process, like follow_graph.
+
+It's enabled with INTEREST_INDEX=1.
+"""
+import os
+import re
+from array import array
+from bisect import bisect_left
+from functools import reduce
+from operator import or_
+from service.in_process_index import InProcessIndex
+
+INTEREST_INDEX = os.getenv("INTEREST_INDEX", "0") == "1"
+
+DENSE_RATIO = 256
+
+_NONZERO_BYTE = re.compile(rb"[^\x00]")
+
+
+def _to_bitmap(user_ids):
+    """
+    Returns the bitmap of the ids of an array.
+    """
+    if not user_ids:
+        return 0
+    data = bytearray(user_ids[-1] // 8 + 1)
+    for user_id in user_ids:
+        data[user_id >> 3] |= 1 << (user_id & 7)
+    return int.from_bytes(data, "little")
+
+
+def _set_bits(bitmap):
+    """
+    Generator of the positions of the bits set in the bitmap, lowest first.
+    The zero bytes are skipped by the regex engine, not one by one.
+    """
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for match in _NONZERO_BYTE.finditer(data):
+        byte = data[match.start()]
+        while byte:
+            lowest = byte & -byte
+            yield match.start() * 8 + lowest.bit_length() - 1
+            byte ^= lowest
+
+
+def _count(bitmaps):
+    """
+    Adds the bitmaps as a binary counter: returns a list of ints, the bit
+    n of the int i is the bit i of how many bitmaps have the bit n set.
+    """
+    planes = []
+    for carry in bitmaps:
+        for bit, plane in enumerate(planes):
+            planes[bit], carry = plane ^ carry, plane & carry
+            if not carry:
+                break
+        if carry:
+            planes.append(carry)
+    return planes
+
+
+class InterestIndex(InProcessIndex):
+    """
+    In-process inverted index of the interests, see the module docstring.
+    It's loaded from batches of (user_id, interest) rows sorted by user_id,
+    like the ones of stream_interests.
+    """
+
+    def __init__(self, dense_ratio=DENSE_RATIO):
+        super().__init__()
+        self.dense_ratio = dense_ratio
+        self._postings = {}
+        self._max_user_id = 0
+
+    def _build(self, *sources):
+        (batches,) = sources
+        postings = {}
+        max_user_id = 0
+        for batch in batches:
+            for user_id, interest in batch:
+                postings.setdefault(interest, array("i")).append(user_id)
+                max_user_id = max(max_user_id, user_id)
+        for interest, user_ids in postings.items():
+            if len(user_ids) * self.dense_ratio > max_user_id:
+                postings[interest] = _to_bitmap(user_ids)
+        return postings, max_user_id
+
+    def _install(self, state):
+        self._postings, self._max_user_id = state or ({}, 0)
+
+    def _add(self, interest, user_id):
+        self._max_user_id = max(self._max_user_id, user_id)
+        posting = self._postings.setdefault(interest, array("i"))
+        if isinstance(posting, int):
+            self._postings[interest] = posting | 1 << user_id
+            return
+        index = bisect_left(posting, user_id)
+        if index < len(posting) and posting[index] == user_id:
+            return
+        posting.insert(index, user_id)
+        if len(posting) * self.dense_ratio > self._max_user_id:
+            self._postings[interest] = _to_bitmap(posting)
+
+    def _remove(self, interest, user_id):
+        posting = self._postings.get(interest)
+        if isinstance(posting, int):
+            self._postings[interest] = posting & ~(1 << user_id)
+        elif posting is not None:
+            index = bisect_left(posting, user_id)
+            if index < len(posting) and posting[index] == user_id:
+                del posting[index]
+            if not posting:
+                del self._postings[interest]
+
+    def _set(self, user_id, old_interests, new_interests):
+        for interest in set(old_interests).difference(new_interests):
+            self._remove(interest, user_id)
+        for interest in set(new_interests).difference(old_interests):
+            self._add(interest, user_id)
+
+    def set_interests(self, user_id, old_interests, new_interests):
+        """
+        Records that the user changed its interests.
+        """
+        self._record(lambda: self._set(user_id, old_interests, new_interests))
+
+    def remove_user(self, user_id, interests):
+        """
+        Records that the user, that had these interests, was removed.
+        """
+        self._record(lambda: self._set(user_id, interests, ()))
+
+    def ranked(self, interests, user_id, excluded=()):
+        """
+        Generator of the users that share the most of these interests (the
+        ones of the user with the given id), as (id, shared interests), the
+        most first and then the lowest id first. The user and the ids in
+        excluded are left out.
+        """
+        with self._lock:
+            bitmaps = [
+                posting if isinstance(posting, int) else _to_bitmap(posting)
+                for posting in (
+                    self._postings.get(interest) for interest in set(interests)
+                )
+                if posting
+            ]
+        planes = _count(bitmaps)
+        union = reduce(or_, bitmaps, 0)
+        for count in range(len(bitmaps), 0, -1):
+            at_count = union
+            for bit, plane in enumerate(planes):
+                at_count = at_count & plane if count >> bit & 1 else at_count & ~plane
+            for candidate_id in _set_bits(at_count):
+                if candidate_id != user_id and candidate_id not in excluded:
+                    yield candidate_id, count
+
+    def users(self, interest):
+        """
+        Returns how many users have the interest.
+        """
+        with self._lock:
+            posting = self._postings.get(interest)
+            if isinstance(posting, int):
+                return bin(posting).count("1")
+            return len(posting or ())
+
+    def size(self):
+        """
+        Returns the bytes of its arrays and bitmaps.
+        """
+        with self._lock:
+            return sum(
+                (posting.bit_length() + 7) // 8
+                if isinstance(posting, int)
+                else len(posting) * posting.itemsize
+                for posting in self._postings.values()
+            )
+
+
+interest_index = InterestIndex()
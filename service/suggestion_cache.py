@@ -0,0 +1,158 @@
+# suggestion_cache.py
+"""
+This module is the in-process cache of the follow suggestions.
+
+An entry has the best candidates of a user, each with its score (how
+many of the people the user follows follow them), and the follow_version
+of the user it was computed for. It's only used while the user's
+follow_version is the same and for SUGGESTIONS_TTL seconds (300 by
+default), so other processes and the changes of the people the user
+follows are picked up.
+
+When the user follows or unfollows someone through this process, the
+entry is updated with the users that one follows instead of computed
+again from scratch.
+
+It's configured with environment variables:
+- SUGGESTIONS_TTL: seconds an entry is used.
+- SUGGESTIONS_CACHE_SIZE: max users with an entry (the least recently
+  used are dropped). Defaults to 10000.
+- SUGGESTIONS_POOL: max candidates kept per user. Defaults to 200.
+"""
+import heapq
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def _by_score(item):
+    """
+    Sort key of a (candidate id, score) pair: best score, then lowest id.
+    """
+    candidate_id, score = item
+    return score, -candidate_id
+
+
+# pylint: disable=too-few-public-methods
+class _Entry:
+    """
+    The candidates of a user, and when and for which version they were computed.
+    """
+
+    def __init__(self, version, scores, expires_at):
+        self.version = version
+        self.scores = scores
+        self.expires_at = expires_at
+
+
+class SuggestionCache:
+    """
+    LRU cache from a user's id to its best max_candidates ({id: score}).
+    on_lookup, if set, is called with True or False on every hit or miss.
+    """
+
+    def __init__(self, ttl, max_users, max_candidates, clock=time.monotonic):
+        self._ttl = ttl
+        self._max_users = max_users
+        self.max_candidates = max_candidates
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.on_lookup = None
+
+    def get(self, user_id, version):
+        """
+        Returns a copy of the candidates of the user if they were computed
+        for this version and didn't expire, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            hit = (
+                entry is not None
+                and entry.version == version
+                and entry.expires_at > self._clock()
+            )
+            if hit:
+                self._entries.move_to_end(user_id)
+                scores = dict(entry.scores)
+            else:
+                scores = None
+        if self.on_lookup is not None:
+            self.on_lookup(hit)
+        return scores
+
+    def put(self, user_id, version, scores):
+        """
+        Saves the candidates of the user, computed for this version.
+        """
+        with self._lock:
+            self._entries[user_id] = _Entry(
+                version, dict(scores), self._clock() + self._ttl
+            )
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self._max_users:
+                self._entries.popitem(last=False)
+
+    def has(self, user_id):
+        """
+        Returns if the user has an entry, so the updates that need a query
+        are only done for the users that have one.
+        """
+        with self._lock:
+            return user_id in self._entries
+
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+    def apply(self, user_id, followee_id, candidates, delta, followee_score=0):
+        """
+        Updates the entry of the user after it followed (delta 1) or
+        unfollowed (delta -1) followee_id: every candidate followee_id
+        follows gains or loses a point, and followee_id is left out, or
+        after an unfollow is a candidate again with followee_score.
+        Following or unfollowing bumps the user's follow_version by one,
+        so the entry keeps being valid for the next version.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            entry.scores.pop(followee_id, None)
+            if followee_score > 0:
+                entry.scores[followee_id] = followee_score
+            for candidate_id in candidates:
+                score = entry.scores.get(candidate_id, 0) + delta
+                if score > 0:
+                    entry.scores[candidate_id] = score
+                else:
+                    entry.scores.pop(candidate_id, None)
+            if len(entry.scores) > self.max_candidates:
+                best = heapq.nlargest(
+                    self.max_candidates, entry.scores.items(), key=_by_score
+                )
+                entry.scores = dict(best)
+            entry.version += 1
+
+    def invalidate(self, user_id):
+        """
+        Drops the entry of the user, it's computed again on the next request.
+        """
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        """
+        Drops every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+suggestion_cache = SuggestionCache(
+    float(os.getenv("SUGGESTIONS_TTL", "300")),
+    int(os.getenv("SUGGESTIONS_CACHE_SIZE", "10000")),
+    int(os.getenv("SUGGESTIONS_POOL", "200")),
+)
@@ -0,0 +1,171 @@
+# suggestion_handler.py
+"""
+This module is used to encapsulate the suggestions of users to follow.
+"""
+import os
+from itertools import islice
+from repository.user_repository import (
+    get_suggestion_scores as get_suggestion_scores_repo,
+    get_suggestion_candidates as get_suggestion_candidates_repo,
+    get_suggestion_score as get_suggestion_score_repo,
+    get_interest_suggestion_scores as get_interest_suggestion_scores_repo,
+    get_user_summaries_by_ids as get_user_summaries_by_ids_repo,
+    get_user_interests as get_user_interests_repo,
+    get_following_ids as get_following_ids_repo,
+    stream_interests as stream_interests_repo,
+)
+from service.errors import MaxAmmountExceeded
+from service.follow_graph import follow_graph
+from service.interest_index import interest_index
+from service.suggestion_cache import suggestion_cache
+from service.user_handler import MAX_AMMOUNT
+
+# How many of the users someone follows (the last ones) are expanded to
+# find the candidates, so users that follow thousands stay fast.
+MAX_SUGGESTION_FOLLOWEES = int(os.getenv("SUGGESTIONS_MAX_FOLLOWEES", "2000"))
+# How many times ammount candidates are looked at, at most, to find
+# ammount that can be suggested (not blocked, deleted or private).
+MAX_CANDIDATES_RATIO = 10
+
+
+def _ranking(item):
+    """
+    Sort key of a (candidate id, score) pair: best score, then lowest id.
+    """
+    candidate_id, score = item
+    return -score, candidate_id
+
+
+def _check_ammount(ammount):
+    """
+    Raises if the ammount of suggestions asked for is not valid.
+    """
+    if ammount < 0:
+        raise ValueError("ammount must be positive")
+    if ammount > MAX_AMMOUNT:
+        raise MaxAmmountExceeded("ammount must be less than " + str(MAX_AMMOUNT))
+
+
+def _pick(ranked, ammount, public_only=False):
+    """
+    Takes the first ammount candidates of ranked, an iterable of
+    (id, score) best first, that can still be suggested: the ones that
+    were not blocked or deleted and, if public_only, the public ones.
+    Their summaries are read twice as many at a time.
+    Returns their UserSummary and a dict from their ids to their scores.
+    """
+    ranked = islice(ranked, ammount * MAX_CANDIDATES_RATIO)
+    suggested, scores = [], {}
+    chunk = list(islice(ranked, ammount * 2))
+    while chunk and len(suggested) < ammount:
+        users = {
+            user.id: user
+            for user in get_user_summaries_by_ids_repo(
+                candidate_id for candidate_id, _ in chunk
+            )
+        }
+        for candidate_id, score in chunk:
+            user = users.get(candidate_id)
+            if user is None or (public_only and not user.is_public):
+                continue
+            suggested.append(user)
+            scores[candidate_id] = score
+            if len(suggested) == ammount:
+                break
+        chunk = list(islice(ranked, ammount * 2))
+    return suggested, scores
+
+
+class SuggestionHandler:
+    """
+    Class used to encapsulate the suggestions of users to follow.
+    The candidates of every user are cached in suggestion_cache.
+    """
+
+    def get_suggestions(self, user_id: int, follow_version: int, ammount: int):
+        """
+        This function is used to get the users followed by the most people
+        the user follows, that the user doesn't follow yet.
+
+        :param user_id: The id of the user asking.
+        :param follow_version: The user's follow_version, the cache is only
+        used if its candidates are from this version.
+        :param ammount: The max ammount of users to return.
+        :return: The UserSummary of the suggested users, best first, and a
+        dict from their ids to how many of the user's followees follow them.
+        """
+        _check_ammount(ammount)
+        scores = suggestion_cache.get(user_id, follow_version)
+        if scores is None:
+            rows = get_suggestion_scores_repo(
+                user_id, MAX_SUGGESTION_FOLLOWEES, suggestion_cache.max_candidates
+            )
+            scores = {row.id: row.mutuals for row in rows}
+            suggestion_cache.put(user_id, follow_version, scores)
+        return _pick(sorted(scores.items(), key=_ranking), ammount)
+
+    def get_interest_suggestions(self, user_id: int, options: dict):
+        """
+        This function is used to get the users that share the most
+        interests with the user. They come from interest_index if it's
+        loaded, or from the database if it isn't.
+
+        :param user_id: The id of the user asking.
+        :param options: Dict with "ammount" (the max ammount of users to
+        return), "public_only" (leave out the private users) and
+        "not_followed" (leave out the users it follows).
+        :return: The UserSummary of the suggested users, best first, and a
+        dict from their ids to how many interests they share with the user.
+        """
+        ammount = options["ammount"]
+        _check_ammount(ammount)
+        if not interest_index.loaded:
+            rows = get_interest_suggestion_scores_repo(user_id, options, ammount)
+            return _pick(rows, ammount, options.get("public_only"))
+        excluded = ()
+        if options.get("not_followed"):
+            excluded = set(
+                follow_graph.following(user_id)
+                if follow_graph.loaded
+                else get_following_ids_repo(user_id)
+            )
+        interests = [row.interest_id for row in get_user_interests_repo(user_id)]
+        ranked = interest_index.ranked(interests, user_id, excluded)
+        return _pick(ranked, ammount, options.get("public_only"))
+
+    def load_interest_index(self):
+        """
+        This function is used to build interest_index from a streaming scan
+        of the interests. Until it's built, the suggestions by interests
+        come from the database.
+        """
+        interest_index.load(stream_interests_repo())
+
+    def followed(self, user_id: int, followee_id: int):
+        """
+        This function updates the cached candidates of the user after it
+        followed followee_id (if it has any), instead of dropping them.
+        """
+        if suggestion_cache.has(user_id):
+            candidates = get_suggestion_candidates_repo(user_id, followee_id)
+            suggestion_cache.apply(user_id, followee_id, candidates, 1)
+
+    def unfollowed(self, user_id: int, followee_id: int):
+        """
+        This function updates the cached candidates of the user after it
+        unfollowed followee_id (if it has any), instead of dropping them.
+        followee_id can be suggested again, with the score it has now.
+        """
+        if suggestion_cache.has(user_id):
+            candidates = get_suggestion_candidates_repo(user_id, followee_id)
+            score = get_suggestion_score_repo(
+                user_id, followee_id, MAX_SUGGESTION_FOLLOWEES
+            )
+            suggestion_cache.apply(user_id, followee_id, candidates, -1, score)
+
+    def forget(self, user_id: int):
+        """
+        This function drops the cached candidates of the user, after a
+        change too big to apply to them (like a bulk follow).
+        """
+        suggestion_cache.invalidate(user_id)
@@ -15,6 +15,7 @@ from service.errors import (
     UsernameAlreadyRegistered,
     EmailAlreadyRegistered,
 )
+from service.autocomplete_index import autocomplete_index
 
 
 # Pydantic model for users
@@ -117,10 +118,13 @@ class User(BaseModel):
                 "blocked": False,  # At time of registration, user is not blocked
                 "is_public": True,  # At time of registration, user is public
             }
-            register_user(self.email, self.password, self.username, data)
+            registered = register_user(self.email, self.password, self.username, data)
         except UsernameAlreadyExists as error:
             # if we had more errors we could do this and then default to a generic error:
             # if (error.response.detail) == "User already registered":
             raise UsernameAlreadyRegistered() from error
         except EmailAlreadyExists as error:
             raise EmailAlreadyRegistered() from error
+        autocomplete_index.set_user(
+            registered["id"], self.username, self.name, self.surname
+        )
@@ -2,6 +2,7 @@
 """
 This module encapsulates all the logic of the user's backend.
 """
+import os
 from repository.user_repository import (
     update_user_password as update_user_password_repo,
     update_user_bio as update_user_bio_repo,
@@ -12,15 +13,29 @@ from repository.user_repository import (
     get_user_email as get_user_repo,
     remove_user,
     get_user_username as get_user_username_repo,
+    get_auth_user as get_auth_user_repo,
+    get_user_credentials as get_user_credentials_repo,
+    get_user_summary as get_user_summary_repo,
+    get_user_summary_username as get_user_summary_username_repo,
     update_user_location as update_user_location_repo,
     set_user_interests as set_user_interests_repo,
     get_user_interests as get_user_interests_repo,
+    get_popular_interests as get_popular_interests_repo,
     search_for_users as search_for_users_repo,
+    autocomplete_users as autocomplete_users_repo,
+    stream_autocomplete_users as stream_autocomplete_users_repo,
+    search_users_by_distance as search_users_by_distance_repo,
     update_user_public_status as update_user_public_status_repo,
     add_user_biometric_token as add_user_biometric_token_repo,
     get_biometric_token as get_biometric_token_repo,
     remove_biometric_token as remove_biometric_token_repo,
+    get_users_batch as get_users_batch_repo,
+    get_profile as get_profile_repo,
+    get_profile_versions as get_profile_versions_repo,
 )
+from service.follow_graph import follow_graph
+from service.interest_index import interest_index
+from service.autocomplete_index import autocomplete_index
 from service.errors import (
     UserNotFound,
     PasswordDoesntMatch,
@@ -28,8 +43,54 @@ from service.errors import (
 )
 
 MAX_AMMOUNT = 25
+MAX_BATCH_AMMOUNT = 1000
+# The ranked search only looks at the users someone followed last, and
+# at that many users followed by them, so it takes the same for everyone.
+SEARCH_MAX_FOLLOWEES = int(os.getenv("SEARCH_MAX_FOLLOWEES", "5000"))
+SEARCH_MAX_TWO_HOP = int(os.getenv("SEARCH_MAX_TWO_HOP", "50000"))
+
+# The fields that can be asked for in a batch, and their column in the db.
+BATCH_FIELDS = {
+    "id": "id",
+    "email": "email",
+    "username": "username",
+    "name": "name",
+    "last_name": "surname",
+    "date_of_birth": "date_of_birth",
+    "bio": "bio",
+    "avatar": "avatar",
+    "location": "location",
+    "blocked": "blocked",
+    "is_public": "is_public",
+}
+# The kind of identifier and the column used to look it up.
+BATCH_KEYS = {"ids": "id", "emails": "email", "usernames": "username"}
+
+
+def _reindex(user):
+    """
+    Records the username, name and surname of the user (if it was updated)
+    in the autocomplete index.
+    """
+    if user is not None:
+        autocomplete_index.set_user(user.id, user.username, user.name, user.surname)
+
+
+def _decode_cursor(cursor):
+    """
+    Returns the (distance, relevance, id) of a cursor of the ranked search,
+    or None if there is no cursor. Raises ValueError if it's not one.
+    """
+    if cursor is None:
+        return None
+    try:
+        distance, relevance, user_id = map(int, cursor.split("."))
+    except ValueError as error:
+        raise ValueError("Invalid cursor " + cursor) from error
+    return distance, relevance, user_id
 
 
+# pylint: disable=too-many-public-methods
 class UserHandler:
     """
     This class encapsulates all the logic of the user's backend.
@@ -82,9 +143,10 @@ class UserHandler:
         :param name: The user's new name.
         """
         try:
-            update_user_name_repo(email, new_name)
+            user = update_user_name_repo(email, new_name)
         except KeyError as error:
             raise UserNotFound() from error
+        _reindex(user)
 
     def change_date_of_birth(self, email: str, new_date_of_birth: str):
         """
@@ -106,9 +168,10 @@ class UserHandler:
         :param new_last_name: The user's new last name.
         """
         try:
-            update_user_last_name_repo(email, new_last_name)
+            user = update_user_last_name_repo(email, new_last_name)
         except KeyError as error:
             raise UserNotFound() from error
+        _reindex(user)
 
     def change_avatar(self, email: str, new_avatar: str):
         """
@@ -158,6 +221,57 @@ class UserHandler:
         except KeyError as error:
             raise UserNotFound() from error
 
+    def get_auth_user(self, email: str):
+        """
+        This function is used to retrieve only what's needed to authorize
+        a request of the user (without its password nor the fields it shows).
+
+        :param email: The email of the user to retrieve.
+        :return: The user's AuthUser.
+        """
+        try:
+            return get_auth_user_repo(email)
+        except KeyError as error:
+            raise UserNotFound() from error
+
+    def get_user_credentials(self, email: str):
+        """
+        This function is used to retrieve what the login needs.
+
+        :param email: The email of the user to retrieve.
+        :return: The user's UserCredentials.
+        """
+        try:
+            return get_user_credentials_repo(email)
+        except KeyError as error:
+            raise UserNotFound() from error
+
+    def get_user_summary(self, email: str):
+        """
+        This function is used to retrieve the fields of the user that are
+        shown, without its password.
+
+        :param email: The email of the user to retrieve.
+        :return: The user's UserSummary.
+        """
+        try:
+            return get_user_summary_repo(email)
+        except KeyError as error:
+            raise UserNotFound() from error
+
+    def get_user_summary_username(self, username: str):
+        """
+        This function is used to retrieve the fields of the user that are
+        shown, by its username, without its password.
+
+        :param username: The username of the user to retrieve.
+        :return: The user's UserSummary.
+        """
+        try:
+            return get_user_summary_username_repo(username)
+        except KeyError as error:
+            raise UserNotFound() from error
+
     def get_user_username(self, username: str):
         """
         This function is used to retrieve the user from the database.
@@ -176,10 +290,17 @@ class UserHandler:
 
         :param email: The email of the user to remove.
         """
+        interests = []
+        if interest_index.loaded:
+            user = self.get_user_email(email)
+            interests = [row.interest_id for row in get_user_interests_repo(user.id)]
         try:
-            remove_user(email)
+            user_id = remove_user(email)
         except KeyError as error:
             raise UserNotFound() from error
+        follow_graph.remove_user(user_id)
+        interest_index.remove_user(user_id, interests)
+        autocomplete_index.remove_user(user_id)
 
     def remove_user_username(self, username: str):
         """
@@ -189,7 +310,7 @@ class UserHandler:
         """
 
         user = self.get_user_username(username)
-        remove_user(user.email)
+        self.remove_user_email(user.email)
 
     def set_user_interests(self, email: str, interests: str):
         """
@@ -201,7 +322,8 @@ class UserHandler:
 
         user = self.get_user_email(email)
         interests_list = interests.split(",")
-        set_user_interests_repo(user.id, interests_list)
+        old_ids, new_ids = set_user_interests_repo(user.id, interests_list)
+        interest_index.set_interests(user.id, old_ids, new_ids)
 
     def get_user_interests(self, email: str):
         """
@@ -214,6 +336,27 @@ class UserHandler:
         interests = get_user_interests_repo(user.id)
         return [interest.interest for interest in interests]
 
+    def get_popular_interests(self, prefix, ammount: int):
+        """
+        This function is used to get the interests most users have, for the
+        autocomplete of the interests.
+
+        :param prefix: If it's not None, only the interests that start with
+        it (ignoring case).
+        :param ammount: The max ammount of interests to return.
+        :return: A list of {"name", "users"}, the most popular first.
+        """
+        if ammount < 0:
+            raise ValueError("ammount must be positive")
+        if ammount > MAX_AMMOUNT:
+            raise MaxAmmountExceeded(
+                "Ammount can't be greater than " + str(MAX_AMMOUNT)
+            )
+        return [
+            {"name": row.name, "users": row.users}
+            for row in get_popular_interests_repo(prefix, ammount)
+        ]
+
     def search_for_users(self, username, options):
         """
         This function is used to search for users.
@@ -237,6 +380,76 @@ class UserHandler:
             options["in_followers"],
         )
 
+    def search_users_by_distance(self, query, options):
+        """
+        This function is used to search for users ranked by their social
+        distance to the user: the users it follows first, then its
+        followers, then the users followed by the ones it follows and then
+        everyone else. Text relevance (the same username, a prefix of it,
+        part of it, or only the name, surname or email) breaks the ties.
+
+        :param query: The text to search for.
+        :param options: A dict with the "user_id" of the user, the
+        "ammount" of users to return and the "cursor" of the page (the
+        next_cursor of the previous page, or None for the first one).
+        :return: The users of the page and the cursor of the next one (None
+        if there are no more).
+        """
+        if options["ammount"] < 1:
+            raise ValueError("ammount must be positive")
+        if options["ammount"] > MAX_AMMOUNT:
+            raise MaxAmmountExceeded(
+                "Ammount can't be greater than " + str(MAX_AMMOUNT)
+            )
+        ranked = search_users_by_distance_repo(
+            query,
+            options["user_id"],
+            after=_decode_cursor(options["cursor"]),
+            amount=options["ammount"],
+            limits=(SEARCH_MAX_FOLLOWEES, SEARCH_MAX_TWO_HOP),
+        )
+        next_cursor = None
+        if len(ranked) == options["ammount"]:
+            distance, relevance, user = ranked[-1]
+            next_cursor = f"{distance}.{relevance}.{user.id}"
+        return [user for _, _, user in ranked], next_cursor
+
+    def autocomplete_users(self, prefix: str, ammount: int):
+        """
+        This function is used for the autocomplete of the mentions: the
+        users with a username, name or surname that starts with prefix
+        (ignoring case). They come from autocomplete_index if it's loaded,
+        or from the database if it's not.
+
+        :param prefix: The start of the username, name or surname.
+        :param ammount: The max ammount of users to return.
+        :return: A list of {"id", "username", "name", "surname"}.
+        """
+        if not prefix:
+            raise ValueError("prefix can't be empty")
+        if ammount < 1:
+            raise ValueError("ammount must be positive")
+        if ammount > MAX_AMMOUNT:
+            raise MaxAmmountExceeded(
+                "Ammount can't be greater than " + str(MAX_AMMOUNT)
+            )
+        if autocomplete_index.loaded:
+            users = autocomplete_index.complete(prefix, ammount)
+        else:
+            users = autocomplete_users_repo(prefix, ammount)
+        return [
+            {"id": user_id, "username": username, "name": name, "surname": surname}
+            for user_id, username, name, surname in users
+        ]
+
+    def load_autocomplete_index(self):
+        """
+        This function is used to build autocomplete_index from a streaming
+        scan of the users. The users registered, renamed and removed while
+        it's being built are applied after.
+        """
+        autocomplete_index.load(stream_autocomplete_users_repo())
+
     def add_biometric_token(self, email: str, biometric_token: str):
         """
         This function is used to add a biometric token to the user.
@@ -264,3 +477,68 @@ class UserHandler:
             remove_biometric_token_repo(user_id, biometric_token)
         except KeyError as error:
             raise UserNotFound() from error
+
+    def get_users_batch(self, identifiers: dict, fields=None):
+        """
+        This function is used to get many users at once, with one query
+        for each kind of identifier.
+
+        :param identifiers: Dict with the lists "ids", "emails" and "usernames".
+        :param fields: The fields to return for each user (all if None).
+        :return: A dict with the same keys as identifiers, each one mapping
+        every identifier to the user's fields (or None if it doesn't exist).
+        """
+        fields = fields or list(BATCH_FIELDS)
+        unknown = [field for field in fields if field not in BATCH_FIELDS]
+        if unknown:
+            raise ValueError("Unknown fields: " + ", ".join(unknown))
+        total = sum(len(identifiers.get(kind) or []) for kind in BATCH_KEYS)
+        if total > MAX_BATCH_AMMOUNT:
+            raise MaxAmmountExceeded(
+                "Can't ask for more than " + str(MAX_BATCH_AMMOUNT) + " users"
+            )
+
+        columns = {field: BATCH_FIELDS[field] for field in fields}
+        result = {}
+        for kind, key in BATCH_KEYS.items():
+            values = list(dict.fromkeys(identifiers.get(kind) or []))
+            users = dict.fromkeys(values)
+            if values:
+                for row in get_users_batch_repo(key, values, columns):
+                    user = row._asdict()
+                    users[user.pop("key")] = user
+            result[kind] = users
+        return result
+
+    def get_profile_versions(self, username: str):
+        """
+        This function is used to get what the ETag of a profile depends on,
+        without building the profile.
+
+        :param username: The username of the user of the profile.
+        :return: A row with the id, version, follow_version and is_public.
+        """
+        try:
+            return get_profile_versions_repo(username)
+        except KeyError as error:
+            raise UserNotFound() from error
+
+    def get_profile(self, username: str, viewer_id: int):
+        """
+        This function is used to get everything that is shown in a profile,
+        so the app doesn't have to ask for each part separately.
+
+        :param username: The username of the user of the profile.
+        :param viewer_id: The id of the user looking at the profile.
+        :return: A dict with the user's fields, the followers and following
+        counts, the interests and the relation with the viewer, and the
+        "version" and "follow_version" the ETag is computed from.
+        """
+        try:
+            profile = get_profile_repo(username, viewer_id)
+        except KeyError as error:
+            raise UserNotFound() from error
+        fields = profile._asdict()
+        fields["last_name"] = fields.pop("surname")
+        fields["interests"] = fields["interests"] or []
+        return fields
@@ -0,0 +1,131 @@
+# autocomplete_index_tests.py
+"""
+This is a module for the tests of the autocomplete of the users and the
+in-process autocomplete index.
+"""
+import pytest
+from service.autocomplete_index import AutocompleteIndex, autocomplete_index
+from service.user_handler import UserHandler, MAX_AMMOUNT
+from service.errors import MaxAmmountExceeded
+from tests.utils import (
+    save_test_user_to_db,
+    remove_test_user_from_db,
+    EMAIL,
+    USERNAME,
+    EMAIL_2,
+    USERNAME_2,
+)
+
+EMAIL_3 = "test_email_3@gmail.com"
+USERNAME_3 = "test_username_3"
+
+# We create the handler that will be used in all tests.
+# Since the handler is stateless, we don't care if it's global.
+handler = UserHandler()
+
+ROWS = [
+    (1, "alice", "Alicia", "Zeta"),
+    (2, "bob", "Alberto", None),
+    (5, "Ñandu", "Nadia", "Al"),
+]
+
+
+def build(max_delta=10000):
+    """
+    Returns an index loaded with ROWS, in batches of two rows.
+    """
+    index = AutocompleteIndex(max_delta)
+    index.load(ROWS[start : start + 2] for start in range(0, len(ROWS), 2))
+    return index
+
+
+def ids(users):
+    """
+    Returns the ids of the (id, username, name, surname) of the users.
+    """
+    return [user[0] for user in users]
+
+
+def test_index_completes_by_the_matched_term():
+    """
+    This function tests the order of the matches, that case is ignored and
+    that every user comes once.
+    """
+    index = build()
+
+    assert ids(index.complete("al", 10)) == [5, 2, 1]
+    assert index.complete("AL", 1) == [(5, "Ñandu", "Nadia", "Al")]
+    assert ids(index.complete("ñ", 10)) == [5]
+    assert ids(index.complete("alicia", 10)) == [1]
+    assert not index.complete("x", 10)
+
+
+def test_index_is_updated_with_the_users():
+    """
+    This function tests that the registered, renamed and removed users are
+    applied to the index, before and after merging them into the arrays.
+    """
+    for max_delta in (0, 10000):
+        index = build(max_delta)
+
+        index.set_user(7, "alfa", "Xavier", "")
+        index.set_user(2, "bob", "Roberto", None)
+        index.remove_user(1)
+        assert index.complete("al", 10) == [
+            (5, "Ñandu", "Nadia", "Al"),
+            (7, "alfa", "Xavier", ""),
+        ]
+        assert ids(index.complete("r", 10)) == [2]
+
+        index.set_user(1, "alice", "Alicia", "Zeta")
+        assert ids(index.complete("al", 10)) == [5, 7, 1]
+
+
+def create_users():
+    """
+    Saves the users of the tests and returns their ids.
+    """
+    for email, username in ((EMAIL, USERNAME), (EMAIL_2, USERNAME_2)):
+        save_test_user_to_db(email, username)
+    return [handler.get_user_email(email).id for email in (EMAIL, EMAIL_2)]
+
+
+def completed(prefix, ammount=10):
+    """
+    Returns the ids of the users of the autocomplete.
+    """
+    return [user["id"] for user in handler.autocomplete_users(prefix, ammount)]
+
+
+def test_autocomplete_from_the_database_and_the_index():
+    """
+    This function tests that both ways give the same users, and that the
+    index follows the users registered, renamed and removed.
+    """
+    user, user_2 = create_users()
+
+    for load in (False, True):
+        if load:
+            handler.load_autocomplete_index()
+        assert completed("TEST_user") == [user_2]
+        assert handler.autocomplete_users("test", 1)[0]["username"] == USERNAME_2
+        assert completed("real", 1) == [user]
+
+    handler.change_name(EMAIL_2, "Zoe")
+    save_test_user_to_db(EMAIL_3, USERNAME_3)
+    remove_test_user_from_db(EMAIL)
+    user_3 = handler.get_user_email(EMAIL_3).id
+    for load in (True, False):
+        if not load:
+            autocomplete_index.clear()
+        assert completed("zoe") == [user_2]
+        assert completed("test_username") == [user_2, user_3]
+        assert user not in completed("real")
+
+    with pytest.raises(ValueError):
+        handler.autocomplete_users("", 10)
+    with pytest.raises(MaxAmmountExceeded):
+        handler.autocomplete_users("test", MAX_AMMOUNT + 1)
+
+    remove_test_user_from_db(EMAIL_2)
+    remove_test_user_from_db(EMAIL_3)
@@ -0,0 +1,146 @@
+# bulk_loader_tests.py
+"""
+This is a module for the tests of the bulk loads of users, follows and
+interests.
+"""
+import pytest
+from sqlalchemy import create_engine, select
+from control.utils.auth import AuthHandler
+from repository import user_repository
+from repository.tables.users import Base, User, Following, InterestCatalog
+from service.bulk_loader import BulkLoader
+from service.errors import UserNotFound
+from service.follow_handler import FollowHandler
+from service.user_handler import UserHandler
+from tests.utils import (
+    remove_test_user_from_db,
+    EMAIL,
+    USERNAME,
+    EMAIL_2,
+    USERNAME_2,
+    PASSWORD,
+)
+
+INTEREST = "bulk loaded interest"
+
+# We create the handlers that will be used in all tests.
+# Since the handlers are stateless, we don't care if they're global.
+auth_handler = AuthHandler()
+handler = UserHandler()
+follow_handler = FollowHandler()
+loader = BulkLoader(
+    auth_handler.get_password_hash, auth_handler.pwd_context.identify, 2
+)
+
+
+def write_files(tmp_path):
+    """
+    Writes a CSV of two users (the first with a password, the second with
+    its hash), and NDJSON files of their follows and interests.
+    Returns their paths.
+    """
+    users = tmp_path / "users.csv"
+    users.write_text(
+        "email,username,name,surname,password,password_hash,date_of_birth,blocked\n"
+        f"{EMAIL},{USERNAME},Real_name,Real_surname,{PASSWORD},,1990-05-01,\n"
+        f'{EMAIL_2},{USERNAME_2},Ana,"Tab\tSurname",,'
+        f"{auth_handler.get_password_hash(PASSWORD)},1991-01-02T10:00:00,true\n"
+    )
+    following = tmp_path / "following.ndjson"
+    following.write_text(
+        f'{{"email": "{EMAIL}", "email_to_follow": "{EMAIL_2}"}}\n'
+        f'{{"email": "{EMAIL_2}", "email_to_follow": "{EMAIL}"}}\n\n'
+        f'{{"email": "{EMAIL}", "email_to_follow": "{EMAIL}"}}\n'
+        f'{{"email": "{EMAIL}", "email_to_follow": "nobody@gmail.com"}}\n'
+    )
+    interests = tmp_path / "interests.jsonl"
+    interests.write_text(
+        f'{{"email": "{EMAIL}", "interest": "{INTEREST}"}}\n'
+        f'{{"email": "{EMAIL_2}", "interest": "{INTEREST}"}}\n'
+    )
+    return str(users), str(following), str(interests)
+
+
+def counts(stats, field):
+    """
+    Returns the field of the stats of the users, follows and interests.
+    """
+    return [stats[kind][field] for kind in ("users", "following", "interests")]
+
+
+@pytest.mark.parametrize("use_copy", [True, False])
+def test_bulk_load_of_users_follows_and_interests(tmp_path, use_copy):
+    """
+    This function tests that the rows are loaded with COPY and with the
+    inserts, that the counts and versions are updated at the end and that
+    loading them again adds nothing.
+    """
+    files = write_files(tmp_path)
+    stats = loader.load(*files, rebuild_indexes=use_copy, use_copy=use_copy)
+    assert counts(stats, "rows") == [2, 4, 2]
+    assert counts(stats, "added") == [2, 2, 2]
+    assert stats["hashed"] == 1
+
+    user, user_2 = handler.get_user_email(EMAIL), handler.get_user_email(EMAIL_2)
+    assert user.id < user_2.id
+    assert user.follow_version == user_2.follow_version == 2
+    assert user_2.surname == "Tab\tSurname" and user_2.blocked and user.is_public
+    for email in (EMAIL, EMAIL_2):
+        password = handler.get_user_credentials(email).password
+        assert auth_handler.verify_password(PASSWORD, password)
+    assert follow_handler.get_following_count(EMAIL) == 1
+    assert follow_handler.get_followers_count(EMAIL) == 1
+    assert handler.get_user_interests(EMAIL_2) == [INTEREST]
+    assert {"name": INTEREST, "users": 2} in handler.get_popular_interests("bulk", 10)
+
+    stats = loader.load(*files, use_copy=use_copy)
+    assert counts(stats, "added") == [0, 0, 0]
+    # Nothing was added, so the lists of followers didn't change.
+    assert handler.get_user_email(EMAIL).follow_version == 2
+
+    remove_test_user_from_db(EMAIL)
+    remove_test_user_from_db(EMAIL_2)
+
+
+def test_bulk_load_with_inserts_on_sqlite(tmp_path, monkeypatch):
+    """
+    This function tests the batched inserts of the other dialects on
+    SQLite, and that COPY can't be used with them.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'users.db'}")
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(user_repository, "engine", engine)
+    files = write_files(tmp_path)
+    with pytest.raises(ValueError):
+        loader.load(*files, use_copy=True)
+
+    stats = loader.load(*files, use_copy=False)
+    assert counts(stats, "rows") == [2, 4, 2]
+    assert counts(stats, "added") == [2, 2, 2]
+    stats = loader.load(*files, use_copy=False)
+    assert counts(stats, "added") == [0, 0, 0]
+    with engine.connect() as connection:
+        assert connection.execute(
+            select(User.email, User.follow_version).order_by(User.id)
+        ).all() == [(EMAIL, 2), (EMAIL_2, 2)]
+        assert len(connection.execute(select(Following)).all()) == 2
+        assert connection.execute(
+            select(InterestCatalog.name, InterestCatalog.users)
+        ).all() == [(INTEREST, 2)]
+    engine.dispose()
+
+
+def test_bulk_load_of_invalid_rows_loads_nothing(tmp_path):
+    """
+    This function tests that a row that is not valid raises ValueError
+    with its line, and that the rows before it are not loaded.
+    """
+    users, _, _ = write_files(tmp_path)
+    with open(users, "a", encoding="utf-8") as file:
+        file.write("other@gmail.com,other,Name,Surname,secret,,yesterday,\n")
+    with pytest.raises(ValueError, match="users.csv:4"):
+        loader.load(users)
+    with pytest.raises(ValueError):
+        loader.load(str(tmp_path / "users.xml"))
+    with pytest.raises(UserNotFound):
+        handler.get_user_email(EMAIL)
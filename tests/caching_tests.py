@@ -0,0 +1,46 @@
+# caching_tests.py
+"""
+This is a module for the tests of the ETag helpers of the conditional GETs.
+"""
+from control.utils.caching import (
+    make_etag,
+    etag_matches,
+    not_modified,
+    PRIVATE_CACHE,
+)
+
+
+def test_etag_is_strong_and_made_of_the_parts():
+    """
+    This function tests the format of the ETags.
+    """
+    assert make_etag("user", 7, 3) == '"user-7-3"'
+
+
+def test_etag_matches_one_of_many():
+    """
+    This function tests that If-None-Match can have many ETags.
+    """
+    etag = make_etag("user", 7, 3)
+    assert etag_matches('"user-7-2", "user-7-3"', etag)
+    assert not etag_matches('"user-7-2"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_etag_matches_weak_and_wildcard():
+    """
+    This function tests the weak comparison and the * of If-None-Match.
+    """
+    etag = make_etag("user", 7, 3)
+    assert etag_matches('W/"user-7-3"', etag)
+    assert etag_matches("*", etag)
+
+
+def test_not_modified_has_the_caching_headers():
+    """
+    This function tests the 304 response.
+    """
+    response = not_modified(make_etag("user", 7, 3))
+    assert response.status_code == 304
+    assert response.headers["ETag"] == '"user-7-3"'
+    assert response.headers["Cache-Control"] == PRIVATE_CACHE
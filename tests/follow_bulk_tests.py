@@ -0,0 +1,123 @@
+# follow_bulk_tests.py
+"""
+This is a module for all the tests of following and unfollowing many
+users at once.
+"""
+import pytest
+
+from service.follow_handler import FollowHandler
+from service.user_handler import UserHandler, MAX_BATCH_AMMOUNT
+from service.errors import MaxAmmountExceeded
+from tests.utils import (
+    save_test_user_to_db,
+    remove_test_user_from_db,
+    EMAIL,
+    USERNAME,
+    EMAIL_2,
+    USERNAME_2,
+)
+
+EMAIL_3 = "test_email_3@gmail.com"
+USERNAME_3 = "test_username_3"
+MISSING_EMAIL = "not@an.email"
+
+# We create the handlers that will be used in all tests.
+# Since the handlers are stateless, we don't care if they're global.
+handler = FollowHandler()
+user_handler = UserHandler()
+
+
+def create_users():
+    """
+    Saves the three users of the tests and returns them.
+    """
+    for email, username in (
+        (EMAIL, USERNAME),
+        (EMAIL_2, USERNAME_2),
+        (EMAIL_3, USERNAME_3),
+    ):
+        save_test_user_to_db(email, username)
+    return [user_handler.get_user_email(email) for email in (EMAIL, EMAIL_2, EMAIL_3)]
+
+
+def remove_users():
+    """
+    Removes the three users of the tests.
+    """
+    remove_test_user_from_db()
+    remove_test_user_from_db(EMAIL_2)
+    remove_test_user_from_db(EMAIL_3)
+
+
+def test_follow_many_returns_the_outcome_of_every_target():
+    """
+    This function tests every kind of outcome of a bulk follow.
+    """
+    user, user_2, _ = create_users()
+    handler.create_follow(EMAIL, EMAIL_2)
+
+    outcomes = handler.follow_many(
+        user.id, {"ids": [user_2.id], "emails": [EMAIL_3, EMAIL, MISSING_EMAIL]}
+    )
+
+    assert outcomes == {
+        user_2.id: "already_following",
+        EMAIL_3: "followed",
+        EMAIL: "self",
+        MISSING_EMAIL: "not_found",
+    }
+    assert handler.is_following(EMAIL, EMAIL_3)
+
+    remove_users()
+
+
+def test_follow_many_changes_the_follow_versions():
+    """
+    This function tests the ETags of both users change after a bulk follow.
+    """
+    user = create_users()[0]
+    _, version = handler.get_follow_version(EMAIL)
+    _, version_3 = handler.get_follow_version(EMAIL_3)
+
+    handler.follow_many(user.id, {"emails": [EMAIL_3]})
+
+    assert handler.get_follow_version(EMAIL)[1] == version + 1
+    assert handler.get_follow_version(EMAIL_3)[1] == version_3 + 1
+
+    remove_users()
+
+
+def test_unfollow_many_returns_the_outcome_of_every_target():
+    """
+    This function tests every kind of outcome of a bulk unfollow.
+    """
+    user, _, user_3 = create_users()
+    handler.create_follow(EMAIL, EMAIL_2)
+
+    outcomes = handler.unfollow_many(
+        user.id, {"ids": [user_3.id], "emails": [EMAIL_2, MISSING_EMAIL]}
+    )
+
+    assert outcomes == {
+        user_3.id: "not_following",
+        EMAIL_2: "unfollowed",
+        MISSING_EMAIL: "not_found",
+    }
+    assert not handler.is_following(EMAIL, EMAIL_2)
+
+    remove_users()
+
+
+def test_bulk_follow_without_targets_does_nothing():
+    """
+    This function tests an empty bulk follow.
+    """
+    assert not handler.follow_many(1, {"ids": [], "emails": []})
+
+
+def test_bulk_follow_of_too_many_users_raises_exception():
+    """
+    This function tests that following too many users raises an exception.
+    """
+    with pytest.raises(MaxAmmountExceeded):
+        handler.follow_many(1, {"ids": list(range(MAX_BATCH_AMMOUNT + 1))})
@@ -0,0 +1,176 @@
+# follow_graph_tests.py
+"""
+This is a module for the tests of the in-process follow graph index.
+"""
+import threading
+from service.follow_graph import FollowGraph, follow_graph, intersect, _Adjacency
+from service.follow_handler import FollowHandler
+from tests.utils import (
+    save_test_user_to_db,
+    remove_test_user_from_db,
+    EMAIL,
+    EMAIL_2,
+    USERNAME_2,
+)
+
+# We create the handler that will be used in all tests.
+# Since the handler is stateless, we don't care if it's global.
+handler = FollowHandler()
+
+# 1 follows 2 and 3, 2 follows 3 and 4, 3 follows 4 and 4 follows 1.
+EDGES = [(1, 2), (1, 3), (2, 3), (2, 4), (3, 4), (4, 1)]
+
+
+def build(edges=None, max_delta=100):
+    """
+    Returns a graph loaded with the edges, in batches of two rows.
+    """
+    edges = EDGES if edges is None else edges
+    graph = FollowGraph(max_delta)
+    graph.load(edges[start : start + 2] for start in range(0, len(edges), 2))
+    return graph
+
+
+def test_graph_answers_relations_and_counts():
+    """
+    This function tests the queries of a loaded graph.
+    """
+    graph = build()
+
+    assert graph.is_following(1, 2)
+    assert not graph.is_following(2, 1)
+    assert not graph.is_following(7, 1)
+    assert graph.following_count(2) == 2
+    assert graph.followers_count(4) == 2
+    assert list(graph.followers(3)) == [1, 2]
+    assert graph.edges() == len(EDGES)
+
+
+def test_graph_intersections_and_two_hop():
+    """
+    This function tests the common followees, the followees that follow
+    someone and the two-hop expansion.
+    """
+    graph = build()
+
+    assert graph.common_following(1, 2) == [3]
+    assert graph.following_that_follow(1, 4) == [2, 3]
+    assert graph.following_that_follow(1, 4, max_following=1) == [2]
+    assert graph.two_hop(1) == {4: 2}
+    assert intersect(list(range(100)), [5, 50, 500]) == [5, 50]
+
+
+def test_graph_applies_follows_unfollows_and_removed_users():
+    """
+    This function tests that the changes are seen before and after they're
+    merged into the arrays.
+    """
+    graph = build(max_delta=4)
+
+    graph.follow(3, 1)
+    graph.follow(9, 1)
+    graph.unfollow(1, 2)
+    assert graph.is_following(9, 1)
+    assert not graph.is_following(1, 2)
+    assert list(graph.followers(1)) == [3, 4, 9]
+
+    graph.remove_user(4)
+    assert not graph.is_following(4, 1)
+    assert graph.followers_count(4) == 0
+    assert list(graph.following(1)) == [3]
+    assert graph.edges() == 4
+    graph.wait_for_merge()
+    assert list(graph.following(1)) == [3]
+    assert graph.edges() == 4
+
+
+def test_graph_is_answered_while_the_changes_are_merged(monkeypatch):
+    """
+    This function tests that the arrays are merged without the lock, and
+    that the changes made meanwhile are kept in the new ones.
+    """
+    graph = build(max_delta=2)
+    size = graph.size()
+    merging, resume = threading.Event(), threading.Event()
+    compacted = _Adjacency.compacted
+
+    def paused(adjacency):
+        merging.set()
+        resume.wait()
+        return compacted(adjacency)
+
+    monkeypatch.setattr(_Adjacency, "compacted", paused)
+    graph.follow(9, 1)
+    graph.follow(3, 1)
+    assert merging.wait(5)
+
+    graph.unfollow(1, 2)
+    graph.follow(5, 4)
+    assert list(graph.followers(1)) == [3, 4, 9]
+    assert list(graph.following(1)) == [3]
+    resume.set()
+    graph.wait_for_merge()
+
+    assert graph.size() > size
+    assert list(graph.followers(1)) == [3, 4, 9]
+    assert list(graph.following(1)) == [3]
+    assert list(graph.followers(4)) == [2, 3, 5]
+    assert graph.edges() == len(EDGES) + 2
+
+
+def test_graph_applies_the_changes_made_while_it_was_loading():
+    """
+    This function tests that a follow made in the middle of the scan is
+    not lost.
+    """
+    graph = FollowGraph()
+
+    def batches():
+        yield EDGES[:3]
+        graph.follow(4, 2)
+        yield EDGES[3:]
+
+    graph.load(batches())
+
+    assert graph.is_following(4, 2)
+    assert graph.following_count(4) == 2
+
+
+def test_graph_is_caught_up_with_the_changes_of_a_snapshot():
+    """
+    This function tests loading it from the rows of a snapshot and the
+    changes since then: the new lists of some users (one that wasn't in
+    it) and the removed users.
+    """
+    graph = FollowGraph()
+    rows = [EDGES[start : start + 2] for start in range(0, len(EDGES), 2)]
+    graph.load(rows, lambda: ({2: [1], 5: [1, 3, 4]}, [4]))
+
+    assert list(graph.following(1)) == [2, 3]
+    assert list(graph.following(2)) == [1]
+    assert not graph.following(3)
+    assert list(graph.followers(1)) == [2, 5]
+    assert list(graph.followers(3)) == [1, 5]
+    assert graph.edges() == 5
+
+
+def test_handler_uses_the_loaded_graph():
+    """
+    This function tests that the follows and unfollows of the handler keep
+    the global graph current.
+    """
+    save_test_user_to_db()
+    save_test_user_to_db(EMAIL_2, USERNAME_2)
+    handler.load_follow_graph()
+
+    handler.create_follow(EMAIL, EMAIL_2)
+    assert handler.is_following(EMAIL, EMAIL_2)
+    assert handler.is_follower(EMAIL_2, EMAIL)
+    assert handler.get_followers_count(EMAIL_2) == 1
+    handler.remove_follow(EMAIL, EMAIL_2)
+    assert not handler.is_following(EMAIL, EMAIL_2)
+    assert handler.get_following_count(EMAIL) == 0
+
+    follow_graph.clear()
+    remove_test_user_from_db(EMAIL)
+    remove_test_user_from_db(EMAIL_2)
@@ -0,0 +1,140 @@
+# follow_status_tests.py
+"""
+This is a module for all the tests that are related to the follow status
+of many users at once.
+"""
+import pytest
+
+from service.follow_handler import FollowHandler
+from service.user_handler import UserHandler, MAX_BATCH_AMMOUNT
+from service.errors import MaxAmmountExceeded
+from tests.utils import (
+    create_multiple_generic_users,
+    remove_multiple_generic_users,
+    save_test_user_to_db,
+    remove_test_user_from_db,
+    EMAIL,
+    EMAIL_2,
+    USERNAME_2,
+)
+
+EMAIL_3 = "test_email_3@gmail.com"
+USERNAME_3 = "test_username_3"
+
+# We create the handlers that will be used in all tests.
+# Since the handlers are stateless, we don't care if they're global.
+handler = FollowHandler()
+user_handler = UserHandler()
+
+
+def create_three_users():
+    """
+    Saves the three users of the tests and returns the first one.
+    """
+    save_test_user_to_db()
+    save_test_user_to_db(EMAIL_2, USERNAME_2)
+    save_test_user_to_db(EMAIL_3, USERNAME_3)
+    return user_handler.get_user_email(EMAIL)
+
+
+def remove_three_users():
+    """
+    Removes the three users of the tests.
+    """
+    remove_test_user_from_db()
+    remove_test_user_from_db(EMAIL_2)
+    remove_test_user_from_db(EMAIL_3)
+
+
+def test_follow_status_by_email():
+    """
+    This function tests that the relation in both directions is returned.
+    """
+    user = create_three_users()
+    handler.create_follow(EMAIL, EMAIL_2)
+    handler.create_follow(EMAIL_3, EMAIL)
+
+    status = handler.get_follow_status(user.id, {"emails": [EMAIL_2, EMAIL_3]})
+
+    assert status[EMAIL_2] == {"following": True, "followed_by": False}
+    assert status[EMAIL_3] == {"following": False, "followed_by": True}
+
+    remove_three_users()
+
+
+def test_follow_status_by_id():
+    """
+    This function tests that the targets can be given by id.
+    """
+    user = create_three_users()
+    handler.create_follow(EMAIL, EMAIL_2)
+    handler.create_follow(EMAIL_2, EMAIL)
+    user_2 = user_handler.get_user_email(EMAIL_2)
+
+    status = handler.get_follow_status(user.id, {"ids": [user_2.id]})
+
+    assert status[user_2.id] == {"following": True, "followed_by": True}
+
+    remove_three_users()
+
+
+def test_follow_status_of_missing_user_is_none():
+    """
+    This function tests that the users that don't exist map to None.
+    """
+    user = create_three_users()
+
+    status = handler.get_follow_status(user.id, {"emails": ["not@an.email"]})
+
+    assert status == {"not@an.email": None}
+
+    remove_three_users()
+
+
+def test_users_follow_status_is_keyed_by_id():
+    """
+    This function tests the status of a list of users, used to embed it
+    in the search results and the lists of followers.
+    """
+    user = create_three_users()
+    handler.create_follow(EMAIL, EMAIL_3)
+    users = handler.get_all_following(EMAIL)
+
+    status = handler.get_users_follow_status(user.id, users)
+
+    assert status == {users[0].id: {"following": True, "followed_by": False}}
+
+    remove_three_users()
+
+
+def test_follow_status_of_too_many_users_raises_exception():
+    """
+    This function tests that asking for too many users raises an exception.
+    """
+    with pytest.raises(MaxAmmountExceeded):
+        handler.get_follow_status(1, {"ids": list(range(MAX_BATCH_AMMOUNT + 1))})
+
+
+def test_users_follow_status_of_more_users_than_a_batch():
+    """
+    This function tests that the status of a list longer than the limit
+    of the batches (like the followers of a popular user) is returned.
+    """
+    ammount = MAX_BATCH_AMMOUNT + 1
+    save_test_user_to_db()
+    create_multiple_generic_users(ammount)
+    user = user_handler.get_user_email(EMAIL)
+    emails = [EMAIL + str(number) for number in range(ammount)]
+    for start in range(0, ammount, MAX_BATCH_AMMOUNT):
+        handler.follow_many(
+            user.id, {"emails": emails[start : start + MAX_BATCH_AMMOUNT]}
+        )
+    users = handler.get_all_following(EMAIL)
+
+    status = handler.get_users_follow_status(user.id, users)
+
+    assert len(status) == ammount
+    assert all(relation["following"] for relation in status.values())
+
+    remove_multiple_generic_users(ammount)
+    remove_test_user_from_db()
@@ -0,0 +1,140 @@
+# following_export_tests.py
+"""
+This is a module for the tests of the streamed export of the following relations.
+"""
+import csv
+import datetime
+import io
+import json
+import pytest
+
+from service.follow_handler import FollowHandler
+from service.user_handler import UserHandler
+from service.errors import InvalidExportFilter
+from control.utils.streaming import encode_batches
+from tests.utils import (
+    save_test_user_to_db,
+    remove_test_user_from_db,
+    EMAIL,
+    EMAIL_2,
+    USERNAME_2,
+)
+
+FIELDS = ("user_id", "following_id", "created_at")
+CREATED_AT = datetime.datetime(2023, 11, 5, 10, 30)
+
+# We create the handlers that will be used in all tests.
+# Since the handlers are stateless, we don't care if they're global.
+handler = FollowHandler()
+user_handler = UserHandler()
+
+
+def export(filters):
+    """
+    Returns every relation of the export as a list of tuples.
+    """
+    return [
+        tuple(row)
+        for batch in handler.stream_following_relations(filters)
+        for row in batch
+    ]
+
+
+def test_export_has_the_relations_of_both_users():
+    """
+    This function tests the relations are exported with their fields.
+    """
+    save_test_user_to_db()
+    save_test_user_to_db(EMAIL_2, USERNAME_2)
+    user = user_handler.get_user_email(EMAIL)
+    user_2 = user_handler.get_user_email(EMAIL_2)
+    handler.create_follow(EMAIL, EMAIL_2)
+    handler.create_follow(EMAIL_2, EMAIL)
+
+    filters = {"min_user_id": min(user.id, user_2.id)}
+    relations = [row[:2] for row in export(filters)]
+
+    assert relations == sorted([(user.id, user_2.id), (user_2.id, user.id)])
+
+    remove_test_user_from_db()
+    remove_test_user_from_db(EMAIL_2)
+
+
+def test_export_filters_by_follower_id_and_date():
+    """
+    This function tests the user id range and the since filter.
+    """
+    save_test_user_to_db()
+    save_test_user_to_db(EMAIL_2, USERNAME_2)
+    user = user_handler.get_user_email(EMAIL)
+    handler.create_follow(EMAIL, EMAIL_2)
+    handler.create_follow(EMAIL_2, EMAIL)
+
+    only_user = {"min_user_id": user.id, "max_user_id": user.id}
+    future = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+
+    assert [row[0] for row in export(only_user)] == [user.id]
+    assert not export(dict(only_user, since=future))
+
+    remove_test_user_from_db()
+    remove_test_user_from_db(EMAIL_2)
+
+
+def test_export_with_an_inverted_range_raises_error():
+    """
+    This function tests that min_user_id can't be bigger than max_user_id.
+    """
+    with pytest.raises(InvalidExportFilter):
+        handler.stream_following_relations({"min_user_id": 5, "max_user_id": 4})
+
+
+def test_json_export_is_a_list_of_relations():
+    """
+    This function tests the json format is one array across the batches.
+    """
+    batches = [[(1, 2, CREATED_AT)], [], [(1, 3, CREATED_AT)]]
+
+    body = b"".join(encode_batches(batches, FIELDS, "json"))
+
+    assert json.loads(body) == [
+        {"user_id": 1, "following_id": 2, "created_at": "2023-11-05T10:30:00"},
+        {"user_id": 1, "following_id": 3, "created_at": "2023-11-05T10:30:00"},
+    ]
+
+
+def test_ndjson_and_csv_exports_have_one_line_per_relation():
+    """
+    This function tests the ndjson and csv formats.
+    """
+    batches = [[(1, 2, CREATED_AT), (1, 3, CREATED_AT)], [(4, 1, CREATED_AT)]]
+
+    ndjson = b"".join(encode_batches(batches, FIELDS, "ndjson")).decode()
+    lines = [json.loads(line) for line in ndjson.splitlines()]
+    rows = list(
+        csv.reader(
+            io.StringIO(b"".join(encode_batches(batches, FIELDS, "csv")).decode())
+        )
+    )
+
+    assert [line["following_id"] for line in lines] == [2, 3, 1]
+    assert rows[0] == list(FIELDS)
+    assert rows[3] == ["4", "1", "2023-11-05T10:30:00"]
+
+
+def test_empty_exports_are_still_valid():
+    """
+    This function tests an export without relations.
+    """
+    assert b"".join(encode_batches([], FIELDS, "json")) == b"[]"
+    assert (
+        b"".join(encode_batches([], FIELDS, "csv"))
+        == b"user_id,following_id,created_at\r\n"
+    )
+
+
+def test_unsupported_format_raises_error():
+    """
+    This function tests only json, ndjson and csv are supported.
+    """
+    with pytest.raises(ValueError):
+        encode_batches([], FIELDS, "xml")
@@ -0,0 +1,118 @@
+# graph_snapshot_tests.py
+"""
+This is a module for the tests of the binary graph snapshots and their
+changes.
+"""
+from datetime import datetime
+import pytest
+from service.graph_snapshot import GraphSnapshot, write, FULL, CHANGES
+from service.follow_graph import follow_graph
+from service.follow_handler import FollowHandler
+from service.user_handler import UserHandler
+from tests.utils import (
+    save_test_user_to_db,
+    remove_test_user_from_db,
+    EMAIL,
+    USERNAME,
+    EMAIL_2,
+    USERNAME_2,
+)
+
+EMAIL_3 = "test_email_3@gmail.com"
+USERNAME_3 = "test_username_3"
+
+# We create the handlers that will be used in all tests.
+# Since the handlers are stateless, we don't care if they're global.
+handler = FollowHandler()
+user_handler = UserHandler()
+
+# The gaps of the first user fit in 1, 2 and 4 bytes.
+USERS = [
+    [(1, "first", False, True), (3, "ñandú", True, False)],
+    [(70000, "third", False, False)],
+]
+FOLLOWING = [[(1, 3), (1, 70000)], [(3, 1), (3, 5), (3, 200), (70000, 1)]]
+
+
+def test_snapshot_keeps_users_and_relations(tmp_path):
+    """
+    This function tests that a snapshot gives back what was written.
+    """
+    path = str(tmp_path / "graph.snap")
+    taken_at = datetime(2026, 10, 19, 18, 0, 0, 123456)
+    stats = write(path, USERS, FOLLOWING, taken_at=taken_at)
+    assert stats["users"] == 3
+    assert stats["edges"] == 6
+
+    with GraphSnapshot(path) as snapshot:
+        assert snapshot.kind == FULL
+        assert snapshot.taken_at == taken_at
+        assert list(snapshot.users()) == [user for batch in USERS for user in batch]
+        assert list(snapshot.following(1)) == [3, 70000]
+        assert list(snapshot.following(3)) == [1, 5, 200]
+        assert not snapshot.removed
+        assert [row for batch in snapshot.rows(2) for row in batch] == [
+            row for batch in FOLLOWING for row in batch
+        ]
+        with pytest.raises(KeyError):
+            snapshot.following(2)
+
+
+def test_snapshot_rejects_bad_files_and_relations(tmp_path):
+    """
+    This function tests the files that are not snapshots and the
+    relations of users that are not in it.
+    """
+    path = tmp_path / "graph.snap"
+    path.write_bytes(b"not a snapshot")
+    with pytest.raises(ValueError):
+        GraphSnapshot(str(path))
+    with pytest.raises(ValueError):
+        write(str(path), USERS, [[(2, 1)]])
+
+
+def create_users():
+    """
+    The first user follows the second and the third one.
+    Returns their ids.
+    """
+    for email, username in ((EMAIL, USERNAME), (EMAIL_2, USERNAME_2)):
+        save_test_user_to_db(email, username)
+    save_test_user_to_db(EMAIL_3, USERNAME_3)
+    handler.create_follow(EMAIL, EMAIL_2)
+    handler.create_follow(EMAIL, EMAIL_3)
+    return [
+        user_handler.get_user_email(email).id for email in (EMAIL, EMAIL_2, EMAIL_3)
+    ]
+
+
+def test_changes_since_a_snapshot_and_warm_start(tmp_path):
+    """
+    This function tests a snapshot of the database, the changes since it
+    was taken and loading follow_graph from it.
+    """
+    user, user_2, user_3 = create_users()
+    path, changes_path = str(tmp_path / "graph.snap"), str(tmp_path / "changes.snap")
+    taken_at = handler.write_graph_snapshot(path)["taken_at"]
+    with GraphSnapshot(path) as snapshot:
+        assert list(snapshot.following(user)) == sorted([user_2, user_3])
+
+    handler.create_follow(EMAIL_2, EMAIL)
+    handler.remove_follow(EMAIL, EMAIL_2)
+    remove_test_user_from_db(EMAIL_3)
+
+    handler.write_graph_snapshot(changes_path, taken_at)
+    with GraphSnapshot(changes_path) as changes:
+        assert changes.kind == CHANGES
+        assert user_3 in changes.removed
+        assert not changes.following(user)
+        assert list(changes.following(user_2)) == [user]
+
+    handler.load_follow_graph(path)
+    assert not follow_graph.following(user)
+    assert list(follow_graph.following(user_2)) == [user]
+    assert follow_graph.followers_count(user_3) == 0
+
+    follow_graph.clear()
+    remove_test_user_from_db(EMAIL)
+    remove_test_user_from_db(EMAIL_2)
@@ -0,0 +1,88 @@
+# interest_catalog_tests.py
+"""
+This is a module for the tests of the interest catalog: the popular
+interests, their autocomplete and how many users have each one.
+"""
+import pytest
+from service.user_handler import UserHandler, MAX_AMMOUNT
+from service.errors import MaxAmmountExceeded
+from tests.utils import (
+    save_test_user_to_db,
+    remove_test_user_from_db,
+    EMAIL,
+    USERNAME,
+    EMAIL_2,
+    USERNAME_2,
+)
+
+# We create the handler that will be used in all tests.
+# Since the handler is stateless, we don't care if it's global.
+handler = UserHandler()
+
+# Names no other test uses, so the counts are only the ones of these tests.
+PREFIX = "Catalogtest"
+
+
+def users_of(prefix=PREFIX):
+    """
+    Returns a dict from the name of the interests that start with the
+    prefix to how many users have them.
+    """
+    return {
+        interest["name"]: interest["users"]
+        for interest in handler.get_popular_interests(prefix, MAX_AMMOUNT)
+    }
+
+
+def test_counts_follow_the_changes_of_interests():
+    """
+    This function tests that the counts go up and down when the users set
+    their interests or are removed, without recounting.
+    """
+    save_test_user_to_db(EMAIL, USERNAME)
+    save_test_user_to_db(EMAIL_2, USERNAME_2)
+
+    handler.set_user_interests(EMAIL, f"{PREFIX}Cars,{PREFIX}Music,{PREFIX}Cars")
+    handler.set_user_interests(EMAIL_2, f"{PREFIX}Music")
+    assert users_of() == {f"{PREFIX}Music": 2, f"{PREFIX}Cars": 1}
+    assert sorted(handler.get_user_interests(EMAIL)) == [
+        f"{PREFIX}Cars",
+        f"{PREFIX}Music",
+    ]
+
+    handler.set_user_interests(EMAIL, f"{PREFIX}Cars")
+    assert users_of() == {f"{PREFIX}Music": 1, f"{PREFIX}Cars": 1}
+
+    remove_test_user_from_db(EMAIL_2)
+    assert users_of() == {f"{PREFIX}Cars": 1}
+
+    remove_test_user_from_db(EMAIL)
+    assert not users_of()
+
+
+def test_autocomplete_ignores_case_and_ranks_by_popularity():
+    """
+    This function tests the prefix of the autocomplete and the order.
+    """
+    save_test_user_to_db(EMAIL, USERNAME)
+    save_test_user_to_db(EMAIL_2, USERNAME_2)
+    handler.set_user_interests(EMAIL, f"{PREFIX}Bikes,{PREFIX}Boats")
+    handler.set_user_interests(EMAIL_2, f"{PREFIX}Boats,{PREFIX}_x")
+
+    names = [
+        interest["name"]
+        for interest in handler.get_popular_interests(PREFIX.lower() + "b", 10)
+    ]
+    assert names == [f"{PREFIX}Boats", f"{PREFIX}Bikes"]
+    assert list(users_of(PREFIX + "_")) == [f"{PREFIX}_x"]
+
+    remove_test_user_from_db(EMAIL)
+    remove_test_user_from_db(EMAIL_2)
+
+
+def test_too_many_interests_raises_exception():
+    """
+    This function tests that asking for too many interests raises an exception.
+    """
+    with pytest.raises(MaxAmmountExceeded):
+        handler.get_popular_interests(None, MAX_AMMOUNT + 1)
@@ -0,0 +1,122 @@
+# interest_suggestion_tests.py
+"""
+This is a module for the tests of the suggestions by interests and the
+in-process interest index.
+"""
+from service.interest_index import InterestIndex, interest_index
+from service.suggestion_handler import SuggestionHandler
+from service.user_handler import UserHandler
+from service.follow_handler import FollowHandler
+from tests.utils import (
+    save_test_user_to_db,
+    remove_test_user_from_db,
+    EMAIL,
+    USERNAME,
+    EMAIL_2,
+    USERNAME_2,
+)
+
+EMAIL_3 = "test_email_3@gmail.com"
+USERNAME_3 = "test_username_3"
+
+# We create the handlers that will be used in all tests.
+# Since the handlers are stateless, we don't care if they're global.
+handler = SuggestionHandler()
+user_handler = UserHandler()
+follow_handler = FollowHandler()
+
+ROWS = [(1, "cars"), (1, "music"), (2, "music"), (3, "cars"), (3, "music"), (9, "art")]
+
+
+def build(dense_ratio=256):
+    """
+    Returns an index loaded with ROWS, in batches of two rows.
+    """
+    index = InterestIndex(dense_ratio)
+    index.load(ROWS[start : start + 2] for start in range(0, len(ROWS), 2))
+    return index
+
+
+def test_index_ranks_by_shared_interests_then_id():
+    """
+    This function tests the order of the candidates, with the interests
+    stored as arrays and as bitmaps.
+    """
+    for dense_ratio in (1, 256):
+        index = build(dense_ratio)
+
+        assert list(index.ranked(["cars", "music"], 1)) == [(3, 2), (2, 1)]
+        assert list(index.ranked(["cars", "music"], 1, {3})) == [(2, 1)]
+        assert not list(index.ranked(["unknown"], 1))
+
+
+def test_index_is_updated_when_the_interests_change():
+    """
+    This function tests that the changes of interests and the removed users
+    are applied to the index.
+    """
+    index = build(dense_ratio=4)
+
+    index.set_interests(2, ["music"], ["cars", "music", "art"])
+    index.remove_user(3, ["cars", "music"])
+
+    assert list(index.ranked(["cars", "music"], 1)) == [(2, 2)]
+    assert index.users("art") == 2
+    assert index.users("cars") == 2
+
+
+def create_users():
+    """
+    The first user likes cars and music, the second one music and the
+    third one cars and music. The first one follows the third one.
+    """
+    for email, username, interests in (
+        (EMAIL, USERNAME, "cars,music"),
+        (EMAIL_2, USERNAME_2, "music"),
+        (EMAIL_3, USERNAME_3, "cars,music"),
+    ):
+        save_test_user_to_db(email, username)
+        user_handler.set_user_interests(email, interests)
+    follow_handler.create_follow(EMAIL, EMAIL_3)
+    return [
+        user_handler.get_user_email(email).id for email in (EMAIL, EMAIL_2, EMAIL_3)
+    ]
+
+
+def remove_users():
+    """
+    Removes the users of the tests and drops the global index.
+    """
+    for email in (EMAIL, EMAIL_2, EMAIL_3):
+        remove_test_user_from_db(email)
+    interest_index.clear()
+
+
+def suggestions(user_id, **options):
+    """
+    Returns the suggestions by interests as a list of (id, shared).
+    """
+    options = {"ammount": 10, **options}
+    users, shared = handler.get_interest_suggestions(user_id, options)
+    return [(user.id, shared[user.id]) for user in users]
+
+
+def test_suggestions_by_interests_from_the_database_and_the_index():
+    """
+    This function tests that both ways give the same suggestions, with and
+    without the filters.
+    """
+    user, user_2, user_3 = create_users()
+    user_handler.change_public_status(EMAIL_3, False)
+
+    for load in (False, True):
+        if load:
+            handler.load_interest_index()
+        assert suggestions(user) == [(user_3, 2), (user_2, 1)]
+        assert suggestions(user, not_followed=True) == [(user_2, 1)]
+        assert suggestions(user, public_only=True) == [(user_2, 1)]
+
+    user_handler.set_user_interests(EMAIL_2, "cars,music")
+    assert suggestions(user, not_followed=True) == [(user_2, 2)]
+
+    remove_users()
@@ -0,0 +1,79 @@
+# logger_tests.py
+
+"""
+This is the test module for the queue based structured logger.
+"""
+import io
+import json
+import logging
+from control.utils.logger import (
+    configure_logger,
+    request_id_var,
+    SamplingFilter,
+)
+
+
+def create_settings(name, level_rates=None):
+    """
+    This function creates the settings for a test logger.
+    """
+    return {
+        "name": name,
+        "level": "INFO",
+        "format": "json",
+        "level_rates": level_rates or {},
+        "route_rates": {},
+    }
+
+
+def read_records(stream):
+    """
+    This function parses the JSON lines written to the stream.
+    """
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_records_are_written_as_json_with_the_request_id():
+    """
+    This function tests that the listener writes JSON with the request id
+    of the context that logged the record.
+    """
+    stream = io.StringIO()
+    test_logger, listener = configure_logger(create_settings("test-json"), stream)
+
+    token = request_id_var.set("request-1")
+    test_logger.info("User %s logged in", "real_email@gmail.com")
+    request_id_var.reset(token)
+    listener.stop()
+
+    records = read_records(stream)
+    assert len(records) == 1
+    assert records[0]["message"] == "User real_email@gmail.com logged in"
+    assert records[0]["level"] == "INFO"
+    assert records[0]["request_id"] == "request-1"
+
+
+def test_info_records_can_be_sampled_out():
+    """
+    This function tests that with a rate of 0 the INFO records are dropped
+    but the errors are still written.
+    """
+    stream = io.StringIO()
+    settings = create_settings("test-sampled", level_rates={"INFO": 0})
+    test_logger, listener = configure_logger(settings, stream)
+
+    test_logger.info("This is dropped")
+    test_logger.error("This is kept")
+    listener.stop()
+
+    records = read_records(stream)
+    assert [record["message"] for record in records] == ["This is kept"]
+
+
+def test_sampling_filter_keeps_everything_by_default():
+    """
+    This function tests that without rates every record is kept.
+    """
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, "msg", (), None)
+
+    assert SamplingFilter().filter(record)
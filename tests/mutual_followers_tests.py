@@ -0,0 +1,131 @@
+# mutual_followers_tests.py
+"""
+This is a module for the tests of the users someone follows that follow
+another user ("followed by X, Y and 12 others you follow").
+"""
+import pytest
+from service.admin_handler import AdminHandler
+from service import follow_handler
+from service.follow_handler import FollowHandler
+from service.follow_graph import follow_graph
+from service.user_handler import UserHandler, MAX_AMMOUNT
+from service.errors import MaxAmmountExceeded, UserNotFound
+from tests.utils import (
+    save_test_user_to_db,
+    remove_test_user_from_db,
+    EMAIL,
+    USERNAME,
+    EMAIL_2,
+    USERNAME_2,
+)
+
+EMAIL_3 = "test_email_3@gmail.com"
+USERNAME_3 = "test_username_3"
+EMAIL_4 = "test_email_4@gmail.com"
+USERNAME_4 = "test_username_4"
+USERS = list(
+    zip(
+        (EMAIL, EMAIL_2, EMAIL_3, EMAIL_4),
+        (USERNAME, USERNAME_2, USERNAME_3, USERNAME_4),
+    )
+)
+
+# We create the handlers that will be used in all tests.
+# Since the handlers are stateless, we don't care if they're global.
+handler = FollowHandler()
+user_handler = UserHandler()
+
+
+def create_users():
+    """
+    The first user follows the second and the third one, and both of them
+    follow the fourth one. Returns the id of the first one.
+    """
+    for email, username in USERS:
+        save_test_user_to_db(email, username)
+    handler.create_follow(EMAIL, EMAIL_2)
+    handler.create_follow(EMAIL, EMAIL_3)
+    handler.create_follow(EMAIL_2, EMAIL_4)
+    handler.create_follow(EMAIL_3, EMAIL_4)
+    return user_handler.get_user_email(EMAIL).id
+
+
+def remove_users():
+    """
+    Removes the users of the tests and drops the global graph.
+    """
+    for email, _ in USERS:
+        remove_test_user_from_db(email)
+    follow_graph.clear()
+
+
+def test_mutual_followers_from_the_database_and_the_graph():
+    """
+    This function tests that both ways give the same count and users.
+    """
+    user_id = create_users()
+
+    for load in (False, True):
+        if load:
+            handler.load_follow_graph()
+        users, count, capped = handler.get_mutual_followers(user_id, EMAIL_4, 1)
+        assert [user.email for user in users] == [EMAIL_2]
+        assert count == 2
+        assert not capped
+        users, count, _ = handler.get_mutual_followers(user_id, EMAIL_2, 3)
+        assert not users
+        assert count == 0
+
+    handler.remove_follow(EMAIL_3, EMAIL_4)
+    users, count, _ = handler.get_mutual_followers(user_id, EMAIL_4, 3)
+    assert [user.email for user in users] == [EMAIL_2]
+    assert count == 1
+
+    remove_users()
+
+
+def test_blocked_mutual_followers_are_not_counted():
+    """
+    This function tests that the count leaves out the blocked users, like
+    the users that are returned, both from the database and the graph.
+    """
+    user_id = create_users()
+    AdminHandler().change_blocked_status(EMAIL_2, True)
+
+    for load in (False, True):
+        if load:
+            handler.load_follow_graph()
+        users, count, _ = handler.get_mutual_followers(user_id, EMAIL_4, 3)
+        assert [user.email for user in users] == [EMAIL_3]
+        assert count == 1
+
+    remove_users()
+
+
+def test_mutual_followers_are_capped_the_same_way_by_both(monkeypatch):
+    """
+    This function tests that with the cap both ways look at the same
+    users (the ones with the lowest ids), not the ones followed last.
+    """
+    user_id = create_users()
+    monkeypatch.setattr(follow_handler, "MAX_MUTUAL_FOLLOWEES", 1)
+
+    for load in (False, True):
+        if load:
+            handler.load_follow_graph()
+        users, count, capped = handler.get_mutual_followers(user_id, EMAIL_4, 3)
+        assert [user.email for user in users] == [EMAIL_2]
+        assert count == 1
+        assert capped
+
+    remove_users()
+
+
+def test_mutual_followers_of_an_unknown_user_or_too_many_raise_exceptions():
+    """
+    This function tests the exceptions of the mutual followers.
+    """
+    with pytest.raises(UserNotFound):
+        handler.get_mutual_followers(1, "not_an_user@gmail.com", 3)
+    with pytest.raises(MaxAmmountExceeded):
+        handler.get_mutual_followers(1, EMAIL, MAX_AMMOUNT + 1)
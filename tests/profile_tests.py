@@ -0,0 +1,105 @@
+# profile_tests.py
+"""
+This is a module for all the tests that are related to the profiles.
+"""
+import pytest
+
+from service.user_handler import UserHandler
+from service.follow_handler import FollowHandler
+from service.errors import UserNotFound
+from tests.utils import (
+    save_test_user_to_db,
+    remove_test_user_from_db,
+    EMAIL,
+    USERNAME,
+    EMAIL_2,
+    USERNAME_2,
+)
+
+
+# We create the handlers that will be used in all tests.
+# Since the handlers are stateless, we don't care if they're global.
+handler = UserHandler()
+follow_handler = FollowHandler()
+
+
+def test_profile_has_the_users_fields():
+    """
+    This function tests that the profile has the fields of the user.
+    """
+    save_test_user_to_db()
+    user = handler.get_user_email(EMAIL)
+
+    profile = handler.get_profile(USERNAME, user.id)
+
+    assert profile["email"] == EMAIL
+    assert profile["username"] == USERNAME
+    assert profile["last_name"] == "Real_surname"
+    assert profile["interests"] == []
+    assert "password" not in profile
+
+    remove_test_user_from_db()
+
+
+def test_profile_has_the_counts_and_the_relation():
+    """
+    This function tests the counts of followers and following and the
+    relation with the viewer.
+    """
+    save_test_user_to_db()
+    save_test_user_to_db(EMAIL_2, USERNAME_2)
+    follow_handler.create_follow(EMAIL_2, EMAIL)
+    viewer = handler.get_user_email(EMAIL_2)
+
+    profile = handler.get_profile(USERNAME, viewer.id)
+
+    assert profile["followers_count"] == 1
+    assert profile["following_count"] == 0
+    assert profile["following"] is True
+    assert profile["followed_by"] is False
+
+    remove_test_user_from_db()
+    remove_test_user_from_db(EMAIL_2)
+
+
+def test_profile_has_the_interests():
+    """
+    This function tests that the profile has the interests of the user.
+    """
+    save_test_user_to_db()
+    handler.set_user_interests(EMAIL, "Cooking,Cars")
+    user = handler.get_user_email(EMAIL)
+
+    profile = handler.get_profile(USERNAME, user.id)
+
+    assert sorted(profile["interests"]) == ["Cars", "Cooking"]
+
+    remove_test_user_from_db()
+
+
+def test_profile_with_its_interests_and_versions_takes_one_statement(max_queries):
+    """
+    This function tests that the profile, its interests and the versions
+    its ETag needs are read with a single statement.
+    """
+    save_test_user_to_db()
+    handler.set_user_interests(EMAIL, "Cooking")
+    user = handler.get_user_email(EMAIL)
+
+    with max_queries(1):
+        profile = handler.get_profile(USERNAME, user.id)
+
+    assert profile["interests"] == ["Cooking"]
+    assert profile["version"] == user.version
+    assert profile["follow_version"] == user.follow_version
+
+    remove_test_user_from_db()
+
+
+def test_profile_of_user_that_doesnt_exist_raises_exception():
+    """
+    This function tests that asking for a profile that doesn't exist
+    raises an exception.
+    """
+    with pytest.raises(UserNotFound):
+        handler.get_profile("not_a_username", 1)
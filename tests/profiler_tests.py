@@ -0,0 +1,102 @@
+# profiler_tests.py
+"""
+This is a module for the tests of the profiles of requests and the
+always-on sampling profiler.
+"""
+import threading
+import time
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from control.utils.logger import REQUEST_ID_HEADER, add_request_context_middleware
+from control.utils.profiler import (
+    ProfileStore,
+    SamplingProfiler,
+    add_profiler_middleware,
+    PROFILE_HEADER,
+    PROFILE_ID_HEADER,
+)
+
+ADMIN_TOKEN = "admin token"
+
+
+def spin(seconds):
+    """
+    Keeps the CPU busy for seconds, so it's in the samples.
+    """
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+# How spin shows up in the stacks.
+SPIN = f"spin (profiler_tests.py:{spin.__code__.co_firstlineno})"
+
+
+def names(profile):
+    """
+    Returns the names of the functions of a profile.
+    """
+    return [function["function"].split(" ")[0] for function in profile.functions(50)]
+
+
+def test_hot_stacks_are_counted_by_window():
+    """
+    This function tests that the busy threads are sampled, the idle ones
+    are not and only the last windows are kept.
+    """
+    profiler = SamplingProfiler(10, window=0, windows=2)
+    busy = threading.Thread(target=spin, args=(0.3,))
+    idle = threading.Event()
+    waiting = threading.Thread(target=idle.wait)
+    busy.start()
+    waiting.start()
+    for _ in range(3):
+        profiler.sample()
+        time.sleep(0.01)
+    busy.join()
+    idle.set()
+    waiting.join()
+
+    profile = profiler.hot(3600)
+    # Only the last two windows are kept.
+    assert {"function": SPIN, "samples": 2, "self": 2} in profile.functions(50)
+    assert "wait" not in names(profile)
+    assert SPIN + " 2\n" in profile.folded()
+    assert profiler.sampling_seconds > 0
+    assert not SamplingProfiler().enabled
+
+
+def test_requests_of_admins_are_profiled():
+    """
+    This function tests that only the requests of admins that ask for it
+    are profiled, and that their profiles are kept.
+    """
+    store = ProfileStore(size=1)
+    app = FastAPI()
+    add_profiler_middleware(app, lambda token: token == ADMIN_TOKEN, store)
+    add_request_context_middleware(app)
+
+    @app.get("/busy")
+    def busy():
+        spin(0.05)
+        return {}
+
+    client = TestClient(app)
+    response = client.get("/busy", headers={"token": ADMIN_TOKEN})
+    assert PROFILE_ID_HEADER not in response.headers
+    response = client.get("/busy?profile=1", headers={"token": "user token"})
+    assert PROFILE_ID_HEADER not in response.headers
+
+    headers = {"token": ADMIN_TOKEN, PROFILE_HEADER: "1", REQUEST_ID_HEADER: "first"}
+    response = client.get("/busy", headers=headers)
+    assert response.headers[PROFILE_ID_HEADER] == "first"
+    entry = store.get("first")
+    assert entry["route"] == "GET /busy"
+    assert entry["ms"] >= 50
+    assert "spin" in names(entry["profile"])
+
+    response = client.get("/busy?profile=true", headers={"token": ADMIN_TOKEN})
+    assert store.get("first") is None
+    assert [summary["id"] for summary in store.summaries()] == [
+        response.headers[PROFILE_ID_HEADER]
+    ]
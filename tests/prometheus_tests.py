@@ -0,0 +1,147 @@
+# prometheus_tests.py
+
+"""
+This is the test module for the in-process metrics registry, and for
+how it's hooked into the app and the database engine.
+"""
+import re
+import threading
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from control.routers import monitoring
+from control.utils.instrumentation import add_metrics_middleware, instrument_engine
+from control.utils.prometheus import Registry
+from repository.user_repository import engine, manual_rollback
+from service.errors import UserNotFound
+from service.user_handler import UserHandler
+
+THREADS = 8
+OBSERVATIONS = 1000
+
+
+def test_counter_adds_the_increments_of_every_thread():
+    """
+    This function tests that a counter sums the shards of all the threads.
+    """
+    registry = Registry()
+    counter = registry.counter("test_total", "A test counter.")
+
+    def work():
+        for _ in range(OBSERVATIONS):
+            counter.inc()
+
+    threads = [threading.Thread(target=work) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert f"test_total {THREADS * OBSERVATIONS}" in registry.render()
+
+
+def test_histogram_buckets_are_cumulative():
+    """
+    This function tests that the histogram renders cumulative buckets,
+    the count and the sum of the observations.
+    """
+    registry = Registry()
+    histogram = registry.histogram(
+        "test_seconds", "A test histogram.", ("route",), buckets=(0.1, 1.0)
+    )
+
+    histogram.labels("/users").observe(0.05)
+    histogram.labels("/users").observe(0.5)
+    histogram.labels("/users").observe(5)
+
+    text = registry.render()
+
+    assert 'test_seconds_bucket{route="/users",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{route="/users",le="1"} 2' in text
+    assert 'test_seconds_bucket{route="/users",le="+Inf"} 3' in text
+    assert 'test_seconds_count{route="/users"} 3' in text
+    assert 'test_seconds_sum{route="/users"} 5.55' in text
+
+
+def test_gauge_callback_is_called_on_render():
+    """
+    This function tests that gauges with a callback are read when rendering.
+    """
+    registry = Registry()
+    registry.gauge(
+        "test_pool", "A test gauge.", ("state",), callback=lambda: [(("idle",), 4)]
+    )
+
+    assert 'test_pool{state="idle"} 4' in registry.render()
+
+
+def test_label_values_are_escaped():
+    """
+    This function tests that quotes in the label values don't break the format.
+    """
+    registry = Registry()
+    counter = registry.counter("test_escape_total", "A test counter.", ("route",))
+
+    counter.labels('/a"b').inc()
+
+    assert 'test_escape_total{route="/a\\"b"} 1' in registry.render()
+
+
+def test_metric_cant_be_registered_twice():
+    """
+    This function tests that registering two metrics with the same name fails.
+    """
+    registry = Registry()
+    registry.counter("test_total", "A test counter.")
+
+    with pytest.raises(ValueError):
+        registry.counter("test_total", "A test counter.")
+
+
+def test_wrong_ammount_of_labels_fails():
+    """
+    This function tests that using a different number of labels fails.
+    """
+    registry = Registry()
+    counter = registry.counter("test_total", "A test counter.", ("a", "b"))
+
+    with pytest.raises(ValueError):
+        counter.labels("only_one")
+
+
+def test_requests_and_statements_are_scraped(monkeypatch):
+    """
+    This function tests that a request is recorded by its route template,
+    its statements by repository function and the connections checked out
+    of the pool, and that /metrics renders them.
+    """
+    app = FastAPI()
+    add_metrics_middleware(app)
+    app.include_router(monitoring.router)
+    handler = UserHandler()
+
+    @app.get("/scraped/{email}")
+    def lookup(email):
+        try:
+            handler.get_user_email(email)
+        except UserNotFound:
+            pass
+        return {}
+
+    # The wrapper of pool.connect is taken out after the test.
+    monkeypatch.setattr(engine.pool, "connect", engine.pool.connect)
+    instrument_engine(engine)
+    # So the request checks out a connection of the pool.
+    manual_rollback()
+    client = TestClient(app)
+    assert client.get("/scraped/nobody@gmail.com").status_code == 200
+
+    text = client.get("/metrics").text
+    assert (
+        'http_request_duration_seconds_count{method="GET",'
+        'route="/scraped/{email}",status="200"} 1'
+    ) in text
+    assert 'db_queries_total{function="get_user_email"}' in text
+    checkouts = re.search(r"^db_pool_checkout_seconds_count (\S+)$", text, re.M)
+    assert float(checkouts.group(1)) >= 1
+    assert 'db_pool_connections{state="size"}' in text
@@ -0,0 +1,92 @@
+# query_stats_tests.py
+"""
+This is a module for the tests of the statements counted by request and
+the probable N+1.
+"""
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from control.utils.query_stats import (
+    QueryStats,
+    add_query_stats_middleware,
+    QUERIES_HEADER,
+    N_PLUS_ONE_HEADER,
+)
+from service.errors import UserNotFound
+from service.follow_handler import FollowHandler
+from service.user_handler import UserHandler
+from tests.utils import (
+    save_test_user_to_db,
+    remove_test_user_from_db,
+    EMAIL,
+    USERNAME,
+    EMAIL_2,
+    USERNAME_2,
+)
+
+# We create the handlers that will be used in all tests.
+# Since the handlers are stateless, we don't care if they're global.
+handler = UserHandler()
+follow_handler = FollowHandler()
+
+EMAILS = [f"nobody_{number}@gmail.com" for number in range(5)]
+
+
+def test_statements_with_many_parameters_are_flagged():
+    """
+    This function tests that a statement is a probable N+1 when it runs
+    with threshold different parameters, and that executemany counts once.
+    """
+    stats = QueryStats()
+    for user_id in (1, 2, 3, 3):
+        stats.record("SELECT * FROM users WHERE id = %(id)s", {"id": user_id}, 0.001)
+    stats.record(
+        "INSERT INTO users VALUES (%(id)s)", [{"id": 1}, {"id": 2}], 0.01, True
+    )
+
+    assert stats.count == 5
+    assert round(stats.seconds, 3) == 0.014
+    assert stats.repeated(3) == [("SELECT * FROM users WHERE id = %(id)s", 3)]
+    assert not stats.repeated(4)
+    assert "3x SELECT" in stats.describe()
+
+
+def test_followers_take_two_statements(max_queries):
+    """
+    This function tests the fixture with a handler: the followers are the
+    lookup of the user and a single query, not one per follower.
+    """
+    save_test_user_to_db(EMAIL, USERNAME)
+    save_test_user_to_db(EMAIL_2, USERNAME_2)
+    follow_handler.create_follow(EMAIL_2, EMAIL)
+
+    with max_queries(2) as queries:
+        followers = follow_handler.get_all_followers(EMAIL)
+    assert [follower.username for follower in followers] == [USERNAME_2]
+    assert not queries.repeated()
+
+    remove_test_user_from_db(EMAIL)
+    remove_test_user_from_db(EMAIL_2)
+
+
+def test_routes_report_their_statements(max_queries):
+    """
+    This function tests the headers of the middleware, with a route that
+    looks up users one by one.
+    """
+    app = FastAPI()
+    add_query_stats_middleware(app, headers=True)
+
+    @app.get("/lookups")
+    def lookups():
+        for email in EMAILS:
+            try:
+                handler.get_auth_user(email)
+            except UserNotFound:
+                pass
+        return {}
+
+    with max_queries(len(EMAILS)) as queries:
+        response = TestClient(app).get("/lookups")
+    assert response.headers[QUERIES_HEADER] == str(len(EMAILS))
+    assert response.headers[N_PLUS_ONE_HEADER] == "1"
+    assert len(queries.repeated()) == 1
@@ -0,0 +1,103 @@
+# ranked_search_tests.py
+"""
+This is a module for the tests of the search ranked by social distance.
+"""
+import pytest
+from service.follow_handler import FollowHandler
+from service.user_handler import UserHandler, MAX_AMMOUNT
+from service.errors import MaxAmmountExceeded
+from tests.utils import (
+    save_test_user_to_db,
+    remove_test_user_from_db,
+    EMAIL,
+    EMAIL_2,
+    USERNAME_2,
+)
+
+# Every user but the first one is test_username_<n>.
+OTHERS = [(EMAIL_2, USERNAME_2)] + [
+    (f"test_email_{n}@gmail.com", f"test_username_{n}") for n in (3, 4, 5)
+]
+
+# We create the handlers that will be used in all tests.
+# Since the handlers are stateless, we don't care if they're global.
+handler = UserHandler()
+follow_handler = FollowHandler()
+
+
+def create_users():
+    """
+    The first user follows the second one, the third one follows the first
+    one, the second one follows the fourth one and nobody follows the
+    fifth one. Returns their ids.
+    """
+    save_test_user_to_db()
+    for email, username in OTHERS:
+        save_test_user_to_db(email, username)
+    emails = [EMAIL] + [email for email, _ in OTHERS]
+    follow_handler.create_follow(EMAIL, emails[1])
+    follow_handler.create_follow(emails[2], EMAIL)
+    follow_handler.create_follow(emails[1], emails[3])
+    return [handler.get_user_email(email).id for email in emails]
+
+
+def remove_users():
+    """
+    Removes the users of the tests.
+    """
+    remove_test_user_from_db()
+    for email, _ in OTHERS:
+        remove_test_user_from_db(email)
+
+
+def search(query, user_id, ammount, cursor=None):
+    """
+    Returns the ids of a page of the ranked search and the next cursor.
+    """
+    options = {"user_id": user_id, "cursor": cursor, "ammount": ammount}
+    users, next_cursor = handler.search_users_by_distance(query, options)
+    return [user.id for user in users], next_cursor
+
+
+def test_ranked_search_orders_by_distance_then_relevance():
+    """
+    This function tests that the followees go first, then the followers,
+    then the two-hop users and then everyone else, and that on each group
+    the usernames that start with the query go before the other matches.
+    """
+    user, followee, follower, two_hop, other = create_users()
+
+    # "real" is the start of the first username and part of every name.
+    ids, next_cursor = search("real", user, MAX_AMMOUNT)
+    assert ids == [followee, follower, two_hop, user, other]
+    assert next_cursor is None
+    # Nobody is close to the fifth user, so only the relevance counts.
+    ids, _ = search("real", other, MAX_AMMOUNT)
+    assert ids == [user] + sorted([followee, follower, two_hop, other])
+
+    remove_users()
+
+
+def test_ranked_search_pages_with_the_cursor():
+    """
+    This function tests that following the cursors gives every user once,
+    in the same order as one page.
+    """
+    user = create_users()[0]
+    everyone, _ = search("test_username", user, MAX_AMMOUNT)
+
+    pages, cursor = [], None
+    while True:
+        page, cursor = search("test_username", user, 2, cursor)
+        pages.extend(page)
+        if cursor is None:
+            break
+    assert pages == everyone
+    assert len(everyone) == len(OTHERS)
+
+    with pytest.raises(ValueError):
+        search("test_username", user, 2, "not a cursor")
+    with pytest.raises(MaxAmmountExceeded):
+        search("test_username", user, MAX_AMMOUNT + 1)
+
+    remove_users()
@@ -0,0 +1,121 @@
+# read_models_tests.py
+"""
+This is a module for the tests of the read models: the reads of lists,
+searches and authorization must never load the password.
+"""
+import pytest
+from service.user_handler import UserHandler
+from service.follow_handler import FollowHandler
+from service.errors import UserNotFound
+from repository.read_models import AuthUser, UserCredentials, UserSummary
+from tests.utils import (
+    save_test_user_to_db,
+    remove_test_user_from_db,
+    EMAIL,
+    USERNAME,
+    EMAIL_2,
+    USERNAME_2,
+)
+
+# We create the handlers that will be used in all tests.
+# Since the handlers are stateless, we don't care if they're global.
+handler = UserHandler()
+follow_handler = FollowHandler()
+
+
+def test_auth_user_has_no_password():
+    """
+    This function tests that authorizing a request doesn't load the password.
+    """
+    save_test_user_to_db()
+
+    user = handler.get_auth_user(EMAIL)
+
+    assert isinstance(user, AuthUser)
+    assert user.email == EMAIL
+    assert "password" not in user._fields
+
+    remove_test_user_from_db()
+
+
+def test_credentials_have_the_password():
+    """
+    This function tests that the login gets the hashed password.
+    """
+    save_test_user_to_db()
+
+    credentials = handler.get_user_credentials(EMAIL)
+
+    assert isinstance(credentials, UserCredentials)
+    assert credentials.password == handler.get_user_email(EMAIL).password
+
+    remove_test_user_from_db()
+
+
+def test_user_by_username_has_no_password():
+    """
+    This function tests that the user looked up by username (a route that
+    can be cached) doesn't load the password.
+    """
+    save_test_user_to_db()
+
+    user = handler.get_user_summary_username(USERNAME)
+
+    assert isinstance(user, UserSummary)
+    assert user.email == EMAIL
+    assert "password" not in user._fields
+    with pytest.raises(UserNotFound):
+        handler.get_user_summary_username("not_an_username")
+
+    remove_test_user_from_db()
+
+
+def test_search_returns_summaries():
+    """
+    This function tests that the search returns read models.
+    """
+    save_test_user_to_db()
+    options = {"start": 0, "ammount": 10, "in_followers": False, "email": None}
+
+    users = handler.search_for_users("Real", options)
+
+    assert users
+    assert all(isinstance(user, UserSummary) for user in users)
+
+    remove_test_user_from_db()
+
+
+def test_followers_are_summaries_in_a_single_query():
+    """
+    This function tests that the followers are read models.
+    """
+    save_test_user_to_db()
+    save_test_user_to_db(EMAIL_2, USERNAME_2)
+    follow_handler.create_follow(EMAIL_2, EMAIL)
+
+    followers = follow_handler.get_all_followers(EMAIL)
+
+    assert [follower.email for follower in followers] == [EMAIL_2]
+    assert isinstance(followers[0], UserSummary)
+
+    remove_test_user_from_db()
+    remove_test_user_from_db(EMAIL_2)
+
+
+def test_read_models_are_immutable():
+    """
+    This function tests that the read models can't be changed.
+    """
+    save_test_user_to_db()
+    user = handler.get_user_summary(EMAIL)
+
+    try:
+        user.bio = "New bio"
+        changed = True
+    except AttributeError:
+        changed = False
+
+    assert not changed
+    assert not hasattr(user, "__dict__")
+
+    remove_test_user_from_db()
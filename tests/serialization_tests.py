@@ -0,0 +1,94 @@
+# serialization_tests.py
+"""
+This is a module for the tests of the fast serialization of the users.
+The json must be the same the pydantic models produced.
+"""
+import datetime
+import json
+from control.models.models import UserResponse, UserPostResponse
+from control.utils.serialization import (
+    FastJSONResponse,
+    user_serializer,
+    user_with_id_serializer,
+)
+from repository.tables.users import User
+
+DATE_OF_BIRTH = datetime.datetime(2000, 1, 2)
+
+
+def create_row(user_id=7):
+    """
+    Returns a user like the ones that come from the database.
+    """
+    user = User(
+        username="Real_username",
+        surname="Real_surname",
+        name="Real_name",
+        password="Real_password123",
+        email="real_email@gmail.com",
+        date_of_birth=DATE_OF_BIRTH,
+    )
+    user.id = user_id
+    return user
+
+
+def test_user_dict_is_the_same_as_the_pydantic_model():
+    """
+    This function tests the fields of a user match the UserResponse model.
+    """
+    user = create_row()
+
+    data = user_serializer.to_dict(user)
+
+    assert data == dict(UserResponse(**data))
+    assert data["last_name"] == "Real_surname"
+    assert data["date_of_birth"] == str(DATE_OF_BIRTH)
+
+
+def test_user_with_id_dict_is_the_same_as_the_pydantic_model():
+    """
+    This function tests the fields of a user match the UserPostResponse model.
+    """
+    data = user_with_id_serializer.to_dict(create_row())
+
+    assert data == dict(UserPostResponse(**data))
+    assert data["id"] == 7
+
+
+def test_relations_are_embedded_by_id():
+    """
+    This function tests that the follow status is added to every user.
+    """
+    users = [create_row(1), create_row(2)]
+    relations = {
+        1: {"following": True, "followed_by": False},
+        2: {"following": False, "followed_by": True},
+    }
+
+    data = user_serializer.to_dicts(users, relations)
+
+    assert [user["following"] for user in data] == [True, False]
+    assert [user["followed_by"] for user in data] == [False, True]
+
+
+def test_users_removed_before_their_relations_are_left_out():
+    """
+    This function tests that the users without a follow status (missing,
+    or None since they were not found) are not in the response.
+    """
+    users = [create_row(1), create_row(2), create_row(3)]
+    relations = {1: {"following": True, "followed_by": False}, 2: None}
+
+    data = user_serializer.to_dicts(users, relations)
+
+    assert [user["following"] for user in data] == [True]
+
+
+def test_fast_response_is_valid_json_with_int_keys():
+    """
+    This function tests that the response encodes dicts with int keys.
+    """
+    response = FastJSONResponse({1: {"following": True}})
+
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == {"1": {"following": True}}
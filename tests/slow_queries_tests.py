@@ -0,0 +1,93 @@
+# slow_queries_tests.py
+"""
+This is a module for the tests of the slow query log.
+"""
+from types import SimpleNamespace
+from control.utils import instrumentation
+from control.utils.instrumentation import instrument_statements
+from control.utils.logger import request_scope_var
+from control.utils.slow_queries import (
+    SlowQueryLog,
+    parameter_shapes,
+    route_comment,
+)
+from repository.user_repository import engine
+from service.user_handler import UserHandler
+from tests.utils import save_test_user_to_db, remove_test_user_from_db, EMAIL
+
+# We create the handler that will be used in all tests.
+# Since the handler is stateless, we don't care if it's global.
+handler = UserHandler()
+
+
+def test_parameters_are_recorded_without_their_values():
+    """
+    This function tests the shapes of the parameters: their types and
+    lengths, summarized when there are many of them.
+    """
+    assert parameter_shapes({"email": "a@b.c", "ids": [1, 2], "bio": None}) == {
+        "email": "str",
+        "ids": "list[2]",
+        "bio": "null",
+    }
+    assert parameter_shapes(("a", 1)) == {"0": "str", "1": "int"}
+    assert parameter_shapes({f"id_{n}": n for n in range(30)}) == {
+        "count": 30,
+        "types": {"int": 30},
+    }
+    assert parameter_shapes([{"id": 1}, {"id": 2}], executemany=True) == {
+        "rows": 2,
+        "row": {"id": "int"},
+    }
+
+
+def test_routes_are_added_as_comments():
+    """
+    This function tests the comment of the route, escaped so it can't
+    close the comment.
+    """
+    assert route_comment() == ""
+    scope = {"method": "GET", "route": SimpleNamespace(path="/users/{email}%s*/'")}
+    token = request_scope_var.set(scope)
+    try:
+        assert route_comment() == " /*route='GET /users/{email}_s_/_'*/"
+    finally:
+        request_scope_var.reset(token)
+
+
+def test_slow_statements_are_kept_with_their_plans(monkeypatch):
+    """
+    This function tests that the statements are recorded with their
+    repository function and a plan, in a buffer of the last ones.
+    """
+    save_test_user_to_db()
+    log = SlowQueryLog(0, size=2)
+    log.start_explaining(engine)
+    instrument_statements(engine)
+    monkeypatch.setattr(instrumentation, "slow_query_log", log)
+
+    handler.get_user_email(EMAIL)
+    log.wait_for_plans()
+    (entry,) = log.entries()
+    assert entry["function"] == "get_user_email"
+    assert "email_1" in entry["parameters"]
+    assert EMAIL not in str(entry)
+    assert any("actual time" in line for line in entry["plan"])
+
+    for _ in range(2):
+        handler.get_user_email(EMAIL)
+    log.wait_for_plans()
+    entries = log.entries()
+    assert len(entries) == 2
+    # The same statement is explained once per interval.
+    assert [entry["plan"] for entry in entries] == [None, None]
+
+    plan = log.explain(
+        "UPDATE users SET bio = 'x' WHERE email = %(email)s", {"email": EMAIL}
+    )
+    assert not any("actual time" in line for line in plan)
+    assert handler.get_user_email(EMAIL).bio != "x"
+
+    log.clear()
+    assert not log.entries()
+    remove_test_user_from_db()
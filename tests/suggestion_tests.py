@@ -0,0 +1,161 @@
+# suggestion_tests.py
+"""
+This is a module for the tests of the follow suggestions and their cache.
+"""
+import pytest
+
+from service.follow_handler import FollowHandler
+from service.suggestion_handler import SuggestionHandler
+from service.suggestion_cache import SuggestionCache, suggestion_cache
+from service.admin_handler import AdminHandler
+from service.user_handler import MAX_AMMOUNT
+from service.errors import MaxAmmountExceeded
+from tests.utils import (
+    save_test_user_to_db,
+    remove_test_user_from_db,
+    EMAIL,
+    EMAIL_2,
+    USERNAME_2,
+)
+
+EMAIL_3 = "test_email_3@gmail.com"
+USERNAME_3 = "test_username_3"
+EMAIL_4 = "test_email_4@gmail.com"
+USERNAME_4 = "test_username_4"
+
+# We create the handlers that will be used in all tests.
+# Since the handlers are stateless, we don't care if they're global.
+handler = SuggestionHandler()
+follow_handler = FollowHandler()
+admin_handler = AdminHandler()
+
+
+def create_graph():
+    """
+    The user follows the second and third users, who both follow the
+    fourth one. The second one also follows the third one.
+    Returns the ids of the four users.
+    """
+    save_test_user_to_db()
+    save_test_user_to_db(EMAIL_2, USERNAME_2)
+    save_test_user_to_db(EMAIL_3, USERNAME_3)
+    save_test_user_to_db(EMAIL_4, USERNAME_4)
+    for follower, followed in (
+        (EMAIL, EMAIL_2),
+        (EMAIL, EMAIL_3),
+        (EMAIL_2, EMAIL_4),
+        (EMAIL_3, EMAIL_4),
+        (EMAIL_2, EMAIL_3),
+        (EMAIL_2, EMAIL),
+    ):
+        follow_handler.create_follow(follower, followed)
+    return [
+        follow_handler.get_follow_version(email)[0]
+        for email in (EMAIL, EMAIL_2, EMAIL_3, EMAIL_4)
+    ]
+
+
+def remove_graph():
+    """
+    Removes the four users of the tests and their cached suggestions.
+    """
+    for email in (EMAIL, EMAIL_2, EMAIL_3, EMAIL_4):
+        remove_test_user_from_db(email)
+    suggestion_cache.clear()
+
+
+def suggestions_of(email):
+    """
+    Returns the suggestions of the user as a list of (id, mutuals).
+    """
+    user_id, version = follow_handler.get_follow_version(email)
+    users, mutuals = handler.get_suggestions(user_id, version, 10)
+    return [(user.id, mutuals[user.id]) for user in users]
+
+
+def test_suggestions_are_ranked_by_mutuals():
+    """
+    This function tests that the users followed by the people the user
+    follows are suggested, leaving out the ones it follows and itself.
+    """
+    user, _, _, user_4 = create_graph()
+
+    assert suggestions_of(EMAIL) == [(user_4, 2)]
+    assert not suggestions_of(EMAIL_4)
+    follow_handler.create_follow(EMAIL_3, EMAIL_2)
+    assert suggestions_of(EMAIL_3) == [(user, 1)]
+
+    remove_graph()
+
+
+def test_blocked_users_are_not_suggested():
+    """
+    This function tests that blocked users are left out, even if they were
+    blocked after the suggestions were cached.
+    """
+    create_graph()
+    suggestions_of(EMAIL)
+
+    admin_handler.change_blocked_status(EMAIL_4, True)
+
+    assert not suggestions_of(EMAIL)
+
+    remove_graph()
+
+
+def test_cached_suggestions_are_updated_on_follow_and_unfollow():
+    """
+    This function tests that following or unfollowing someone updates the
+    cached suggestions instead of dropping them, to what they would be if
+    they were computed again.
+    """
+    user, _, user_3, user_4 = create_graph()
+    suggestions_of(EMAIL)
+
+    # The third user can be suggested again: the second one follows it.
+    follow_handler.remove_follow(EMAIL, EMAIL_3)
+    assert suggestion_cache.has(user)
+    assert suggestions_of(EMAIL) == [(user_3, 1), (user_4, 1)]
+    suggestion_cache.invalidate(user)
+    assert suggestions_of(EMAIL) == [(user_3, 1), (user_4, 1)]
+
+    follow_handler.create_follow(EMAIL, EMAIL_4)
+    assert suggestion_cache.has(user)
+    assert suggestions_of(EMAIL) == [(user_3, 1)]
+
+    remove_graph()
+
+
+def test_too_many_suggestions_raises_exception():
+    """
+    This function tests that asking for too many suggestions raises an exception.
+    """
+    with pytest.raises(MaxAmmountExceeded):
+        handler.get_suggestions(1, 1, MAX_AMMOUNT + 1)
+
+
+def test_cache_is_only_used_for_the_same_version_and_until_it_expires():
+    """
+    This function tests the cache without a database.
+    """
+    now = [0.0]
+    cache = SuggestionCache(10, 100, 5, clock=lambda: now[0])
+    cache.put(1, 3, {7: 2})
+
+    assert cache.get(1, 3) == {7: 2}
+    assert cache.get(1, 4) is None
+    now[0] = 11.0
+    assert cache.get(1, 3) is None
+
+
+def test_cache_keeps_the_best_candidates_when_applying_a_follow():
+    """
+    This function tests a follow applied to the cache: the candidates gain
+    a point, the followed user is removed and only the best are kept.
+    """
+    cache = SuggestionCache(10, 100, 2)
+    cache.put(1, 3, {7: 2, 8: 1})
+
+    cache.apply(1, 7, [8, 9], 1)
+
+    assert cache.get(1, 4) == {8: 2, 9: 1}
@@ -0,0 +1,128 @@
+# tracer_tests.py
+
+"""
+This is the test module for the sampling and retention of the traces.
+"""
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+from opentelemetry.trace import Status, StatusCode
+from control.utils.tracer import build_tracer_provider, RETAINED_ATTRIBUTE
+
+SECOND_NS = 1_000_000_000
+
+
+def create_settings(sample_ratio=1.0, route_ratios=None, keep_slow_ms=None):
+    """
+    This function creates the settings for the tracer provider.
+    """
+    return {
+        "exporter": "none",
+        "sample_ratio": sample_ratio,
+        "route_ratios": route_ratios or {},
+        "keep_slow_ms": keep_slow_ms,
+    }
+
+
+def run_request(provider, name="GET /user", duration_ns=1000, error=False):
+    """
+    This function simulates a request: a server span with a child span.
+    """
+    tracer = provider.get_tracer("tests")
+    with tracer.start_as_current_span(name, start_time=0, end_on_exit=False) as root:
+        with tracer.start_as_current_span("Get User by Token with ID - Users"):
+            pass
+        if error:
+            root.set_status(Status(StatusCode.ERROR))
+    root.end(end_time=duration_ns)
+
+
+def exported_spans(provider, exporter):
+    """
+    This function flushes the provider and returns the exported spans.
+    """
+    provider.force_flush()
+    return exporter.get_finished_spans()
+
+
+def test_all_traces_are_exported_with_ratio_one():
+    """
+    This function tests that with ratio 1 every span is exported.
+    """
+    exporter = InMemorySpanExporter()
+    provider = build_tracer_provider(create_settings(), exporter)
+
+    run_request(provider)
+
+    assert len(exported_spans(provider, exporter)) == 2
+
+
+def test_no_traces_are_exported_with_ratio_zero():
+    """
+    This function tests that with ratio 0 nothing is exported.
+    """
+    exporter = InMemorySpanExporter()
+    provider = build_tracer_provider(create_settings(sample_ratio=0), exporter)
+
+    run_request(provider)
+
+    assert len(exported_spans(provider, exporter)) == 0
+
+
+def test_route_ratio_overrides_the_default_ratio():
+    """
+    This function tests that a route with its own ratio ignores the default one.
+    """
+    exporter = InMemorySpanExporter()
+    settings = create_settings(route_ratios={"GET /health": 0})
+    provider = build_tracer_provider(settings, exporter)
+
+    run_request(provider, name="GET /health")
+    run_request(provider, name="GET /user")
+
+    names = [span.name for span in exported_spans(provider, exporter)]
+    assert "GET /health" not in names
+    assert "GET /user" in names
+
+
+def test_slow_traces_are_kept_even_if_not_sampled():
+    """
+    This function tests that a slow trace is exported with ratio 0.
+    """
+    exporter = InMemorySpanExporter()
+    settings = create_settings(sample_ratio=0, keep_slow_ms=500)
+    provider = build_tracer_provider(settings, exporter)
+
+    run_request(provider, duration_ns=SECOND_NS)
+
+    spans = exported_spans(provider, exporter)
+    assert len(spans) == 2
+    assert all(span.attributes[RETAINED_ATTRIBUTE] == "slow" for span in spans)
+
+
+def test_error_traces_are_kept_even_if_not_sampled():
+    """
+    This function tests that a failed trace is exported with ratio 0.
+    """
+    exporter = InMemorySpanExporter()
+    settings = create_settings(sample_ratio=0, keep_slow_ms=500)
+    provider = build_tracer_provider(settings, exporter)
+
+    run_request(provider, error=True)
+
+    spans = exported_spans(provider, exporter)
+    assert len(spans) == 2
+    assert all(span.attributes[RETAINED_ATTRIBUTE] == "error" for span in spans)
+
+
+def test_fast_traces_are_dropped_if_not_sampled():
+    """
+    This function tests that a fast trace that wasn't sampled is not exported.
+    """
+    exporter = InMemorySpanExporter()
+    settings = create_settings(sample_ratio=0, keep_slow_ms=500)
+    provider = build_tracer_provider(settings, exporter)
+
+    run_request(provider)
+
+    assert len(exported_spans(provider, exporter)) == 0
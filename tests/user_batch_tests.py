@@ -0,0 +1,106 @@
+# user_batch_tests.py
+"""
+This is a module for all the tests that are related to getting
+many users at once.
+"""
+import pytest
+
+from service.user_handler import UserHandler, MAX_BATCH_AMMOUNT
+from service.errors import MaxAmmountExceeded
+from tests.utils import (
+    remove_test_user_from_db,
+    save_test_user_to_db,
+    create_multiple_generic_users,
+    remove_multiple_generic_users,
+    USERNAME,
+    EMAIL,
+)
+
+AMMOUNT = 10
+
+# We create the handler that will be used in all tests.
+# Since the handler is stateless, we don't care if it's global.
+handler = UserHandler()
+
+
+def test_batch_by_usernames_returns_every_user():
+    """
+    This function tests that every username asked for is in the result.
+    """
+    create_multiple_generic_users(AMMOUNT)
+    usernames = [USERNAME + str(i) for i in range(AMMOUNT)]
+
+    users = handler.get_users_batch({"usernames": usernames})
+
+    assert len(users["usernames"]) == AMMOUNT
+    for username in usernames:
+        assert users["usernames"][username]["username"] == username
+
+    remove_multiple_generic_users(AMMOUNT)
+
+
+def test_batch_mixes_ids_emails_and_usernames():
+    """
+    This function tests that the same user can be asked for by id,
+    email and username in the same batch.
+    """
+    save_test_user_to_db()
+    user_id = handler.get_user_email(EMAIL).id
+
+    users = handler.get_users_batch(
+        {"ids": [user_id], "emails": [EMAIL], "usernames": [USERNAME]}
+    )
+
+    assert users["ids"][user_id]["email"] == EMAIL
+    assert users["emails"][EMAIL]["id"] == user_id
+    assert users["usernames"][USERNAME]["id"] == user_id
+
+    remove_test_user_from_db()
+
+
+def test_batch_returns_none_for_missing_users():
+    """
+    This function tests that the identifiers of users that don't exist
+    map to None instead of failing the whole batch.
+    """
+    save_test_user_to_db()
+
+    users = handler.get_users_batch({"usernames": [USERNAME, "not_a_user"]})
+
+    assert users["usernames"][USERNAME] is not None
+    assert users["usernames"]["not_a_user"] is None
+
+    remove_test_user_from_db()
+
+
+def test_batch_only_returns_the_fields_asked_for():
+    """
+    This function tests the projection of the fields.
+    """
+    save_test_user_to_db()
+
+    users = handler.get_users_batch({"emails": [EMAIL]}, ["username", "last_name"])
+
+    assert users["emails"][EMAIL] == {
+        "username": USERNAME,
+        "last_name": "Real_surname",
+    }
+
+    remove_test_user_from_db()
+
+
+def test_batch_never_returns_the_password():
+    """
+    This function tests that the password can't be asked for.
+    """
+    with pytest.raises(ValueError):
+        handler.get_users_batch({"emails": [EMAIL]}, ["password"])
+
+
+def test_batch_bigger_than_the_max_raises_exception():
+    """
+    This function tests that asking for too many users raises an exception.
+    """
+    ids = list(range(MAX_BATCH_AMMOUNT + 1))
+    with pytest.raises(MaxAmmountExceeded):
+        handler.get_users_batch({"ids": ids})
@@ -0,0 +1,79 @@
+# user_export_tests.py
+"""
+This is a module for the tests of the streamed export of the users.
+"""
+import datetime
+import pytest
+
+from service.admin_handler import AdminHandler
+from service.errors import InvalidExportFilter
+from control.utils.prometheus import EXPORT_ROWS
+from control.utils.streaming import measure_export
+from repository.read_models import UserExport
+from tests.utils import (
+    save_test_user_to_db,
+    remove_test_user_from_db,
+    EMAIL,
+    EMAIL_2,
+    USERNAME_2,
+)
+
+# We create the handler that will be used in all tests.
+# Since the handler is stateless, we don't care if it's global.
+handler = AdminHandler()
+
+
+def export(filters):
+    """
+    Returns every user of the export as a UserExport.
+    """
+    return [
+        UserExport._make(row)
+        for batch in handler.stream_users(filters)
+        for row in batch
+    ]
+
+
+def test_export_filters_by_creation_and_blocked_status():
+    """
+    This function tests the users created in the range are exported,
+    and that the blocked filter is applied.
+    """
+    created_from = datetime.datetime.utcnow()
+    save_test_user_to_db()
+    save_test_user_to_db(EMAIL_2, USERNAME_2)
+    handler.change_blocked_status(EMAIL_2, True)
+
+    everyone = export({"created_from": created_from})
+    blocked = export({"created_from": created_from, "blocked": True})
+    before = export({"created_to": created_from - datetime.timedelta(seconds=1)})
+
+    assert [user.email for user in everyone] == [EMAIL, EMAIL_2]
+    assert [user.email for user in blocked] == [EMAIL_2]
+    assert EMAIL not in [user.email for user in before]
+
+    remove_test_user_from_db()
+    remove_test_user_from_db(EMAIL_2)
+
+
+def test_export_with_an_inverted_range_raises_error():
+    """
+    This function tests that created_from can't be after created_to.
+    """
+    now = datetime.datetime.utcnow()
+    with pytest.raises(InvalidExportFilter):
+        handler.stream_users(
+            {"created_from": now, "created_to": now - datetime.timedelta(days=1)}
+        )
+
+
+def test_measured_export_counts_the_rows():
+    """
+    This function tests the rows of an export are recorded in its metric.
+    """
+    rows_before = EXPORT_ROWS.labels("test").value()
+
+    batches = list(measure_export(iter([[(1,), (2,)], [(3,)]]), "test"))
+
+    assert len(batches) == 2
+    assert EXPORT_ROWS.labels("test").value() == rows_before + 3
@@ -0,0 +1,152 @@
+# user_version_tests.py
+"""
+This is a module for all the tests that are related to the versions
+of the users, which the ETags are computed from.
+"""
+from service.user_handler import UserHandler
+from service.follow_handler import FollowHandler
+from tests.utils import (
+    save_test_user_to_db,
+    remove_test_user_from_db,
+    EMAIL,
+    USERNAME,
+    EMAIL_2,
+    USERNAME_2,
+)
+
+EMAIL_3 = "test_email_3@gmail.com"
+USERNAME_3 = "test_username_3"
+
+# We create the handlers that will be used in all tests.
+# Since the handlers are stateless, we don't care if they're global.
+handler = UserHandler()
+follow_handler = FollowHandler()
+
+
+def test_updating_the_user_changes_its_version():
+    """
+    This function tests that changing a field of the user changes its version.
+    """
+    save_test_user_to_db()
+    version = handler.get_user_email(EMAIL).version
+
+    handler.change_bio(EMAIL, "New bio")
+
+    assert handler.get_user_email(EMAIL).version > version
+
+    remove_test_user_from_db()
+
+
+def test_changing_the_interests_changes_the_version():
+    """
+    This function tests that the interests are part of the user's version.
+    """
+    save_test_user_to_db()
+    version = handler.get_user_email(EMAIL).version
+
+    handler.set_user_interests(EMAIL, "Cooking,Cars")
+
+    assert handler.get_user_email(EMAIL).version > version
+
+    remove_test_user_from_db()
+
+
+def test_following_changes_the_follow_version_of_both_users():
+    """
+    This function tests that a follow changes the follow_version of the
+    follower and the followed, but not their version.
+    """
+    save_test_user_to_db()
+    save_test_user_to_db(EMAIL_2, USERNAME_2)
+    user = handler.get_user_email(EMAIL)
+    user_2 = handler.get_user_email(EMAIL_2)
+    before = [(u.version, u.follow_version) for u in (user, user_2)]
+
+    follow_handler.create_follow(EMAIL, EMAIL_2)
+
+    user = handler.get_user_email(EMAIL)
+    user_2 = handler.get_user_email(EMAIL_2)
+    for (version, follow_version), after in zip(before, (user, user_2)):
+        assert after.version == version
+        assert after.follow_version == follow_version + 1
+
+    remove_test_user_from_db()
+    remove_test_user_from_db(EMAIL_2)
+
+
+def test_unfollowing_changes_the_follow_version():
+    """
+    This function tests that an unfollow changes the follow_version.
+    """
+    save_test_user_to_db()
+    save_test_user_to_db(EMAIL_2, USERNAME_2)
+    follow_handler.create_follow(EMAIL, EMAIL_2)
+    _, follow_version = follow_handler.get_follow_version(EMAIL_2)
+
+    follow_handler.remove_follow(EMAIL, EMAIL_2)
+
+    assert follow_handler.get_follow_version(EMAIL_2)[1] == follow_version + 1
+
+    remove_test_user_from_db()
+    remove_test_user_from_db(EMAIL_2)
+
+
+def test_followers_version_changes_when_a_follower_changes():
+    """
+    This function tests that the version of a list of followers changes if
+    one of the followers changes, even if nobody followed or unfollowed.
+    """
+    save_test_user_to_db()
+    save_test_user_to_db(EMAIL_2, USERNAME_2)
+    follow_handler.create_follow(EMAIL_2, EMAIL)
+    version = follow_handler.get_followers_version(EMAIL)
+
+    handler.change_bio(EMAIL_2, "New bio")
+
+    assert follow_handler.get_followers_version(EMAIL) != version
+
+    remove_test_user_from_db()
+    remove_test_user_from_db(EMAIL_2)
+
+
+def test_follow_versions_change_when_a_related_user_is_deleted():
+    """
+    This function tests that deleting a user changes the follow_version of
+    the users it followed and of its followers, whose relations go away
+    with it.
+    """
+    save_test_user_to_db()
+    save_test_user_to_db(EMAIL_2, USERNAME_2)
+    save_test_user_to_db(EMAIL_3, USERNAME_3)
+    follow_handler.create_follow(EMAIL_2, EMAIL)
+    follow_handler.create_follow(EMAIL, EMAIL_3)
+    version_2 = follow_handler.get_follow_version(EMAIL_2)[1]
+    version_3 = follow_handler.get_follow_version(EMAIL_3)[1]
+    followers_version = follow_handler.get_followers_version(EMAIL_3)
+
+    remove_test_user_from_db()
+
+    assert follow_handler.get_follow_version(EMAIL_2)[1] == version_2 + 1
+    assert follow_handler.get_follow_version(EMAIL_3)[1] == version_3 + 1
+    assert follow_handler.get_followers_version(EMAIL_3) != followers_version
+    assert follow_handler.get_followers_version(EMAIL_3)[2:] == (0, 0)
+
+    remove_test_user_from_db(EMAIL_2)
+    remove_test_user_from_db(EMAIL_3)
+
+
+def test_profile_versions_of_the_user():
+    """
+    This function tests the versions used for the ETag of a profile.
+    """
+    save_test_user_to_db()
+    user = handler.get_user_email(EMAIL)
+
+    versions = handler.get_profile_versions(USERNAME)
+
+    assert versions.id == user.id
+    assert versions.version == user.version
+    assert versions.follow_version == user.follow_version
+    assert versions.is_public == user.is_public
+
+    remove_test_user_from_db()
@@ -9,6 +9,9 @@ from service.errors import UserNotFound
 EMAIL = "real_email@gmail.com"
 USERNAME = "real_username"
 PASSWORD = "Real_password123"
+# A second user, for the tests that need two.
+EMAIL_2 = "test_email_2@gmail.com"
+USERNAME_2 = "test_username_2"
 
 # We create the handler that will be used in all tests.
 # Since the handler is stateless, we don't care if it's global.